@@ -48,6 +48,7 @@ class Events(object):
 	METADATA_ANALYSIS_STARTED = "MetadataAnalysisStarted"
 	METADATA_ANALYSIS_FINISHED = "MetadataAnalysisFinished"
 	METADATA_STATISTICS_UPDATED = "MetadataStatisticsUpdated"
+	METADATA_UPDATED = "MetadataUpdated"
 
 	# SD Upload
 	TRANSFER_STARTED = "TransferStarted"
@@ -5,6 +5,7 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import contextlib
 import logging
 import os
 
@@ -12,11 +13,14 @@ import octoprint.plugin
 import octoprint.util
 
 from octoprint.events import eventManager, Events
+from octoprint.util.compression import strip_compressed_extension
 
 from .destinations import FileDestinations
-from .analysis import QueueEntry, AnalysisQueue
+from .analysis import QueueEntry, AnalysisQueue, RESULT_ARTIFACTS
+from .history import PrintHistory
+from .search import FileSearchIndex
 from .storage import LocalFileStorage
-from .util import AbstractFileWrapper, StreamWrapper, DiskFileWrapper
+from .util import AbstractFileWrapper, StreamWrapper, DiskFileWrapper, IngestFileWrapper, DecompressingFileWrapper
 
 extensions = dict(
 )
@@ -112,19 +116,30 @@ class NoSuchStorage(Exception):
 
 
 class FileManager(object):
-	def __init__(self, analysis_queue, slicing_manager, printer_profile_manager, initial_storage_managers=None):
+	def __init__(self, analysis_queue, slicing_manager, printer_profile_manager, initial_storage_managers=None, print_history=None):
 		self._logger = logging.getLogger(__name__)
 		self._analysis_queue = analysis_queue
 		self._analysis_queue.register_finish_callback(self._on_analysis_finished)
 
+		self._print_history = print_history if print_history is not None else PrintHistory()
+
+		import threading
 		self._storage_managers = dict()
+		self._metadata_callbacks = dict()
+		self._change_callbacks = dict()
+		self._search_index = FileSearchIndex()
+
+		# paths changed by other processes, refreshed in the search index together once things have settled
+		self._search_index_refreshes = set()
+		self._search_index_refresh_timer = None
+		self._search_index_refresh_mutex = threading.Lock()
 		if initial_storage_managers:
-			self._storage_managers.update(initial_storage_managers)
+			for storage_type, storage_manager in initial_storage_managers.items():
+				self._register_storage(storage_type, storage_manager)
 
 		self._slicing_manager = slicing_manager
 		self._printer_profile_manager = printer_profile_manager
 
-		import threading
 		self._slicing_jobs = dict()
 		self._slicing_jobs_mutex = threading.Lock()
 
@@ -134,6 +149,21 @@ class FileManager(object):
 		self._progress_plugins = []
 		self._preprocessor_hooks = dict()
 
+		self._geometry_cache = None
+		self._geometry_cache_mutex = threading.Lock()
+
+		# hashes of all thumbnails on disk, read from the thumbnail folder on first use
+		self._thumbnail_folder = None
+		self._thumbnails = None
+		self._thumbnails_mutex = threading.Lock()
+
+		# thumbnails are only evicted once the search index knows all files that might still need them
+		self._search_index_complete = False
+
+		self._batches = 0
+		self._batch_updated_files = False
+		self._batch_mutex = threading.Lock()
+
 	def initialize(self):
 		self.reload_plugins()
 
@@ -142,6 +172,12 @@ class FileManager(object):
 			for storage_type, storage_manager in self._storage_managers.items():
 				self._determine_analysis_backlog(storage_type, storage_manager)
 
+			for storage_type, storage_manager in self._storage_managers.items():
+				self._build_search_index(storage_type, storage_manager)
+
+			self._search_index_complete = True
+			self._evict_thumbnails()
+
 		import threading
 		thread = threading.Thread(target=worker)
 		thread.daemon = True
@@ -168,18 +204,168 @@ class FileManager(object):
 
 			# we'll use the default printer profile for the backlog since we don't know better
 			queue_entry = QueueEntry(entry, file_type, storage_type, path, self._printer_profile_manager.get_default())
+			self._add_provisional_analysis_result(storage_type, entry, file_type, path)
 			self._analysis_queue.enqueue(queue_entry, high_priority=False)
 			counter += 1
 		self._logger.info("Added {counter} items from storage type \"{storage_type}\" to analysis queue".format(**locals()))
 
+	def _build_search_index(self, storage_type, storage_manager):
+		self._search_index.clear(storage_type)
+		try:
+			entries = storage_manager.list_files(recursive=True)
+			self._import_legacy_history(storage_type, storage_manager, entries, "")
+			self._add_print_statistics(storage_type, entries, "")
+			self._index_folder(storage_type, entries, "")
+		except:
+			self._logger.exception("Error while building the search index for storage type \"{storage_type}\"".format(**locals()))
+			return
+		self._logger.info("Indexed files from storage type \"{}\" for search, {} files in the index now".format(storage_type, len(self._search_index)))
+		self._evict_thumbnails()
+
+	def _index_folder(self, storage_type, entries, prefix):
+		for name, entry in entries.items():
+			path = prefix + name
+			if entry.get("type") == "folder":
+				self._index_folder(storage_type, entry.get("children", dict()), path + "/")
+			else:
+				self._search_index.update(storage_type, path, entry)
+
+	def _add_print_statistics(self, storage_type, entries, prefix):
+		for name, entry in entries.items():
+			path = prefix + name
+			if entry.get("type") == "folder":
+				self._add_print_statistics(storage_type, entry.get("children", dict()), path + "/")
+			else:
+				self._add_print_statistics_to_entry(storage_type, path, entry)
+
+	def _add_print_statistics_to_entry(self, storage_type, path, entry):
+		"""
+		Replaces the per file print history that earlier versions kept in the storage's metadata in ``entry`` with a
+		``prints`` summary of the file's prints from the print history: the number of successful and failed prints,
+		the ids of the printer profiles the file was printed with and the success, date, duration and printer profile
+		of the last print.
+		"""
+		entry.pop("history", None)
+		entry.pop("statistics", None)
+
+		statistics = self._print_history.statistics(origin=storage_type, path=path)
+		if statistics is None:
+			return
+
+		profiles = self._print_history.printer_profiles(origin=storage_type, path=path)
+		prints = dict(success=statistics.successes,
+		              failure=statistics.failures,
+		              printerProfiles=sorted(profiles.keys()))
+
+		last = statistics.last_print
+		if last is not None:
+			prints["last"] = dict(success=last["success"])
+			if "timestamp" in last:
+				prints["last"]["date"] = last["timestamp"]
+			if "printTime" in last:
+				prints["last"]["printTime"] = last["printTime"]
+
+			# the profile whose last print is the file's last print
+			for profile, profile_statistics in profiles.items():
+				if profile_statistics.last_print == last:
+					prints["last"]["printerProfile"] = profile
+					break
+
+		entry["prints"] = prints
+
+	def _import_legacy_history(self, storage_type, storage_manager, entries, prefix):
+		"""
+		Moves the per file print history that earlier versions kept in the storage's metadata over to the print
+		history, unless the print history already knows the file. The history is only removed from the metadata once
+		it was written to the print history's log file.
+		"""
+		with storage_manager.batch():
+			for name, entry in entries.items():
+				path = prefix + name
+				if entry.get("type") == "folder":
+					self._import_legacy_history(storage_type, storage_manager, entry.get("children", dict()), path + "/")
+					continue
+
+				if not "history" in entry and not "statistics" in entry:
+					continue
+
+				history = entry.get("history")
+				if isinstance(history, list) and history and self._print_history.statistics(origin=storage_type, path=path) is None:
+					records = [record for record in history if isinstance(record, dict)]
+					if not self._print_history.log_many(storage_type, path, sorted(records, key=lambda record: record.get("timestamp", 0))):
+						self._logger.warn("Could not persist the print history of {}:{}, keeping it in its metadata for now".format(storage_type, path))
+						continue
+
+				for key in ("history", "statistics"):
+					storage_manager.remove_additional_metadata(path, key)
+
 	def add_storage(self, storage_type, storage_manager):
-		self._storage_managers[storage_type] = storage_manager
+		self._register_storage(storage_type, storage_manager)
 		self._determine_analysis_backlog(storage_type, storage_manager)
+		self._build_search_index(storage_type, storage_manager)
 
 	def remove_storage(self, type):
 		if not type in self._storage_managers:
 			return
+		self._storage_managers[type].unregister_metadata_callback(self._metadata_callbacks[type])
+		self._storage_managers[type].unregister_change_callback(self._change_callbacks[type])
+		self._storage_managers[type].set_print_history(None, None)
 		del self._storage_managers[type]
+		del self._metadata_callbacks[type]
+		del self._change_callbacks[type]
+		self._search_index.clear(type)
+
+	def _register_storage(self, storage_type, storage_manager):
+		def on_metadata_updated(path, key):
+			self._update_search_index(storage_type, path)
+			eventManager().fire(Events.METADATA_UPDATED, dict(storage=storage_type, path=path, key=key))
+
+		def on_changed(path):
+			self._schedule_search_index_refresh(storage_type, path)
+
+		self._storage_managers[storage_type] = storage_manager
+		self._metadata_callbacks[storage_type] = on_metadata_updated
+		self._change_callbacks[storage_type] = on_changed
+		storage_manager.register_metadata_callback(on_metadata_updated)
+		storage_manager.register_change_callback(on_changed)
+		storage_manager.set_print_history(self._print_history, storage_type)
+
+	def _schedule_search_index_refresh(self, storage_type, path):
+		# files copied in by other processes cause a burst of events, only look at them once that's over
+		with self._search_index_refresh_mutex:
+			self._search_index_refreshes.add((storage_type, path))
+			if self._search_index_refresh_timer is not None:
+				self._search_index_refresh_timer.cancel()
+
+			import threading
+			self._search_index_refresh_timer = threading.Timer(1.0, self._refresh_search_index)
+			self._search_index_refresh_timer.daemon = True
+			self._search_index_refresh_timer.start()
+
+	def _refresh_search_index(self):
+		with self._search_index_refresh_mutex:
+			refreshes = sorted(self._search_index_refreshes)
+			self._search_index_refreshes.clear()
+			self._search_index_refresh_timer = None
+
+		for storage_type, path in refreshes:
+			if not storage_type in self._storage_managers:
+				continue
+
+			try:
+				# whatever was at path before is gone, or about to be indexed again
+				self._search_index.remove(storage_type, path)
+				self._search_index.remove(storage_type, path, recursive=True)
+
+				if os.path.isdir(self._storage(storage_type).path_on_disk(path)):
+					self._update_search_index_folder(storage_type, path)
+				else:
+					self._update_search_index(storage_type, path)
+			except:
+				self._logger.exception("Error while refreshing the search index for {storage_type}:{path}".format(**locals()))
+
+		# removed files might have left unused thumbnails behind
+		self._evict_thumbnails()
 
 	@property
 	def slicing_enabled(self):
@@ -205,7 +391,8 @@ class FileManager(object):
 					eventManager().fire(Events.SLICING_CANCELLED, {"stl": source_path, "gcode": dest_path})
 				else:
 					source_meta = self.get_metadata(source_location, source_path)
-					hash = source_meta["hash"]
+					# the hash might still be computed in the background
+					hash = source_meta.get("hash", "") if source_meta else ""
 
 					import io
 					links = [("model", dict(name=source_path))]
@@ -310,13 +497,27 @@ class FileManager(object):
 
 		result = dict()
 		for dst in destinations:
-			result[dst] = self._storage_managers[dst].list_files(path=path, filter=filter, recursive=recursive)
+			entries = self._storage_managers[dst].list_files(path=path, filter=filter, recursive=recursive)
+			self._add_print_statistics(dst, entries, self._path_in_storage(dst, path).rstrip("/") + "/" if path else "")
+			result[dst] = entries
 		return result
 
+	def get_file(self, destination, path):
+		entry = self._storage(destination).get_file(path)
+		if isinstance(entry, dict):
+			self._add_print_statistics_to_entry(destination, self._path_in_storage(destination, path), entry)
+		return entry
+
 	def add_file(self, destination, path, file_object, links=None, allow_overwrite=False, printer_profile=None, analysis=None):
 		if printer_profile is None:
 			printer_profile = self._printer_profile_manager.get_current_or_default()
 
+		uncompressed_path = strip_compressed_extension(path)
+		if uncompressed_path is not None and valid_file_type(uncompressed_path, type="machinecode") and isinstance(file_object, AbstractFileWrapper):
+			# compressed machine code gets stored under its uncompressed name, the storage decides whether to compress it
+			path = uncompressed_path
+			file_object = DecompressingFileWrapper(file_object, filename=os.path.basename(uncompressed_path))
+
 		for hook in self._preprocessor_hooks.values():
 			try:
 				hook_file_object = hook(path, file_object, links=links, printer_profile=printer_profile, allow_overwrite=allow_overwrite)
@@ -326,58 +527,429 @@ class FileManager(object):
 
 			if hook_file_object is not None:
 				file_object = hook_file_object
+
+		if analysis is None and isinstance(file_object, AbstractFileWrapper):
+			file_object = self._create_ingest_wrapper(path, file_object, printer_profile)
+
+		previous_hash = None
+		if allow_overwrite and self._print_history.statistics(origin=destination, path=self._path_in_storage(destination, path)) is not None:
+			previous_hash = self._get_hash(destination, path)
+
 		file_path = self._storage(destination).add_file(path, file_object, links=links, printer_profile=printer_profile, allow_overwrite=allow_overwrite)
 		absolute_path = self._storage(destination).path_on_disk(file_path)
 
-		if analysis is None:
+		if previous_hash is not None and previous_hash != self._get_hash(destination, file_path):
+			# the earlier prints were of different contents
+			self._print_history.forget(destination, file_path)
+
+		if analysis is None and isinstance(file_object, IngestFileWrapper) and file_object.analysis is not None:
+			# make sure no outdated analysis of a file we just replaced is still pending
+			self._analysis_queue.dequeue(destination, file_path)
+			analysis = self._add_analysis_result(destination, file_path, file_object.analysis)
+			eventManager().fire(Events.METADATA_ANALYSIS_FINISHED, {"file": file_path, "result": analysis})
+		elif analysis is None:
 			file_type = get_file_type(absolute_path)
 			if file_type:
 				queue_entry = QueueEntry(file_path, file_type[-1], destination, absolute_path, printer_profile)
+				self._add_provisional_analysis_result(destination, file_path, file_type[-1], absolute_path)
 				self._analysis_queue.enqueue(queue_entry, high_priority=True)
 		else:
+			self._analysis_queue.dequeue(destination, file_path)
 			self._add_analysis_result(destination, path, analysis)
 
-		eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
+		self._update_search_index(destination, file_path)
+		if previous_hash is not None:
+			# the replaced file might have left an unused thumbnail behind
+			self._evict_thumbnails()
+		self._fire_updated_files()
 		return file_path
 
+	def _create_ingest_wrapper(self, path, file_object, printer_profile):
+		"""
+		Wraps ``file_object`` into an :class:`~octoprint.filemanager.util.IngestFileWrapper` so that it gets written,
+		hashed and analysed in one single pass while being stored, if analysis on ingest is enabled, the analysis
+		queue is not paused (e.g. due to an ongoing print) and the file type can be analysed. Otherwise ``file_object``
+		is returned as is.
+		"""
+		from octoprint.settings import settings
+
+		file_type = get_file_type(path)
+		if not file_type or self._analysis_queue.paused or not settings().getBoolean(["gcodeAnalysis", "ingest", "enabled"]):
+			return file_object
+
+		analysis_type = file_type[-1]
+		analyzer = lambda lines: self._analysis_queue.analyze_lines(analysis_type, lines, printer_profile)
+		return IngestFileWrapper(file_object, analyzer=analyzer, max_size=settings().getInt(["gcodeAnalysis", "ingest", "maxSize"]))
+
 	def remove_file(self, destination, path):
 		self._storage(destination).remove_file(path)
-		eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
+		self._dequeue_analysis(destination, path)
+		self._search_index.remove(destination, self._path_in_storage(destination, path))
+		self._print_history.forget(destination, self._path_in_storage(destination, path))
+		self._evict_thumbnails()
+		self._fire_updated_files()
 
 	def add_folder(self, destination, path, ignore_existing=True):
 		folder_path = self._storage(destination).add_folder(path, ignore_existing=ignore_existing)
-		eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
+		self._fire_updated_files()
 		return folder_path
 
 	def remove_folder(self, destination, path, recursive=True):
 		self._storage(destination).remove_folder(path, recursive=recursive)
-		eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
+		self._dequeue_analysis(destination, path)
+		self._search_index.remove(destination, self._path_in_storage(destination, path), recursive=True)
+		self._print_history.forget(destination, self._path_in_storage(destination, path), recursive=True)
+		self._evict_thumbnails()
+		self._fire_updated_files()
+
+	def copy_file(self, destination, source, target):
+		file_path = self._storage(destination).copy_file(source, target)
+		self._enqueue_analysis_backlog(destination, file_path)
+		self._update_search_index(destination, file_path)
+		self._fire_updated_files()
+		return file_path
+
+	def move_file(self, destination, source, target):
+		source = self._path_in_storage(destination, source)
+		file_path = self._storage(destination).move_file(source, target)
+		self._analysis_queue.dequeue(destination, source)
+		self._enqueue_analysis_backlog(destination, file_path)
+		self._search_index.remove(destination, source)
+		self._update_search_index(destination, file_path)
+		self._print_history.move(destination, source, file_path)
+		self._fire_updated_files()
+		return file_path
+
+	def copy_folder(self, destination, source, target):
+		folder_path = self._storage(destination).copy_folder(source, target)
+		self._enqueue_analysis_backlog(destination, folder_path)
+		self._update_search_index_folder(destination, folder_path)
+		self._fire_updated_files()
+		return folder_path
+
+	def move_folder(self, destination, source, target):
+		source = self._path_in_storage(destination, source)
+		folder_path = self._storage(destination).move_folder(source, target)
+		self._analysis_queue.dequeue(destination, source)
+		self._enqueue_analysis_backlog(destination, folder_path)
+		self._search_index.remove(destination, source, recursive=True)
+		self._update_search_index_folder(destination, folder_path)
+		self._print_history.move(destination, source, folder_path, recursive=True)
+		self._fire_updated_files()
+		return folder_path
+
+	def _enqueue_analysis_backlog(self, destination, path):
+		# whatever was still waiting to be analysed at its old location needs to be analysed at its new one
+		for entry, absolute_path, printer_profile in self._storage(destination).analysis_backlog_for_path(path):
+			file_type = get_file_type(absolute_path)
+			if not file_type:
+				continue
+
+			queue_entry = QueueEntry(entry, file_type[-1], destination, absolute_path, self._printer_profile_manager.get_default())
+			self._analysis_queue.enqueue(queue_entry, high_priority=False)
+
+	def _update_search_index_folder(self, destination, path):
+		try:
+			entries = self._storage(destination).list_files(path=path, recursive=True)
+		except NotImplementedError:
+			return
+		except:
+			self._logger.exception("Error while updating the search index for {destination}:{path}".format(**locals()))
+			return
+
+		prefix = self._path_in_storage(destination, path).rstrip("/") + "/"
+		self._add_print_statistics(destination, entries, prefix)
+		self._index_folder(destination, entries, prefix)
+
+	def _dequeue_analysis(self, destination, path):
+		# the analysis queue knows files by their normalized path in storage
+		self._analysis_queue.dequeue(destination, self._path_in_storage(destination, path))
+
+	def _get_hash(self, destination, path):
+		try:
+			metadata = self._storage(destination).get_metadata(path)
+		except:
+			return None
+		if metadata is None:
+			return None
+		return metadata.get("hash")
+
+	def _path_in_storage(self, destination, path):
+		if not destination in self._storage_managers:
+			# e.g. the printer's SD card, its paths are used as they are
+			return path
+
+		storage = self._storage(destination)
+		try:
+			return storage.path_in_storage(storage.path_on_disk(path))
+		except:
+			return path
+
+	def _update_search_index(self, destination, path):
+		path = self._path_in_storage(destination, path)
+		try:
+			entry = self.get_file(destination, path)
+		except NotImplementedError:
+			return
+		except:
+			self._logger.exception("Error while updating the search index for {destination}:{path}".format(**locals()))
+			return
+
+		if isinstance(entry, dict):
+			self._search_index.update(destination, path, entry)
+		else:
+			self._search_index.remove(destination, path)
+
+	def search_files(self, text=None, ranges=None, values=None):
+		"""
+		Searches the files of all storages, see :func:`~octoprint.filemanager.search.FileSearchIndex.search`.
+
+		Returns a list of ``(destination, path)`` tuples.
+		"""
+		return list(self._search_index.search(text=text, ranges=ranges, values=values))
 
 	def get_metadata(self, destination, path):
 		return self._storage(destination).get_metadata(path)
 
 	def add_link(self, destination, path, rel, data):
 		self._storage(destination).add_link(path, rel, data)
+		self._update_search_index(destination, path)
 
 	def remove_link(self, destination, path, rel, data):
 		self._storage(destination).remove_link(path, rel, data)
+		self._update_search_index(destination, path)
+
+	@property
+	def print_history(self):
+		return self._print_history
+
+	def get_print_statistics(self, destination, path, printer_profile=None):
+		"""
+		Returns the statistics over all prints of the file at ``path`` on ``destination`` as returned by
+		:func:`~octoprint.filemanager.history.PrintStatistics.as_dict`, only taking prints with the printer profile
+		``printer_profile`` into account if set. Returns ``None`` if the file hasn't been printed yet.
+		"""
+		statistics = self._print_history.statistics(origin=destination, path=self._path_in_storage(destination, path), printer_profile=printer_profile)
+		if statistics is None:
+			return None
+		return statistics.as_dict()
 
 	def log_print(self, destination, path, timestamp, print_time, success, printer_profile):
 		try:
-			if success:
-				self._storage(destination).add_history(path, dict(timestamp=timestamp, printTime=print_time, success=success, printerProfile=printer_profile))
-			else:
-				self._storage(destination).add_history(path, dict(timestamp=timestamp, success=success, printerProfile=printer_profile))
-			eventManager().fire(Events.METADATA_STATISTICS_UPDATED, dict(storage=destination, path=path))
-		except NoSuchStorage:
-			# if there's no storage configured where to log the print, we'll just not log it
-			pass
+			self._print_history.log(destination, self._path_in_storage(destination, path), timestamp, success, printer_profile, print_time=print_time)
+		except:
+			self._logger.exception("Error while adding print of {} to the print history".format(path))
+
+		if not destination in self._storage_managers:
+			# prints of files without a storage (e.g. on the printer's SD card) are only kept in the print history
+			return
+
+		self._update_search_index(destination, path)
+		eventManager().fire(Events.METADATA_STATISTICS_UPDATED, dict(storage=destination, path=path))
 
 	def set_additional_metadata(self, destination, path, key, data, overwrite=False, merge=False):
 		self._storage(destination).set_additional_metadata(path, key, data, overwrite=overwrite, merge=merge)
+		self._update_search_index(destination, path)
 
 	def remove_additional_metadata(self, destination, path, key):
 		self._storage(destination).remove_additional_metadata(path, key)
+		self._update_search_index(destination, path)
+
+	def rescan(self, destination):
+		storage_manager = self._storage(destination)
+		storage_manager.rescan()
+		self._build_search_index(destination, storage_manager)
+
+	@contextlib.contextmanager
+	def batch(self, destination):
+		"""
+		Context manager for adding, removing or modifying a number of files on ``destination`` at once. The storage
+		persists the metadata modifications of the whole batch together and only one ``UpdatedFiles`` event is fired
+		once the batch is done.
+		"""
+		with self._batch_mutex:
+			self._batches += 1
+
+		try:
+			with self._storage(destination).batch():
+				yield
+		finally:
+			with self._batch_mutex:
+				self._batches -= 1
+				fire = self._batches == 0 and self._batch_updated_files
+				if fire:
+					self._batch_updated_files = False
+			if fire:
+				eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
+
+	def _fire_updated_files(self):
+		with self._batch_mutex:
+			if self._batches:
+				self._batch_updated_files = True
+				return
+		eventManager().fire(Events.UPDATED_FILES, dict(type="printables"))
+
+	def flush(self):
+		for storage_type, storage_manager in self._storage_managers.items():
+			try:
+				storage_manager.flush()
+			except:
+				self._logger.exception("Error while flushing storage {}".format(storage_type))
+
+	def get_layer_index(self, destination, path):
+		return self._storage(destination).get_layer_index(path)
+
+	def get_time_index(self, destination, path):
+		return self._storage(destination).get_time_index(path)
+
+	def get_layer_geometry(self, destination, path, start=None, end=None):
+		"""
+		Retrieves the toolpath geometry of layers ``start`` (inclusive) to ``end`` (exclusive) of the file at ``path``
+		as binary data in the format described in :func:`~octoprint.filemanager.geometry.LayerGeometryCache.read`.
+
+		The geometry is generated lazily in the background upon first request and cached by the file's hash. If it is
+		not available yet, ``None`` is returned and the generation is triggered, callers should retry later.
+
+		Returns:
+		    tuple: a tuple of the total number of layers and the geometry data, or ``None`` if the geometry is not
+		        available yet or can't be generated since the file doesn't have a layer index (yet)
+		"""
+		storage = self._storage(destination)
+
+		metadata = storage.get_metadata(path)
+		if not metadata or not "hash" in metadata:
+			return None
+
+		cache = self._get_geometry_cache()
+		result = cache.read(metadata["hash"], start=start, end=end)
+		if result is not None:
+			return result
+
+		layer_index = storage.get_layer_index(path)
+		if layer_index is not None:
+			cache.generate(metadata["hash"], storage.path_on_disk(path), layer_index, self._printer_profile_for(storage, path))
+		return None
+
+	def _printer_profile_for(self, storage, path):
+		"""
+		Determines the printer profile linked to the file at ``path`` in ``storage``, falling back to the current or
+		default profile if no profile is linked or the linked profile doesn't exist anymore.
+		"""
+		printer_profile = None
+
+		links = storage.get_link(path, "printerprofile")
+		if links:
+			printer_profile = self._printer_profile_manager.get(links[0]["id"])
+
+		if printer_profile is None:
+			printer_profile = self._printer_profile_manager.get_current_or_default()
+		return printer_profile
+
+	def get_thumbnail(self, destination, path):
+		"""
+		Retrieves the path on disk of the toolpath thumbnail rendered for the file at ``path`` during its analysis.
+
+		Thumbnails are stored by the hash of the file they were rendered for.
+
+		Returns:
+		    str: the path to the thumbnail PNG or ``None`` if there's no thumbnail for the file
+		"""
+		metadata = self._storage(destination).get_metadata(path)
+		if not metadata or not "hash" in metadata:
+			return None
+		return self.get_thumbnail_by_hash(metadata["hash"])
+
+	def get_thumbnail_by_hash(self, hash):
+		"""
+		Retrieves the path on disk of the toolpath thumbnail rendered for files with the hash ``hash``. Unlike
+		:func:`get_thumbnail` this doesn't need to look at the file's metadata or the disk, making it suitable for
+		file listings.
+
+		Returns:
+		    str: the path to the thumbnail PNG or ``None`` if there's no thumbnail for the hash
+		"""
+		with self._thumbnails_mutex:
+			if not hash in self._known_thumbnails():
+				return None
+			return self._thumbnail_path(hash)
+
+	def _save_thumbnail(self, destination, path, thumbnail):
+		metadata = self._storage(destination).get_metadata(path)
+		if not metadata or not "hash" in metadata:
+			return
+
+		hash = metadata["hash"]
+		with self._thumbnails_mutex:
+			if hash in self._known_thumbnails():
+				return
+			thumbnail_path = self._thumbnail_path(hash)
+
+		try:
+			data = thumbnail.render()
+			if data is None:
+				return
+
+			import tempfile
+			import shutil
+			file_obj = tempfile.NamedTemporaryFile(dir=os.path.dirname(thumbnail_path), delete=False)
+			try:
+				file_obj.write(data)
+				file_obj.close()
+				shutil.move(file_obj.name, thumbnail_path)
+			finally:
+				if os.path.exists(file_obj.name):
+					os.remove(file_obj.name)
+		except:
+			self._logger.exception("Error while saving thumbnail for {path} on {destination}".format(**locals()))
+			return
+
+		with self._thumbnails_mutex:
+			self._known_thumbnails().add(hash)
+
+	def _evict_thumbnails(self):
+		"""
+		Removes all thumbnails rendered for hashes no file in any storage has anymore.
+		"""
+		if not self._search_index_complete:
+			return
+
+		referenced = self._search_index.values("hash")
+		with self._thumbnails_mutex:
+			thumbnails = self._known_thumbnails()
+			for hash in thumbnails - referenced:
+				try:
+					os.remove(self._thumbnail_path(hash))
+				except OSError:
+					if os.path.exists(self._thumbnail_path(hash)):
+						self._logger.exception("Error while removing thumbnail for hash {}".format(hash))
+						continue
+				thumbnails.discard(hash)
+
+	def _known_thumbnails(self):
+		# callers have to hold the _thumbnails_mutex
+		if self._thumbnails is None:
+			if self._thumbnail_folder is None:
+				from octoprint.settings import settings
+				self._thumbnail_folder = os.path.join(settings().getBaseFolder("generated"), "thumbnails")
+			if not os.path.exists(self._thumbnail_folder):
+				os.makedirs(self._thumbnail_folder)
+			self._thumbnails = set(name[:-len(".png")] for name in os.listdir(self._thumbnail_folder) if name.endswith(".png"))
+		return self._thumbnails
+
+	def _thumbnail_path(self, hash):
+		return os.path.join(self._thumbnail_folder, "{}.png".format(hash))
+
+	def _get_geometry_cache(self):
+		with self._geometry_cache_mutex:
+			if self._geometry_cache is None:
+				from octoprint.settings import settings
+				from .geometry import LayerGeometryCache
+
+				folder = os.path.join(settings().getBaseFolder("generated"), "geometry")
+				self._geometry_cache = LayerGeometryCache(folder,
+				                                          max_entries=settings().getInt(["gcodeViewer", "geometry", "cacheSize"]),
+				                                          paused=lambda: self._analysis_queue.paused)
+			return self._geometry_cache
 
 	def path_on_disk(self, destination, path):
 		return self._storage(destination).path_on_disk(path)
@@ -406,11 +978,67 @@ class FileManager(object):
 		return self._storage_managers[destination]
 
 	def _add_analysis_result(self, destination, path, result):
+		artifacts = dict()
+		if isinstance(result, dict):
+			# layer index and thumbnail are persisted separately from the metadata
+			artifacts = dict((key, result[key]) for key in RESULT_ARTIFACTS if key in result)
+			result = dict((key, value) for key, value in result.items() if not key in RESULT_ARTIFACTS)
+
+		if not destination in self._storage_managers:
+			return result
+
+		storage_manager = self._storage_managers[destination]
+		if artifacts.get("layerIndex") is not None:
+			storage_manager.set_layer_index(path, artifacts["layerIndex"])
+		if artifacts.get("timeIndex") is not None:
+			storage_manager.set_time_index(path, artifacts["timeIndex"])
+		if artifacts.get("thumbnail") is not None:
+			self._save_thumbnail(destination, path, artifacts["thumbnail"])
+
+		overwrite = False
+		if isinstance(result, dict):
+			existing = self._get_analysis_result(storage_manager, path)
+			if existing is not None and existing.get("provisional"):
+				# the full analysis replaces the provisional one, but we keep what the slicer claimed for comparison
+				overwrite = True
+				if "slicer" in existing and not "slicer" in result:
+					result["slicer"] = existing["slicer"]
+
+		storage_manager.set_additional_metadata(path, "analysis", result, overwrite=overwrite, merge=True)
+		self._update_search_index(destination, path)
+		return result
+
+	def _add_provisional_analysis_result(self, destination, path, analysis_type, absolute_path):
 		if not destination in self._storage_managers:
 			return
 
 		storage_manager = self._storage_managers[destination]
-		storage_manager.set_additional_metadata(path, "analysis", result)
+		existing = self._get_analysis_result(storage_manager, path)
+		if existing is not None and not existing.get("provisional"):
+			# never replace the result of a full analysis, even if it's outdated
+			return
+
+		try:
+			result = self._analysis_queue.analyze_provisionally(analysis_type, absolute_path)
+		except:
+			self._logger.exception("Error while determining provisional analysis result for {destination}:{path}".format(**locals()))
+			return
+
+		if result is None:
+			return
+
+		storage_manager.set_additional_metadata(path, "analysis", result, overwrite=True)
+		self._update_search_index(destination, path)
+
+	def _get_analysis_result(self, storage_manager, path):
+		metadata = storage_manager.get_metadata(path)
+		if not isinstance(metadata, dict):
+			return None
+
+		analysis = metadata.get("analysis")
+		if not isinstance(analysis, dict):
+			return None
+		return analysis
 
 	def _on_analysis_finished(self, entry, result):
 		self._add_analysis_result(entry.location, entry.path, result)
@@ -7,15 +7,26 @@ __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms
 
 
 import logging
-import Queue as queue
 import os
 import threading
 import collections
+import copy
+import itertools
 import time
 
 from octoprint.events import Events, eventManager
 
 import octoprint.util.gcodeInterpreter as gcodeInterpreter
+from octoprint.util.compression import uncompressed_size
+
+from octoprint.filemanager.layers import LayerIndex
+from octoprint.filemanager.slicerinfo import read_slicer_info
+from octoprint.filemanager.timeindex import TimeIndex
+from octoprint.filemanager.thumbnail import ToolpathThumbnail
+
+
+RESULT_ARTIFACTS = ("layerIndex", "timeIndex", "thumbnail")
+"""Keys of analysis results which are not part of the file's metadata but persisted separately."""
 
 
 class QueueEntry(collections.namedtuple("QueueEntry", "path, type, location, absolute_path, printer_profile")):
@@ -72,6 +83,65 @@ class AnalysisQueue(object):
 
 		self._queues[entry.type].enqueue(entry, high_priority=high_priority)
 
+	def dequeue(self, location, path):
+		"""
+		Removes the file ``path`` on ``location`` (or all files within the folder ``path``) from all queues, aborting
+		a running analysis of it.
+		"""
+		removed = False
+		for queue in self._queues.values():
+			removed = queue.dequeue(location, path) or removed
+		return removed
+
+	@property
+	def status(self):
+		"""
+		The status of all queues as a :class:`dict` with a ``paused`` flag, the ``current`` jobs and the pending jobs
+		(``queue``) of all queues and the overall ``estimatedTime`` until all jobs are processed. See
+		:attr:`AbstractAnalysisQueue.status` for details.
+		"""
+		current = []
+		pending = []
+		estimated_time = 0
+		for queue in self._queues.values():
+			status = queue.status
+			if status["current"] is not None:
+				current.append(status["current"])
+			pending += status["queue"]
+			if estimated_time is not None and status["estimatedTime"] is not None:
+				estimated_time += status["estimatedTime"]
+			else:
+				estimated_time = None
+
+		return dict(paused=self.paused, current=current, queue=pending, estimatedTime=estimated_time)
+
+	def analyze_lines(self, type, lines, printer_profile):
+		"""
+		Synchronously analyzes the provided ``lines`` of a file of type ``type``, e.g. while the file is being ingested.
+
+		Returns ``None`` if there is no analysis queue for ``type`` or it doesn't support analyzing lines directly.
+		"""
+		if not type in self._queues:
+			return None
+
+		return self._queues[type].analyze_lines(lines, printer_profile)
+
+	def analyze_provisionally(self, type, path):
+		"""
+		Synchronously extracts a provisional analysis result for the file of type ``type`` located at ``path`` on
+		disk, e.g. from estimates the slicer left in the file.
+
+		Returns ``None`` if there is no analysis queue for ``type`` or no provisional result could be determined.
+		"""
+		if not type in self._queues:
+			return None
+
+		return self._queues[type].analyze_provisionally(path)
+
+	@property
+	def paused(self):
+		return any(queue.paused for queue in self._queues.values())
+
 	def pause(self):
 		for queue in self._queues.values():
 			queue.pause()
@@ -83,7 +153,36 @@ class AnalysisQueue(object):
 	def _analysis_finished(self, entry, result):
 		for callback in self._callbacks:
 			callback(entry, result)
-		eventManager().fire(Events.METADATA_ANALYSIS_FINISHED, {"file": entry.path, "result": result})
+
+		# layer index and thumbnail are persisted separately and are of no interest to event consumers
+		payload = result
+		if isinstance(result, dict):
+			payload = dict((key, value) for key, value in result.items() if not key in RESULT_ARTIFACTS)
+		eventManager().fire(Events.METADATA_ANALYSIS_FINISHED, {"file": entry.path, "result": payload})
+
+
+def _job_key(entry):
+	return entry.location, entry.path
+
+
+class _AnalysisJob(object):
+	"""
+	A pending or running job of an :class:`AbstractAnalysisQueue`.
+	"""
+
+	def __init__(self, entry, priority, enqueued, sequence):
+		self.entry = entry
+		self.priority = priority
+		self.enqueued = enqueued
+		self.sequence = sequence
+		self.cancelled = False
+
+	def effective_priority(self, now, aging):
+		return self.priority + max(now - self.enqueued, 0) * aging
+
+	def sort_key(self, now, aging):
+		return -self.effective_priority(now, aging), self.sequence
+
 
 class AbstractAnalysisQueue(object):
 	"""
@@ -91,6 +190,15 @@ class AbstractAnalysisQueue(object):
 	:class:`GcodeAnalysisQueue`. It offers methods to enqueue new entries to analyze and pausing and resuming analysis
 	processing.
 
+	The queue holds at most one pending job per file (identified by location and path). Enqueuing a file that is
+	already pending only updates the pending job, raising its priority if necessary. Enqueuing a file that is
+	currently being analysed aborts that analysis since its result would be outdated, :meth:`dequeue` drops pending
+	and aborts running jobs for files that were removed.
+
+	The job with the highest priority is processed next. Low priority jobs age, their priority increasing over time
+	by :attr:`AGING_PER_SECOND` so that they are not starved by a constant stream of high priority jobs. Jobs with the
+	same priority are processed in the order they were enqueued.
+
 	Arguments:
 	    finished_callback (callable): Callback that will be called upon finishing analysis of an entry in the queue.
 	        The callback will be called with the analyzed entry as the first argument and the analysis result as
@@ -104,6 +212,9 @@ class AbstractAnalysisQueue(object):
 	LOW_PRIO = 0
 	HIGH_PRIO = 100
 
+	AGING_PER_SECOND = HIGH_PRIO / 600.0
+	"""Priority increase of pending jobs per second, a low priority job reaches high priority after ten minutes."""
+
 	def __init__(self, finished_callback):
 		self._logger = logging.getLogger(__name__)
 
@@ -112,11 +223,17 @@ class AbstractAnalysisQueue(object):
 		self._active = threading.Event()
 		self._active.set()
 
-		self._currentFile = None
-		self._currentProgress = None
+		self._pending = dict()
+		self._pending_condition = threading.Condition()
+		self._sequence = itertools.count()
 
-		self._queue = queue.PriorityQueue()
 		self._current = None
+		self._current_job = None
+		self._current_progress = None
+		self._current_start = None
+
+		# exponential moving average of analysed bytes per second, by high_priority flag
+		self._throughput = {True: None, False: None}
 
 		self._worker = threading.Thread(target=self._work)
 		self._worker.daemon = True
@@ -129,6 +246,9 @@ class AbstractAnalysisQueue(object):
 		If ``high_priority`` is True (defaults to False), the entry will be prioritized and hence processed before
 		other entries in the queue with normal priority.
 
+		If the file is already pending, the pending job will be updated instead. If it is currently being analysed,
+		the running analysis will be aborted and the file analysed again.
+
 		Arguments:
 		    entry (QueueEntry): The :class:`QueueEntry` to analyze.
 		    high_priority (boolean): Whether to process the provided entry with high priority (True) or not
@@ -142,7 +262,127 @@ class AbstractAnalysisQueue(object):
 			self._logger.debug("Adding entry {entry} to analysis queue with low priority".format(entry=entry))
 			prio = self.__class__.LOW_PRIO
 
-		self._queue.put((prio, entry))
+		key = _job_key(entry)
+		with self._pending_condition:
+			if key in self._pending:
+				job = self._pending[key]
+				job.entry = entry
+				job.priority = max(job.priority, prio)
+			else:
+				self._pending[key] = _AnalysisJob(entry, prio, time.time(), next(self._sequence))
+
+			if self._current_job is not None and _job_key(self._current_job.entry) == key:
+				self._logger.debug("Entry {entry} changed while being analysed, aborting running analysis".format(entry=entry))
+				self._cancel_current_job()
+
+			self._pending_condition.notify()
+
+	def dequeue(self, location, path):
+		"""
+		Removes the file ``path`` on ``location`` (or all files within the folder ``path``) from the queue, aborting
+		a running analysis of it, e.g. when the file was deleted.
+
+		Returns:
+		    bool: ``True`` if a pending or running job was removed, ``False`` otherwise.
+		"""
+		def matches(key):
+			return key[0] == location and (key[1] == path or key[1].startswith(path + "/"))
+
+		removed = False
+		with self._pending_condition:
+			for key in [key for key in self._pending.keys() if matches(key)]:
+				del self._pending[key]
+				removed = True
+
+			if self._current_job is not None and matches(_job_key(self._current_job.entry)):
+				self._cancel_current_job()
+				removed = True
+
+		if removed:
+			self._logger.debug("Removed {location}:{path} from analysis queue".format(**locals()))
+		return removed
+
+	@property
+	def status(self):
+		"""
+		The current state of the queue as a :class:`dict` with the following keys:
+
+		  * ``current``: the job currently being analysed or ``None``
+		  * ``queue``: list of pending jobs, in the order they will be processed
+		  * ``estimatedTime``: the estimated time in seconds until all jobs are processed, ``None`` if unknown
+
+		Jobs are represented as :class:`dict` with the keys ``path``, ``origin``, ``type``, ``priority`` (the current
+		priority including aging), ``highPriority``, ``enqueued`` (timestamp), ``size`` (in bytes, if known) and
+		``estimatedTime`` (estimated analysis duration in seconds, ``None`` if unknown). The current job additionally
+		contains its ``progress`` (0.0 to 1.0).
+		"""
+		now = time.time()
+		with self._pending_condition:
+			jobs = sorted(self._pending.values(), key=lambda job: job.sort_key(now, self.AGING_PER_SECOND))
+			current_job = self._current_job
+			current_progress = self._current_progress
+			current_start = self._current_start
+
+		total = 0
+		current = None
+		if current_job is not None:
+			current = self._job_status(current_job, now)
+			current["progress"] = current_progress if current_progress is not None else 0.0
+			if current_start is not None and current["progress"] > 0:
+				# extrapolate from how long the analysis took so far
+				elapsed = now - current_start
+				current["estimatedTime"] = elapsed * (1.0 - current["progress"]) / current["progress"]
+			elif current["estimatedTime"] is not None:
+				current["estimatedTime"] *= 1.0 - current["progress"]
+
+			if current["estimatedTime"] is not None:
+				total += current["estimatedTime"]
+			else:
+				total = None
+
+		queue_status = []
+		for job in jobs:
+			job_status = self._job_status(job, now)
+			if total is not None and job_status["estimatedTime"] is not None:
+				total += job_status["estimatedTime"]
+			else:
+				total = None
+			queue_status.append(job_status)
+
+		return dict(current=current, queue=queue_status, estimatedTime=total)
+
+	def analyze_lines(self, lines, printer_profile):
+		"""
+		Synchronously analyzes the file contents provided through the iterable ``lines``, bypassing the queue. Can be
+		overridden by sub classes that support incremental analysis. The default implementation returns ``None``.
+
+		Arguments:
+		    lines (iterable): The lines of the file to analyze.
+		    printer_profile (PrinterProfile): :class:`PrinterProfile` which to use for analysis.
+
+		Returns:
+		    object: The result of the analysis, structured like the one returned by :meth:`_do_analysis`, or ``None``.
+		"""
+		return None
+
+	def analyze_provisionally(self, path):
+		"""
+		Cheaply determines a provisional analysis result for the file at ``path`` without analyzing it fully, to be
+		used until the queued full analysis finishes. Can be overridden by sub classes. The default implementation
+		returns ``None``.
+
+		Arguments:
+		    path (str): Absolute path on disk through which to access the file.
+
+		Returns:
+		    object: The provisional result, structured like the one returned by :meth:`_do_analysis` but marked with
+		        ``provisional`` set to ``True``, or ``None``.
+		"""
+		return None
+
+	@property
+	def paused(self):
+		return not self._active.is_set()
 
 	def pause(self):
 		"""
@@ -164,26 +404,74 @@ class AbstractAnalysisQueue(object):
 		self._active.set()
 
 	def _work(self):
-		aborted = None
 		while True:
-			if aborted is not None:
-				entry = aborted
-				aborted = None
-				self._logger.debug("Got an aborted analysis job for entry {entry}, processing this instead of first item in queue".format(**locals()))
-			else:
-				(priority, entry) = self._queue.get()
-				self._logger.debug("Processing entry {entry} from queue (priority {priority})".format(**locals()))
+			job = self._next_job()
+			self._logger.debug("Processing entry {entry} from queue (priority {priority})".format(entry=job.entry, priority=job.priority))
 
 			self._active.wait()
 
 			try:
-				self._analyze(entry, high_priority=(priority == self.__class__.HIGH_PRIO))
-				self._queue.task_done()
+				if job.cancelled:
+					continue
+				self._analyze(job.entry, high_priority=(job.priority >= self.__class__.HIGH_PRIO))
 			except gcodeInterpreter.AnalysisAborted:
-				aborted = entry
-				self._logger.debug("Running analysis of entry {entry} aborted".format(**locals()))
+				if job.cancelled:
+					self._logger.debug("Running analysis of entry {entry} cancelled".format(entry=job.entry))
+				else:
+					self._logger.debug("Running analysis of entry {entry} aborted, requeuing it".format(entry=job.entry))
+					self._requeue(job)
 			else:
 				time.sleep(1.0)
+			finally:
+				with self._pending_condition:
+					self._current_job = None
+
+	def _next_job(self):
+		with self._pending_condition:
+			while not self._pending:
+				self._pending_condition.wait()
+
+			now = time.time()
+			job = min(self._pending.values(), key=lambda job: job.sort_key(now, self.AGING_PER_SECOND))
+			del self._pending[_job_key(job.entry)]
+			self._current_job = job
+			return job
+
+	def _requeue(self, job):
+		with self._pending_condition:
+			key = _job_key(job.entry)
+			if key in self._pending:
+				# the file has been enqueued again in the meantime, that job supersedes ours
+				return
+			self._pending[key] = job
+			self._pending_condition.notify()
+
+	def _cancel_current_job(self):
+		self._current_job.cancelled = True
+		if self._current is not None:
+			self._do_abort()
+
+	def _job_status(self, job, now):
+		size = None
+		estimated_time = None
+		if job.entry.absolute_path is not None:
+			try:
+				size = uncompressed_size(job.entry.absolute_path)
+			except OSError:
+				pass
+
+		throughput = self._throughput[job.priority >= self.__class__.HIGH_PRIO]
+		if size is not None and throughput:
+			estimated_time = size / throughput
+
+		return dict(path=job.entry.path,
+		            origin=job.entry.location,
+		            type=job.entry.type,
+		            priority=job.effective_priority(now, self.AGING_PER_SECOND),
+		            highPriority=job.priority >= self.__class__.HIGH_PRIO,
+		            enqueued=job.enqueued,
+		            size=size,
+		            estimatedTime=estimated_time)
 
 	def _analyze(self, entry, high_priority=False):
 		path = entry.absolute_path
@@ -196,15 +484,36 @@ class AbstractAnalysisQueue(object):
 		try:
 			self._logger.info("Starting analysis of {entry}".format(**locals()))
 			eventManager().fire(Events.METADATA_ANALYSIS_STARTED, {"file": entry.path, "type": entry.type})
+
+			self._current_start = time.time()
+			size = uncompressed_size(path)
 			try:
 				result = self._do_analysis(high_priority=high_priority)
 			except TypeError:
 				result = self._do_analysis()
+			self._update_throughput(high_priority, size, time.time() - self._current_start)
+
+			if self._current_job is not None and self._current_job.cancelled:
+				self._logger.debug("Entry {entry} was cancelled while finishing analysis, dropping result".format(**locals()))
+				return
+
 			self._logger.debug("Analysis of entry {entry} finished, notifying callback".format(**locals()))
 			self._finished_callback(self._current, result)
 		finally:
 			self._current = None
 			self._current_progress = None
+			self._current_start = None
+
+	def _update_throughput(self, high_priority, size, duration):
+		if duration <= 0 or size <= 0:
+			return
+
+		throughput = size / duration
+		previous = self._throughput[high_priority]
+		if previous is None:
+			self._throughput[high_priority] = throughput
+		else:
+			self._throughput[high_priority] = 0.7 * previous + 0.3 * throughput
 
 	def _do_analysis(self, high_priority=False):
 		"""
@@ -245,6 +554,20 @@ class GcodeAnalysisQueue(AbstractAnalysisQueue):
 	     * The extruded length in mm
 	   - * ``filament.toolX.volume``
 	     * The extruded volume in cm³
+	   - * ``layerCount``
+	     * Number of layers detected in the file
+	   - * ``layerIndex``
+	     * :class:`~octoprint.filemanager.layers.LayerIndex` of the file, not part of the persisted metadata
+	   - * ``timeIndex``
+	     * :class:`~octoprint.filemanager.timeindex.TimeIndex` of the file, not part of the persisted metadata
+	   - * ``thumbnail``
+	     * :class:`~octoprint.filemanager.thumbnail.ToolpathThumbnail` of the file if thumbnail creation is enabled,
+	       not part of the persisted metadata
+
+	If enabled through the ``gcodeAnalysis.fastPath`` settings, :meth:`analyze_provisionally` will extract the
+	estimates known slicers write into the header and footer comments of a file (see
+	:func:`~octoprint.filemanager.slicerinfo.read_slicer_info`) so they can be used until the full analysis has
+	finished.
 	"""
 
 	def _do_analysis(self, high_priority=False):
@@ -256,23 +579,74 @@ class GcodeAnalysisQueue(AbstractAnalysisQueue):
 			if high_priority:
 				throttle_callback = None
 
+			thumbnail = self._create_thumbnail()
+
+			def progress(value):
+				self._current_progress = min(value, 1.0)
+
 			self._gcode = gcodeInterpreter.gcode()
+			self._gcode.progressCallback = progress
+			if thumbnail is not None:
+				self._gcode.segmentCallback = thumbnail.add_segment
 			self._gcode.load(self._current.absolute_path, self._current.printer_profile, throttle=throttle_callback)
-
-			result = dict()
-			if self._gcode.totalMoveTimeMinute:
-				result["estimatedPrintTime"] = self._gcode.totalMoveTimeMinute * 60
-			if self._gcode.extrusionAmount:
-				result["filament"] = dict()
-				for i in range(len(self._gcode.extrusionAmount)):
-					result["filament"]["tool%d" % i] = {
-						"length": self._gcode.extrusionAmount[i],
-						"volume": self._gcode.extrusionVolume[i]
-					}
-			return result
+			return self._to_result(self._gcode, thumbnail=thumbnail)
 		finally:
 			self._gcode = None
 
+	def analyze_lines(self, lines, printer_profile):
+		thumbnail = self._create_thumbnail()
+
+		gcode = gcodeInterpreter.gcode()
+		if thumbnail is not None:
+			gcode.segmentCallback = thumbnail.add_segment
+		gcode.load_lines(lines, printer_profile)
+		return self._to_result(gcode, thumbnail=thumbnail)
+
+	def analyze_provisionally(self, path):
+		from octoprint.settings import settings
+		if not settings().getBoolean(["gcodeAnalysis", "fastPath", "enabled"]):
+			return None
+
+		info = read_slicer_info(path, read_size=settings().getInt(["gcodeAnalysis", "fastPath", "readSize"]))
+		if info is None:
+			return None
+
+		result = dict((key, value) for key, value in info.items() if key != "slicer")
+
+		# keep the slicer's claims around so they can be compared against the full analysis later on
+		slicer = copy.deepcopy(result)
+		slicer["name"] = info["slicer"]
+		result["slicer"] = slicer
+
+		result["provisional"] = True
+		return result
+
+	def _create_thumbnail(self):
+		from octoprint.settings import settings
+		if not settings().getBoolean(["gcodeAnalysis", "thumbnail", "enabled"]):
+			return None
+
+		size = settings().getInt(["gcodeAnalysis", "thumbnail", "size"])
+		return ToolpathThumbnail(width=size, height=size)
+
+	def _to_result(self, gcode, thumbnail=None):
+		result = dict()
+		if gcode.totalMoveTimeMinute:
+			result["estimatedPrintTime"] = gcode.totalMoveTimeMinute * 60
+		if gcode.extrusionAmount:
+			result["filament"] = dict()
+			for i in range(len(gcode.extrusionAmount)):
+				result["filament"]["tool%d" % i] = {
+					"length": gcode.extrusionAmount[i],
+					"volume": gcode.extrusionVolume[i]
+				}
+		result["layerCount"] = len(gcode.layers)
+		result["layerIndex"] = LayerIndex(gcode.layers)
+		result["timeIndex"] = TimeIndex(gcode.times)
+		if thumbnail is not None and not thumbnail.empty:
+			result["thumbnail"] = thumbnail
+		return result
+
 	def _do_abort(self):
 		if self._gcode:
 			self._gcode.abort()
@@ -0,0 +1,281 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import logging
+import os
+import threading
+
+
+class FileTreeIndex(object):
+	"""
+	In-memory index of all files and folders below ``basefolder`` with their size and modification date, so that
+	listings don't need to hit the disk.
+
+	Folders are indexed as :class:`dict` nodes mapping names to child nodes, files as ``(size, mtime)`` tuples.
+	Hidden files and folders (those starting with a ``.``) are never indexed.
+
+	The index is kept current through :func:`refresh`, which the storage calls for its own modifications, and, if
+	``watch`` is set, through filesystem events delivered by a `watchdog <https://pypi.python.org/pypi/watchdog>`_
+	observer (inotify on Linux) for modifications made by other processes. Callbacks registered through
+	:func:`register_change_callback` are told about the latter.
+
+	If the tree grows beyond ``max_entries`` entries the index gives up to bound its memory use and reports itself as
+	not :attr:`valid`, callers then have to fall back to reading the disk. :func:`rescan` rebuilds the index from
+	scratch.
+
+	Arguments:
+	    basefolder (str): absolute path of the folder to index
+	    max_entries (int): maximum number of files and folders to index
+	    watch (bool): whether to watch ``basefolder`` for modifications
+	    polling (bool): whether to use watchdog's polling observer instead of the platform's native one
+	"""
+
+	def __init__(self, basefolder, max_entries=100000, watch=True, polling=False):
+		self._logger = logging.getLogger(__name__)
+
+		self._basefolder = basefolder
+		self._max_entries = max_entries
+
+		self._lock = threading.RLock()
+		self._root = None
+		self._count = 0
+
+		self._change_callbacks = []
+
+		self._observer = None
+		self.rescan()
+
+		if watch:
+			self._start_observer(polling)
+
+	@property
+	def valid(self):
+		"""Whether the index currently covers the whole tree."""
+		return self._root is not None
+
+	def rescan(self):
+		"""
+		Rebuilds the whole index from disk.
+		"""
+		with self._lock:
+			self._count = 0
+			try:
+				self._root = self._scan(self._basefolder)
+			except _IndexOverflow:
+				self._root = None
+				self._count = 0
+				self._logger.warn("More than {} files and folders below {}, not indexing them in memory".format(self._max_entries, self._basefolder))
+
+	def list_folder(self, path):
+		"""
+		Returns the entries of the folder at absolute ``path`` as a list of ``(name, is_file, size, mtime)`` tuples,
+		with ``size`` and ``mtime`` being ``None`` for folders, or ``None`` if the index is not valid or doesn't
+		know the folder.
+		"""
+		with self._lock:
+			node = self._node(path)
+			if not isinstance(node, dict):
+				return None
+
+			result = []
+			for name, child in node.items():
+				if isinstance(child, dict):
+					result.append((name, False, None, None))
+				else:
+					result.append((name, True, child[0], child[1]))
+			return result
+
+	def file_exists(self, path):
+		"""
+		Returns whether there is a file at absolute ``path``, or ``None`` if the index is not valid.
+		"""
+		with self._lock:
+			if self._root is None:
+				return None
+			node = self._node(path)
+			return node is not None and not isinstance(node, dict)
+
+	def refresh(self, path):
+		"""
+		Updates the index for the file or folder at absolute ``path`` from disk, indexing it and all its contents if
+		it exists and removing it from the index otherwise.
+		"""
+		parts = self._parts(path)
+		if parts is None or any(part.startswith(".") for part in parts):
+			return
+		if not parts:
+			self.rescan()
+			return
+
+		with self._lock:
+			if self._root is None:
+				return
+
+			try:
+				parent = self._folder_node(parts[:-1])
+				name = parts[-1]
+
+				if name in parent:
+					self._count -= self._size(parent[name])
+					del parent[name]
+
+				if os.path.isdir(path):
+					parent[name] = self._scan(path)
+					self._count += 1
+				elif os.path.isfile(path):
+					stat = os.stat(path)
+					parent[name] = (stat.st_size, stat.st_mtime)
+					self._count += 1
+
+				if self._count > self._max_entries:
+					raise _IndexOverflow()
+			except _IndexOverflow:
+				self._root = None
+				self._count = 0
+				self._logger.warn("More than {} files and folders below {}, not indexing them in memory any more".format(self._max_entries, self._basefolder))
+			except OSError:
+				# the entry vanished while we were looking at it, there will be another event for that
+				pass
+
+	def register_change_callback(self, callback):
+		"""
+		Registers ``callback`` to be called as ``callback(path)`` with the absolute ``path`` of every file or folder
+		that was added, modified or removed by another process, once the index has been updated accordingly.
+		"""
+		self._change_callbacks.append(callback)
+
+	def unregister_change_callback(self, callback):
+		try:
+			self._change_callbacks.remove(callback)
+		except ValueError:
+			# callback was not registered
+			pass
+
+	def stop(self):
+		if self._observer is not None:
+			self._observer.stop()
+			self._observer.join()
+			self._observer = None
+
+	##~~ internals
+
+	def _parts(self, path):
+		relative = os.path.relpath(path, self._basefolder)
+		if relative == os.curdir:
+			return []
+		if relative.startswith(os.pardir):
+			return None
+		return relative.split(os.sep)
+
+	def _node(self, path):
+		if self._root is None:
+			return None
+
+		parts = self._parts(path)
+		if parts is None:
+			return None
+
+		node = self._root
+		for part in parts:
+			if not isinstance(node, dict) or not part in node:
+				return None
+			node = node[part]
+		return node
+
+	def _folder_node(self, parts):
+		# makes sure all folders along parts are indexed, scanning them if they are not yet
+		node = self._root
+		current = self._basefolder
+		for part in parts:
+			current = os.path.join(current, part)
+			if not isinstance(node.get(part), dict):
+				if part in node:
+					self._count -= 1
+				node[part] = self._scan(current)
+				self._count += 1
+			node = node[part]
+		return node
+
+	def _scan(self, path):
+		node = dict()
+		for entry in os.listdir(path):
+			if entry.startswith("."):
+				continue
+
+			entry_path = os.path.join(path, entry)
+			try:
+				if os.path.isdir(entry_path):
+					node[entry] = self._scan(entry_path)
+				elif os.path.isfile(entry_path):
+					stat = os.stat(entry_path)
+					node[entry] = (stat.st_size, stat.st_mtime)
+				else:
+					continue
+			except OSError:
+				continue
+
+			self._count += 1
+			if self._count > self._max_entries:
+				raise _IndexOverflow()
+		return node
+
+	def _notify_change(self, path):
+		parts = self._parts(path)
+		if not parts or any(part.startswith(".") for part in parts):
+			return
+
+		for callback in self._change_callbacks:
+			try:
+				callback(path)
+			except:
+				self._logger.exception("Error in change callback for {}".format(path))
+
+	def _size(self, node):
+		if isinstance(node, dict):
+			return 1 + sum(self._size(child) for child in node.values())
+		return 1
+
+	def _start_observer(self, polling):
+		try:
+			import watchdog.events
+			if polling:
+				from watchdog.observers.polling import PollingObserver as Observer
+			else:
+				from watchdog.observers import Observer
+		except ImportError:
+			self._logger.warn("watchdog is not available, the file index of {} will only be updated by OctoPrint itself".format(self._basefolder))
+			return
+
+		index = self
+
+		class Handler(watchdog.events.FileSystemEventHandler):
+			def on_any_event(self, event):
+				if event.is_directory and event.event_type == watchdog.events.EVENT_TYPE_MODIFIED:
+					# contents of folders are reported individually
+					return
+
+				index.refresh(event.src_path)
+				if event.event_type == watchdog.events.EVENT_TYPE_MOVED:
+					index.refresh(event.dest_path)
+
+				index._notify_change(event.src_path)
+				if event.event_type == watchdog.events.EVENT_TYPE_MOVED:
+					index._notify_change(event.dest_path)
+
+		try:
+			self._observer = Observer()
+			self._observer.schedule(Handler(), self._basefolder, recursive=True)
+			self._observer.daemon = True
+			self._observer.start()
+		except:
+			self._logger.exception("Could not watch {} for modifications, the file index will only be updated by OctoPrint itself".format(self._basefolder))
+			self._observer = None
+
+
+class _IndexOverflow(Exception):
+	pass
@@ -0,0 +1,332 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import array
+import collections
+import io
+import logging
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+import octoprint.util.gcodeInterpreter as gcodeInterpreter
+
+
+FLAG_EXTRUDE = 1
+"""Segment flag: the segment extrudes material."""
+
+FLAG_RETRACT = 2
+"""Segment flag: the segment retracts the filament."""
+
+FLAG_UNRETRACT = 4
+"""Segment flag: the segment extrudes material without moving in X or Y, e.g. to prime after a retraction."""
+
+MAGIC = b"OPLG"
+VERSION = 1
+
+_file_header = struct.Struct("<4sBxxxI")
+_file_table_entry = struct.Struct("<QI")
+_response_header = struct.Struct("<4sBxxxII")
+_layer_header = struct.Struct("<fI")
+
+
+class LayerGeometryBuilder(object):
+	"""
+	Collects the toolpath segments of a machine code file as reported by the
+	:class:`~octoprint.util.gcodeInterpreter.gcode` interpreter and sorts them into the layers of the file's
+	:class:`~octoprint.filemanager.layers.LayerIndex`.
+
+	Per layer the segments are kept as typed arrays ready to be sent to the client as is:
+
+	  * ``coords``: ``float32``, four values (start x, start y, end x, end y) per segment
+	  * ``offsets``: ``uint32``, byte offset of the segment's line within the file
+	  * ``flags``: ``uint8``, combination of :data:`FLAG_EXTRUDE`, :data:`FLAG_RETRACT` and :data:`FLAG_UNRETRACT`,
+	    travel moves have no flag set
+	  * ``tools``: ``uint8``, the tool the segment was printed with
+
+	Segments preceding the first layer are added to the first layer.
+
+	Arguments:
+	    layer_index (octoprint.filemanager.layers.LayerIndex): The layer index of the file.
+	"""
+
+	def __init__(self, layer_index):
+		self._starts = [layer.offset for layer in layer_index]
+		self._z = [layer.z for layer in layer_index]
+		self._layers = [self._new_layer() for _ in self._starts]
+		self._current = 0
+
+	def add_segment(self, offset, start, end, move_type, tool):
+		if not self._layers:
+			return
+
+		moves_xy = start[0] != end[0] or start[1] != end[1]
+		if move_type == "extrude":
+			flags = FLAG_EXTRUDE if moves_xy else FLAG_UNRETRACT
+		elif move_type == "retract":
+			flags = FLAG_RETRACT
+		elif moves_xy:
+			flags = 0
+		else:
+			# z only moves are of no interest for rendering
+			return
+
+		# segments are reported in file order, so we only ever need to advance
+		while self._current + 1 < len(self._starts) and self._starts[self._current + 1] <= offset:
+			self._current += 1
+
+		layer = self._layers[self._current]
+		layer["coords"].extend((start[0], start[1], end[0], end[1]))
+		layer["offsets"].append(offset)
+		layer["flags"].append(flags)
+		layer["tools"].append(min(tool, 255))
+
+	def dump(self, stream):
+		"""
+		Writes the collected geometry in the format expected by :class:`LayerGeometryCache` to ``stream``.
+		"""
+		blocks = [_layer_block(z, layer) for z, layer in zip(self._z, self._layers)]
+
+		stream.write(_file_header.pack(MAGIC, VERSION, len(blocks)))
+		position = _file_header.size + len(blocks) * _file_table_entry.size
+		for block in blocks:
+			stream.write(_file_table_entry.pack(position, len(block)))
+			position += len(block)
+		for block in blocks:
+			stream.write(block)
+
+	@staticmethod
+	def _new_layer():
+		return dict(coords=array.array("f"),
+		            offsets=array.array("I"),
+		            flags=array.array("B"),
+		            tools=array.array("B"))
+
+
+def _layer_block(z, layer):
+	coords = layer["coords"]
+	offsets = layer["offsets"]
+	if sys.byteorder != "little":
+		coords = array.array("f", coords)
+		coords.byteswap()
+		offsets = array.array("I", offsets)
+		offsets.byteswap()
+
+	count = len(layer["flags"])
+	block = _layer_header.pack(z, count) + coords.tostring() + offsets.tostring() + layer["flags"].tostring() + layer["tools"].tostring()
+
+	# pad to a multiple of four bytes so that the float and integer arrays of all following layers stay aligned
+	padding = (4 - len(block) % 4) % 4
+	return block + b"\x00" * padding
+
+
+class LayerGeometryCache(object):
+	"""
+	Disk cache for the layer geometry of machine code files, keyed by the files' hashes.
+
+	Geometry is generated lazily upon first request (see :func:`generate`) by a single background worker, one file
+	at a time, and persisted as ``<hash>.geometry`` within ``folder``. Only the ``max_entries`` most recently used
+	files are kept.
+
+	While ``paused`` returns ``True`` (e.g. while the file analysis is paused during a print) no generation takes
+	place, a generation already running is aborted and requeued to be continued once ``paused`` returns ``False``
+	again.
+
+	Arguments:
+	    folder (str): The folder in which to store the generated geometry, will be created if necessary.
+	    max_entries (int): Maximum number of files for which to keep generated geometry.
+	    paused (callable): Callable returning whether generation should currently be paused, optional.
+	"""
+
+	def __init__(self, folder, max_entries=20, paused=None):
+		self._logger = logging.getLogger(__name__)
+
+		self._folder = folder
+		if not os.path.exists(self._folder):
+			os.makedirs(self._folder)
+		self._max_entries = max_entries
+
+		if paused is None:
+			paused = lambda: False
+		self._paused = paused
+
+		self._mutex = threading.Lock()
+		self._condition = threading.Condition(self._mutex)
+		self._generating = set()
+		self._queue = collections.deque()
+		self._worker = None
+
+	def is_available(self, hash):
+		return os.path.exists(self._path(hash))
+
+	def is_generating(self, hash):
+		with self._mutex:
+			return hash in self._generating
+
+	def generate(self, hash, path, layer_index, printer_profile):
+		"""
+		Queues the generation of the geometry for the file ``path`` with hash ``hash`` on the background worker,
+		unless it is already available or currently queued or being generated.
+
+		Returns:
+		    bool: ``True`` if generation was queued, ``False`` otherwise.
+		"""
+		with self._mutex:
+			if hash in self._generating or self.is_available(hash):
+				return False
+			self._generating.add(hash)
+			self._queue.append((hash, path, layer_index, printer_profile))
+
+			if self._worker is None:
+				self._worker = threading.Thread(target=self._work, name="LayerGeometryWorker")
+				self._worker.daemon = True
+				self._worker.start()
+			self._condition.notify()
+		return True
+
+	def read(self, hash, start=None, end=None):
+		"""
+		Reads the geometry of layers ``start`` (inclusive) to ``end`` (exclusive) of the file with hash ``hash``.
+
+		The result starts with a header (magic ``OPLG``, ``uint8`` format version, three bytes padding, ``uint32``
+		number of the first contained layer and ``uint32`` number of contained layers), followed by one block per
+		layer: ``float32`` z, ``uint32`` segment count ``n`` and the ``coords``, ``offsets``, ``flags`` and ``tools``
+		arrays as described in :class:`LayerGeometryBuilder`, padded to a multiple of four bytes. All values are
+		little endian.
+
+		Returns:
+		    tuple: a tuple of the total number of layers in the file and the geometry data, or ``None`` if no
+		        geometry is available for ``hash``
+		"""
+		path = self._path(hash)
+		try:
+			with io.open(path, "rb") as f:
+				magic, version, count = _file_header.unpack(f.read(_file_header.size))
+				if magic != MAGIC or version != VERSION:
+					return None
+
+				start, end = _clamp_range(start, end, count)
+				if end <= start:
+					return count, _response_header.pack(MAGIC, VERSION, start, 0)
+
+				f.seek(_file_header.size + start * _file_table_entry.size)
+				first_offset, _ = _file_table_entry.unpack(f.read(_file_table_entry.size))
+				f.seek(_file_header.size + (end - 1) * _file_table_entry.size)
+				last_offset, last_length = _file_table_entry.unpack(f.read(_file_table_entry.size))
+
+				f.seek(first_offset)
+				data = f.read(last_offset + last_length - first_offset)
+		except (IOError, OSError, struct.error):
+			return None
+
+		try:
+			# mark as recently used
+			os.utime(path, None)
+		except OSError:
+			pass
+
+		return count, _response_header.pack(MAGIC, VERSION, start, end - start) + data
+
+	def remove(self, hash):
+		path = self._path(hash)
+		try:
+			if os.path.exists(path):
+				os.remove(path)
+		except OSError:
+			self._logger.exception("Could not remove cached geometry {}".format(path))
+
+	def _path(self, hash):
+		return os.path.join(self._folder, "{}.geometry".format(hash))
+
+	def _work(self):
+		while True:
+			with self._mutex:
+				while not self._queue or self._paused():
+					# there's no notification upon resume, so poll while paused
+					self._condition.wait(1.0 if self._queue else None)
+				job = self._queue.popleft()
+
+			hash = job[0]
+			done = True
+			try:
+				done = self._generate(*job)
+			finally:
+				with self._mutex:
+					if done:
+						self._generating.discard(hash)
+					else:
+						self._queue.appendleft(job)
+
+	def _generate(self, hash, path, layer_index, printer_profile):
+		"""
+		Returns:
+		    bool: ``False`` if generation was aborted due to being paused and needs to be retried, ``True`` otherwise.
+		"""
+		try:
+			self._logger.info("Generating layer geometry for {}".format(path))
+
+			builder = LayerGeometryBuilder(layer_index)
+			interpreter = gcodeInterpreter.gcode()
+			interpreter.segmentCallback = builder.add_segment
+
+			def check_paused():
+				if self._paused():
+					interpreter.abort()
+
+			interpreter.load(path, printer_profile, throttle=check_paused)
+
+			file_obj = tempfile.NamedTemporaryFile(dir=self._folder, delete=False)
+			try:
+				builder.dump(file_obj)
+				file_obj.close()
+
+				import shutil
+				shutil.move(file_obj.name, self._path(hash))
+			finally:
+				if os.path.exists(file_obj.name):
+					os.remove(file_obj.name)
+
+			self._logger.info("Layer geometry for {} generated".format(path))
+			self._evict()
+		except gcodeInterpreter.AnalysisAborted:
+			self._logger.info("Generation of layer geometry for {} paused, will continue later".format(path))
+			return False
+		except:
+			self._logger.exception("Error while generating layer geometry for {}".format(path))
+		return True
+
+	def _evict(self):
+		entries = []
+		for entry in os.listdir(self._folder):
+			if not entry.endswith(".geometry"):
+				continue
+			entry_path = os.path.join(self._folder, entry)
+			try:
+				entries.append((os.stat(entry_path).st_mtime, entry_path))
+			except OSError:
+				continue
+
+		if len(entries) <= self._max_entries:
+			return
+
+		entries.sort()
+		for _, entry_path in entries[:len(entries) - self._max_entries]:
+			try:
+				os.remove(entry_path)
+			except OSError:
+				self._logger.exception("Could not remove cached geometry {}".format(entry_path))
+
+
+def _clamp_range(start, end, count):
+	if start is None:
+		start = 0
+	if end is None or end > count:
+		end = count
+	return min(start, count), end
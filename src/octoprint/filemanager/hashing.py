@@ -0,0 +1,147 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import hashlib
+import logging
+import os
+import Queue
+import threading
+
+import pylru
+
+from octoprint.util.compression import open_file
+
+
+def create_hash(path, blocksize=65536):
+	"""
+	Computes the SHA1 hex digest of the contents of the file at ``path``, of its uncompressed contents if it is stored
+	compressed.
+	"""
+	hash = hashlib.sha1()
+	with open_file(path) as f:
+		buffer = f.read(blocksize)
+		while len(buffer) > 0:
+			hash.update(buffer)
+			buffer = f.read(blocksize)
+
+	return hash.hexdigest()
+
+
+class HashCache(object):
+	"""
+	Caches the hashes of files by their device, inode, size and modification time, so that a file only needs to be
+	read again once it has actually changed (or has been replaced by another one).
+
+	Arguments:
+	    size (int): maximum number of cached hashes
+	"""
+
+	def __init__(self, size=1000):
+		self._cache = pylru.lrucache(size)
+		self._lock = threading.Lock()
+
+	def get(self, path):
+		"""
+		Returns the hash of the file at ``path``, computing it only if it is not cached yet for the file's current
+		state.
+
+		Raises:
+		    OSError, IOError: the file could not be read
+		"""
+		key = self._key(path)
+		with self._lock:
+			if key in self._cache:
+				return self._cache[key]
+
+		hash = create_hash(path)
+		with self._lock:
+			self._cache[key] = hash
+		return hash
+
+	def cached(self, path):
+		"""
+		Returns the hash of the file at ``path`` if it is cached for the file's current state, ``None`` otherwise.
+		"""
+		try:
+			key = self._key(path)
+		except OSError:
+			return None
+
+		with self._lock:
+			if key in self._cache:
+				return self._cache[key]
+		return None
+
+	def set(self, path, hash):
+		"""
+		Stores the already known ``hash`` of the file at ``path`` in its current state.
+		"""
+		try:
+			key = self._key(path)
+		except OSError:
+			return
+
+		with self._lock:
+			self._cache[key] = hash
+
+	def _key(self, path):
+		stat = os.stat(path)
+		return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime
+
+
+class BackgroundHasher(object):
+	"""
+	Computes file hashes through a :class:`HashCache` on a pool of ``workers`` daemon threads and reports each
+	result to ``callback`` as ``callback(path, hash)``. Paths already waiting to be hashed are not enqueued twice.
+	"""
+
+	def __init__(self, hash_cache, callback, workers=1):
+		self._logger = logging.getLogger(__name__)
+		self._hash_cache = hash_cache
+		self._callback = callback
+
+		self._queue = Queue.Queue()
+		self._pending = set()
+		self._pending_lock = threading.Lock()
+
+		for i in range(workers):
+			thread = threading.Thread(target=self._work, name="BackgroundHasher-{}".format(i))
+			thread.daemon = True
+			thread.start()
+
+	def enqueue(self, path):
+		with self._pending_lock:
+			if path in self._pending:
+				return
+			self._pending.add(path)
+		self._queue.put(path)
+
+	def is_pending(self, path):
+		with self._pending_lock:
+			return path in self._pending
+
+	def _work(self):
+		while True:
+			path = self._queue.get()
+			try:
+				hash = self._hash_cache.get(path)
+			except (IOError, OSError):
+				# most likely the file got removed in the meantime
+				self._logger.debug("Could not hash {}, skipping it".format(path))
+				continue
+			except:
+				self._logger.exception("Error while hashing {}".format(path))
+				continue
+			finally:
+				with self._pending_lock:
+					self._pending.discard(path)
+
+			try:
+				self._callback(path, hash)
+			except:
+				self._logger.exception("Error in callback for hash of {}".format(path))
@@ -0,0 +1,300 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import bisect
+import io
+import json
+import logging
+import os
+import threading
+
+
+PERCENTILES = (10, 25, 50, 75, 90)
+"""Percentiles of the print times reported by :func:`PrintStatistics.as_dict`."""
+
+
+class PrintStatistics(object):
+	"""
+	Statistics over a number of prints, updated incrementally with every print added: the number of prints, how many
+	of them succeeded and the distribution of the print times of the successful ones.
+
+	The print times are kept sorted, so that percentiles can be looked up without sorting them again.
+	"""
+
+	def __init__(self):
+		self.count = 0
+		self.successes = 0
+		self.last_print = None
+
+		self._print_times = []
+		self._print_time_sum = 0.0
+
+	def add(self, success, print_time=None, timestamp=None):
+		self.count += 1
+		if success:
+			self.successes += 1
+			if print_time is not None:
+				bisect.insort(self._print_times, print_time)
+				self._print_time_sum += print_time
+
+		if self.last_print is None or (timestamp is not None and timestamp >= self.last_print.get("timestamp", 0)):
+			self.last_print = dict(success=success)
+			if timestamp is not None:
+				self.last_print["timestamp"] = timestamp
+			if print_time is not None:
+				self.last_print["printTime"] = print_time
+
+	@property
+	def failures(self):
+		return self.count - self.successes
+
+	@property
+	def success_rate(self):
+		"""Share of successful prints from 0.0 to 1.0, ``None`` without any prints."""
+		if not self.count:
+			return None
+		return self.successes / float(self.count)
+
+	@property
+	def mean(self):
+		"""Mean print time of the successful prints in seconds, ``None`` if there are none."""
+		if not self._print_times:
+			return None
+		return self._print_time_sum / len(self._print_times)
+
+	def percentile(self, percentile):
+		"""
+		Returns the ``percentile`` (from 0 to 100) of the print times of the successful prints, linearly interpolated
+		between the closest print times, or ``None`` if there are none.
+		"""
+		if not self._print_times:
+			return None
+
+		position = (len(self._print_times) - 1) * percentile / 100.0
+		lower = int(position)
+		upper = min(lower + 1, len(self._print_times) - 1)
+		return self._print_times[lower] + (self._print_times[upper] - self._print_times[lower]) * (position - lower)
+
+	def as_dict(self):
+		print_time = dict(count=len(self._print_times))
+		if self._print_times:
+			print_time.update(mean=self.mean,
+			                  min=self._print_times[0],
+			                  max=self._print_times[-1],
+			                  percentiles=dict(("p{}".format(p), self.percentile(p)) for p in PERCENTILES))
+
+		return dict(count=self.count,
+		            successes=self.successes,
+		            failures=self.failures,
+		            successRate=self.success_rate,
+		            printTime=print_time,
+		            lastPrint=self.last_print)
+
+
+class PrintHistory(object):
+	"""
+	Append-only log of all prints across all storages, with :class:`PrintStatistics` maintained incrementally per file,
+	per file and printer profile, per printer profile and over all prints.
+
+	Every logged print is appended as one JSON line to the log file at ``path``, which is replayed on startup to
+	rebuild the statistics. Forgetting a file (e.g. because it was deleted) is logged as well and drops the statistics
+	of the file, while its prints still count towards the statistics per printer profile and over all prints. Moving a
+	file is logged too, its statistics then continue under its new path.
+
+	Arguments:
+	    path (str): absolute path of the log file, if ``None`` the history is only kept in memory
+	"""
+
+	def __init__(self, path=None):
+		self._logger = logging.getLogger(__name__)
+		self._path = path
+
+		self._lock = threading.RLock()
+		self._files = dict()
+		self._profiles = dict()
+		self._total = PrintStatistics()
+
+		if path is not None and os.path.exists(path):
+			self._load()
+
+	def log(self, origin, path, timestamp, success, printer_profile, print_time=None):
+		"""
+		Logs a print of the file at ``path`` on ``origin`` with the printer profile ``printer_profile``.
+
+		Returns whether the print was written to the log file. If it couldn't be, it still counts until shutdown.
+		In-memory histories never write anything and hence always return ``False``.
+		"""
+		return self.log_many(origin, path, [dict(timestamp=timestamp, success=success, printerProfile=printer_profile,
+		                                         printTime=print_time)])
+
+	def log_many(self, origin, path, prints):
+		"""
+		Logs several prints of the file at ``path`` on ``origin`` at once, with one single write to the log file, e.g.
+		when importing them from elsewhere. ``prints`` is a list of dicts with the keys ``timestamp``, ``success``,
+		``printerProfile`` and optionally ``printTime``.
+
+		Returns whether the prints were written to the log file, see :func:`log`.
+		"""
+		records = []
+		for p in prints:
+			record = dict(event="print", origin=origin, path=path, timestamp=p.get("timestamp"),
+			              success=p.get("success", False), printerProfile=p.get("printerProfile"))
+			if p.get("printTime") is not None:
+				record["printTime"] = p["printTime"]
+			records.append(record)
+
+		with self._lock:
+			written = self._append(*records)
+			for record in records:
+				self._apply(record)
+		return written
+
+	def forget(self, origin, path, recursive=False):
+		"""
+		Forgets the statistics of the file at ``path`` on ``origin``, or of all files below it if ``recursive`` is set.
+		"""
+		record = dict(event="forget", origin=origin, path=path, recursive=recursive)
+
+		with self._lock:
+			if not any(self._matches(key, origin, path, recursive) for key in self._files):
+				# nothing to forget, no need to log that
+				return
+			self._append(record)
+			self._apply(record)
+
+	def move(self, origin, source, target, recursive=False):
+		"""
+		Moves the statistics of the file at ``source`` on ``origin`` over to ``target``, or of all files below the folder
+		``source`` to the same paths below ``target`` if ``recursive`` is set.
+		"""
+		record = dict(event="move", origin=origin, path=source, target=target, recursive=recursive)
+
+		with self._lock:
+			if not any(self._matches(key, origin, source, recursive) for key in self._files):
+				# nothing to move, no need to log that
+				return
+			self._append(record)
+			self._apply(record)
+
+	def statistics(self, origin=None, path=None, printer_profile=None):
+		"""
+		Returns the :class:`PrintStatistics` of the file at ``path`` on ``origin`` if given, otherwise over all files.
+		If ``printer_profile`` is given, only prints with that printer profile are taken into account.
+
+		Returns ``None`` if nothing has been printed that matches.
+		"""
+		with self._lock:
+			if path is not None:
+				per_file = self._files.get((origin, path))
+				if per_file is None:
+					return None
+				return per_file.get(printer_profile)
+
+			if printer_profile is not None:
+				return self._profiles.get(printer_profile)
+
+			if not self._total.count:
+				return None
+			return self._total
+
+	def files(self, origin=None, printer_profile=None):
+		"""
+		Returns a list of ``(origin, path, statistics)`` tuples for all files that have been printed, optionally only
+		those on ``origin`` and only taking prints with ``printer_profile`` into account.
+		"""
+		with self._lock:
+			result = []
+			for (file_origin, path), per_file in self._files.items():
+				if origin is not None and file_origin != origin:
+					continue
+				statistics = per_file.get(printer_profile)
+				if statistics is None:
+					continue
+				result.append((file_origin, path, statistics))
+			return result
+
+	def printer_profiles(self, origin=None, path=None):
+		"""
+		Returns a dictionary mapping the ids of all printer profiles that have been printed with to their
+		:class:`PrintStatistics`, only taking the prints of the file at ``path`` on ``origin`` into account if given.
+		"""
+		with self._lock:
+			if path is not None:
+				per_file = self._files.get((origin, path), dict())
+				return dict((profile, statistics) for profile, statistics in per_file.items() if profile is not None)
+			return dict(self._profiles)
+
+	##~~ internals
+
+	def _append(self, *records):
+		if self._path is None:
+			return False
+
+		try:
+			with io.open(self._path, "ab") as f:
+				f.write(b"".join(json.dumps(record) + b"\n" for record in records))
+		except (IOError, OSError):
+			self._logger.exception("Could not write to the print history at {}".format(self._path))
+			return False
+		return True
+
+	def _load(self):
+		records = 0
+		with io.open(self._path, "rb") as f:
+			for line in f:
+				if not line.strip():
+					continue
+
+				try:
+					record = json.loads(line)
+				except ValueError:
+					# most likely a line that was only partially written when we went down
+					self._logger.warn("Skipping unreadable line in the print history at {}".format(self._path))
+					continue
+
+				self._apply(record)
+				records += 1
+
+		self._logger.info("Loaded {} entries from the print history at {}".format(records, self._path))
+
+	def _apply(self, record):
+		event = record.get("event")
+		key = (record.get("origin"), record.get("path"))
+
+		if event == "print":
+			success = record.get("success", False)
+			print_time = record.get("printTime")
+			timestamp = record.get("timestamp")
+			printer_profile = record.get("printerProfile")
+
+			per_file = self._files.setdefault(key, dict())
+			statistics = [per_file.setdefault(None, PrintStatistics()), self._total]
+			if printer_profile is not None:
+				statistics.append(per_file.setdefault(printer_profile, PrintStatistics()))
+				statistics.append(self._profiles.setdefault(printer_profile, PrintStatistics()))
+
+			for s in statistics:
+				s.add(success, print_time=print_time, timestamp=timestamp)
+
+		elif event == "forget":
+			recursive = record.get("recursive", False)
+			for other in [other for other in self._files if self._matches(other, key[0], key[1], recursive)]:
+				del self._files[other]
+
+		elif event == "move":
+			recursive = record.get("recursive", False)
+			target = record.get("target")
+			for other in [other for other in self._files if self._matches(other, key[0], key[1], recursive)]:
+				self._files[(other[0], target + other[1][len(key[1]):])] = self._files.pop(other)
+
+	def _matches(self, key, origin, path, recursive):
+		if key == (origin, path):
+			return True
+		if not recursive or key[0] != origin:
+			return False
+		return not path or key[1].startswith(path.rstrip("/") + "/")
@@ -0,0 +1,133 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import bisect
+import collections
+import io
+import struct
+
+
+class Layer(collections.namedtuple("Layer", "offset, line, z, time, filament")):
+	"""
+	A single entry of a :class:`LayerIndex`.
+
+	Arguments:
+	    offset (int): Byte offset in the file at which the layer starts.
+	    line (int): Line number (1-based) at which the layer starts.
+	    z (float): Z height of the layer, in mm.
+	    time (float): Cumulative estimated print time at the start of the layer, in seconds.
+	    filament (float): Cumulative estimated filament usage (over all tools) at the start of the layer, in mm.
+	"""
+
+	def as_dict(self):
+		# values are persisted as single precision floats, round them to get rid of representation artifacts
+		return dict(offset=self.offset, line=self.line, z=round(self.z, 4), time=round(self.time, 2),
+		            filament=round(self.filament, 2))
+
+
+class LayerIndex(object):
+	"""
+	Per-layer index of a machine code file as generated during analysis. A new layer starts with the first change in
+	Z height preceding an extrusion on a different Z height than the current layer.
+
+	The index can be persisted in a compact binary format (a short header followed by one fixed size record per
+	layer), allowing clients to seek directly to a layer by its number or to look up the layer a byte offset in the
+	file belongs to.
+
+	Arguments:
+	    layers (iterable): The layers to index, as :class:`Layer` instances or tuples of the same structure, sorted
+	        by offset.
+	"""
+
+	MAGIC = b"OPLI"
+	VERSION = 1
+
+	_header = struct.Struct("<4sBI")
+	_record = struct.Struct("<QIfff")
+
+	def __init__(self, layers=None):
+		if layers is None:
+			layers = []
+		self._layers = [layer if isinstance(layer, Layer) else Layer(*layer) for layer in layers]
+		self._offsets = [layer.offset for layer in self._layers]
+
+	def __len__(self):
+		return len(self._layers)
+
+	def __iter__(self):
+		return iter(self._layers)
+
+	def __getitem__(self, item):
+		return self._layers[item]
+
+	def layer_for_offset(self, offset):
+		"""
+		Returns the number (0-based) of the layer the provided byte ``offset`` belongs to, or ``None`` if ``offset``
+		lies before the first layer.
+		"""
+		index = bisect.bisect_right(self._offsets, offset) - 1
+		if index < 0:
+			return None
+		return index
+
+	def as_dict_list(self, start=None, end=None):
+		"""
+		Returns the layers ``start`` (inclusive) to ``end`` (exclusive) as a list of dicts, each including the
+		layer's ``number``.
+		"""
+		if start is None:
+			start = 0
+		if end is None:
+			end = len(self._layers)
+
+		result = []
+		for number, layer in enumerate(self._layers[start:end], start):
+			entry = layer.as_dict()
+			entry["number"] = number
+			result.append(entry)
+		return result
+
+	def dump(self, stream):
+		"""
+		Writes the index in its binary format to ``stream``.
+		"""
+		stream.write(self._header.pack(self.MAGIC, self.VERSION, len(self._layers)))
+		for layer in self._layers:
+			stream.write(self._record.pack(*layer))
+
+	def save(self, path):
+		with io.open(path, "wb") as f:
+			self.dump(f)
+
+	@classmethod
+	def load(cls, stream):
+		"""
+		Reads an index in its binary format from ``stream``.
+
+		Raises:
+		    ValueError: The stream does not contain a valid index.
+		"""
+		header = stream.read(cls._header.size)
+		if len(header) != cls._header.size:
+			raise ValueError("Layer index is truncated")
+
+		magic, version, count = cls._header.unpack(header)
+		if magic != cls.MAGIC or version != cls.VERSION:
+			raise ValueError("Not a layer index of version {}".format(cls.VERSION))
+
+		data = stream.read(count * cls._record.size)
+		if len(data) != count * cls._record.size:
+			raise ValueError("Layer index is truncated")
+
+		layers = [cls._record.unpack_from(data, i * cls._record.size) for i in range(count)]
+		return cls(layers)
+
+	@classmethod
+	def from_file(cls, path):
+		with io.open(path, "rb") as f:
+			return cls.load(f)
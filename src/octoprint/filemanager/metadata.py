@@ -0,0 +1,539 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import pylru
+
+
+class MetadataStore(object):
+	"""
+	Persists the metadata of the files managed by a :class:`~octoprint.filemanager.storage.LocalFileStorage`.
+
+	Metadata is handled per folder, as a :class:`dict` mapping the names of the files within the folder to their
+	metadata. Folders are identified by their absolute path on disk.
+	"""
+
+	def get(self, path):
+		"""
+		Retrieves the metadata of all files in the folder ``path``.
+
+		The returned :class:`dict` might be shared with other callers through a cache. Callers that modify it must
+		persist their modifications through :func:`save` right away.
+
+		:param path: absolute path of the folder
+		:return: dict mapping file names to their metadata, empty if there is none
+		"""
+		return dict()
+
+	def save(self, path, metadata, names=None):
+		"""
+		Persists the metadata of folder ``path``.
+
+		:param path: absolute path of the folder
+		:param metadata: dict mapping file names to their metadata, as retrieved through :func:`get` and modified
+		:param names: the names of the entries in ``metadata`` that have been modified, added or removed, ``None`` if
+		              the whole ``metadata`` is to be persisted. Stores may use this to only persist what changed.
+		"""
+		pass
+
+	def save_many(self, folders):
+		"""
+		Persists the metadata of several folders at once.
+
+		:param folders: list of ``(path, metadata, names)`` tuples, see :func:`save`
+		"""
+		for path, metadata, names in folders:
+			self.save(path, metadata, names=names)
+
+	def remove_folder(self, path):
+		"""
+		Removes all metadata of folder ``path`` and its sub folders.
+
+		:param path: absolute path of the folder
+		"""
+		pass
+
+	def find_by_hash(self, hash):
+		"""
+		Looks up the files whose metadata records the given ``hash``.
+
+		:param hash: SHA1 hex digest to look for
+		:return: list of absolute paths of the matching files, or ``None`` if the store cannot look files up by hash
+		"""
+		return None
+
+	@contextlib.contextmanager
+	def batch(self):
+		"""
+		Context manager for making a number of modifications which should be persisted together once all of them
+		have been made. Stores which persist every modification right away ignore this.
+		"""
+		yield
+
+	def flush(self):
+		"""
+		Persists all modifications that have not been persisted yet.
+		"""
+		pass
+
+	def close(self):
+		pass
+
+
+class YamlMetadataStore(MetadataStore):
+	"""
+	Keeps the metadata of each folder in a ``.metadata.yaml`` file within that folder. Every modification rewrites
+	that file. The metadata of the 10 most recently used folders is cached.
+
+	If the ``basefolder`` of the stored folders is provided, files can be looked up by hash through an in-memory
+	index of all hashes, which is built from all ``.metadata.yaml`` files below ``basefolder`` on the first lookup
+	and kept current on every modification from then on.
+	"""
+
+	def __init__(self, basefolder=None, cache_size=10):
+		self._logger = logging.getLogger(__name__)
+		self._lock = threading.Lock()
+		self._cache = pylru.lrucache(cache_size)
+
+		self._basefolder = basefolder
+		self._hash_lock = threading.Lock()
+		self._paths_by_hash = None
+		self._hashes_by_folder = None
+
+	def get(self, path):
+		if path in self._cache:
+			return self._cache[path]
+
+		metadata_path = os.path.join(path, ".metadata.yaml")
+		if os.path.exists(metadata_path):
+			with self._lock:
+				with open(metadata_path) as f:
+					try:
+						import yaml
+						metadata = yaml.safe_load(f)
+					except:
+						self._logger.exception("Error while reading .metadata.yaml from {path}".format(**locals()))
+					else:
+						self._cache[path] = metadata
+						return metadata
+		return dict()
+
+	def save(self, path, metadata, names=None):
+		metadata_path = os.path.join(path, ".metadata.yaml")
+
+		with self._lock:
+			try:
+				import yaml
+				import shutil
+
+				file_obj = tempfile.NamedTemporaryFile(delete=False)
+				try:
+					yaml.safe_dump(metadata, stream=file_obj, default_flow_style=False, indent="  ", allow_unicode=True)
+					file_obj.close()
+					shutil.move(file_obj.name, metadata_path)
+				finally:
+					try:
+						if os.path.exists(file_obj.name):
+							os.remove(file_obj.name)
+					except Exception as e:
+						self._logger.warn("Could not delete file {}: {}".format(file_obj.name, str(e)))
+			except:
+				self._logger.exception("Error while writing .metadata.yaml to {path}".format(**locals()))
+				return
+			else:
+				self._cache[path] = metadata
+
+		self._update_hashes(path, metadata, names)
+
+	def remove_folder(self, path):
+		# the .metadata.yaml files are removed together with their folders, we only need to forget what we cached
+		prefix = path + os.sep
+		with self._lock:
+			for cached in list(self._cache.keys()):
+				if cached == path or cached.startswith(prefix):
+					del self._cache[cached]
+
+		with self._hash_lock:
+			if self._hashes_by_folder is None:
+				return
+			for folder in list(self._hashes_by_folder.keys()):
+				if folder == path or folder.startswith(prefix):
+					for name, hash in self._hashes_by_folder.pop(folder).items():
+						self._forget_hash(hash, os.path.join(folder, name))
+
+	def find_by_hash(self, hash):
+		if self._basefolder is None:
+			return None
+
+		with self._hash_lock:
+			if self._paths_by_hash is None:
+				self._build_hashes()
+			return list(self._paths_by_hash.get(hash, ()))
+
+	def _build_hashes(self):
+		self._paths_by_hash = dict()
+		self._hashes_by_folder = dict()
+		for folder, dirs, files in os.walk(self._basefolder):
+			dirs[:] = [d for d in dirs if not d.startswith(".")]
+			self._index_folder(folder, self.get(folder), None)
+
+	def _update_hashes(self, path, metadata, names):
+		with self._hash_lock:
+			if self._hashes_by_folder is None:
+				# not built yet, it will be built from the persisted metadata once needed
+				return
+			self._index_folder(path, metadata, names)
+
+	def _index_folder(self, path, metadata, names):
+		if not isinstance(metadata, dict):
+			metadata = dict()
+
+		hashes = self._hashes_by_folder.setdefault(path, dict())
+		if names is None:
+			names = set(hashes.keys()) | set(metadata.keys())
+
+		for name in names:
+			hash = hashes.pop(name, None)
+			if hash is not None:
+				self._forget_hash(hash, os.path.join(path, name))
+
+			entry = metadata.get(name)
+			if isinstance(entry, dict) and entry.get("hash"):
+				hashes[name] = entry["hash"]
+				self._paths_by_hash.setdefault(entry["hash"], set()).add(os.path.join(path, name))
+
+		if not hashes:
+			del self._hashes_by_folder[path]
+
+	def _forget_hash(self, hash, path):
+		paths = self._paths_by_hash.get(hash)
+		if paths is None:
+			return
+		paths.discard(path)
+		if not paths:
+			del self._paths_by_hash[hash]
+
+
+class SqliteMetadataStore(MetadataStore):
+	"""
+	Keeps the metadata of all files within ``basefolder`` in a single SQLite database ``.metadata.db`` in write ahead
+	logging mode, with one row per file indexed by folder and name as well as by hash. Modifications only touch the
+	rows of the modified files and are applied transactionally.
+
+	On first use, the metadata of all existing ``.metadata.yaml`` files below ``basefolder`` is migrated into the
+	database. The ``.metadata.yaml`` files are left untouched, so switching back to the :class:`YamlMetadataStore`
+	is possible, albeit losing all modifications made in the meantime.
+	"""
+
+	SCHEMA_VERSION = 1
+
+	def __init__(self, basefolder, cache_size=100):
+		import sqlite3
+
+		self._logger = logging.getLogger(__name__)
+		self._lock = threading.RLock()
+		self._cache = pylru.lrucache(cache_size)
+
+		self._basefolder = basefolder
+		self._database_path = os.path.join(basefolder, ".metadata.db")
+
+		self._connection = sqlite3.connect(self._database_path, check_same_thread=False)
+		with self._lock:
+			self._connection.execute("PRAGMA journal_mode=WAL")
+			self._connection.execute("PRAGMA synchronous=NORMAL")
+			self._initialize_schema()
+
+	def get(self, path):
+		with self._lock:
+			if path in self._cache:
+				return self._cache[path]
+
+			try:
+				rows = self._connection.execute("SELECT name, data FROM metadata WHERE folder = ?", (self._folder(path),)).fetchall()
+			except:
+				self._logger.exception("Error while reading metadata of {path} from {database}".format(path=path, database=self._database_path))
+				return dict()
+
+			metadata = dict()
+			for name, data in rows:
+				try:
+					metadata[name] = json.loads(data)
+				except ValueError:
+					self._logger.warn("Ignoring invalid metadata of {name} in {path}".format(**locals()))
+
+			self._cache[path] = metadata
+			return metadata
+
+	def save(self, path, metadata, names=None):
+		self.save_many([(path, metadata, names)])
+
+	def save_many(self, folders):
+		with self._lock:
+			try:
+				# all in one transaction
+				with self._connection:
+					for path, metadata, names in folders:
+						self._write(path, metadata, names)
+			except:
+				self._logger.exception("Error while writing metadata of {paths} to {database}".format(paths=", ".join(path for path, _, _ in folders), database=self._database_path))
+				# the cached metadata might now be ahead of the database, better re-read it on next access
+				for path, _, _ in folders:
+					if path in self._cache:
+						del self._cache[path]
+			else:
+				for path, metadata, _ in folders:
+					self._cache[path] = metadata
+
+	def remove_folder(self, path):
+		folder = self._folder(path)
+
+		with self._lock:
+			try:
+				with self._connection:
+					self._connection.execute("DELETE FROM metadata WHERE folder = ? OR folder LIKE ? ESCAPE '\\'",
+					                         (folder, self._escape_like(folder) + "/%"))
+			except:
+				self._logger.exception("Error while removing metadata of {path} from {database}".format(path=path, database=self._database_path))
+
+			prefix = path + os.sep
+			for cached in list(self._cache.keys()):
+				if cached == path or cached.startswith(prefix):
+					del self._cache[cached]
+
+	def find_by_hash(self, hash):
+		with self._lock:
+			try:
+				rows = self._connection.execute("SELECT folder, name FROM metadata WHERE hash = ?", (hash,)).fetchall()
+			except:
+				self._logger.exception("Error while looking up files by hash in {database}".format(database=self._database_path))
+				return None
+
+		result = []
+		for folder, name in rows:
+			if folder:
+				result.append(os.path.join(self._basefolder, folder.replace("/", os.sep), name))
+			else:
+				result.append(os.path.join(self._basefolder, name))
+		return result
+
+	def close(self):
+		with self._lock:
+			self._connection.close()
+
+	##~~ helpers
+
+	def _write(self, path, metadata, names):
+		folder = self._folder(path)
+
+		if names is None:
+			self._connection.execute("DELETE FROM metadata WHERE folder = ?", (folder,))
+			names = metadata.keys()
+
+		for name in names:
+			if name in metadata:
+				entry = metadata[name]
+				self._connection.execute("INSERT OR REPLACE INTO metadata (folder, name, hash, data) VALUES (?, ?, ?, ?)",
+				                         (folder, name, self._hash(entry), json.dumps(entry)))
+			else:
+				self._connection.execute("DELETE FROM metadata WHERE folder = ? AND name = ?", (folder, name))
+
+	def _folder(self, path):
+		folder = os.path.relpath(path, self._basefolder)
+		if folder == os.curdir:
+			return ""
+		return folder.replace(os.sep, "/")
+
+	def _hash(self, entry):
+		if isinstance(entry, dict):
+			return entry.get("hash")
+		return None
+
+	def _escape_like(self, value):
+		return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+	def _initialize_schema(self):
+		with self._connection:
+			self._connection.execute("CREATE TABLE IF NOT EXISTS metadata ("
+			                         "folder TEXT NOT NULL, "
+			                         "name TEXT NOT NULL, "
+			                         "hash TEXT, "
+			                         "data TEXT NOT NULL, "
+			                         "PRIMARY KEY (folder, name))")
+			self._connection.execute("CREATE INDEX IF NOT EXISTS metadata_hash ON metadata (hash)")
+			self._connection.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+			row = self._connection.execute("SELECT value FROM settings WHERE key = 'schema'").fetchone()
+			if row is None:
+				self._migrate_from_yaml()
+				self._connection.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('schema', ?)", (str(self.SCHEMA_VERSION),))
+
+	def _migrate_from_yaml(self):
+		import yaml
+
+		self._logger.info("Migrating file metadata below {} from .metadata.yaml files to {}...".format(self._basefolder, self._database_path))
+
+		folders = 0
+		entries = 0
+		for path, _, files in os.walk(self._basefolder):
+			if not ".metadata.yaml" in files:
+				continue
+
+			try:
+				with open(os.path.join(path, ".metadata.yaml")) as f:
+					metadata = yaml.safe_load(f)
+			except:
+				self._logger.exception("Error while reading .metadata.yaml from {path}, skipping it".format(**locals()))
+				continue
+
+			if not isinstance(metadata, dict):
+				continue
+
+			folder = self._folder(path)
+			for name, entry in metadata.items():
+				self._connection.execute("INSERT OR REPLACE INTO metadata (folder, name, hash, data) VALUES (?, ?, ?, ?)",
+				                         (folder, name, self._hash(entry), json.dumps(entry)))
+				entries += 1
+			folders += 1
+
+		self._logger.info("... migrated metadata of {} files in {} folders".format(entries, folders))
+
+
+class WriteBehindMetadataStore(MetadataStore):
+	"""
+	Wraps another :class:`MetadataStore` and delays persisting modifications by ``delay`` seconds, so that the
+	modifications made to a folder within that window (e.g. adding a file, linking it and storing its analysis result)
+	are merged into a single write. All pending folders are then persisted at once through
+	:func:`MetadataStore.save_many`.
+
+	Reads always return the latest in-memory state, including pending modifications. Pending modifications are lost if
+	the process dies before they were flushed, so :func:`flush` or :func:`close` should be called on shutdown.
+
+	While a :func:`batch` is open, modifications are held back regardless of ``delay`` and persisted at once when
+	the (outermost) batch is closed.
+	"""
+
+	def __init__(self, store, delay):
+		self._logger = logging.getLogger(__name__)
+		self._store = store
+		self._delay = delay
+
+		self._lock = threading.RLock()
+		self._pending = collections.OrderedDict()
+		self._timer = None
+		self._batches = 0
+
+	def get(self, path):
+		with self._lock:
+			if path in self._pending:
+				return self._pending[path][0]
+		return self._store.get(path)
+
+	def save(self, path, metadata, names=None):
+		with self._lock:
+			if path in self._pending:
+				_, pending_names = self._pending[path]
+				if pending_names is None or names is None:
+					names = None
+				else:
+					names = pending_names | set(names)
+			elif names is not None:
+				names = set(names)
+
+			self._pending[path] = (metadata, names)
+
+			if self._timer is None:
+				self._timer = threading.Timer(self._delay, self._on_timer)
+				self._timer.daemon = True
+				self._timer.start()
+
+	def remove_folder(self, path):
+		with self._lock:
+			prefix = path + os.sep
+			for pending in list(self._pending.keys()):
+				if pending == path or pending.startswith(prefix):
+					del self._pending[pending]
+			self._store.remove_folder(path)
+
+	def find_by_hash(self, hash):
+		# the underlying store has to know about pending modifications to find them
+		self.flush()
+		return self._store.find_by_hash(hash)
+
+	@contextlib.contextmanager
+	def batch(self):
+		with self._lock:
+			self._batches += 1
+		try:
+			yield
+		finally:
+			with self._lock:
+				self._batches -= 1
+				done = self._batches == 0
+			if done:
+				self.flush()
+
+	def flush(self):
+		with self._lock:
+			if self._timer is not None:
+				self._timer.cancel()
+				self._timer = None
+
+			if not self._pending:
+				return
+
+			folders = [(path, metadata, names) for path, (metadata, names) in self._pending.items()]
+			self._pending.clear()
+			self._store.save_many(folders)
+
+	def close(self):
+		self.flush()
+		self._store.close()
+
+	def _on_timer(self):
+		with self._lock:
+			if self._batches:
+				# gets flushed once the batch is done
+				self._timer = None
+				return
+
+		try:
+			self.flush()
+		except:
+			self._logger.exception("Error while flushing file metadata")
+
+
+def create_metadata_store(basefolder, backend=None, flush_delay=None):
+	"""
+	Creates the :class:`MetadataStore` for ``backend`` (``yaml`` or ``sqlite``), falling back to the
+	:class:`YamlMetadataStore` if the ``sqlite`` backend is not available on this system. If ``flush_delay`` is
+	set, the store is wrapped into a :class:`WriteBehindMetadataStore` with that delay.
+	"""
+	store = None
+	if backend == "sqlite":
+		try:
+			store = SqliteMetadataStore(basefolder)
+		except ImportError:
+			logging.getLogger(__name__).warn("SQLite is not available, falling back to .metadata.yaml files for storing file metadata")
+		except:
+			logging.getLogger(__name__).exception("Could not open SQLite metadata database, falling back to .metadata.yaml files for storing file metadata")
+	elif backend not in (None, "yaml"):
+		logging.getLogger(__name__).warn("Unknown metadata backend {}, falling back to .metadata.yaml files for storing file metadata".format(backend))
+
+	if store is None:
+		store = YamlMetadataStore(basefolder)
+
+	if flush_delay:
+		store = WriteBehindMetadataStore(store, flush_delay)
+	return store
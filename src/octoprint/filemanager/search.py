@@ -0,0 +1,293 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import bisect
+import re
+import threading
+
+
+RANGE_FIELDS = ("size", "date", "estimatedPrintTime", "filamentLength", "lastPrintDate", "lastPrintTime", "successes", "failures")
+"""
+Numeric fields which can be queried by range. Additionally the filament length of every single tool is available as
+``filamentLength.toolX``.
+"""
+
+VALUE_FIELDS = ("origin", "type", "folder", "hash", "printerProfile", "lastPrintSuccess", "lastPrintProfile")
+"""
+Fields which can be queried by value. ``printerProfile`` holds the ids of all printer profiles the file is linked to
+and was printed with.
+"""
+
+_token_pattern = re.compile("[^\W_]+", re.UNICODE)
+
+
+def tokenize(text):
+	"""
+	Splits ``text`` into lower case alphanumeric tokens, e.g. ``"Whistle_v2.gcode"`` into
+	``["whistle", "v2", "gcode"]``.
+	"""
+	return _token_pattern.findall(text.lower())
+
+
+def is_range_field(field):
+	return field in RANGE_FIELDS or field.startswith("filamentLength.")
+
+
+def is_value_field(field):
+	return field in VALUE_FIELDS
+
+
+def extract_fields(origin, path, entry):
+	"""
+	Extracts the searchable fields from the ``entry`` (as returned by :func:`~octoprint.filemanager.FileManager.get_file`,
+	including the ``prints`` summary from the print history) of the file at ``path`` on ``origin``.
+
+	Returns a dictionary mapping field names to values, fields listed in :data:`VALUE_FIELDS` map to sets of values.
+	"""
+	fields = dict()
+
+	folder = path.rsplit("/", 1)[0] if "/" in path else ""
+	fields["origin"] = {origin}
+	fields["folder"] = {folder}
+	if "type" in entry:
+		fields["type"] = {entry["type"]}
+	if entry.get("hash"):
+		fields["hash"] = {entry["hash"]}
+
+	for key in ("size", "date"):
+		if isinstance(entry.get(key), (int, long, float)):
+			fields[key] = entry[key]
+
+	profiles = set()
+	for link in entry.get("links", []):
+		if isinstance(link, dict) and link.get("rel") == "printerprofile" and "id" in link:
+			profiles.add(link["id"])
+
+	analysis = entry.get("analysis")
+	if isinstance(analysis, dict):
+		if isinstance(analysis.get("estimatedPrintTime"), (int, long, float)):
+			fields["estimatedPrintTime"] = analysis["estimatedPrintTime"]
+
+		filament = analysis.get("filament")
+		if isinstance(filament, dict):
+			total = 0.0
+			for tool, data in filament.items():
+				if not isinstance(data, dict) or not isinstance(data.get("length"), (int, long, float)):
+					continue
+				fields["filamentLength." + tool] = data["length"]
+				total += data["length"]
+			fields["filamentLength"] = total
+
+	prints = entry.get("prints")
+	if isinstance(prints, dict):
+		fields["successes"] = prints.get("success", 0)
+		fields["failures"] = prints.get("failure", 0)
+		profiles.update(prints.get("printerProfiles", []))
+
+		last = prints.get("last")
+		if isinstance(last, dict):
+			fields["lastPrintSuccess"] = {bool(last.get("success"))}
+			if "date" in last:
+				fields["lastPrintDate"] = last["date"]
+			if "printTime" in last:
+				fields["lastPrintTime"] = last["printTime"]
+			if "printerProfile" in last:
+				fields["lastPrintProfile"] = {last["printerProfile"]}
+
+	if profiles:
+		fields["printerProfile"] = profiles
+
+	return fields
+
+
+class _RangeIndex(object):
+	"""
+	Keys sorted by value, for looking up all keys with values within a range in ``O(log n + k)``.
+	"""
+
+	def __init__(self):
+		self._values = []
+		self._keys = []
+
+	def add(self, value, key):
+		index = bisect.bisect_right(self._values, value)
+		self._values.insert(index, value)
+		self._keys.insert(index, key)
+
+	def remove(self, value, key):
+		start = bisect.bisect_left(self._values, value)
+		end = bisect.bisect_right(self._values, value)
+		for index in range(start, end):
+			if self._keys[index] == key:
+				del self._values[index]
+				del self._keys[index]
+				return
+
+	def lookup(self, low=None, high=None):
+		start = 0 if low is None else bisect.bisect_left(self._values, low)
+		end = len(self._values) if high is None else bisect.bisect_right(self._values, high)
+		return set(self._keys[start:end])
+
+
+class FileSearchIndex(object):
+	"""
+	In-memory search index over the files of all storages, keyed by ``(origin, path)``.
+
+	File names (including the names of the folders they are contained in) are indexed by token, numeric fields
+	(:data:`RANGE_FIELDS`) in sorted order for range queries and all other fields (:data:`VALUE_FIELDS`) by value.
+	All indices are updated incrementally through :func:`update` and :func:`remove`.
+	"""
+
+	def __init__(self):
+		self._lock = threading.RLock()
+		self.clear()
+
+	def clear(self, origin=None):
+		"""
+		Removes all files of ``origin`` from the index, or all files if ``origin`` is not set.
+		"""
+		with self._lock:
+			if origin is None:
+				self._documents = dict()
+				self._tokens = dict()
+				self._sorted_tokens = []
+				self._ranges = dict()
+				self._values = dict()
+				return
+
+			for key in [key for key in self._documents if key[0] == origin]:
+				self._remove(key)
+
+	def __len__(self):
+		with self._lock:
+			return len(self._documents)
+
+	def update(self, origin, path, entry):
+		"""
+		Adds the file at ``path`` on ``origin`` with its storage ``entry`` to the index, replacing any earlier
+		version of it.
+		"""
+		key = (origin, path)
+		fields = extract_fields(origin, path, entry)
+		tokens = set(tokenize(path))
+
+		with self._lock:
+			self._remove(key)
+			self._documents[key] = (tokens, fields)
+
+			for token in tokens:
+				if not token in self._tokens:
+					self._tokens[token] = set()
+					bisect.insort(self._sorted_tokens, token)
+				self._tokens[token].add(key)
+
+			for field, value in fields.items():
+				if is_value_field(field):
+					values = self._values.setdefault(field, dict())
+					for v in value:
+						values.setdefault(v, set()).add(key)
+				else:
+					self._ranges.setdefault(field, _RangeIndex()).add(value, key)
+
+	def remove(self, origin, path, recursive=False):
+		"""
+		Removes the file at ``path`` on ``origin`` from the index. If ``recursive`` is set, ``path`` is treated as a
+		folder and all files below it are removed instead.
+		"""
+		with self._lock:
+			if recursive:
+				prefix = path.rstrip("/") + "/"
+				for key in [key for key in self._documents if key[0] == origin and key[1].startswith(prefix)]:
+					self._remove(key)
+			else:
+				self._remove((origin, path))
+
+	def values(self, field):
+		"""
+		Returns the set of all values of the value field ``field`` over all files in the index.
+		"""
+		with self._lock:
+			return set(self._values.get(field, dict()).keys())
+
+	def search(self, text=None, ranges=None, values=None):
+		"""
+		Returns the set of ``(origin, path)`` keys of all files matching all given criteria.
+
+		Arguments:
+		    text (str): every token of ``text`` has to be a prefix of one of the tokens of the file's path
+		    ranges (dict): maps range fields to ``(low, high)`` tuples, either bound may be ``None``
+		    values (dict): maps value fields to the value the field has to contain
+
+		Raises:
+		    ValueError: a field is unknown
+		"""
+		with self._lock:
+			result = None
+
+			def intersect(result, keys):
+				if result is None:
+					return set(keys)
+				return result & keys
+
+			if text:
+				for token in tokenize(text):
+					result = intersect(result, self._prefix_lookup(token))
+					if not result:
+						return set()
+
+			if ranges:
+				for field, (low, high) in ranges.items():
+					if not is_range_field(field):
+						raise ValueError("{} cannot be queried by range".format(field))
+					if not field in self._ranges:
+						return set()
+					result = intersect(result, self._ranges[field].lookup(low=low, high=high))
+					if not result:
+						return set()
+
+			if values:
+				for field, value in values.items():
+					if not is_value_field(field):
+						raise ValueError("{} cannot be queried by value".format(field))
+					result = intersect(result, self._values.get(field, dict()).get(value, set()))
+					if not result:
+						return set()
+
+			if result is None:
+				return set(self._documents.keys())
+			return result
+
+	def _prefix_lookup(self, prefix):
+		result = set()
+		index = bisect.bisect_left(self._sorted_tokens, prefix)
+		while index < len(self._sorted_tokens) and self._sorted_tokens[index].startswith(prefix):
+			result |= self._tokens[self._sorted_tokens[index]]
+			index += 1
+		return result
+
+	def _remove(self, key):
+		if not key in self._documents:
+			return
+
+		tokens, fields = self._documents.pop(key)
+		for token in tokens:
+			keys = self._tokens[token]
+			keys.discard(key)
+			if not keys:
+				del self._tokens[token]
+				del self._sorted_tokens[bisect.bisect_left(self._sorted_tokens, token)]
+
+		for field, value in fields.items():
+			if is_value_field(field):
+				values = self._values[field]
+				for v in value:
+					values[v].discard(key)
+					if not values[v]:
+						del values[v]
+			else:
+				self._ranges[field].remove(value, key)
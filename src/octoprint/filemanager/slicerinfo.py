@@ -0,0 +1,238 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import logging
+import math
+import re
+
+from octoprint.util.compression import open_file, uncompressed_size
+
+
+_logger = logging.getLogger(__name__)
+
+
+def read_slicer_info(path, read_size=64 * 1024):
+	"""
+	Extracts the estimates slicers like Cura, Slic3r or Simplify3D write into the header or footer comments of the
+	GCODE file at ``path``, only reading the first and last ``read_size`` bytes of the file.
+
+	Returns:
+	    dict: ``None`` if no known slicer signature could be found, otherwise a :class:`dict` structured like the
+	        result of the :class:`~octoprint.filemanager.analysis.GcodeAnalysisQueue`, containing as many of the keys
+	        ``estimatedPrintTime``, ``filament`` and ``layerCount`` as the slicer provided, plus a key ``slicer``
+	        holding the detected slicer's name.
+	"""
+	try:
+		lines = _read_head_and_tail(path, read_size)
+	except (IOError, OSError):
+		_logger.exception("Could not read header and footer of {}".format(path))
+		return None
+
+	for parser in _parsers:
+		if not parser.detect(lines):
+			continue
+
+		try:
+			values = parser.parse(lines)
+		except:
+			_logger.exception("Error while parsing {} slicer info of {}".format(parser.name, path))
+			return None
+
+		result = _to_result(values)
+		if not result:
+			return None
+		result["slicer"] = parser.name
+		return result
+
+	return None
+
+
+def _read_head_and_tail(path, read_size):
+	# for compressed files seeking to the tail means decompressing everything up to it, but that's still cheaper than
+	# reading the whole file line by line
+	size = uncompressed_size(path)
+	with open_file(path) as f:
+		if size <= 2 * read_size:
+			data = f.read()
+		else:
+			head = f.read(read_size)
+			f.seek(size - read_size)
+			tail = f.read(read_size)
+
+			# the first and last lines will most likely have been cut off
+			head = head[:head.rfind(b"\n") + 1]
+			tail = tail[tail.find(b"\n") + 1:]
+			data = head + tail
+
+	return [line.strip() for line in data.decode("utf-8", "replace").split(u"\n") if line.startswith(u";")]
+
+
+def _to_result(values):
+	result = dict()
+
+	if values.get("time"):
+		result["estimatedPrintTime"] = values["time"]
+
+	diameter = values.get("diameter")
+	lengths = values.get("lengths") or []
+	volumes = values.get("volumes") or []
+	if lengths or volumes:
+		result["filament"] = dict()
+		for tool in range(max(len(lengths), len(volumes))):
+			length = lengths[tool] if tool < len(lengths) else None
+			volume = volumes[tool] if tool < len(volumes) else None
+
+			if diameter:
+				radius = diameter / 2.0
+				if length is None and volume is not None:
+					length = volume * 1000.0 / (math.pi * radius * radius)
+				elif volume is None and length is not None:
+					volume = length * math.pi * radius * radius / 1000.0
+
+			usage = dict()
+			if length is not None:
+				usage["length"] = length
+			if volume is not None:
+				usage["volume"] = volume
+			if usage:
+				result["filament"]["tool%d" % tool] = usage
+
+	if values.get("layers"):
+		result["layerCount"] = values["layers"]
+
+	return result
+
+
+def _parse_duration(value):
+	"""
+	Parses durations like ``1d 2h 3m 4s`` or ``2 hours 3 minutes`` to seconds.
+	"""
+	units = dict(d=86400, h=3600, m=60, s=1)
+	seconds = 0
+	found = False
+	for amount, unit in re.findall(r"(\d+(?:\.\d+)?)\s*([dhms])", value.lower()):
+		seconds += float(amount) * units[unit]
+		found = True
+	return seconds if found else None
+
+
+def _floats(value):
+	result = []
+	for part in value.split(","):
+		match = re.search(r"[-+]?\d+(?:\.\d+)?", part)
+		if match:
+			result.append(float(match.group(0)))
+	return result
+
+
+class _SlicerParser(object):
+	name = None
+	signature = None
+
+	def detect(self, lines):
+		return any(self.signature.search(line) for line in lines)
+
+	def parse(self, lines):
+		values = dict()
+		for line in lines:
+			try:
+				self._parse_line(line, values)
+			except ValueError:
+				# e.g. unreplaced placeholders in start or end GCODE, just skip those
+				pass
+		return self._finalize(values)
+
+	def _parse_line(self, line, values):
+		raise NotImplementedError()
+
+	def _finalize(self, values):
+		return values
+
+
+class _CuraParser(_SlicerParser):
+	name = "cura"
+	signature = re.compile(r"^;(Generated with Cura|FLAVOR:|TIME:\d|CURA_PROFILE_STRING:)")
+
+	def _parse_line(self, line, values):
+		if line.startswith(u";TIME:"):
+			values["time"] = float(line[len(u";TIME:"):])
+		elif line.startswith(u";Filament used:"):
+			# meters per extruder
+			lengths = [length * 1000.0 for length in _floats(line[len(u";Filament used:"):])]
+			if lengths:
+				values["lengths"] = lengths
+		elif line.startswith(u";MATERIAL:") or line.startswith(u";MATERIAL2:"):
+			# legacy CuraEngine, filament in mm
+			tool = 0 if line.startswith(u";MATERIAL:") else 1
+			length = float(line.split(u":", 1)[1])
+			lengths = values.setdefault("lengths", [])
+			while len(lengths) <= tool:
+				lengths.append(0.0)
+			lengths[tool] = length
+		elif line.startswith(u";LAYER_COUNT:") or line.startswith(u";Layer count:"):
+			values["layers"] = int(line.split(u":", 1)[1])
+
+
+class _Slic3rParser(_SlicerParser):
+	name = "slic3r"
+	signature = re.compile(r"^; generated by (Slic3r|PrusaSlicer|SuperSlicer)", re.IGNORECASE)
+
+	def _parse_line(self, line, values):
+		if not u"=" in line:
+			return
+		key, value = [part.strip() for part in line[1:].split(u"=", 1)]
+
+		if key.startswith(u"estimated printing time"):
+			# prefer normal mode over silent mode
+			if not "time" in values or u"normal" in key:
+				values["time"] = _parse_duration(value)
+		elif key == u"filament used":
+			# one line per extruder, e.g. "1234.5mm (11.1cm3)"
+			match = re.match(r"([\d.]+)mm(?:\s*\(([\d.]+)cm3\))?", value)
+			if match:
+				values.setdefault("lengths", []).append(float(match.group(1)))
+				if match.group(2):
+					values.setdefault("volumes", []).append(float(match.group(2)))
+		elif key == u"filament used [mm]":
+			values["lengths"] = _floats(value)
+		elif key == u"filament used [cm3]":
+			values["volumes"] = _floats(value)
+		elif key == u"total layers count":
+			values["layers"] = int(value)
+		elif key == u"filament_diameter":
+			diameters = _floats(value)
+			if diameters:
+				values["diameter"] = diameters[0]
+
+
+class _Simplify3DParser(_SlicerParser):
+	name = "simplify3d"
+	signature = re.compile(r"^; G-Code generated by Simplify3D")
+
+	def _parse_line(self, line, values):
+		content = line[1:].strip()
+		if content.startswith(u"Build time:"):
+			duration = content[len(u"Build time:"):].replace(u"hours", u"h").replace(u"hour", u"h").replace(u"minutes", u"m").replace(u"minute", u"m")
+			values["time"] = _parse_duration(duration)
+		elif content.startswith(u"Filament length:"):
+			values["lengths"] = _floats(content[len(u"Filament length:"):].split(u"(")[0])
+		elif content.startswith(u"Plastic volume:"):
+			# mm^3
+			values["volumes"] = [volume / 1000.0 for volume in _floats(content[len(u"Plastic volume:"):].split(u"(")[0])]
+		elif content.startswith(u"filamentDiameters,"):
+			diameters = _floats(content[len(u"filamentDiameters,"):].replace(u"|", u","))
+			if diameters:
+				values["diameter"] = diameters[0]
+		else:
+			# "; layer 123, Z = 24.6", the last one in the footer tells us the layer count
+			match = re.match(r"layer (\d+), Z = ", content)
+			if match:
+				values["layers"] = max(values.get("layers", 0), int(match.group(1)))
+
+
+_parsers = [_CuraParser(), _Slic3rParser(), _Simplify3DParser()]
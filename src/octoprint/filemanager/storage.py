@@ -6,13 +6,23 @@ __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
 
+import contextlib
+import copy
 import logging
 import os
-import pylru
 import tempfile
 
 import octoprint.filemanager
 
+from octoprint.filemanager.fileindex import FileTreeIndex
+from octoprint.filemanager.hashing import BackgroundHasher, HashCache
+from octoprint.filemanager.layers import LayerIndex
+from octoprint.filemanager.metadata import create_metadata_store
+from octoprint.filemanager.timeindex import TimeIndex
+from octoprint.filemanager.util import IngestFileWrapper
+from octoprint.util import deprecated
+from octoprint.util.compression import compress_file, is_compressed, uncompressed_size
+
 class StorageInterface(object):
 	"""
 	Interface of storage adapters for OctoPrint.
@@ -33,6 +43,18 @@ class StorageInterface(object):
 		return
 		yield
 
+	def analysis_backlog_for_path(self, path=None):
+		"""
+		Like :attr:`analysis_backlog`, but only for the files within the folder ``path``, or the file ``path`` itself.
+
+		:param string path: path of the folder to restrict the backlog to, the whole storage if not set
+		:return: an iterator yielding all un-analysed files within ``path``, or ``path`` itself if it is an
+		         un-analysed file
+		"""
+		# empty generator pattern, yield is intentionally unreachable
+		return
+		yield
+
 	def file_exists(self, path):
 		"""
 		Returns whether the file indicated by ``path`` exists or not.
@@ -92,6 +114,16 @@ class StorageInterface(object):
 		"""
 		raise NotImplementedError()
 
+	def get_file(self, path):
+		"""
+		Retrieves the entry for the file ``path`` in the same format as used for files by :func:`list_files`, without
+		listing the folder the file is contained in.
+
+		:param string path: path of the file to retrieve
+		:return: the entry data of the file, or ``None`` if there is no such file
+		"""
+		raise NotImplementedError()
+
 	def add_folder(self, path, ignore_existing=True):
 		"""
 		Adds a folder as ``path``. The ``path`` will be sanitized.
@@ -136,6 +168,51 @@ class StorageInterface(object):
 		"""
 		raise NotImplementedError()
 
+	def copy_file(self, source, destination):
+		"""
+		Copies the file at ``source`` to ``destination``, including its metadata apart from any links to other files.
+
+		:param string source:      path of the file to copy
+		:param string destination: path of the copy, including its name, will be sanitized. The folder to copy to must
+		                           exist, the file itself must not.
+		:return: the sanitized path of the copy to be used for future references to it
+		"""
+		raise NotImplementedError()
+
+	def move_file(self, source, destination):
+		"""
+		Moves (or renames) the file at ``source`` to ``destination``, including its metadata. Links to other files are
+		only kept if the file stays in its folder.
+
+		:param string source:      path of the file to move
+		:param string destination: new path of the file, including its name, will be sanitized. The folder to move to
+		                           must exist, the file itself must not.
+		:return: the sanitized new path of the file to be used for future references to it
+		"""
+		raise NotImplementedError()
+
+	def copy_folder(self, source, destination):
+		"""
+		Copies the folder at ``source`` including all its contents and their metadata to ``destination``.
+
+		:param string source:      path of the folder to copy
+		:param string destination: path of the copy, will be sanitized. Its parent folder must exist, the folder itself
+		                           must not.
+		:return: the sanitized path of the copy to be used for future references to it
+		"""
+		raise NotImplementedError()
+
+	def move_folder(self, source, destination):
+		"""
+		Moves (or renames) the folder at ``source`` including all its contents and their metadata to ``destination``.
+
+		:param string source:      path of the folder to move
+		:param string destination: new path of the folder, will be sanitized. Its parent folder must exist, the folder
+		                           itself must not.
+		:return: the sanitized new path of the folder to be used for future references to it
+		"""
+		raise NotImplementedError()
+
 	def get_metadata(self, path):
 		"""
 		Retrieves the metadata for the file ``path``.
@@ -200,6 +277,54 @@ class StorageInterface(object):
 		"""
 		raise NotImplementedError()
 
+	def get_layer_index(self, path):
+		"""
+		Retrieves the layer index for the file at ``path`` as created during its analysis.
+
+		Storage adapters not supporting layer indices may leave this unimplemented, in which case ``None`` will be
+		returned.
+
+		:param path: the virtual path to the file for which to retrieve the layer index
+		:return: the :class:`~octoprint.filemanager.layers.LayerIndex` of the file or ``None`` if there is none
+		"""
+		return None
+
+	def set_layer_index(self, path, layer_index):
+		"""
+		Persists the ``layer_index`` for the file at ``path``, replacing any existing one.
+
+		Storage adapters not supporting layer indices may leave this unimplemented, in which case the index will just
+		be dropped.
+
+		:param path: the virtual path to the file for which to store the layer index
+		:param layer_index: the :class:`~octoprint.filemanager.layers.LayerIndex` to store
+		"""
+		pass
+
+	def get_time_index(self, path):
+		"""
+		Retrieves the time index for the file at ``path`` as created during its analysis.
+
+		Storage adapters not supporting time indices may leave this unimplemented, in which case ``None`` will be
+		returned.
+
+		:param path: the virtual path to the file for which to retrieve the time index
+		:return: the :class:`~octoprint.filemanager.timeindex.TimeIndex` of the file or ``None`` if there is none
+		"""
+		return None
+
+	def set_time_index(self, path, time_index):
+		"""
+		Persists the ``time_index`` for the file at ``path``, replacing any existing one.
+
+		Storage adapters not supporting time indices may leave this unimplemented, in which case the index will just
+		be dropped.
+
+		:param path: the virtual path to the file for which to store the time index
+		:param time_index: the :class:`~octoprint.filemanager.timeindex.TimeIndex` to store
+		"""
+		pass
+
 	def remove_additional_metadata(self, path, key):
 		"""
 		Removes additional metadata under ``key`` for ``name`` on ``path``
@@ -209,6 +334,60 @@ class StorageInterface(object):
 		"""
 		raise NotImplementedError()
 
+	def flush(self):
+		"""
+		Persists all pending metadata modifications. Called on shutdown.
+		"""
+		pass
+
+	@contextlib.contextmanager
+	def batch(self):
+		"""
+		Context manager for adding or modifying a number of files at once, the storage may then persist the
+		metadata modifications of all of them together when the batch is done.
+		"""
+		yield
+
+	def rescan(self):
+		"""
+		Makes sure the storage forgets anything it might have cached about which files and folders exist and
+		looks at the actual storage again.
+		"""
+		pass
+
+	def register_metadata_callback(self, callback):
+		"""
+		Registers ``callback`` to be called as ``callback(path, key)`` whenever the storage updated the metadata
+		``key`` of the file at ``path`` on its own, e.g. after computing a hash in the background.
+		"""
+		pass
+
+	def unregister_metadata_callback(self, callback):
+		"""
+		Unregisters a ``callback`` registered through :func:`register_metadata_callback`.
+		"""
+		pass
+
+	def set_print_history(self, print_history, origin):
+		"""
+		Sets the :class:`~octoprint.filemanager.history.PrintHistory` to which prints of the storage's files are
+		logged as ``origin``, for storages still offering to record prints themselves.
+		"""
+		pass
+
+	def register_change_callback(self, callback):
+		"""
+		Registers ``callback`` to be called as ``callback(path)`` whenever the file or folder at ``path`` was added,
+		modified or removed by something other than the storage itself, e.g. by another process.
+		"""
+		pass
+
+	def unregister_change_callback(self, callback):
+		"""
+		Unregisters a ``callback`` registered through :func:`register_change_callback`.
+		"""
+		pass
+
 	def sanitize(self, path):
 		"""
 		Sanitizes the given ``path``, stripping it of all invalid characters. The ``path`` may consist of both
@@ -282,19 +461,42 @@ class LocalFileStorage(StorageInterface):
 	"""
 	The ``LocalFileStorage`` is a storage implementation which holds all files, folders and metadata on disk.
 
-	Metadata is managed inside ``.metadata.yaml`` files in the respective folders, indexed by the sanitized filenames
-	stored within the folder. Metadata access is managed through an LRU cache to minimize access overhead.
+	Metadata is by default managed inside ``.metadata.yaml`` files in the respective folders, indexed by the sanitized
+	filenames stored within the folder. Metadata access is managed through an LRU cache to minimize access overhead.
+	Alternatively, the metadata of all folders can be kept in a single SQLite database, see
+	:class:`~octoprint.filemanager.metadata.SqliteMetadataStore`. Layer and time indices are stored in binary
+	``.<filename>.layers`` and ``.<filename>.times`` files in the folder of the file.
 
 	This storage type implements :func:`path_on_disk`.
 	"""
 
-	def __init__(self, basefolder, create=False):
+	def __init__(self, basefolder, create=False, metadata_backend=None, metadata_flush_delay=None, hash_workers=0, hash_cache_size=1000,
+	             index=False, index_max_entries=100000, index_watch=True, index_polling=False, compress=False, compression_level=6,
+	             deduplicate=False):
 		"""
 		Initializes a ``LocalFileStorage`` instance under the given ``basefolder``, creating the necessary folder
 		if necessary and ``create`` is set to ``True``.
 
-		:param string basefolder: the path to the folder under which to create the storage
-		:param bool create:       ``True`` if the folder should be created if it doesn't exist yet, ``False`` otherwise
+		:param string basefolder:       the path to the folder under which to create the storage
+		:param bool create:             ``True`` if the folder should be created if it doesn't exist yet, ``False`` otherwise
+		:param string metadata_backend: where to store the file metadata, ``yaml`` (the default) for ``.metadata.yaml``
+		                                files per folder or ``sqlite`` for a single SQLite database
+		:param float metadata_flush_delay: if set, metadata modifications are collected for this many seconds and then
+		                                written at once, see :class:`~octoprint.filemanager.metadata.WriteBehindMetadataStore`
+		:param int hash_workers:        if set, files found without metadata while listing are listed right away and
+		                                hashed by this many background threads, otherwise they are hashed on the spot
+		:param int hash_cache_size:     number of file hashes to cache by inode, size and modification time
+		:param bool index:              whether to keep an in-memory index of all files and folders to serve listings
+		                                from, see :class:`~octoprint.filemanager.fileindex.FileTreeIndex`
+		:param int index_max_entries:   maximum number of files and folders to keep in the index
+		:param bool index_watch:        whether to watch the folder for modifications by other processes to keep the
+		                                index current
+		:param bool index_polling:      whether to poll for such modifications instead of relying on the OS to report them
+		:param bool compress:           whether to store machine code files gzip compressed, see
+		                                :mod:`octoprint.util.compression`
+		:param int compression_level:   gzip compression level to use, from 1 (fastest) to 9 (smallest)
+		:param bool deduplicate:        whether to store files with identical contents only once, as hardlinks to the
+		                                same data, while keeping separate metadata per path
 		"""
 		self._logger = logging.getLogger(__name__)
 
@@ -304,10 +506,26 @@ class LocalFileStorage(StorageInterface):
 		if not os.path.exists(self.basefolder) or not os.path.isdir(self.basefolder):
 			raise RuntimeError("{basefolder} is not a valid directory".format(**locals()))
 
-		import threading
-		self._metadata_lock = threading.Lock()
+		self._metadata_store = create_metadata_store(self.basefolder, backend=metadata_backend, flush_delay=metadata_flush_delay)
+		self._metadata_callbacks = []
+		self._change_callbacks = []
+
+		self._index = None
+		if index:
+			self._index = FileTreeIndex(self.basefolder, max_entries=index_max_entries, watch=index_watch, polling=index_polling)
+			self._index.register_change_callback(self._on_index_change)
+
+		self._hash_cache = HashCache(size=hash_cache_size)
+		self._background_hasher = None
+		if hash_workers:
+			self._background_hasher = BackgroundHasher(self._hash_cache, self._on_background_hash, workers=hash_workers)
 
-		self._metadata_cache = pylru.lrucache(10)
+		self._compress = compress
+		self._compression_level = compression_level
+		self._deduplicate = deduplicate
+
+		self._print_history = None
+		self._print_history_origin = None
 
 		self._old_metadata = None
 		self._initialize_metadata()
@@ -349,6 +567,20 @@ class LocalFileStorage(StorageInterface):
 		for entry in self._analysis_backlog_generator():
 			yield entry
 
+	def analysis_backlog_for_path(self, path=None):
+		if not path:
+			for entry in self._analysis_backlog_generator():
+				yield entry
+			return
+
+		path, name = self.sanitize(path)
+		absolute_path = os.path.join(path, name)
+		if os.path.isdir(absolute_path):
+			for entry, entry_path, printer_profile_id in self._analysis_backlog_generator(absolute_path):
+				yield self.path_in_storage(entry_path), entry_path, printer_profile_id
+		elif os.path.isfile(absolute_path) and octoprint.filemanager.valid_file_type(name) and self._needs_analysis(self._get_metadata(path), name):
+			yield self.path_in_storage(absolute_path), absolute_path, self._printer_profile_id(absolute_path)
+
 	def _analysis_backlog_generator(self, path=None):
 		if path is None:
 			path = self.basefolder
@@ -362,21 +594,36 @@ class LocalFileStorage(StorageInterface):
 
 			absolute_path = os.path.join(path, entry)
 			if os.path.isfile(absolute_path):
-				if not entry in metadata or not isinstance(metadata[entry], dict) or not "analysis" in metadata[entry]:
-					printer_profile_rels = self.get_link(absolute_path, "printerprofile")
-					if printer_profile_rels:
-						printer_profile_id = printer_profile_rels[0]["id"]
-					else:
-						printer_profile_id = None
-
-					yield entry, absolute_path, printer_profile_id
+				if self._needs_analysis(metadata, entry):
+					yield entry, absolute_path, self._printer_profile_id(absolute_path)
 			elif os.path.isdir(absolute_path):
 				for sub_entry in self._analysis_backlog_generator(absolute_path):
 					yield self.join_path(entry, sub_entry[0]), sub_entry[1], sub_entry[2]
 
+	def _needs_analysis(self, metadata, name):
+		if not name in metadata or not isinstance(metadata[name], dict) or not "analysis" in metadata[name]:
+			return True
+
+		analysis = metadata[name]["analysis"]
+		# provisional results from the slicer's header often come with a layer count already, but still need the
+		# full analysis (and with that the layer and time index and thumbnail) if that got lost, e.g. on restart
+		return not "layerCount" in analysis or analysis.get("provisional", False)
+
+	def _printer_profile_id(self, absolute_path):
+		printer_profile_rels = self.get_link(absolute_path, "printerprofile")
+		if printer_profile_rels:
+			return printer_profile_rels[0]["id"]
+		return None
+
 	def file_exists(self, path):
 		path, name = self.sanitize(path)
 		file_path = os.path.join(path, name)
+
+		if self._index is not None:
+			exists = self._index.file_exists(file_path)
+			if exists is not None:
+				return exists
+
 		return os.path.exists(file_path) and os.path.isfile(file_path)
 
 	def list_files(self, path=None, filter=None, recursive=True):
@@ -386,6 +633,28 @@ class LocalFileStorage(StorageInterface):
 			path = self.basefolder
 		return self._list_folder(path, filter=filter, recursive=recursive)
 
+	def get_file(self, path):
+		path, name = self.sanitize(path)
+		file_path = os.path.join(path, name)
+
+		file_type = octoprint.filemanager.get_file_type(name)
+		if not file_type or not os.path.isfile(file_path):
+			return None
+
+		try:
+			stat = os.stat(file_path)
+		except OSError:
+			return None
+
+		metadata = self._get_metadata(path)
+		if not metadata:
+			metadata = dict()
+
+		entry_data, modified = self._file_entry(path, name, file_type[0], stat.st_size, stat.st_mtime, metadata)
+		if modified:
+			self._save_metadata(path, metadata, [name])
+		return entry_data
+
 	def add_folder(self, path, ignore_existing=True):
 		path, name = self.sanitize(path)
 
@@ -395,6 +664,7 @@ class LocalFileStorage(StorageInterface):
 				raise RuntimeError("{sanitized_foldername} does already exist in {virtual_path}".format(**locals()))
 		else:
 			os.mkdir(folder_path)
+			self._refresh_index(folder_path)
 
 		return self.path_in_storage((path, name))
 
@@ -405,15 +675,16 @@ class LocalFileStorage(StorageInterface):
 		if not os.path.exists(folder_path):
 			return
 
-		contents = os.listdir(folder_path)
-		if ".metadata.yaml" in contents:
-			contents.remove(".metadata.yaml")
+		contents = [entry for entry in os.listdir(folder_path) if not entry.startswith(".")]
 		if contents and not recursive:
 			raise RuntimeError("{sanitized_foldername} in {virtual_path} is not empty".format(**locals()))
 
 		import shutil
 		shutil.rmtree(folder_path)
 
+		self._metadata_store.remove_folder(folder_path)
+		self._refresh_index(folder_path)
+
 	def add_file(self, path, file_object, printer_profile=None, links=None, allow_overwrite=False):
 		path, name = self.sanitize(path)
 		if not octoprint.filemanager.valid_file_type(name):
@@ -433,18 +704,51 @@ class LocalFileStorage(StorageInterface):
 		if not os.path.exists(path):
 			os.makedirs(path)
 
-		# save the file
-		file_object.save(file_path)
+		if os.path.exists(file_path) and os.stat(file_path).st_nlink > 1:
+			# the file shares its data with other files, overwriting it in place would modify those too
+			os.remove(file_path)
+
+		# save the file, or if we already have a file with identical contents, link to that instead
+		known_hash = self._known_hash(file_object) if self._deduplicate else None
+		if known_hash is not None and self._link_duplicate(known_hash, file_path):
+			file_hash = known_hash
+		else:
+			file_object.save(file_path)
+
+			# only computing the file's hash if neither we nor the file object know it yet
+			file_hash = self._hash_cache.cached(file_path) or getattr(file_object, "hash", None)
+			if file_hash is None:
+				file_hash = self._create_hash(file_path)
+
+			if self._deduplicate:
+				# the contents turned out to be known after all, so we keep only one copy of them
+				self._link_duplicate(file_hash, file_path)
 
 		# save the file's hash to the metadata of the folder
-		file_hash = self._create_hash(file_path)
 		if not name in metadata or not "hash" in metadata[name] or metadata[name]["hash"] != file_hash:
 			# make sure to create a new metadata entry if we've never seen that file with that content before
 			file_metadata = dict(
 				hash=file_hash
 			)
 			metadata[name] = file_metadata
-			self._save_metadata(path, metadata)
+			self._save_metadata(path, metadata, [name])
+			self._remove_indices(path, name)
+
+		file_type = octoprint.filemanager.get_file_type(name)
+		if self._compress and file_type and file_type[0] == "machinecode" and not is_compressed(file_path):
+			# the hash always refers to the uncompressed contents, so it stays valid
+			compress_file(file_path, level=self._compression_level)
+
+		# remember the uncompressed size of compressed files (which might also be linked duplicates) for the listings
+		compression = None
+		if is_compressed(file_path):
+			compression = dict(size=os.stat(file_path).st_size, uncompressedSize=uncompressed_size(file_path))
+		if metadata[name].get("compression") != compression:
+			if compression is not None:
+				metadata[name]["compression"] = compression
+			else:
+				del metadata[name]["compression"]
+			self._save_metadata(path, metadata, [name])
 
 		# process any links that were also provided for adding to the file
 		if not links:
@@ -457,6 +761,15 @@ class LocalFileStorage(StorageInterface):
 
 		# touch the file to set last access and modification time to now
 		os.utime(file_path, None)
+		self._refresh_index(file_path)
+		if os.stat(file_path).st_nlink > 1:
+			# files sharing their contents also share their modification time
+			for linked_path in self._find_by_hash(file_hash):
+				if linked_path != file_path:
+					self._refresh_index(linked_path)
+
+		# we already know the hash of what we just saved, no need to read it ever again
+		self._hash_cache.set(file_path, file_hash)
 
 		return self.path_in_storage((path, name))
 
@@ -475,18 +788,36 @@ class LocalFileStorage(StorageInterface):
 			os.remove(file_path)
 		except Exception as e:
 			raise RuntimeError("Could not delete {name} in {path}".format(**locals()), e)
+		finally:
+			self._refresh_index(file_path)
+
+		self._remove_indices(path, name)
 
 		if name in metadata:
+			modified = [name]
 			if "hash" in metadata[name]:
 				hash = metadata[name]["hash"]
-				for m in metadata.values():
+				for n, m in metadata.items():
 					if not "links" in m:
 						continue
 					for link in m["links"]:
 						if "rel" in link and "hash" in link and (link["rel"] == "model" or link["rel"] == "machinecode") and link["hash"] == hash:
 							m["links"].remove(link)
+							modified.append(n)
 			del metadata[name]
-			self._save_metadata(path, metadata)
+			self._save_metadata(path, metadata, modified)
+
+	def copy_file(self, source, destination):
+		return self._transfer_file(source, destination, keep_source=True)
+
+	def move_file(self, source, destination):
+		return self._transfer_file(source, destination, keep_source=False)
+
+	def copy_folder(self, source, destination):
+		return self._transfer_folder(source, destination, keep_source=True)
+
+	def move_folder(self, source, destination):
+		return self._transfer_folder(source, destination, keep_source=False)
 
 	def get_metadata(self, path):
 		path, name = self.sanitize(path)
@@ -510,17 +841,30 @@ class LocalFileStorage(StorageInterface):
 		path, name = self.sanitize(path)
 		self._remove_links(name, path, [(rel, data)])
 
+	def set_print_history(self, print_history, origin):
+		self._print_history = print_history
+		self._print_history_origin = origin
+
+	@deprecated("LocalFileStorage.add_history has been replaced by FileManager.log_print",
+	            includedoc="Replaced by :func:`~octoprint.filemanager.FileManager.log_print`", since="1.3.0")
 	def add_history(self, path, data):
+		if self._print_history is None:
+			self._logger.warn("No print history to log the print of {} to, dropping it".format(path))
+			return
+
 		path, name = self.sanitize(path)
-		self._add_history(name, path, data)
+		self._print_history.log(self._print_history_origin, self.path_in_storage((path, name)), data.get("timestamp"),
+		                        data.get("success", False), data.get("printerProfile"), print_time=data.get("printTime"))
 
+	@deprecated("LocalFileStorage.update_history is no longer supported, prints in the print history can't be changed",
+	            includedoc="No longer supported, prints logged to the print history can't be changed", since="1.3.0")
 	def update_history(self, path, index, data):
-		path, name = self.sanitize(path)
-		self._update_history(name, path, index, data)
+		self._logger.warn("Ignoring update of print {} of {}, prints in the print history can't be changed".format(index, path))
 
+	@deprecated("LocalFileStorage.remove_history is no longer supported, prints in the print history can't be removed",
+	            includedoc="No longer supported, prints logged to the print history can't be removed", since="1.3.0")
 	def remove_history(self, path, index):
-		path, name = self.sanitize(path)
-		self._update_history(name, path, index)
+		self._logger.warn("Ignoring removal of print {} of {}, prints in the print history can't be removed".format(index, path))
 
 	def set_additional_metadata(self, path, key, data, overwrite=False, merge=False):
 		path, name = self.sanitize(path)
@@ -545,7 +889,23 @@ class LocalFileStorage(StorageInterface):
 			metadata_dirty = True
 
 		if metadata_dirty:
-			self._save_metadata(path, metadata)
+			self._save_metadata(path, metadata, [name])
+
+	def get_layer_index(self, path):
+		path, name = self.sanitize(path)
+		return self._read_index(path, name, "layers", LayerIndex)
+
+	def set_layer_index(self, path, layer_index):
+		path, name = self.sanitize(path)
+		self._write_index(path, name, "layers", layer_index)
+
+	def get_time_index(self, path):
+		path, name = self.sanitize(path)
+		return self._read_index(path, name, "times", TimeIndex)
+
+	def set_time_index(self, path, time_index):
+		path, name = self.sanitize(path)
+		self._write_index(path, name, "times", time_index)
 
 	def remove_additional_metadata(self, path, key):
 		path, name = self.sanitize(path)
@@ -558,7 +918,39 @@ class LocalFileStorage(StorageInterface):
 			return
 
 		del metadata[name][key]
-		self._save_metadata(path, metadata)
+		self._save_metadata(path, metadata, [name])
+
+	def flush(self):
+		self._metadata_store.flush()
+
+	@contextlib.contextmanager
+	def batch(self):
+		with self._metadata_store.batch():
+			yield
+
+	def rescan(self):
+		if self._index is not None:
+			self._index.rescan()
+
+	def register_metadata_callback(self, callback):
+		self._metadata_callbacks.append(callback)
+
+	def unregister_metadata_callback(self, callback):
+		try:
+			self._metadata_callbacks.remove(callback)
+		except ValueError:
+			# callback was not registered
+			pass
+
+	def register_change_callback(self, callback):
+		self._change_callbacks.append(callback)
+
+	def unregister_change_callback(self, callback):
+		try:
+			self._change_callbacks.remove(callback)
+		except ValueError:
+			# callback was not registered
+			pass
 
 	def split_path(self, path):
 		split = path.split("/")
@@ -710,92 +1102,6 @@ class LocalFileStorage(StorageInterface):
 
 	##~~ internals
 
-	def _add_history(self, name, path, data):
-		metadata = self._get_metadata(path)
-
-		if not name in metadata:
-			metadata[name] = dict()
-
-		if not "hash" in metadata[name]:
-			metadata[name]["hash"] = self._create_hash(os.path.join(path, name))
-
-		if not "history" in metadata[name]:
-			metadata[name]["history"] = []
-
-		metadata[name]["history"].append(data)
-		self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
-		self._save_metadata(path, metadata)
-
-	def _update_history(self, name, path, index, data):
-		metadata = self._get_metadata(path)
-
-		if not name in metadata or not "history" in metadata[name]:
-			return
-
-		try:
-			metadata[name]["history"][index].update(data)
-			self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
-			self._save_metadata(path, metadata)
-		except IndexError:
-			pass
-
-	def _delete_history(self, name, path, index):
-		metadata = self._get_metadata(path)
-
-		if not name in metadata or not "history" in metadata[name]:
-			return
-
-		try:
-			del metadata[name]["history"][index]
-			self._calculate_stats_from_history(name, path, metadata=metadata, save=False)
-			self._save_metadata(path, metadata)
-		except IndexError:
-			pass
-
-	def _calculate_stats_from_history(self, name, path, metadata=None, save=True):
-		if metadata is None:
-			metadata = self._get_metadata(path)
-
-		if not name in metadata or not "history" in metadata[name]:
-			return
-
-		# collect data from history
-		former_print_times = dict()
-		last_print = dict()
-
-
-		for history_entry in metadata[name]["history"]:
-			if not "printTime" in history_entry or not "success" in history_entry or not history_entry["success"] or not "printerProfile" in history_entry:
-				continue
-
-			printer_profile = history_entry["printerProfile"]
-			print_time = history_entry["printTime"]
-
-			if not printer_profile in former_print_times:
-				former_print_times[printer_profile] = []
-			former_print_times[printer_profile].append(print_time)
-
-			if not printer_profile in last_print or last_print[printer_profile] is None or ("timestamp" in history_entry and history_entry["timestamp"] > last_print[printer_profile]["timestamp"]):
-				last_print[printer_profile] = history_entry
-
-		# calculate stats
-		statistics = dict(averagePrintTime=dict(), lastPrintTime=dict())
-
-		for printer_profile in former_print_times:
-			if not former_print_times[printer_profile]:
-				continue
-			statistics["averagePrintTime"][printer_profile] = sum(former_print_times[printer_profile]) / float(len(former_print_times[printer_profile]))
-
-		for printer_profile in last_print:
-			if not last_print[printer_profile]:
-				continue
-			statistics["lastPrintTime"][printer_profile] = last_print[printer_profile]["printTime"]
-
-		metadata[name]["statistics"] = statistics
-
-		if save:
-			self._save_metadata(path, metadata)
-
 	def _get_links(self, name, path, searched_rel):
 		metadata = self._get_metadata(path)
 		result = []
@@ -818,7 +1124,7 @@ class LocalFileStorage(StorageInterface):
 			file_type = file_type[0]
 
 		metadata = self._get_metadata(path)
-		metadata_dirty = False
+		modified = set()
 
 		if not name in metadata:
 			metadata[name] = dict()
@@ -867,7 +1173,7 @@ class LocalFileStorage(StorageInterface):
 				metadata[data["name"]]["links"].append(
 					dict(rel="machinecode" if rel == "model" else "model", name=name, hash=metadata[name]["hash"])
 				)
-				metadata_dirty = True
+				modified.add(data["name"])
 
 				link_dict = dict(
 					rel=rel,
@@ -888,14 +1194,14 @@ class LocalFileStorage(StorageInterface):
 
 			if link_dict:
 				metadata[name]["links"].append(link_dict)
-				metadata_dirty = True
+				modified.add(name)
 
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+		if modified:
+			self._save_metadata(path, metadata, modified)
 
 	def _remove_links(self, name, path, links):
 		metadata = self._get_metadata(path)
-		metadata_dirty = False
+		modified = set()
 
 		if not name in metadata or not "hash" in metadata[name]:
 			hash = self._create_hash(os.path.join(path, name))
@@ -909,7 +1215,7 @@ class LocalFileStorage(StorageInterface):
 					for link in metadata[data["name"]]["links"]:
 						if link["rel"] == ref_rel and "name" in link and link["name"] == name and "hash" in link and link["hash"] == hash:
 							metadata[data["name"]]["links"].remove(link)
-							metadata_dirty = True
+							modified.add(data["name"])
 
 			if "links" in metadata[name]:
 				for link in metadata[name]["links"]:
@@ -926,27 +1232,184 @@ class LocalFileStorage(StorageInterface):
 						continue
 
 					metadata[name]["links"].remove(link)
-					metadata_dirty = True
+					modified.add(name)
 
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+		if modified:
+			self._save_metadata(path, metadata, modified)
+
+	def _transfer_file(self, source, destination, keep_source=False):
+		"""
+		Moves or (if ``keep_source`` is set) copies the file ``source`` to ``destination`` together with its layer and
+		time indices and its metadata, so that nothing needs to be hashed or analysed again.
+		"""
+		source_path, source_name = self.sanitize(source)
+		destination_path, destination_name = self.sanitize(destination)
+
+		source_file = os.path.join(source_path, source_name)
+		destination_file = os.path.join(destination_path, destination_name)
+
+		if not os.path.isfile(source_file):
+			raise RuntimeError("{source_name} in {source_path} does not exist or is not a file".format(**locals()))
+		if not octoprint.filemanager.valid_file_type(destination_name) or octoprint.filemanager.get_file_type(destination_name) != octoprint.filemanager.get_file_type(source_name):
+			raise RuntimeError("{destination_name} is not of the same file type as {source_name}".format(**locals()))
+		if not os.path.isdir(destination_path):
+			raise RuntimeError("{destination_path} does not exist or is not a folder".format(**locals()))
+		if os.path.exists(destination_file):
+			raise RuntimeError("{destination_name} does already exist in {destination_path}".format(**locals()))
+
+		import shutil
+		if not keep_source:
+			shutil.move(source_file, destination_file)
+		elif not (self._deduplicate and self._link_file(source_file, destination_file)):
+			shutil.copy2(source_file, destination_file)
+
+		self._remove_indices(destination_path, destination_name)
+		for kind in ("layers", "times"):
+			source_index = self._index_path(source_path, source_name, kind)
+			if not os.path.exists(source_index):
+				continue
+
+			try:
+				if keep_source:
+					shutil.copy2(source_index, self._index_path(destination_path, destination_name, kind))
+				else:
+					shutil.move(source_index, self._index_path(destination_path, destination_name, kind))
+			except:
+				self._logger.exception("Could not transfer {kind} index of {source_name} in {source_path}".format(**locals()))
+
+		source_metadata = self._get_metadata(source_path)
+		if source_name in source_metadata and isinstance(source_metadata[source_name], dict):
+			hash = source_metadata[source_name].get("hash")
+			if destination_path == source_path:
+				self._transfer_metadata_within_folder(source_path, source_metadata, source_name, destination_name, keep_source)
+			else:
+				self._transfer_metadata_between_folders(source_path, source_metadata, source_name, destination_path, destination_name, keep_source)
+
+			if hash is not None:
+				# the contents didn't change, no need to ever read them again
+				self._hash_cache.set(destination_file, hash)
+
+		if not keep_source:
+			self._refresh_index(source_file)
+		self._refresh_index(destination_file)
+
+		return self.path_in_storage((destination_path, destination_name))
+
+	def _transfer_metadata_within_folder(self, path, metadata, source_name, destination_name, keep_source):
+		if keep_source:
+			# a copy is a separate file, the links of the original stay with the original
+			metadata[destination_name] = self._without_file_links(copy.deepcopy(metadata[source_name]))
+			self._save_metadata(path, metadata, [destination_name])
+			return
+
+		# a renamed file keeps its links, but the files linking to it need to know its new name
+		metadata[destination_name] = metadata.pop(source_name)
+		modified = {source_name, destination_name}
+		for name, entry in metadata.items():
+			if not isinstance(entry, dict):
+				continue
+			for link in entry.get("links", []):
+				if link.get("rel") in ("model", "machinecode") and link.get("name") == source_name:
+					link["name"] = destination_name
+					modified.add(name)
+		self._save_metadata(path, metadata, modified)
+
+	def _transfer_metadata_between_folders(self, source_path, source_metadata, source_name, destination_path, destination_name, keep_source):
+		if keep_source:
+			entry = copy.deepcopy(source_metadata[source_name])
+		else:
+			entry = source_metadata.pop(source_name)
+
+			# links only work within a folder, so the files left behind forget about the moved file
+			modified = {source_name}
+			for name, other in source_metadata.items():
+				if not isinstance(other, dict) or not "links" in other:
+					continue
+				links = [link for link in other["links"] if not (link.get("rel") in ("model", "machinecode") and link.get("name") == source_name)]
+				if len(links) != len(other["links"]):
+					other["links"] = links
+					modified.add(name)
+			self._save_metadata(source_path, source_metadata, modified)
+
+		destination_metadata = self._get_metadata(destination_path)
+		destination_metadata[destination_name] = self._without_file_links(entry)
+		self._save_metadata(destination_path, destination_metadata, [destination_name])
+
+	def _without_file_links(self, entry):
+		if "links" in entry:
+			entry["links"] = [link for link in entry["links"] if not link.get("rel") in ("model", "machinecode")]
+		return entry
+
+	def _link_file(self, source_file, destination_file):
+		"""
+		Creates ``destination_file`` as a hardlink to ``source_file``, returns whether that was possible.
+		"""
+		if not hasattr(os, "link"):
+			return False
+
+		try:
+			os.link(source_file, destination_file)
+		except (IOError, OSError):
+			self._logger.debug("Could not link {} to {}, copying it instead".format(destination_file, source_file))
+			return False
+		return True
+
+	def _transfer_folder(self, source, destination, keep_source=False):
+		"""
+		Moves or (if ``keep_source`` is set) copies the folder ``source`` to ``destination`` with all its contents,
+		writing the metadata of each affected folder only once.
+		"""
+		source_path, source_name = self.sanitize(source)
+		destination_path, destination_name = self.sanitize(destination)
+
+		source_folder = os.path.join(source_path, source_name)
+		destination_folder = os.path.join(destination_path, destination_name)
+
+		if not source_name or not destination_name:
+			raise RuntimeError("The root folder cannot be moved or copied")
+		if not os.path.isdir(source_folder):
+			raise RuntimeError("{source_name} in {source_path} does not exist or is not a folder".format(**locals()))
+		if not os.path.isdir(destination_path):
+			raise RuntimeError("{destination_path} does not exist or is not a folder".format(**locals()))
+		if os.path.exists(destination_folder):
+			raise RuntimeError("{destination_name} does already exist in {destination_path}".format(**locals()))
+		if destination_folder.startswith(source_folder + os.sep):
+			raise RuntimeError("{source_name} cannot be moved or copied into itself".format(**locals()))
+
+		# collect the metadata of all contained folders under their new paths before anything moves
+		folders = []
+		for folder, dirs, files in os.walk(source_folder):
+			dirs[:] = [d for d in dirs if not d.startswith(".")]
+			metadata = self._get_metadata(folder)
+			if metadata:
+				folders.append((destination_folder + folder[len(source_folder):], copy.deepcopy(metadata), None))
+
+		import shutil
+		if keep_source:
+			shutil.copytree(source_folder, destination_folder)
+		else:
+			shutil.move(source_folder, destination_folder)
+			self._metadata_store.remove_folder(source_folder)
+		self._metadata_store.save_many(folders)
+
+		if not keep_source:
+			self._refresh_index(source_folder)
+		self._refresh_index(destination_folder)
+
+		return self.path_in_storage((destination_path, destination_name))
 
 	def _list_folder(self, path, filter=None, recursive=True):
 		metadata = self._get_metadata(path)
 		if not metadata:
 			metadata = dict()
-		metadata_dirty = False
+		modified = []
 
 		result = dict()
-		for entry in os.listdir(path):
-			if entry.startswith("."):
-				# no hidden files and folders
-				continue
-
+		for entry, is_file, size, mtime in self._folder_entries(path):
 			entry_path = os.path.join(path, entry)
 
 			# file handling
-			if os.path.isfile(entry_path):
+			if is_file:
 				file_type = octoprint.filemanager.get_file_type(entry)
 				if not file_type:
 					# only supported extensions
@@ -954,29 +1417,18 @@ class LocalFileStorage(StorageInterface):
 				else:
 					file_type = file_type[0]
 
-				if entry in metadata and isinstance(metadata[entry], dict):
-					entry_data = metadata[entry]
-				else:
-					entry_data = self._add_basic_metadata(path, entry, save=False, metadata=metadata)
-					metadata_dirty = True
+				extended_entry_data, entry_modified = self._file_entry(path, entry, file_type, size, mtime, metadata)
+				if entry_modified:
+					modified.append(entry)
 
 				# TODO extract model hash from source if possible to recreate link
 
-				if not filter or filter(entry, entry_data):
+				if not filter or filter(entry, metadata[entry]):
 					# only add files passing the optional filter
-					extended_entry_data = dict()
-					extended_entry_data.update(entry_data)
-					extended_entry_data["name"] = entry
-					extended_entry_data["type"] = file_type
-					stat = os.stat(entry_path)
-					if stat:
-						extended_entry_data["size"] = stat.st_size
-						extended_entry_data["date"] = int(stat.st_mtime)
-
 					result[entry] = extended_entry_data
 
 			# folder recursion
-			elif os.path.isdir(entry_path) and recursive:
+			elif recursive:
 				sub_result = self._list_folder(entry_path, filter=filter)
 				result[entry] = dict(
 					name=entry,
@@ -987,11 +1439,71 @@ class LocalFileStorage(StorageInterface):
 		# TODO recreate links if we have metadata less entries
 
 		# save metadata
-		if metadata_dirty:
-			self._save_metadata(path, metadata)
+		if modified:
+			self._save_metadata(path, metadata, modified)
+
+		return result
+
+	def _file_entry(self, path, entry, file_type, size, mtime, metadata):
+		"""
+		Creates the listing entry for file ``entry`` in folder ``path`` from its ``metadata``, adding basic metadata
+		to ``metadata`` first if the file has none yet. Returns the entry and whether ``metadata`` was modified.
+		"""
+		modified = False
+		if entry in metadata and isinstance(metadata[entry], dict):
+			entry_data = metadata[entry]
+			if not "hash" in entry_data:
+				# the background hashing of the file didn't finish before we went down, pick it up again
+				hash = self._background_hash(os.path.join(path, entry))
+				if hash is not None:
+					entry_data["hash"] = hash
+					modified = True
+		else:
+			entry_data = self._add_basic_metadata(path, entry, save=False, metadata=metadata)
+			modified = True
+
+		extended_entry_data = dict()
+		extended_entry_data.update(entry_data)
+
+		# sizes of compressed files refer to their uncompressed contents, unless the file was replaced behind our back
+		compression = extended_entry_data.pop("compression", None)
+		if isinstance(compression, dict) and compression.get("size") == size and "uncompressedSize" in compression:
+			size = compression["uncompressedSize"]
+
+		extended_entry_data["name"] = entry
+		extended_entry_data["type"] = file_type
+		extended_entry_data["size"] = size
+		extended_entry_data["date"] = int(mtime)
+		return extended_entry_data, modified
 
+	def _folder_entries(self, path):
+		"""
+		Returns the (non hidden) entries of folder ``path`` as ``(name, is_file, size, mtime)`` tuples, from the
+		index if possible, from disk otherwise.
+		"""
+		if self._index is not None:
+			entries = self._index.list_folder(path)
+			if entries is not None:
+				return entries
+
+		result = []
+		for entry in os.listdir(path):
+			if entry.startswith("."):
+				# no hidden files and folders
+				continue
+
+			entry_path = os.path.join(path, entry)
+			if os.path.isfile(entry_path):
+				stat = os.stat(entry_path)
+				result.append((entry, True, stat.st_size, stat.st_mtime))
+			elif os.path.isdir(entry_path):
+				result.append((entry, False, None, None))
 		return result
 
+	def _refresh_index(self, path):
+		if self._index is not None:
+			self._index.refresh(path)
+
 	def _add_basic_metadata(self, path, entry, additional_metadata=None, save=True, metadata=None):
 		if additional_metadata is None:
 			additional_metadata = dict()
@@ -1000,11 +1512,14 @@ class LocalFileStorage(StorageInterface):
 			metadata = self._get_metadata(path)
 
 		entry_data = dict(
-			hash=self._create_hash(os.path.join(path, entry)),
 			links=[],
 			notes=[]
 		)
 
+		hash = self._background_hash(os.path.join(path, entry))
+		if hash is not None:
+			entry_data["hash"] = hash
+
 		if path == self.basefolder and self._old_metadata is not None and entry in self._old_metadata and "gcodeAnalysis" in self._old_metadata[entry]:
 			# if there is still old metadata available and that contains an analysis for this file, use it!
 			entry_data["analysis"] = self._old_metadata[entry]["gcodeAnalysis"]
@@ -1013,61 +1528,179 @@ class LocalFileStorage(StorageInterface):
 		metadata[entry] = entry_data
 
 		if save:
-			self._save_metadata(path, metadata)
+			self._save_metadata(path, metadata, [entry])
 
 		return entry_data
 
 	def _create_hash(self, path):
-		import hashlib
+		return self._hash_cache.get(path)
 
-		blocksize = 65536
-		hash = hashlib.sha1()
-		with open(path, "rb") as f:
-			buffer = f.read(blocksize)
-			while len(buffer) > 0:
-				hash.update(buffer)
-				buffer = f.read(blocksize)
+	def _background_hash(self, path):
+		"""
+		Returns the hash of the file at ``path`` if it's known already or there's no background hasher, otherwise
+		enqueues the file for hashing in the background and returns ``None``.
+		"""
+		if self._background_hasher is None:
+			return self._create_hash(path)
 
-		return hash.hexdigest()
+		# don't block the caller (usually a file listing) on hashing what might be a huge file
+		hash = self._hash_cache.cached(path)
+		if hash is None:
+			self._background_hasher.enqueue(path)
+		return hash
 
-	def _get_metadata(self, path):
-		if path in self._metadata_cache:
-			return self._metadata_cache[path]
-
-		metadata_path = os.path.join(path, ".metadata.yaml")
-		if os.path.exists(metadata_path):
-			with self._metadata_lock:
-				with open(metadata_path) as f:
-					try:
-						import yaml
-						metadata = yaml.safe_load(f)
-					except:
-						self._logger.exception("Error while reading .metadata.yaml from {path}".format(**locals()))
-					else:
-						self._metadata_cache[path] = metadata
-						return metadata
-		return dict()
+	def _known_hash(self, file_object):
+		"""
+		Returns the hash of the contents ``file_object`` is going to save if those are already on disk and known to
+		have that hash, so the file can be linked to a duplicate without saving it first. Returns ``None`` otherwise.
+		"""
+		# wrappers like the IngestFileWrapper only learn the hash while saving, but they save the contents of the file
+		# they wrap as they are, so that one's hash is what counts
+		while isinstance(file_object, IngestFileWrapper):
+			file_object = file_object.file_object
+
+		hash = getattr(file_object, "hash", None)
+		source = getattr(file_object, "path", None)
+		if hash is None or source is None or not self._find_by_hash(hash):
+			return None
 
-	def _save_metadata(self, path, metadata):
-		metadata_path = os.path.join(path, ".metadata.yaml")
+		# whoever claims the hash, we only link these contents to another file if they really are identical
+		try:
+			if self._hash_cache.get(source) != hash:
+				self._logger.warn("Contents of {} don't match their claimed hash {}, not linking them to a duplicate".format(source, hash))
+				return None
+		except (IOError, OSError):
+			return None
+		return hash
+
+	def _find_by_hash(self, hash):
+		paths = self._metadata_store.find_by_hash(hash)
+		if paths is None:
+			# the metadata store can't look up files by hash, so we don't know of any duplicates
+			return []
+		return paths
+
+	def _link_duplicate(self, hash, file_path):
+		"""
+		Replaces ``file_path`` with a hardlink to another file with the same ``hash``, if there is one. Returns whether
+		such a file was found and linked.
+		"""
+		if not hasattr(os, "link"):
+			# no hardlinks on this platform
+			return False
+
+		import shutil
+		for candidate in self._find_by_hash(hash):
+			if candidate == file_path or not os.path.isfile(candidate):
+				continue
 
-		with self._metadata_lock:
 			try:
-				import yaml
-				import shutil
+				if os.path.exists(file_path) and os.path.samefile(candidate, file_path):
+					return True
 
-				file_obj = tempfile.NamedTemporaryFile(delete=False)
+				# the metadata might be outdated, the contents are what counts
+				if self._hash_cache.get(candidate) != hash:
+					continue
+
+				# and we never replace a file with one that doesn't have the very same contents
+				if os.path.exists(file_path) and self._hash_cache.get(file_path) != hash:
+					return False
+
+				temp_path = os.path.join(os.path.dirname(file_path), "." + os.path.basename(file_path) + ".linking")
+				os.link(candidate, temp_path)
 				try:
-					yaml.safe_dump(metadata, stream=file_obj, default_flow_style=False, indent="  ", allow_unicode=True)
-					file_obj.close()
-					shutil.move(file_obj.name, metadata_path)
+					shutil.move(temp_path, file_path)
 				finally:
-					try:
-						if os.path.exists(file_obj.name):
-							os.remove(file_obj.name)
-					except Exception as e:
-						self._logger.warn("Could not delete file {}: {}".format(file_obj.name, str(e)))
+					if os.path.exists(temp_path):
+						os.remove(temp_path)
+			except (IOError, OSError):
+				# e.g. not on the same device or not supported by the file system
+				self._logger.debug("Could not link {} to {}, storing it separately".format(file_path, candidate))
+				return False
+
+			self._logger.debug("Stored {} as a link to {} with identical contents".format(file_path, candidate))
+			return True
+
+		return False
+
+	def _on_index_change(self, path):
+		path_in_storage = self.path_in_storage(path)
+		for callback in self._change_callbacks:
+			try:
+				callback(path_in_storage)
 			except:
-				self._logger.exception("Error while writing .metadata.yaml to {path}".format(**locals()))
-			else:
-				self._metadata_cache[path] = metadata
+				self._logger.exception("Error in change callback for {}".format(path_in_storage))
+
+	def _on_background_hash(self, file_path, hash):
+		path, name = os.path.split(file_path)
+
+		metadata = self._get_metadata(path)
+		if not name in metadata or not isinstance(metadata[name], dict):
+			# file is gone or was never listed
+			return
+
+		if metadata[name].get("hash") == hash:
+			return
+
+		metadata[name]["hash"] = hash
+		self._save_metadata(path, metadata, [name])
+
+		path_in_storage = self.path_in_storage(file_path)
+		for callback in self._metadata_callbacks:
+			try:
+				callback(path_in_storage, "hash")
+			except:
+				self._logger.exception("Error in metadata callback for {}".format(path_in_storage))
+
+	def _index_path(self, path, name, kind):
+		return os.path.join(path, ".{name}.{kind}".format(name=name, kind=kind))
+
+	def _read_index(self, path, name, kind, index_class):
+		index_path = self._index_path(path, name, kind)
+		if not os.path.exists(index_path):
+			return None
+
+		try:
+			return index_class.from_file(index_path)
+		except:
+			self._logger.exception("Error while reading {kind} index of {name} in {path}".format(**locals()))
+			return None
+
+	def _write_index(self, path, name, kind, index):
+		file_path = os.path.join(path, name)
+		if not os.path.isfile(file_path):
+			return
+
+		index_path = self._index_path(path, name, kind)
+		file_obj = tempfile.NamedTemporaryFile(delete=False)
+		try:
+			index.dump(file_obj)
+			file_obj.close()
+
+			import shutil
+			shutil.move(file_obj.name, index_path)
+		except:
+			self._logger.exception("Error while writing {kind} index of {name} in {path}".format(**locals()))
+		finally:
+			try:
+				if os.path.exists(file_obj.name):
+					os.remove(file_obj.name)
+			except:
+				self._logger.exception("Could not delete {kind} index tempfile {name}".format(kind=kind, name=file_obj.name))
+
+	def _remove_indices(self, path, name):
+		for kind in ("layers", "times"):
+			index_path = self._index_path(path, name, kind)
+			if not os.path.exists(index_path):
+				continue
+
+			try:
+				os.remove(index_path)
+			except:
+				self._logger.exception("Could not delete {kind} index of {name} in {path}".format(**locals()))
+
+	def _get_metadata(self, path):
+		return self._metadata_store.get(path)
+
+	def _save_metadata(self, path, metadata, names=None):
+		self._metadata_store.save(path, metadata, names=names)
@@ -0,0 +1,163 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import array
+import struct
+import zlib
+
+
+class ToolpathThumbnail(object):
+	"""
+	Renders a small top-down preview of the extruded toolpath of a machine code file as PNG, in pure Python and
+	without any further dependencies.
+
+	Extruding segments are collected through :func:`add_segment`, which matches the signature of the segment
+	callback of :class:`~octoprint.util.gcodeInterpreter.gcode`, so the thumbnail can be created during analysis
+	without an additional pass over the file. When rendering, the collected segments are scaled to fit the thumbnail
+	and drawn from bottom to top, shading them from dark (first layer) to light (top layer).
+
+	The scale is only known once all segments have been seen, so they have to be kept until rendering. To keep the
+	memory used for that bounded on huge files, at most ``max_segments`` segments are kept. Once that many have been
+	collected, every other one is dropped and from then on only every other new one is kept, and so on, so the kept
+	segments stay evenly spread over the whole file.
+
+	Arguments:
+	    width (int): Width of the thumbnail in pixels.
+	    height (int): Height of the thumbnail in pixels.
+	    color (tuple): RGB color of the top most layer.
+	    max_segments (int): Maximum number of segments to keep for rendering.
+	"""
+
+	margin = 2
+
+	def __init__(self, width=128, height=128, color=(255, 140, 0), max_segments=100000):
+		self.width = width
+		self.height = height
+		self.color = color
+		self.max_segments = max_segments
+
+		self._segments = array.array("f")
+		self._count = 0
+		self._stride = 1
+		self._min = [None, None, None]
+		self._max = [None, None, None]
+
+	def add_segment(self, offset, start, end, move_type, tool):
+		if move_type != "extrude" or (start[0] == end[0] and start[1] == end[1]):
+			return
+
+		self._extend_bounds(0, start[0], end[0])
+		self._extend_bounds(1, start[1], end[1])
+		self._extend_bounds(2, end[2], end[2])
+
+		self._count += 1
+		if self._count % self._stride:
+			return
+
+		if len(self._segments) >= 5 * self.max_segments:
+			self._decimate()
+		self._segments.extend((start[0], start[1], end[0], end[1], end[2]))
+
+	@property
+	def empty(self):
+		return len(self._segments) == 0
+
+	def _decimate(self):
+		segments = self._segments
+		decimated = array.array("f")
+		for i in range(0, len(segments), 10):
+			decimated.extend(segments[i:i + 5])
+		self._segments = decimated
+		self._stride *= 2
+
+	def _extend_bounds(self, axis, a, b):
+		low, high = (a, b) if a <= b else (b, a)
+		if self._min[axis] is None or low < self._min[axis]:
+			self._min[axis] = low
+		if self._max[axis] is None or high > self._max[axis]:
+			self._max[axis] = high
+
+	def render(self):
+		"""
+		Renders the collected segments.
+
+		Returns:
+		    str: The rendered thumbnail as PNG data, or ``None`` if no extruding segments were collected.
+		"""
+		if self.empty:
+			return None
+
+		# the bounds cover the dropped segments too, so the thumbnail isn't scaled differently due to decimation
+		segments = self._segments
+		min_x, min_y, min_z = self._min
+		max_x, max_y, max_z = self._max
+
+		usable_width = self.width - 2 * self.margin - 1
+		usable_height = self.height - 2 * self.margin - 1
+		scale = min(usable_width / max(max_x - min_x, 0.001), usable_height / max(max_y - min_y, 0.001))
+		offset_x = self.margin + (usable_width - (max_x - min_x) * scale) / 2.0
+		offset_y = self.margin + (usable_height - (max_y - min_y) * scale) / 2.0
+		z_range = max(max_z - min_z, 0.001)
+
+		pixels = bytearray(self.width * self.height * 4)
+		for i in range(0, len(segments), 5):
+			x0 = int(round(offset_x + (segments[i] - min_x) * scale))
+			y0 = self.height - 1 - int(round(offset_y + (segments[i + 1] - min_y) * scale))
+			x1 = int(round(offset_x + (segments[i + 2] - min_x) * scale))
+			y1 = self.height - 1 - int(round(offset_y + (segments[i + 3] - min_y) * scale))
+
+			shade = 0.35 + 0.65 * (segments[i + 4] - min_z) / z_range
+			pixel = bytearray((int(self.color[0] * shade), int(self.color[1] * shade), int(self.color[2] * shade), 255))
+			self._draw_line(pixels, x0, y0, x1, y1, pixel)
+
+		return _encode_png(self.width, self.height, pixels)
+
+	def _draw_line(self, pixels, x0, y0, x1, y1, pixel):
+		# Bresenham
+		dx = abs(x1 - x0)
+		dy = -abs(y1 - y0)
+		sx = 1 if x0 < x1 else -1
+		sy = 1 if y0 < y1 else -1
+		error = dx + dy
+
+		width = self.width
+		while True:
+			index = (y0 * width + x0) * 4
+			pixels[index:index + 4] = pixel
+			if x0 == x1 and y0 == y1:
+				break
+			e2 = 2 * error
+			if e2 >= dy:
+				error += dy
+				x0 += sx
+			if e2 <= dx:
+				error += dx
+				y0 += sy
+
+
+def _encode_png(width, height, pixels):
+	"""
+	Encodes ``pixels`` (RGBA, row by row) as PNG.
+	"""
+
+	def chunk(chunk_type, data):
+		return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)
+
+	stride = width * 4
+	raw = bytearray()
+	for row in range(height):
+		# filter type 0 (none) for every scanline
+		raw.append(0)
+		raw.extend(pixels[row * stride:(row + 1) * stride])
+
+	return b"".join([
+		b"\x89PNG\r\n\x1a\n",
+		chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+		chunk(b"IDAT", zlib.compress(bytes(raw), 9)),
+		chunk(b"IEND", b"")
+	])
@@ -0,0 +1,120 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import bisect
+import io
+import struct
+
+
+class TimeIndex(object):
+	"""
+	Maps byte offsets within a machine code file to the estimated time it takes to print the file up to that offset,
+	as generated during analysis.
+
+	The index is a prefix sum table of samples, each consisting of a byte offset and the cumulative estimated print
+	time in seconds at that offset, sorted by offset. The analysis only records a new sample once the estimated time
+	has advanced a couple of seconds since the last one, so the table stays small even for huge files. Lookups
+	through :func:`time_at` interpolate linearly between the two surrounding samples and take ``O(log n)``.
+
+	The index can be persisted in a compact binary format (a short header followed by one fixed size record per
+	sample).
+
+	Arguments:
+	    samples (iterable): ``(offset, time)`` tuples, sorted by offset. The last sample's time is the estimated total
+	        print time.
+	"""
+
+	MAGIC = b"OPTI"
+	VERSION = 1
+
+	_header = struct.Struct("<4sBI")
+	_record = struct.Struct("<Qf")
+
+	def __init__(self, samples=None):
+		if samples is None:
+			samples = []
+		self._offsets = [int(offset) for offset, _ in samples]
+		self._times = [float(time) for _, time in samples]
+
+	def __len__(self):
+		return len(self._offsets)
+
+	def __iter__(self):
+		return iter(zip(self._offsets, self._times))
+
+	@property
+	def total(self):
+		"""Estimated total print time of the file in seconds, ``None`` if the index is empty."""
+		if not self._times:
+			return None
+		return self._times[-1]
+
+	def time_at(self, offset):
+		"""
+		Returns the estimated print time in seconds it takes to reach byte ``offset`` in the file.
+		"""
+		if not self._offsets:
+			return None
+
+		index = bisect.bisect_right(self._offsets, offset) - 1
+		if index < 0:
+			return 0.0
+		if index >= len(self._offsets) - 1:
+			return self._times[-1]
+
+		start_offset, end_offset = self._offsets[index], self._offsets[index + 1]
+		start_time, end_time = self._times[index], self._times[index + 1]
+		return start_time + (end_time - start_time) * float(offset - start_offset) / float(end_offset - start_offset)
+
+	def progress_at(self, offset):
+		"""
+		Returns the estimated progress of the print, from 0.0 to 1.0, once byte ``offset`` in the file is reached.
+		"""
+		total = self.total
+		if not total:
+			return None
+		return min(1.0, self.time_at(offset) / total)
+
+	def dump(self, stream):
+		"""
+		Writes the index in its binary format to ``stream``.
+		"""
+		stream.write(self._header.pack(self.MAGIC, self.VERSION, len(self._offsets)))
+		for sample in zip(self._offsets, self._times):
+			stream.write(self._record.pack(*sample))
+
+	def save(self, path):
+		with io.open(path, "wb") as f:
+			self.dump(f)
+
+	@classmethod
+	def load(cls, stream):
+		"""
+		Reads an index in its binary format from ``stream``.
+
+		Raises:
+		    ValueError: The stream does not contain a valid index.
+		"""
+		header = stream.read(cls._header.size)
+		if len(header) != cls._header.size:
+			raise ValueError("Time index is truncated")
+
+		magic, version, count = cls._header.unpack(header)
+		if magic != cls.MAGIC or version != cls.VERSION:
+			raise ValueError("Not a time index of version {}".format(cls.VERSION))
+
+		data = stream.read(count * cls._record.size)
+		if len(data) != count * cls._record.size:
+			raise ValueError("Time index is truncated")
+
+		return cls([cls._record.unpack_from(data, i * cls._record.size) for i in range(count)])
+
+	@classmethod
+	def from_file(cls, path):
+		with io.open(path, "rb") as f:
+			return cls.load(f)
@@ -7,16 +7,25 @@ __copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms
 
 import io
 
+INGEST_BLOCKSIZE = 64 * 1024
+""" Size of the blocks in which file contents are copied, hashed and analysed while being stored. """
+
 class AbstractFileWrapper(object):
 	"""
 	Wrapper for file representations to save to storages.
 
 	Arguments:
 	    filename (str): The file's name
+
+	Attributes:
+	    hash (str): The SHA1 hex digest of the file's contents as written by :meth:`save`, if already known (e.g.
+	        because it was computed while the file's data was streamed in). ``None`` if unknown, in which case
+	        storages will have to compute it themselves.
 	"""
 
 	def __init__(self, filename):
 		self.filename = filename
+		self.hash = None
 
 	def save(self, path):
 		"""
@@ -46,12 +55,14 @@ class DiskFileWrapper(AbstractFileWrapper):
 	    filename (str): The file's name
 	    path (str): The file's absolute path
 	    move (boolean): Whether to move the file upon saving (True, default) or copying.
+	    hash (str): The SHA1 hex digest of the file's contents if already known, optional.
 	"""
 
-	def __init__(self, filename, path, move=True):
+	def __init__(self, filename, path, move=True, hash=None):
 		AbstractFileWrapper.__init__(self, filename)
 		self.path = path
 		self.move = move
+		self.hash = hash
 
 	def save(self, path):
 		import shutil
@@ -81,13 +92,16 @@ class StreamWrapper(AbstractFileWrapper):
 	def save(self, path):
 		"""
 		Will dump the contents of all streams provided during construction into the target file, in the order they were
-		provided.
+		provided. The SHA1 hash of the written contents is computed on the fly and available as :attr:`hash` afterwards.
 		"""
+		import hashlib
 		import shutil
 
+		hash = hashlib.sha1()
 		with open(path, "wb") as dest:
 			with self.stream() as source:
-				shutil.copyfileobj(source, dest)
+				shutil.copyfileobj(source, HashingWriter(dest, hash), INGEST_BLOCKSIZE)
+		self.hash = hash.hexdigest()
 
 	def stream(self):
 		"""
@@ -99,6 +113,166 @@ class StreamWrapper(AbstractFileWrapper):
 		else:
 			return self.streams[0]
 
+class DecompressingFileWrapper(AbstractFileWrapper):
+	"""
+	Wraps a gzip compressed file, e.g. an uploaded ``.gcode.gz`` file, into a wrapper of its uncompressed contents.
+
+	Arguments:
+	    file_object (AbstractFileWrapper): The compressed file to wrap
+	    filename (str): The name of the uncompressed file, defaults to the name of ``file_object`` without its
+	        ``.gz`` extension
+	"""
+
+	def __init__(self, file_object, filename=None):
+		from octoprint.util.compression import strip_compressed_extension
+
+		if filename is None:
+			filename = strip_compressed_extension(file_object.filename) or file_object.filename
+		AbstractFileWrapper.__init__(self, filename)
+		self.file_object = file_object
+
+	def save(self, path):
+		import hashlib
+		import shutil
+
+		hash = hashlib.sha1()
+		with open(path, "wb") as dest:
+			with self.stream() as source:
+				shutil.copyfileobj(source, HashingWriter(dest, hash), INGEST_BLOCKSIZE)
+		self.hash = hash.hexdigest()
+
+	def stream(self):
+		from octoprint.util.compression import decompressing_stream
+		return decompressing_stream(self.file_object.stream())
+
+class HashingWriter(object):
+	"""
+	Minimal writable file-like object which forwards all written data to ``destination`` while also feeding it into
+	the ``hash`` object (e.g. a ``hashlib.sha1`` instance).
+
+	Arguments:
+	    destination (file): The file-like object to write to.
+	    hash (object): The hash object to update with the written data.
+	"""
+
+	def __init__(self, destination, hash):
+		self.destination = destination
+		self.hash = hash
+
+	def write(self, data):
+		self.hash.update(data)
+		self.destination.write(data)
+
+class IngestLimitExceeded(Exception):
+	"""
+	Raised from the line iterator of an :class:`IngestFileWrapper` to stop its ``analyzer`` once ``max_size`` bytes have
+	been fed to it.
+	"""
+	pass
+
+class IngestFileWrapper(AbstractFileWrapper):
+	"""
+	Wraps another :class:`AbstractFileWrapper` and upon :meth:`save` processes its contents in one single pass: the
+	contents are written to the target path, hashed with an incremental SHA1 and - if an ``analyzer`` was provided -
+	fed line by line to that analyzer, all while they are being read.
+
+	If the wrapped file is a :class:`DiskFileWrapper` configured to move its file, the (cheap) move is performed first
+	and the moved file is then read exactly once for hashing and analysis. If the wrapped file already knows its hash
+	and no analysis is requested, no read takes place at all.
+
+	Arguments:
+	    file_object (AbstractFileWrapper): The file to wrap.
+	    analyzer (callable): Callable which will be called with an iterator over the lines of the file and which is
+	        expected to consume that iterator and return its analysis result. Optional.
+	    max_size (int): Maximum number of bytes to feed into the ``analyzer``. If the file is larger than that, analysis
+	        will be stopped and :attr:`analysis` will stay ``None``. Optional, defaults to no limit.
+
+	Attributes:
+	    analysis: The result returned from the ``analyzer``, ``None`` if there was no analyzer or analysis did not
+	        finish.
+	"""
+
+	def __init__(self, file_object, analyzer=None, max_size=None):
+		AbstractFileWrapper.__init__(self, file_object.filename)
+		self.file_object = file_object
+		self.analyzer = analyzer
+		self.max_size = max_size
+		self.analysis = None
+
+	def save(self, path):
+		import hashlib
+		import logging
+
+		if isinstance(self.file_object, DiskFileWrapper) and self.file_object.move:
+			self.file_object.save(path)
+			if self.file_object.hash is not None and self.analyzer is None:
+				self.hash = self.file_object.hash
+				return
+			source = io.open(path, "rb")
+			destination = None
+		else:
+			source = self.file_object.stream()
+			destination = io.open(path, "wb")
+
+		hash = hashlib.sha1()
+		try:
+			def process(chunk):
+				if destination is not None:
+					destination.write(chunk)
+				hash.update(chunk)
+
+			if self.analyzer is not None:
+				lines = self._lines(source, process)
+				try:
+					self.analysis = self.analyzer(lines)
+				except IngestLimitExceeded:
+					logging.getLogger(__name__).debug("{} is larger than {} bytes, skipping analysis on ingest".format(self.filename, self.max_size))
+				except:
+					logging.getLogger(__name__).exception("Error while analysing {} on ingest".format(self.filename))
+
+				# make sure everything that wasn't consumed by the analyzer still gets processed
+				try:
+					for _ in lines:
+						pass
+				except IngestLimitExceeded:
+					pass
+
+			while True:
+				chunk = source.read(INGEST_BLOCKSIZE)
+				if not chunk:
+					break
+				process(chunk)
+		finally:
+			source.close()
+			if destination is not None:
+				destination.close()
+
+		self.hash = hash.hexdigest()
+
+	def stream(self):
+		return self.file_object.stream()
+
+	def _lines(self, source, process):
+		read = 0
+		leftover = b""
+		while True:
+			chunk = source.read(INGEST_BLOCKSIZE)
+			if not chunk:
+				break
+			process(chunk)
+			read += len(chunk)
+
+			if self.max_size is not None and read > self.max_size:
+				raise IngestLimitExceeded()
+
+			lines = (leftover + chunk).split(b"\n")
+			leftover = lines.pop()
+			for line in lines:
+				yield line + b"\n"
+
+		if leftover:
+			yield leftover
+
 class MultiStream(io.RawIOBase):
 	"""
 	A stream implementation which when read reads from multiple streams, one after the other, basically concatenating
@@ -152,6 +326,21 @@ class MultiStream(io.RawIOBase):
 	def writable(self, *args, **kwargs):
 		return False
 
+def _split_lines(data):
+	"""
+	Splits ``data`` into lines after each ``\\n``, keeping the line endings, like reading it line by line would.
+	"""
+	if data.count(b'\r') == data.count(b'\r\n'):
+		# no line ends with a lone \r, so the much faster splitlines splits exactly the same way
+		return data.splitlines(True)
+
+	lines = data.split(b'\n')
+	last = lines.pop()
+	lines = [line + b'\n' for line in lines]
+	if last:
+		lines.append(last)
+	return lines
+
 class LineProcessorStream(io.RawIOBase):
 	"""
 	While reading from this stream the provided `input_stream` is read line by line, calling the (overridable) method
@@ -159,56 +348,90 @@ class LineProcessorStream(io.RawIOBase):
 
 	Sub classes can thus modify the contents of the `input_stream` in line, while it is being read.
 
+	The `input_stream` is read in blocks of :data:`INGEST_BLOCKSIZE` bytes, which are split into lines and processed
+	as a whole, buffering the processed data until it is read.
+
+	If `input_stream` is another :class:`LineProcessorStream` that hasn't been read from yet (e.g. when several
+	``octoprint.filemanager.preprocessor`` hooks wrap each other's output), the two are fused: every line of the
+	original input is then passed through the :meth:`.process_line` methods of both in one single pass, instead of
+	this stream having to read and split the output of the wrapped one again.
+
 	Arguments:
 	    input_stream (io.IOBase): The stream to process on the fly.
 	"""
 
 	def __init__(self, input_stream):
 		io.RawIOBase.__init__(self)
-		self.input_stream = io.BufferedReader(input_stream)
-		self.leftover = None
+
+		if isinstance(input_stream, LineProcessorStream) and not input_stream._started:
+			self._processors = input_stream._processors + [self.process_line]
+			self.input_stream = input_stream.input_stream
+		else:
+			self._processors = [self.process_line]
+			self.input_stream = input_stream
+
+		# incomplete last line of the previous block, for each of the processors
+		self._partial_lines = [b''] * len(self._processors)
+
+		self._buffer = bytearray()
+		self._position = 0
+		self._started = False
+		self._eof = False
 
 	def read(self, n=-1):
 		if n == 0:
 			return b''
 
-		result = b''
-		while len(result) < n or n == -1:
-			bytes_left = (n - len(result)) if n != -1 else -1
-			if self.leftover is not None:
-				if bytes_left != -1 and bytes_left < len(self.leftover):
-					result += self.leftover[:bytes_left]
-					self.leftover = self.leftover[bytes_left:]
-					break
-				else:
-					result += self.leftover
-					self.leftover = None
-
-			processed_line = None
-			while processed_line is None:
-				line = self.input_stream.readline()
-				if not line:
-					break
-				processed_line = self.process_line(line)
-
-			if processed_line is None:
-				break
-
-			bytes_left = (n - len(result)) if n != -1 else -1
-			if bytes_left != -1 and bytes_left < len(processed_line):
-				result += processed_line[:bytes_left]
-				self.leftover = processed_line[bytes_left:]
-				break
-			else:
-				result += processed_line
+		self._fill(n)
 
+		end = len(self._buffer) if n < 0 else min(len(self._buffer), self._position + n)
+		result = memoryview(self._buffer)[self._position:end].tobytes()
+		self._position = end
+		self._compact()
 		return result
 
 	def readinto(self, b):
 		n = len(b)
-		read = self.read(n)
-		b[:len(read)] = read
-		return len(read)
+		self._fill(n)
+
+		read = min(n, len(self._buffer) - self._position)
+		b[:read] = self._buffer[self._position:self._position + read]
+		self._position += read
+		self._compact()
+		return read
+
+	def _fill(self, n):
+		self._started = True
+		while not self._eof and (n < 0 or len(self._buffer) - self._position < n):
+			chunk = self.input_stream.read(INGEST_BLOCKSIZE)
+			if not chunk:
+				self._eof = True
+			self._buffer += self._process(chunk or b'', self._eof)
+
+	def _compact(self):
+		# only drop what has already been read once that's the larger part of the buffer, to keep copying linear
+		if self._position >= INGEST_BLOCKSIZE and self._position * 2 >= len(self._buffer):
+			del self._buffer[:self._position]
+			self._position = 0
+
+	def _process(self, data, final):
+		for index, processor in enumerate(self._processors):
+			if self._partial_lines[index]:
+				data = self._partial_lines[index] + data
+
+			lines = _split_lines(data)
+			if lines and not final and not lines[-1].endswith(b'\n'):
+				self._partial_lines[index] = lines.pop()
+			else:
+				self._partial_lines[index] = b''
+
+			output = []
+			for line in lines:
+				processed_line = processor(line)
+				if processed_line is not None:
+					output.append(processed_line)
+			data = b''.join(output)
+		return data
 
 	def process_line(self, line):
 		"""
@@ -13,6 +13,9 @@ abstracted version of the actual printer communiciation.
 
 .. autoclass:: PrinterCallback
    :members:
+
+.. autoclass:: PrinterStateSnapshot
+   :members:
 """
 
 from __future__ import absolute_import
@@ -21,7 +24,9 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import json
 import re
+import threading
 
 import octoprint.util.comm as comm
 from octoprint.settings import settings
@@ -488,6 +493,8 @@ class PrinterCallback(object):
 		        filepos: <current position in the file in bytes>
 		        printTime: <current time elapsed for printing, in seconds>
 		        printTimeLeft: <estimated time left to finish printing, in seconds>
+		        printTimeLeftInterval: <lower and upper bound of the time left to finish printing, in seconds, or None>
+		        printTimeLeftStable: <whether the estimated time left isn't expected to change considerably anymore>
 		    currentZ: <current position of the z axis, in mm>
 		    offsets: <current configured temperature offsets, keys are "bed" or "tool[0-9]+", values the offset in degC>
 
@@ -496,6 +503,180 @@ class PrinterCallback(object):
 		"""
 		pass
 
+	def on_printer_send_current_snapshot(self, snapshot):
+		"""
+		Called with the same updates as :func:`on_printer_send_current_data`, but with a :class:`PrinterStateSnapshot`
+		of the data shared by all callbacks instead of a copy of the data for each callback.
+
+		The default implementation hands a copy of the snapshot's data to :func:`on_printer_send_current_data`.
+		Callbacks that only read the data (e.g. to forward it to a client) should override this instead, saving that
+		copy.
+
+		Arguments:
+		    snapshot (PrinterStateSnapshot): The current data
+		"""
+		self.on_printer_send_current_data(snapshot.copy())
+
+
+class PrinterStateSnapshot(object):
+	"""
+	Immutable snapshot of the current data of the :class:`PrinterInterface` as pushed to
+	:func:`PrinterCallback.on_printer_send_current_snapshot`, shared by all callbacks.
+
+	The data is available as nested read-only ``dict`` and ``tuple`` instances through :attr:`data`. The JSON
+	representation of the data is only created once, on first request through :func:`as_json`, and then shared by all
+	callbacks as well.
+
+	Snapshots are numbered consecutively through their :attr:`sequence`. If the ``previous`` snapshot is provided, the
+	snapshot also knows the :attr:`changes` of its data since that.
+
+	Arguments:
+	    data (dict): The data to take a snapshot of, the snapshot doesn't keep any reference to its containers
+	    previous (PrinterStateSnapshot): The snapshot preceding this one, no reference to it is kept either
+	"""
+
+	def __init__(self, data, previous=None):
+		self._data = _freeze(data)
+		self._json = None
+		self._json_lock = threading.Lock()
+
+		if previous is not None:
+			self._sequence = previous.sequence + 1
+			self._changes = tuple(_diff(previous.data, self._data))
+		else:
+			self._sequence = 1
+			self._changes = None
+		self._delta_json = None
+
+	@property
+	def sequence(self):
+		"""Sequence number of the snapshot, one higher than the one of the preceding snapshot."""
+		return self._sequence
+
+	@property
+	def changes(self):
+		"""
+		Changes of the data since the preceding snapshot, ``None`` if that wasn't provided. A tuple of ``(path, value)``
+		tuples for each value that was added or changed and ``(path,)`` tuples for each value that was removed, with
+		``path`` being the tuple of keys leading to the value. Values that aren't a ``dict`` in both snapshots are
+		reported as a whole.
+		"""
+		return self._changes
+
+	@property
+	def data(self):
+		"""The snapshot's data, as a read-only ``dict``."""
+		return self._data
+
+	def copy(self):
+		"""Returns a mutable deep copy of the snapshot's data."""
+		return _thaw(self._data)
+
+	def as_json(self, extra=None):
+		"""
+		Returns the JSON representation of the snapshot's data.
+
+		If ``extra`` is provided, its entries are added to the JSON object of the snapshot's data, overriding entries
+		with the same keys. Only ``extra`` is encoded for that, the snapshot's data is reused as already encoded.
+
+		Arguments:
+		    extra (dict): Additional entries to add to the encoded data
+
+		Returns:
+		    str: The JSON representation of the data
+		"""
+		with self._json_lock:
+			if self._json is None:
+				self._json = _json_encode(self._data)
+			result = self._json
+
+		return _json_merge(result, extra)
+
+	def as_delta_json(self, extra=None):
+		"""
+		Returns the JSON representation of the :attr:`changes` since the preceding snapshot, as an object with the
+		snapshot's ``seq`` and the ``changes`` as a list of ``[path, value]`` and ``[path]`` lists. Like with
+		:func:`as_json`, ``extra`` is added to that object without encoding the changes again.
+
+		Arguments:
+		    extra (dict): Additional entries to add to the encoded changes
+
+		Returns:
+		    str: The JSON representation of the changes, or ``None`` if they are unknown
+		"""
+		if self._changes is None:
+			return None
+
+		with self._json_lock:
+			if self._delta_json is None:
+				self._delta_json = _json_encode(dict(seq=self._sequence, changes=self._changes))
+			result = self._delta_json
+
+		return _json_merge(result, extra)
+
+
+def _json_encode(data):
+	# same compact encoding as SockJS uses for its messages
+	return json.dumps(data, separators=(",", ":"))
+
+
+def _json_merge(encoded, extra):
+	# adds the entries of extra to the already encoded object, without encoding that again
+	if not extra:
+		return encoded
+
+	encoded_extra = _json_encode(extra)
+	if encoded == "{}":
+		return encoded_extra
+	return encoded[:-1] + "," + encoded_extra[1:]
+
+
+def _diff(old, new, path=()):
+	if not isinstance(old, dict) or not isinstance(new, dict):
+		# True == 1 == 1.0, but they'd still look different to the client
+		if type(old) is not type(new) or old != new:
+			yield (path, new)
+		return
+
+	for key in old:
+		if key not in new:
+			yield (path + (key,),)
+
+	for key, value in new.items():
+		if key in old:
+			for change in _diff(old[key], value, path=path + (key,)):
+				yield change
+		else:
+			yield (path + (key,), value)
+
+
+class _FrozenDict(dict):
+	def _immutable(self, *args, **kwargs):
+		raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+	__setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+	def __reduce__(self):
+		# copying and pickling would otherwise try to set the items one by one
+		return self.__class__, (dict(self),)
+
+
+def _freeze(value):
+	if isinstance(value, dict):
+		return _FrozenDict((key, _freeze(v)) for key, v in value.items())
+	elif isinstance(value, (list, tuple)):
+		return tuple(_freeze(v) for v in value)
+	return value
+
+
+def _thaw(value):
+	if isinstance(value, dict):
+		return dict((key, _thaw(v)) for key, v in value.items())
+	elif isinstance(value, tuple):
+		return [_thaw(v) for v in value]
+	return value
+
+
 class UnknownScript(Exception):
 	def __init__(self, name, *args, **kwargs):
 		self.name = name
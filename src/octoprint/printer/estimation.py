@@ -6,7 +6,100 @@ __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
 
+import collections
+import math
+
+from octoprint.settings import settings
+
+
+PrintTimeEstimate = collections.namedtuple("PrintTimeEstimate", "progress, time_left, interval, stable")
+PrintTimeEstimate.__new__.__defaults__ = (False,)
+"""
+Result of :func:`PrintTimeEstimator.estimate`.
+
+``progress`` is the progress of the print job from 0.0 to 1.0, ``time_left`` the estimated time left to print in
+seconds (or ``None`` if there's no estimate yet) and ``interval`` a ``(low, high)`` tuple bounding ``time_left`` (or
+``None`` if the estimator cannot tell how reliable its estimate is yet). ``stable`` tells whether the estimate is
+based on the progress of the job itself enough to not be expected to change considerably anymore, it's optional and
+defaults to ``False``.
+"""
+
+
+class _RollingWindow(object):
+	"""
+	Fixed size window over the most recent values which keeps its sum and the sum of squared deviations from its mean
+	up to date on every append, so that mean and variance can be read in ``O(1)``.
+
+	Sliding a value out of a running sum accumulates rounding errors, so both sums are recomputed from scratch every
+	time the window has been completely replaced, which keeps appends amortized ``O(1)``.
+	"""
+
+	def __init__(self, size):
+		self._size = size
+		self._values = collections.deque([], size)
+		self._sum = 0.0
+		self._mean = 0.0
+		self._m2 = 0.0
+		self._replaced = 0
+
+	def __len__(self):
+		return len(self._values)
+
+	@property
+	def full(self):
+		return len(self._values) >= self._size
+
+	@property
+	def mean(self):
+		if not self._values:
+			return None
+		return self._sum / len(self._values)
+
+	@property
+	def variance(self):
+		if len(self._values) < 2:
+			return None
+		return max(0.0, self._m2 / (len(self._values) - 1))
+
+	def append(self, value):
+		count = len(self._values)
+		if count < self._size:
+			# Welford's algorithm
+			self._values.append(value)
+			self._sum += value
+			delta = value - self._mean
+			self._mean += delta / (count + 1)
+			self._m2 += delta * (value - self._mean)
+			return
+
+		# the window is full, so the oldest value gets replaced by the new one
+		oldest = self._values[0]
+		self._values.append(value)
+		self._replaced += 1
+
+		if self._replaced >= self._size:
+			self._recompute()
+			return
+
+		old_mean = self._mean
+		self._sum += value - oldest
+		self._mean += (value - oldest) / count
+		self._m2 += (value - oldest) * (value - self._mean + oldest - old_mean)
+
+	def _recompute(self):
+		self._replaced = 0
+		self._sum = sum(self._values)
+		self._mean = self._sum / len(self._values)
+		self._m2 = sum((value - self._mean) ** 2 for value in self._values)
+
+
 class TimeEstimationHelper(object):
+	"""
+	Tracks the stream of total print time estimates produced during a print and decides when their average has become
+	stable enough to be presented to the user.
+
+	All updates and properties take constant time regardless of the size of the rolling window.
+	"""
 
 	STABLE_THRESHOLD = 0.1
 	STABLE_COUNTDOWN = 250
@@ -24,9 +117,8 @@ class TimeEstimationHelper(object):
 		self._countdown = countdown
 		self._threshold = threshold
 
-		import collections
-		self._distances = collections.deque([], self._rolling_window)
-		self._totals = collections.deque([], self._rolling_window)
+		self._distances = _RollingWindow(self._rolling_window)
+		self._totals = _RollingWindow(self._rolling_window)
 		self._sum_total = 0
 		self._count = 0
 		self._stable_counter = None
@@ -44,7 +136,8 @@ class TimeEstimationHelper(object):
 			if old_average_total:
 				self._distances.append(abs(self.average_total - old_average_total))
 
-			if -1.0 * self._threshold < self.average_distance < self._threshold:
+			average_distance = self.average_distance
+			if average_distance is not None and -1.0 * self._threshold < average_distance < self._threshold:
 				if self._stable_counter is None:
 					self._stable_counter = 0
 				else:
@@ -64,11 +157,190 @@ class TimeEstimationHelper(object):
 		if not self._count or self._count < self._rolling_window:
 			return None
 		else:
-			return sum(self._totals) / len(self._totals)
+			return self._totals.mean
 
 	@property
 	def average_distance(self):
 		if not self._count or self._count < self._rolling_window + 1:
 			return None
 		else:
-			return sum(self._distances) / len(self._distances)
\ No newline at end of file
+			return self._distances.mean
+
+	@property
+	def variance_rolling(self):
+		"""Sample variance of the estimates within the rolling window, ``None`` until the window has been filled."""
+		if not self._count or self._count < self._rolling_window:
+			return None
+		else:
+			return self._totals.variance
+
+	@property
+	def stddev_rolling(self):
+		variance = self.variance_rolling
+		if variance is None:
+			return None
+		return math.sqrt(variance)
+
+	def confidence_interval(self, z=1.96):
+		"""
+		Returns a ``(low, high)`` tuple around :attr:`average_total_rolling` spanning ``z`` standard deviations of the
+		estimates within the rolling window to either side, or ``None`` until the window has been filled. The
+		default of ``z = 1.96`` covers roughly 95% of normally distributed estimates.
+		"""
+		average = self.average_total_rolling
+		stddev = self.stddev_rolling
+		if average is None or stddev is None:
+			return None
+		return average - z * stddev, average + z * stddev
+
+
+class PrintTimeEstimator(object):
+	"""
+	Estimates progress and time left of a print job from the job's progress as reported by the communication layer.
+
+	This default implementation extrapolates the total print time from the print time so far and the progress through
+	the file, tracked through a :class:`TimeEstimationHelper`. Until those extrapolations have become stable it blends
+	in the statistical estimate of the job (average print time of earlier prints or the analysis result), if available.
+
+	A new estimator is created for every print job. Plugins may provide their own estimator through the
+	``octoprint.printer.estimation.factory`` hook.
+
+	Arguments:
+	    job (dict): The print job to estimate, containing the keys ``file`` (path of the file), ``origin`` (``local`` or
+	        ``sdcard``), ``size`` (file size in bytes), ``estimatedPrintTime`` (statistical estimate of the total print
+	        time in seconds or ``None``), ``averagePrintTime`` (average total print time of earlier prints of the file
+	        on the current printer or ``None``), ``printTimeStatistics`` (statistics over earlier prints of the file on
+	        the current printer as returned by :func:`~octoprint.filemanager.history.PrintStatistics.as_dict` or
+	        ``None``) and ``timeIndex`` (the file's :class:`~octoprint.filemanager.timeindex.TimeIndex` or ``None``).
+	"""
+
+	def __init__(self, job):
+		self._job = job
+
+		# percentiles of the print times of earlier prints of the file, if it has been printed successfully before
+		self._percentiles = None
+		statistics = job.get("printTimeStatistics")
+		if statistics:
+			self._percentiles = statistics.get("printTime", dict()).get("percentiles")
+
+		rolling_window = None
+		threshold = None
+		countdown = None
+		if job.get("origin") == "sdcard":
+			# we are interesting in a rolling window of roughly the last 15s, so the number of entries has to be derived
+			# by that divided by the sd status polling interval
+			rolling_window = 15 / settings().get(["serial", "timeout", "sdStatus"])
+
+			# we are happy if the average of the estimates stays within 60s of the prior one
+			threshold = 60
+
+			# we are happy when one rolling window has been stable
+			countdown = rolling_window
+		self._helper = TimeEstimationHelper(rolling_window=rolling_window, threshold=threshold, countdown=countdown)
+
+	def estimate(self, progress, filepos, printTime, cleanedPrintTime):
+		"""
+		Estimates the time left of the print job.
+
+		Arguments:
+		    progress (float): Progress through the file from 0.0 to 1.0, may be ``None``.
+		    filepos (int): Current position in the file in bytes, may be ``None``.
+		    printTime (float): Time spent printing so far in seconds, may be ``None``.
+		    cleanedPrintTime (float): Time spent printing so far in seconds minus the time it took to heat up, may be
+		        ``None``.
+
+		Returns:
+		    PrintTimeEstimate: The estimate.
+		"""
+		estimatedTotalPrintTime = None
+		interval = None
+		stable = False
+		if progress and cleanedPrintTime:
+			self._helper.update(cleanedPrintTime / progress)
+			if self._helper.is_stable():
+				estimatedTotalPrintTime = self._helper.average_total_rolling
+				interval = self._helper.confidence_interval()
+				stable = True
+
+		totalPrintTime = estimatedTotalPrintTime
+		statisticalTotalPrintTime = self._job.get("estimatedPrintTime")
+		if statisticalTotalPrintTime and progress and cleanedPrintTime:
+			if estimatedTotalPrintTime is None:
+				totalPrintTime = statisticalTotalPrintTime
+				if self._percentiles:
+					# most earlier prints took somewhere in between
+					interval = (self._percentiles["p10"], self._percentiles["p90"])
+			else:
+				if progress < 0.5:
+					sub_progress = progress * 2
+				else:
+					sub_progress = 1.0
+				totalPrintTime = (1 - sub_progress) * statisticalTotalPrintTime + sub_progress * estimatedTotalPrintTime
+
+				if sub_progress < 1.0:
+					# we are still mixing in the statistical estimate, so we can't really tell how far off we are
+					interval = None
+					stable = False
+
+		if totalPrintTime is None or cleanedPrintTime is None:
+			return PrintTimeEstimate(progress, None, None, False)
+
+		if interval is not None:
+			interval = (max(0.0, interval[0] - cleanedPrintTime), max(0.0, interval[1] - cleanedPrintTime))
+		return PrintTimeEstimate(progress, totalPrintTime - cleanedPrintTime, interval, stable)
+
+
+class TimeIndexPrintTimeEstimator(PrintTimeEstimator):
+	"""
+	Estimates progress and time left of a print job from the :class:`~octoprint.filemanager.timeindex.TimeIndex` the
+	analysis created for the file, falling back to :class:`PrintTimeEstimator` for jobs without one.
+
+	Progress is the estimated print time up to the current file position relative to the estimated total print time.
+	The time left is corrected by how far the actual print time has drifted from the estimated one, starting from the
+	ratio of average to estimated print time of earlier prints and trusting the observed drift more the longer the job
+	has been printing.
+	"""
+
+	DRIFT_WINDOW = 600.0
+	"""Estimated print time in seconds after which the drift from the time index is fully trusted."""
+
+	MIN_FACTOR = 0.25
+	MAX_FACTOR = 4.0
+
+	def __init__(self, job):
+		PrintTimeEstimator.__init__(self, job)
+
+		self._time_index = job.get("timeIndex")
+		if self._time_index is not None and not self._time_index.total:
+			self._time_index = None
+
+		self._factor = 1.0
+		averagePrintTime = self._percentiles["p50"] if self._percentiles else job.get("averagePrintTime")
+		if self._time_index is not None and averagePrintTime:
+			# if we've printed this file before, we know how far off the analysis was
+			self._factor = self._clamp(averagePrintTime / self._time_index.total)
+
+	def estimate(self, progress, filepos, printTime, cleanedPrintTime):
+		if self._time_index is None or not progress or filepos is None:
+			return PrintTimeEstimator.estimate(self, progress, filepos, printTime, cleanedPrintTime)
+
+		total = self._time_index.total
+		expected = self._time_index.time_at(filepos)
+
+		factor = self._factor
+		observed = factor
+		weight = 0.0
+		if cleanedPrintTime and expected > 0:
+			observed = self._clamp(cleanedPrintTime / expected)
+			weight = min(1.0, expected / self.DRIFT_WINDOW)
+			factor = self._clamp((1.0 - weight) * factor + weight * observed)
+
+		# the truth is most likely somewhere between what we assumed up front and what we are observing right now
+		remaining = total - expected
+		interval = (remaining * min(self._factor, observed), remaining * max(self._factor, observed))
+
+		# once the observed drift is fully trusted, the estimate only follows the actual progress
+		return PrintTimeEstimate(min(1.0, expected / total), remaining * factor, interval, weight >= 1.0)
+
+	def _clamp(self, factor):
+		return max(self.MIN_FACTOR, min(self.MAX_FACTOR, factor))
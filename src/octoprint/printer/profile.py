@@ -137,6 +137,30 @@ class PrinterProfileManager(object):
 	   * - ``axes.e.inverted``
 	     - ``bool``
 	     - Whether a positive value change extrudes (False, default) or retracts (True) filament
+	   * - ``kinematics``
+	     - ``dict``
+	     - Information about the printer's motion planner as configured in its firmware, used for estimating print times.
+	       ``None`` (the default) if not configured, print times are then estimated from distances and feedrates
+	       alone. Values missing from a configured section are taken from :attr:`default_kinematics`
+	   * - ``kinematics.acceleration``
+	     - ``dict``
+	     - Default accelerations in mm/s² for printing (``print``), travel (``travel``) and extruder only (``retract``)
+	       moves, as set through ``M204``
+	   * - ``kinematics.maxAcceleration``
+	     - ``dict``
+	     - Maximum acceleration in mm/s² per axis ``x``, ``y``, ``z`` and ``e``, as set through ``M201``
+	   * - ``kinematics.maxFeedrate``
+	     - ``dict``
+	     - Maximum feedrate in mm/s per axis ``x``, ``y``, ``z`` and ``e``, as set through ``M203``
+	   * - ``kinematics.jerk``
+	     - ``dict``
+	     - Maximum instantaneous speed change in mm/s per axis ``x``, ``y``, ``z`` and ``e``, as set through ``M205``
+	   * - ``kinematics.junctionDeviation``
+	     - ``float``
+	     - Junction deviation in mm if the firmware uses it instead of jerk, 0 otherwise
+	   * - ``kinematics.bufferDepth``
+	     - ``int``
+	     - Number of moves the firmware's planner looks ahead
 	"""
 
 	default = dict(
@@ -164,9 +188,20 @@ class PrinterProfileManager(object):
 			y = dict(speed=6000, inverted=False),
 			z = dict(speed=200, inverted=False),
 			e = dict(speed=300, inverted=False)
-		)
+		),
+		kinematics = None
 	)
 
+	default_kinematics = dict(
+		acceleration = {"print": 1000.0, "travel": 1000.0, "retract": 1000.0},
+		maxAcceleration = dict(x=3000.0, y=3000.0, z=100.0, e=10000.0),
+		maxFeedrate = dict(x=300.0, y=300.0, z=5.0, e=25.0),
+		jerk = dict(x=10.0, y=10.0, z=0.4, e=5.0),
+		junctionDeviation = 0.0,
+		bufferDepth = 16
+	)
+	"""Marlin-like defaults for anything missing from a profile's configured ``kinematics`` section."""
+
 	def __init__(self):
 		self._current = None
 		self._folder = settings().getBaseFolder("printerProfiles")
@@ -371,11 +406,22 @@ class PrinterProfileManager(object):
 
 	def _migrate_profile(self, profile):
 		# make sure profile format is up to date
+		modified = False
+
 		if "volume" in profile and "formFactor" in profile["volume"] and not "origin" in profile["volume"]:
 			profile["volume"]["origin"] = BedOrigin.CENTER if profile["volume"]["formFactor"] == BedTypes.CIRCULAR else BedOrigin.LOWERLEFT
-			return True
+			modified = True
+
+		if not "kinematics" in profile:
+			# kinematics were added later, they stay unconfigured until the user configures them, so that print time
+			# estimates don't change based on guessed values
+			profile["kinematics"] = None
+			modified = True
+		elif isinstance(profile["kinematics"], dict) and not dict_contains_keys(self.__class__.default_kinematics, profile["kinematics"]):
+			profile["kinematics"] = dict_merge(self.__class__.default_kinematics, profile["kinematics"])
+			modified = True
 
-		return False
+		return modified
 
 	def _ensure_valid_profile(self, profile):
 		# ensure all keys are present
@@ -396,8 +442,19 @@ class PrinterProfileManager(object):
 
 			value[path[-1]] = converter(value[path[-1]])
 
+		# fill in whatever is missing from configured kinematics
+		kinematics = profile["kinematics"]
+		if kinematics is not None:
+			if not isinstance(kinematics, dict):
+				self._logger.warn("Profile has invalid value for kinematics: {kinematics!r}".format(kinematics=kinematics))
+				return False
+			profile["kinematics"] = dict_merge(self.__class__.default_kinematics, kinematics)
+
 		# convert ints
-		for path in (("extruder", "count"), ("axes", "x", "speed"), ("axes", "y", "speed"), ("axes", "z", "speed")):
+		int_paths = [("extruder", "count"), ("axes", "x", "speed"), ("axes", "y", "speed"), ("axes", "z", "speed")]
+		if kinematics is not None:
+			int_paths.append(("kinematics", "bufferDepth"))
+		for path in int_paths:
 			try:
 				convert_value(profile, path, int)
 			except Exception as e:
@@ -405,7 +462,15 @@ class PrinterProfileManager(object):
 				return False
 
 		# convert floats
-		for path in (("volume", "width"), ("volume", "depth"), ("volume", "height"), ("extruder", "nozzleDiameter")):
+		kinematics_paths = []
+		if kinematics is not None:
+			kinematics_paths.append(("kinematics", "junctionDeviation"))
+			for key in ("print", "travel", "retract"):
+				kinematics_paths.append(("kinematics", "acceleration", key))
+			for key in ("maxAcceleration", "maxFeedrate", "jerk"):
+				for axis in ("x", "y", "z", "e"):
+					kinematics_paths.append(("kinematics", key, axis))
+		for path in [("volume", "width"), ("volume", "depth"), ("volume", "height"), ("extruder", "nozzleDiameter")] + kinematics_paths:
 			try:
 				convert_value(profile, path, float)
 			except:
@@ -420,6 +485,11 @@ class PrinterProfileManager(object):
 				self._logger.warn("Profile has invalid value for path {path!r}: {msg}".format(path=".".join(path), msg=str(e)))
 				return False
 
+		# validate kinematics
+		if kinematics is not None and profile["kinematics"]["bufferDepth"] < 1:
+			self._logger.warn("Profile has invalid value kinematics.bufferDepth: {bufferDepth}".format(bufferDepth=profile["kinematics"]["bufferDepth"]))
+			return False
+
 		# validate form factor
 		if not profile["volume"]["formFactor"] in BedTypes.values():
 			self._logger.warn("Profile has invalid value volume.formFactor: {formFactor}".format(formFactor=profile["volume"]["formFactor"]))
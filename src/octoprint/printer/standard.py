@@ -9,7 +9,6 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
-import copy
 import logging
 import os
 import threading
@@ -19,8 +18,8 @@ from octoprint import util as util
 from octoprint.events import eventManager, Events
 from octoprint.filemanager import FileDestinations
 from octoprint.plugin import plugin_manager, ProgressPlugin
-from octoprint.printer import PrinterInterface, PrinterCallback, UnknownScript
-from octoprint.printer.estimation import TimeEstimationHelper
+from octoprint.printer import PrinterInterface, PrinterCallback, PrinterStateSnapshot, UnknownScript
+from octoprint.printer.estimation import TimeIndexPrintTimeEstimator
 from octoprint.settings import settings
 from octoprint.util import comm as comm
 from octoprint.util import InvariantContainer
@@ -72,20 +71,23 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 		self._sdPrinting = False
 		self._sdStreaming = False
 		self._sdFilelistAvailable = threading.Event()
+		self._sdFilelistGeneration = 0
 		self._streamingFinishedCallback = None
 
 		self._selectedFile = None
-		self._timeEstimationData = None
+		self._timeEstimator = None
 
 		# comm
 		self._comm = None
 
 		# callbacks
 		self._callbacks = []
+		self._lastSnapshot = None
 
 		# progress plugins
 		self._lastProgressReport = None
 		self._progressPlugins = plugin_manager().get_implementations(ProgressPlugin)
+		self._estimatorFactoryHooks = plugin_manager().get_hooks("octoprint.printer.estimation.factory")
 
 		self._stateMonitor = StateMonitor(
 			interval=0.5,
@@ -110,7 +112,7 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 					"volume": None
 				}
 			},
-			progress={"completion": None, "filepos": None, "printTime": None, "printTimeLeft": None},
+			progress={"completion": None, "filepos": None, "printTime": None, "printTimeLeft": None, "printTimeLeftInterval": None, "printTimeLeftStable": False},
 			current_z=None
 		)
 
@@ -146,8 +148,15 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 			except: self._logger.exception("Exception while adding printer message")
 
 	def _sendCurrentDataCallbacks(self, data):
+		# one snapshot for all callbacks, so it only gets copied (and serialized) once
+		snapshot = PrinterStateSnapshot(data, previous=self._lastSnapshot)
+		self._lastSnapshot = snapshot
 		for callback in self._callbacks:
-			try: callback.on_printer_send_current_data(copy.deepcopy(data))
+			try:
+				if hasattr(callback, "on_printer_send_current_snapshot"):
+					callback.on_printer_send_current_snapshot(snapshot)
+				else:
+					callback.on_printer_send_current_data(snapshot.copy())
 			except: self._logger.exception("Exception while pushing current data")
 
 	#~~ callback from metadata analysis event
@@ -375,20 +384,15 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 		if self._selectedFile is None:
 			return
 
-		rolling_window = None
-		threshold = None
-		countdown = None
-		if self._selectedFile["sd"]:
-			# we are interesting in a rolling window of roughly the last 15s, so the number of entries has to be derived
-			# by that divided by the sd status polling interval
-			rolling_window = 15 / settings().get(["serial", "timeout", "sdStatus"])
-
-			# we are happy if the average of the estimates stays within 60s of the prior one
-			threshold = 60
-
-			# we are happy when one rolling window has been stable
-			countdown = rolling_window
-		self._timeEstimationData = TimeEstimationHelper(rolling_window=rolling_window, threshold=threshold, countdown=countdown)
+		self._timeEstimator = self._createTimeEstimator({
+			"file": self._selectedFile["filename"],
+			"origin": FileDestinations.SDCARD if self._selectedFile["sd"] else FileDestinations.LOCAL,
+			"size": self._selectedFile["filesize"],
+			"estimatedPrintTime": self._selectedFile["estimatedPrintTime"],
+			"averagePrintTime": self._selectedFile["averagePrintTime"],
+			"printTimeStatistics": self._selectedFile["printTimeStatistics"],
+			"timeIndex": self._selectedFile["timeIndex"]
+		})
 
 		self._lastProgressReport = None
 		self._setProgressData(0, None, None, None)
@@ -508,10 +512,20 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 	#~~ sd file handling
 
 	def get_sd_files(self):
+		"""
+		Returns the cached list of files stored on the SD card as ``(name, size)`` tuples. The list is refreshed in the
+		background whenever the contents of the SD card change, see :func:`get_sd_files_generation`.
+		"""
 		if self._comm is None or not self._comm.isSdReady():
 			return []
 		return map(lambda x: (x[0][1:], x[1]), self._comm.getSdFiles())
 
+	def get_sd_files_generation(self):
+		"""
+		Returns a counter which is increased every time the list of files returned by :func:`get_sd_files` changes.
+		"""
+		return self._sdFilelistGeneration
+
 	def add_sd_file(self, filename, absolutePath, streamingFinishedCallback):
 		if not self._comm or self._comm.isBusy() or not self._comm.isSdReady():
 			self._logger.error("No connection to printer or printer is busy")
@@ -519,11 +533,21 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 
 		self._streamingFinishedCallback = streamingFinishedCallback
 
-		self.refresh_sd_files(blocking=True)
+		if self._comm.isSdFileListOutdated():
+			# we need to know all files on the card to pick a name that's not taken yet
+			self.refresh_sd_files(blocking=True)
 		existingSdFiles = map(lambda x: x[0], self._comm.getSdFiles())
 
 		remoteName = util.get_dos_filename(filename, existing_filenames=existingSdFiles, extension="gco")
-		self._timeEstimationData = TimeEstimationHelper()
+		self._timeEstimator = self._createTimeEstimator({
+			"file": filename,
+			"origin": FileDestinations.LOCAL,
+			"size": None,
+			"estimatedPrintTime": None,
+			"averagePrintTime": None,
+			"printTimeStatistics": None,
+			"timeIndex": None
+		})
 		self._comm.startFileTransfer(absolutePath, filename, "/" + remoteName)
 
 		return remoteName
@@ -546,15 +570,26 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 	def refresh_sd_files(self, blocking=False):
 		"""
 		Refreshs the list of file stored on the SD card attached to printer (if available and printer communication
-		available). Optional blocking parameter allows making the method block (max 10s) until the file list has been
-		received (and can be accessed via self._comm.getSdFiles()). Defaults to an asynchronous operation.
+		available). Optional blocking parameter allows making the method block (max 10s) until an up to date file list
+		has been received (and can be accessed via self._comm.getSdFiles()). Defaults to an asynchronous operation.
+
+		Modifications of the SD card made through OctoPrint already refresh the list on their own, so this only needs to
+		be called if the card might have been modified otherwise.
 		"""
-		if not self._comm or not self._comm.isSdReady():
+		comm = self._comm
+		if not comm or not comm.isSdReady():
 			return
-		self._sdFilelistAvailable.clear()
-		self._comm.refreshSdFiles()
+		comm.refreshSdFiles()
 		if blocking:
-			self._sdFilelistAvailable.wait(10000)
+			deadline = time.time() + 10.0
+			while comm.isSdFileListOutdated():
+				remaining = deadline - time.time()
+				if remaining <= 0:
+					break
+				self._sdFilelistAvailable.clear()
+				if not comm.isSdFileListOutdated():
+					break
+				self._sdFilelistAvailable.wait(remaining)
 
 	#~~ state monitoring
 
@@ -580,45 +615,45 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 		self._messages.append(message)
 		self._stateMonitor.add_message(message)
 
-	def _estimateTotalPrintTime(self, progress, printTime):
-		if not progress or not printTime or not self._timeEstimationData:
-			return None
-
-		else:
-			newEstimate = printTime / progress
-			self._timeEstimationData.update(newEstimate)
+	def _createTimeEstimator(self, job):
+		for name, factory in self._estimatorFactoryHooks.items():
+			try:
+				estimator = factory(job)
+			except:
+				self._logger.exception("Error while creating print time estimator through hook {}".format(name))
+				continue
 
-			result = None
-			if self._timeEstimationData.is_stable():
-				result = self._timeEstimationData.average_total_rolling
+			if estimator is not None:
+				return estimator
 
-			return result
+		return TimeIndexPrintTimeEstimator(job)
 
 	def _setProgressData(self, progress, filepos, printTime, cleanedPrintTime):
-		estimatedTotalPrintTime = self._estimateTotalPrintTime(progress, cleanedPrintTime)
-		totalPrintTime = estimatedTotalPrintTime
-
-		if self._selectedFile and "estimatedPrintTime" in self._selectedFile and self._selectedFile["estimatedPrintTime"]:
-			statisticalTotalPrintTime = self._selectedFile["estimatedPrintTime"]
-			if progress and cleanedPrintTime:
-				if estimatedTotalPrintTime is None:
-					totalPrintTime = statisticalTotalPrintTime
-				else:
-					if progress < 0.5:
-						sub_progress = progress * 2
-					else:
-						sub_progress = 1.0
-					totalPrintTime = (1 - sub_progress) * statisticalTotalPrintTime + sub_progress * estimatedTotalPrintTime
+		printTimeLeft = None
+		printTimeLeftInterval = None
+		printTimeLeftStable = False
+		if self._timeEstimator is not None:
+			try:
+				estimate = self._timeEstimator.estimate(progress, filepos, printTime, cleanedPrintTime)
+			except:
+				self._logger.exception("Error while estimating print time")
+			else:
+				progress, printTimeLeft = estimate.progress, estimate.time_left
+				if printTimeLeft is not None:
+					printTimeLeftInterval = estimate.interval
+					printTimeLeftStable = bool(getattr(estimate, "stable", False))
 
 		self._progress = progress
 		self._printTime = printTime
-		self._printTimeLeft = totalPrintTime - cleanedPrintTime if (totalPrintTime is not None and cleanedPrintTime is not None) else None
+		self._printTimeLeft = printTimeLeft
 
 		self._stateMonitor.set_progress({
 			"completion": self._progress * 100 if self._progress is not None else None,
 			"filepos": filepos,
 			"printTime": int(self._printTime) if self._printTime is not None else None,
-			"printTimeLeft": int(self._printTimeLeft) if self._printTimeLeft is not None else None
+			"printTimeLeft": int(self._printTimeLeft) if self._printTimeLeft is not None else None,
+			"printTimeLeftInterval": [int(x) for x in printTimeLeftInterval] if printTimeLeftInterval is not None else None,
+			"printTimeLeftStable": printTimeLeftStable
 		})
 
 		if progress:
@@ -664,7 +699,10 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 				"filename": path_in_storage,
 				"filesize": filesize,
 				"sd": sd,
-				"estimatedPrintTime": None
+				"estimatedPrintTime": None,
+				"averagePrintTime": None,
+				"printTimeStatistics": None,
+				"timeIndex": None
 			}
 		else:
 			self._selectedFile = None
@@ -703,19 +741,35 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 						estimatedPrintTime = fileData["analysis"]["estimatedPrintTime"]
 					if "filament" in fileData["analysis"].keys():
 						filament = fileData["analysis"]["filament"]
-				if "statistics" in fileData:
-					printer_profile = self._printerProfileManager.get_current_or_default()["id"]
-					if "averagePrintTime" in fileData["statistics"] and printer_profile in fileData["statistics"]["averagePrintTime"]:
-						averagePrintTime = fileData["statistics"]["averagePrintTime"][printer_profile]
-					if "lastPrintTime" in fileData["statistics"] and printer_profile in fileData["statistics"]["lastPrintTime"]:
-						lastPrintTime = fileData["statistics"]["lastPrintTime"][printer_profile]
-
-				if averagePrintTime is not None:
-					self._selectedFile["estimatedPrintTime"] = averagePrintTime
-				elif estimatedPrintTime is not None:
+
+				if estimatedPrintTime is not None:
 					# TODO apply factor which first needs to be tracked!
 					self._selectedFile["estimatedPrintTime"] = estimatedPrintTime
 
+		printTimeStatistics = None
+		try:
+			printTimeStatistics = self._fileManager.get_print_statistics(FileDestinations.SDCARD if sd else FileDestinations.LOCAL, path_in_storage, printer_profile=self._printerProfileManager.get_current_or_default()["id"])
+		except:
+			self._logger.exception("Error while loading print statistics of {}".format(path_in_storage))
+		if printTimeStatistics is not None:
+			averagePrintTime = printTimeStatistics["printTime"].get("mean")
+
+			lastPrint = printTimeStatistics["lastPrint"]
+			if lastPrint is not None and lastPrint.get("success"):
+				lastPrintTime = lastPrint.get("printTime")
+
+			if "percentiles" in printTimeStatistics["printTime"]:
+				# unlike the average, the median isn't thrown off by the odd print that took ages
+				self._selectedFile["estimatedPrintTime"] = printTimeStatistics["printTime"]["percentiles"]["p50"]
+
+		self._selectedFile["averagePrintTime"] = averagePrintTime
+		self._selectedFile["printTimeStatistics"] = printTimeStatistics
+		if not sd:
+			try:
+				self._selectedFile["timeIndex"] = self._fileManager.get_time_index(FileDestinations.LOCAL, path_in_storage)
+			except:
+				self._logger.exception("Error while loading time index of {}".format(path_in_storage))
+
 		self._stateMonitor.set_job_data({
 			"file": {
 				"name": path_in_storage,
@@ -822,6 +876,7 @@ class Printer(PrinterInterface, comm.MachineComPrintCallback):
 		self._stateMonitor.set_state({"text": self.get_state_string(), "flags": self._getStateFlags()})
 
 	def on_comm_sd_files(self, files):
+		self._sdFilelistGeneration += 1
 		eventManager().fire(Events.UPDATED_FILES, {"type": "gcode"})
 		self._sdFilelistAvailable.set()
 
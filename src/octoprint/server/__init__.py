@@ -60,6 +60,7 @@ import octoprint._version
 import octoprint.util
 import octoprint.filemanager.storage
 import octoprint.filemanager.analysis
+import octoprint.filemanager.history
 import octoprint.slicing
 
 from . import util
@@ -180,8 +181,9 @@ class Server():
 		analysisQueue = octoprint.filemanager.analysis.AnalysisQueue()
 		slicingManager = octoprint.slicing.SlicingManager(s.getBaseFolder("slicingProfiles"), printerProfileManager)
 		storage_managers = dict()
-		storage_managers[octoprint.filemanager.FileDestinations.LOCAL] = octoprint.filemanager.storage.LocalFileStorage(s.getBaseFolder("uploads"))
-		fileManager = octoprint.filemanager.FileManager(analysisQueue, slicingManager, printerProfileManager, initial_storage_managers=storage_managers)
+		storage_managers[octoprint.filemanager.FileDestinations.LOCAL] = octoprint.filemanager.storage.LocalFileStorage(s.getBaseFolder("uploads"), metadata_backend=s.get(["fileStorage", "metadata", "backend"]), metadata_flush_delay=s.getFloat(["fileStorage", "metadata", "flushDelay"]), hash_workers=s.getInt(["fileStorage", "hashing", "workers"]), hash_cache_size=s.getInt(["fileStorage", "hashing", "cacheSize"]), index=s.getBoolean(["fileStorage", "index", "enabled"]), index_max_entries=s.getInt(["fileStorage", "index", "maxEntries"]), index_polling=s.getBoolean(["fileStorage", "index", "polling"]), compress=s.getBoolean(["fileStorage", "compression", "enabled"]), compression_level=s.getInt(["fileStorage", "compression", "level"]), deduplicate=s.getBoolean(["fileStorage", "deduplication", "enabled"]))
+		printHistory = octoprint.filemanager.history.PrintHistory(os.path.join(s.getBaseFolder("data"), "print_history.jsonl"))
+		fileManager = octoprint.filemanager.FileManager(analysisQueue, slicingManager, printerProfileManager, initial_storage_managers=storage_managers, print_history=printHistory)
 		printer = Printer(fileManager, analysisQueue, printerProfileManager)
 		appSessionManager = util.flask.AppSessionManager()
 		pluginLifecycleManager = LifecycleManager(pluginManager)
@@ -334,7 +336,8 @@ class Server():
 		server_routes = self._router.urls + [
 			# various downloads
 			(r"/downloads/timelapse/([^/]*\.mpg)", util.tornado.LargeResponseHandler, dict(path=s.getBaseFolder("timelapse"), as_attachment=True)),
-			(r"/downloads/files/local/(.*)", util.tornado.LargeResponseHandler, dict(path=s.getBaseFolder("uploads"), as_attachment=True, path_validation=util.tornado.path_validation_factory(lambda path: not os.path.basename(path).startswith("."), status_code=404))),
+			(r"/downloads/files/local/(.*)", util.tornado.LargeResponseHandler, dict(path=s.getBaseFolder("uploads"), as_attachment=True, path_validation=util.tornado.path_validation_factory(lambda path: not os.path.basename(path).startswith("."), status_code=404), compressed_files=True)),
+			(r"/downloads/archive/local", util.tornado.ZipArchiveHandler, dict(path=s.getBaseFolder("uploads"), path_validation=util.tornado.path_validation_factory(lambda path: not os.path.basename(path).startswith("."), status_code=404), compressed_files=True)),
 			(r"/downloads/logs/([^/]*)", util.tornado.LargeResponseHandler, dict(path=s.getBaseFolder("logs"), as_attachment=True, access_validation=util.tornado.access_validation_factory(app, loginManager, util.flask.admin_validator))),
 			# camera snapshot
 			(r"/downloads/camera/current", util.tornado.UrlForwardHandler, dict(url=s.get(["webcam", "snapshot"]), as_attachment=True, access_validation=util.tornado.access_validation_factory(app, loginManager, util.flask.user_validator))),
@@ -410,7 +413,7 @@ class Server():
 		else:
 			# use os default
 			observer = Observer()
-		observer.schedule(util.watchdog.GcodeWatchdogHandler(fileManager, printer), s.getBaseFolder("watched"))
+		observer.schedule(util.watchdog.GcodeWatchdogHandler(fileManager, printer, settle_time=s.getFloat(["fileStorage", "watched", "settleTime"]), workers=s.getInt(["fileStorage", "watched", "workers"])), s.getBaseFolder("watched"))
 		observer.start()
 
 		# run our startup plugins
@@ -456,6 +459,7 @@ class Server():
 			self._logger.info("Shutting down...")
 			observer.stop()
 			observer.join()
+			fileManager.flush()
 			octoprint.plugin.call_plugin(octoprint.plugin.ShutdownPlugin,
 			                             "on_shutdown")
 			self._logger.info("Goodbye!")
@@ -5,20 +5,32 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import base64
+import json
+import logging
+import os
+import time
+
 from flask import request, jsonify, make_response, url_for
 
 import octoprint.util as util
 from octoprint.filemanager.destinations import FileDestinations
 from octoprint.settings import settings, valid_boolean_trues
-from octoprint.server import printer, fileManager, slicingManager, eventManager, NO_CONTENT
+from octoprint.server import printer, fileManager, slicingManager, eventManager, analysisQueue, NO_CONTENT
 from octoprint.server.util.flask import restricted_access, get_json_command_from_request
 from octoprint.server.api import api
 from octoprint.events import Events
+from octoprint.util.compression import strip_compressed_extension
 import octoprint.filemanager
 import octoprint.filemanager.util
+import octoprint.filemanager.geometry
 import octoprint.slicing
 
 
+# the SD card file list generation starts over with every server start, this tells them apart in ETags
+_etagNonce = "{:x}".format(int(time.time() * 1000))
+
+
 #~~ GCODE file handling
 
 
@@ -27,9 +39,97 @@ def readGcodeFiles():
 	filter = None
 	if "filter" in request.values:
 		filter = request.values["filter"]
-	files = _getFileList(FileDestinations.LOCAL, filter=filter)
-	files.extend(_getFileList(FileDestinations.SDCARD))
-	return jsonify(files=files, free=util.get_free_bytes(settings().getBaseFolder("uploads")))
+	if _forceRescan():
+		fileManager.rescan(FileDestinations.LOCAL)
+
+	try:
+		query = _getListQuery()
+	except ValueError as e:
+		return make_response(str(e), 400)
+
+	entries = _getFileEntries(FileDestinations.LOCAL, filter=filter)
+	entries.extend(_getFileEntries(FileDestinations.SDCARD))
+	return _listResponse(entries, query, free=util.get_free_bytes(settings().getBaseFolder("uploads")))
+
+
+@api.route("/files/search", methods=["GET"])
+def searchGcodeFiles():
+	try:
+		query = _getListQuery()
+		text, ranges, values = _getSearchQuery()
+		keys = fileManager.search_files(text=text, ranges=ranges, values=values)
+	except ValueError as e:
+		return make_response(str(e), 400)
+
+	entries = []
+	for origin, path in keys:
+		entry = fileManager.get_file(origin, path)
+		if entry is None:
+			continue
+		entry["path"] = path
+		entries.append((origin, entry))
+
+	return _listResponse(entries, query)
+
+
+@api.route("/files/statistics", methods=["GET"])
+def getPrintStatistics():
+	origin = request.values.get("origin")
+	if origin is not None and not origin in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
+		return make_response("Unknown origin: %s" % origin, 404)
+	path = request.values.get("path")
+	printerProfile = request.values.get("printerProfile")
+
+	history = fileManager.print_history
+
+	def toDict(statistics):
+		return statistics.as_dict() if statistics is not None else None
+
+	files = []
+	for fileOrigin, filePath, statistics in history.files(origin=origin, printer_profile=printerProfile):
+		if path is not None and filePath != path:
+			continue
+		files.append(dict(origin=fileOrigin, path=filePath, statistics=statistics.as_dict()))
+	files.sort(key=lambda f: (f["origin"], f["path"]))
+
+	printerProfiles = dict()
+	for profile, statistics in history.printer_profiles().items():
+		if printerProfile is None or profile == printerProfile:
+			printerProfiles[profile] = statistics.as_dict()
+
+	return jsonify(total=toDict(history.statistics(printer_profile=printerProfile)), printerProfiles=printerProfiles, files=files)
+
+
+def _getSearchQuery():
+	"""
+	Parses the search parameters of a file search request into the text to search for, the ranges and the values to
+	match. Range fields are given as ``min..max``, with either bound being optional.
+
+	Raises:
+	    ValueError: if any of the parameters is invalid
+	"""
+	from octoprint.filemanager.search import is_range_field, is_value_field
+
+	text = request.values.get("q")
+	ranges = dict()
+	values = dict()
+	for key in request.values.keys():
+		value = request.values[key]
+		if is_range_field(key):
+			if ".." in value:
+				low, high = value.split("..", 1)
+			else:
+				low = high = value
+			try:
+				ranges[key] = (float(low) if low else None, float(high) if high else None)
+			except ValueError:
+				raise ValueError("{} must be a number or a range of numbers like min..max".format(key))
+		elif key == "lastPrintSuccess":
+			values[key] = value in valid_boolean_trues
+		elif is_value_field(key):
+			values[key] = value
+
+	return text, ranges, values
 
 
 @api.route("/files/<string:origin>", methods=["GET"])
@@ -37,84 +137,367 @@ def readGcodeFilesForOrigin(origin):
 	if origin not in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
 		return make_response("Unknown origin: %s" % origin, 404)
 
-	files = _getFileList(origin)
+	if _forceRescan():
+		if origin == FileDestinations.LOCAL:
+			fileManager.rescan(FileDestinations.LOCAL)
+		else:
+			printer.refresh_sd_files(blocking=True)
+
+	try:
+		query = _getListQuery()
+	except ValueError as e:
+		return make_response(str(e), 400)
 
 	if origin == FileDestinations.LOCAL:
-		return jsonify(files=files, free=util.get_free_bytes(settings().getBaseFolder("uploads")))
+		entries = _getFileEntries(origin)
+		return _listResponse(entries, query, free=util.get_free_bytes(settings().getBaseFolder("uploads")))
+
+	# the SD card listing is served from the printer's cache, it only changes with a new generation of that
+	etag = "{nonce}-{generation}-{ready}".format(nonce=_etagNonce,
+	                                             generation=printer.get_sd_files_generation(),
+	                                             ready=printer.is_sd_ready())
+	if request.if_none_match.contains(etag):
+		response = make_response("", 304)
+		response.set_etag(etag)
+		return response
+
+	entries = _getFileEntries(origin)
+	response = _listResponse(entries, query)
+	response.set_etag(etag)
+	return response
+
+
+def _forceRescan():
+	return "force" in request.values and request.values["force"] in valid_boolean_trues
+
+
+def _lastPrinted(entry):
+	return entry.get("prints", dict()).get("last", dict()).get("date")
+
+
+def _estimatedPrintTime(entry):
+	analysis = entry.get("analysis")
+	if not isinstance(analysis, dict):
+		return None
+	return analysis.get("estimatedPrintTime")
+
+
+_listSortKeys = {
+	"name": lambda entry: entry["name"].lower(),
+	"date": lambda entry: entry.get("date"),
+	"size": lambda entry: entry.get("size"),
+	"estimatedPrintTime": _estimatedPrintTime,
+	"lastPrinted": _lastPrinted
+}
+
+
+def _getListQuery():
+	"""
+	Parses the sorting, filtering and paging parameters of a file list request.
+
+	Raises:
+	    ValueError: if any of the parameters is invalid
+	"""
+	query = dict(
+		name=request.values.get("name"),
+		sort=request.values.get("sort"),
+		order=request.values.get("order", "asc"),
+		offset=0,
+		limit=None,
+		after=None
+	)
+
+	if query["sort"] is not None and not query["sort"] in _listSortKeys:
+		raise ValueError("sort must be one of {}".format(", ".join(sorted(_listSortKeys.keys()))))
+	if not query["order"] in ("asc", "desc"):
+		raise ValueError("order must be either asc or desc")
+
+	for key in ("offset", "limit"):
+		if not key in request.values:
+			continue
+		try:
+			query[key] = int(request.values[key])
+		except ValueError:
+			raise ValueError("{} must be an integer".format(key))
+		if query[key] < 0:
+			raise ValueError("{} must not be negative".format(key))
+
+	if "after" in request.values:
+		query["after"] = _decodeCursor(request.values["after"])
+
+	return query
+
+
+def _encodeCursor(value, origin, path):
+	return base64.urlsafe_b64encode(json.dumps([value, origin, path], separators=(",", ":")))
+
+
+def _decodeCursor(cursor):
+	try:
+		value, origin, path = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+	except (TypeError, ValueError, UnicodeError):
+		raise ValueError("after must be a cursor as returned as next by a previous request")
+	return value, origin, path
+
+
+def _followsCursor(item, cursor, order):
+	value, origin, path = item
+	cursor_value, cursor_origin, cursor_path = cursor
+
+	if (value is None) != (cursor_value is None):
+		# entries without a value are sorted last
+		return value is None
+	if value != cursor_value:
+		return value < cursor_value if order == "desc" else value > cursor_value
+	return (origin, path) > (cursor_origin, cursor_path)
+
+
+def _queryFileEntries(entries, name=None, sort=None, order="asc", offset=0, limit=None, after=None):
+	"""
+	Filters, sorts and pages a list of ``(origin, entry)`` tuples as returned by :func:`_getFileEntries`.
+
+	Entries without a value for the sort key are always sorted last, entries with equal values by origin and path.
+	Paged lists are sorted by origin and path if no sort key is given, so that cursors stay valid. ``after`` is the decoded cursor of the last entry of the previous page, a tuple of its sort value, origin and path.
+	If set it takes precedence over ``offset`` and the page starts with the first entry sorted after that tuple, so
+	paging continues correctly even if the entry itself has been removed in the meantime.
+
+	Returns the requested page, the total number of entries matching the filter and the encoded cursor of the last
+	entry of the page if there are more entries after it, ``None`` otherwise.
+	"""
+	if name:
+		name = name.lower()
+		entries = [(origin, entry) for origin, entry in entries if name in entry["name"].lower()]
+
+	sort_key = _listSortKeys[sort] if sort is not None else lambda entry: None
+	keyed = [(sort_key(entry), origin, _entryPath(entry), entry) for origin, entry in entries]
+
+	if sort is not None or after is not None or limit is not None or offset:
+		keyed.sort(key=lambda item: (item[1], item[2]))
+
+		with_value = [item for item in keyed if item[0] is not None]
+		without_value = [item for item in keyed if item[0] is None]
+
+		# sorted is stable, so entries with equal values stay sorted by origin and path
+		with_value.sort(key=lambda item: item[0], reverse=order == "desc")
+		keyed = with_value + without_value
+
+	total = len(keyed)
+
+	if after is not None:
+		offset = total
+		for index, item in enumerate(keyed):
+			if _followsCursor(item[:3], after, order):
+				offset = index
+				break
+
+	if limit is not None:
+		page = keyed[offset:offset + limit]
 	else:
-		return jsonify(files=files)
+		page = keyed[offset:]
+
+	next = None
+	if page and offset + len(page) < total:
+		next = _encodeCursor(*page[-1][:3])
+
+	return [(origin, entry) for _, origin, _, entry in page], total, next
+
+
+def _listResponse(entries, query, **kwargs):
+	page, total, next = _queryFileEntries(entries, **query)
+
+	# only the requested page needs to be turned into full API entries
+	files = [_toApiEntry(origin, entry) for origin, entry in page]
+
+	result = dict(files=files)
+	if query["name"] or query["limit"] is not None or query["offset"] or query["after"] is not None:
+		result["total"] = total
+		if next is not None:
+			result["next"] = next
+	result.update(kwargs)
+	return jsonify(**result)
+
+
+def _entryPath(entry):
+	# entries from a search carry their full path, all others live in the root folder
+	return entry.get("path", entry["name"])
 
 
 def _getFileDetails(origin, filename):
-	files = _getFileList(origin)
-	for file in files:
-		if file["name"] == filename:
-			return file
-	return None
+	if origin == FileDestinations.SDCARD:
+		for sdFile, sdSize in printer.get_sd_files() or []:
+			if sdFile == filename:
+				return _toApiEntry(origin, _sdFileEntry(sdFile, sdSize))
+		return None
+	else:
+		entry = fileManager.get_file(origin, filename)
+		if entry is None:
+			return None
+		entry["path"] = filename
+		return _toApiEntry(origin, entry)
+
+
+def _sdFileEntry(sdFile, sdSize):
+	entry = dict(name=sdFile, type="machinecode")
+	if sdSize is not None:
+		entry["size"] = sdSize
+	return entry
 
 
-def _getFileList(origin, filter=None):
+def _getFileEntries(origin, filter=None):
+	"""
+	Returns the raw entries of all files on ``origin`` as a list of ``(origin, entry)`` tuples, to be turned into API
+	entries through :func:`_toApiEntry`.
+	"""
 	if origin == FileDestinations.SDCARD:
 		sdFileList = printer.get_sd_files()
 
-		files = []
+		entries = []
 		if sdFileList is not None:
 			for sdFile, sdSize in sdFileList:
-				file = {
-					"type": "machinecode",
-					"name": sdFile,
-					"origin": FileDestinations.SDCARD,
-					"refs": {
-						"resource": url_for(".readGcodeFile", target=FileDestinations.SDCARD, filename=sdFile, _external=True)
-					}
-				}
-				if sdSize is not None:
-					file.update({"size": sdSize})
-				files.append(file)
+				entries.append((origin, _sdFileEntry(sdFile, sdSize)))
+		return entries
 	else:
 		filter_func = None
 		if filter:
 			filter_func = lambda entry, entry_data: octoprint.filemanager.valid_file_type(entry, type=filter)
 		files = fileManager.list_files(origin, filter=filter_func, recursive=False)[origin].values()
-		for file in files:
-			file["origin"] = FileDestinations.LOCAL
-
-			if "analysis" in file and octoprint.filemanager.valid_file_type(file["name"], type="gcode"):
-				file["gcodeAnalysis"] = file["analysis"]
-				del file["analysis"]
-
-			if "history" in file and octoprint.filemanager.valid_file_type(file["name"], type="gcode"):
-				# convert print log
-				history = file["history"]
-				del file["history"]
-				success = 0
-				failure = 0
-				last = None
-				for entry in history:
-					success += 1 if "success" in entry and entry["success"] else 0
-					failure += 1 if "success" in entry and not entry["success"] else 0
-					if not last or ("timestamp" in entry and "timestamp" in last and entry["timestamp"] > last["timestamp"]):
-						last = entry
-				if last:
-					prints = dict(
-						success=success,
-						failure=failure,
-						last=dict(
-							success=last["success"],
-							date=last["timestamp"]
-						)
-					)
-					if "printTime" in last:
-						prints["last"]["printTime"] = last["printTime"]
-					file["prints"] = prints
-
-			file.update({
-				"refs": {
-					"resource": url_for(".readGcodeFile", target=FileDestinations.LOCAL, filename=file["name"], _external=True),
-					"download": url_for("index", _external=True) + "downloads/files/" + FileDestinations.LOCAL + "/" + file["name"]
-				}
-			})
-	return files
+		return [(origin, file) for file in files]
+
+
+def _toApiEntry(origin, file):
+	if origin == FileDestinations.SDCARD:
+		file = dict(file)
+		file.update({
+			"origin": FileDestinations.SDCARD,
+			"refs": {
+				"resource": url_for(".readGcodeFile", target=FileDestinations.SDCARD, filename=file["name"], _external=True)
+			}
+		})
+		return file
+
+	file = dict(file)
+	file["origin"] = FileDestinations.LOCAL
+	path = _entryPath(file)
+
+	if "analysis" in file and octoprint.filemanager.valid_file_type(file["name"], type="gcode"):
+		file["gcodeAnalysis"] = file["analysis"]
+		del file["analysis"]
+
+	if "prints" in file and not octoprint.filemanager.valid_file_type(file["name"], type="gcode"):
+		del file["prints"]
+
+	file.update({
+		"refs": {
+			"resource": url_for(".readGcodeFile", target=FileDestinations.LOCAL, filename=path, _external=True),
+			"download": url_for("index", _external=True) + "downloads/files/" + FileDestinations.LOCAL + "/" + path
+		}
+	})
+
+	if "gcodeAnalysis" in file and file["gcodeAnalysis"].get("layerCount"):
+		file["refs"]["layers"] = url_for(".readGcodeFileLayers", target=FileDestinations.LOCAL, filename=path, _external=True)
+		file["refs"]["geometry"] = url_for(".readGcodeFileGeometry", target=FileDestinations.LOCAL, filename=path, _external=True)
+
+	if "hash" in file and fileManager.get_thumbnail_by_hash(file["hash"]) is not None:
+		file["refs"]["thumbnail"] = url_for(".readGcodeFileThumbnail", target=FileDestinations.LOCAL, filename=path, _external=True)
+	return file
+
+
+@api.route("/files/batch", methods=["POST"])
+@restricted_access
+def batchFileOperations():
+	if not "application/json" in request.headers["Content-Type"]:
+		return make_response("Expected content-type JSON", 400)
+
+	data = request.json
+	origin = data.get("origin", FileDestinations.LOCAL)
+	if origin == FileDestinations.SDCARD:
+		return make_response("Batch operations are not supported for files on SD card", 400)
+	if origin != FileDestinations.LOCAL:
+		return make_response("Unknown origin: %s" % origin, 404)
+
+	operations = data.get("operations")
+	if not isinstance(operations, list) or not operations:
+		return make_response("Expected a non-empty list of operations", 400)
+
+	# all operations share one metadata write per folder and one UpdatedFiles event
+	results = []
+	with fileManager.batch(origin):
+		for operation in operations:
+			try:
+				path = _batchFileOperation(origin, operation)
+			except (ValueError, RuntimeError) as e:
+				results.append(dict(success=False, error=str(e)))
+			except:
+				logging.getLogger(__name__).exception("Error while processing batch file operation {!r}".format(operation))
+				results.append(dict(success=False, error="Unexpected error, see the log for details"))
+			else:
+				result = dict(success=True)
+				if path is not None:
+					result["path"] = path
+				results.append(result)
+
+	return jsonify(results=results)
+
+
+def _batchFileOperation(origin, operation):
+	# valid batch commands, dict mapping command name to mandatory parameters
+	valid_commands = {
+		"move": ["source", "destination"],
+		"copy": ["source", "destination"],
+		"rename": ["source", "name"],
+		"delete": ["path"]
+	}
+
+	if not isinstance(operation, dict) or not operation.get("command") in valid_commands:
+		raise ValueError("Expected valid command")
+
+	command = operation["command"]
+	for parameter in valid_commands[command]:
+		if not operation.get(parameter):
+			raise ValueError("Mandatory parameter %s missing for command %s" % (parameter, command))
+
+	path = operation["path"] if command == "delete" else operation["source"]
+	folder = os.path.isdir(fileManager.path_on_disk(origin, path))
+	if not folder and not fileManager.file_exists(origin, path):
+		raise ValueError("File not found on '%s': %s" % (origin, path))
+
+	if command != "copy":
+		# the source goes away, so it must not be in use
+		_verifyNotInUse(origin, path, folder)
+
+	if command == "delete":
+		if folder:
+			fileManager.remove_folder(origin, path)
+		else:
+			fileManager.remove_file(origin, path)
+		return None
+
+	if command == "rename":
+		parent, _ = fileManager.split_path(origin, path)
+		destination = fileManager.join_path(origin, parent, operation["name"]) if parent else operation["name"]
+	else:
+		destination = operation["destination"]
+
+	if command == "copy":
+		transfer = fileManager.copy_folder if folder else fileManager.copy_file
+	else:
+		transfer = fileManager.move_folder if folder else fileManager.move_file
+	return transfer(origin, path, destination)
+
+
+def _verifyNotInUse(origin, path, folder):
+	def affected(filename):
+		return filename == path or (folder and filename.startswith(path.rstrip("/") + "/"))
+
+	currentOrigin, currentFilename = _getCurrentFile()
+	if currentFilename is not None and currentOrigin == origin and affected(currentFilename):
+		if printer.is_printing() or printer.is_paused():
+			raise ValueError("Trying to modify file that is currently being printed: %s" % currentFilename)
+		printer.unselect_file()
+
+	for busyOrigin, busyPath in fileManager.get_busy_files():
+		if busyOrigin == origin and affected(busyPath):
+			raise ValueError("Trying to modify a file that is currently in use: %s" % busyPath)
 
 
 def _verifyFileExists(origin, filename):
@@ -133,8 +516,11 @@ def uploadGcodeFile(target):
 	input_name = "file"
 	input_upload_name = input_name + "." + settings().get(["server", "uploads", "nameSuffix"])
 	input_upload_path = input_name + "." + settings().get(["server", "uploads", "pathSuffix"])
+	input_upload_hash = input_name + ".hash"
 	if input_upload_name in request.values and input_upload_path in request.values:
-		upload = octoprint.filemanager.util.DiskFileWrapper(request.values[input_upload_name], request.values[input_upload_path])
+		# the hash is only ever computed by the upload handler and hence part of the rewritten form, never take it from
+		# the query string
+		upload = octoprint.filemanager.util.DiskFileWrapper(request.values[input_upload_name], request.values[input_upload_path], hash=request.form.get(input_upload_hash, None))
 	else:
 		return make_response("No file included", 400)
 
@@ -172,8 +558,14 @@ def uploadGcodeFile(target):
 			currentOrigin = currentJobFile["origin"]
 
 	# determine future filename of file to be uploaded, abort if it can't be uploaded
+	uploadFilename = upload.filename
+	uncompressedFilename = strip_compressed_extension(uploadFilename)
+	if uncompressedFilename is not None and octoprint.filemanager.valid_file_type(uncompressedFilename, type="machinecode"):
+		# compressed machine code gets stored under its uncompressed name
+		uploadFilename = uncompressedFilename
+
 	try:
-		futureFilename = fileManager.sanitize_name(FileDestinations.LOCAL, upload.filename)
+		futureFilename = fileManager.sanitize_name(FileDestinations.LOCAL, uploadFilename)
 	except:
 		futureFilename = None
 	if futureFilename is None:
@@ -271,6 +663,116 @@ def readGcodeFile(target, filename):
 	return jsonify(file)
 
 
+@api.route("/files/<string:target>/<path:filename>/layers", methods=["GET"])
+def readGcodeFileLayers(target, filename):
+	if not target in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
+		return make_response("Unknown target: %s" % target, 404)
+
+	if target == FileDestinations.SDCARD:
+		return make_response("Layer indices are not available for files on SD card", 400)
+
+	if not _verifyFileExists(target, filename):
+		return make_response("File not found on '%s': %s" % (target, filename), 404)
+
+	layer_index = fileManager.get_layer_index(target, filename)
+	if layer_index is None:
+		return make_response("No layer index available for %s yet" % filename, 404)
+
+	start = None
+	end = None
+	try:
+		if "from" in request.values:
+			start = int(request.values["from"])
+		if "to" in request.values:
+			end = int(request.values["to"])
+	except ValueError:
+		return make_response("from and to must be integer layer numbers", 400)
+	if (start is not None and start < 0) or (end is not None and end < 0):
+		return make_response("from and to must not be negative", 400)
+
+	return jsonify(count=len(layer_index), layers=layer_index.as_dict_list(start=start, end=end))
+
+
+@api.route("/files/<string:target>/<path:filename>/geometry", methods=["GET"])
+def readGcodeFileGeometry(target, filename):
+	if not target in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
+		return make_response("Unknown target: %s" % target, 404)
+
+	if target == FileDestinations.SDCARD:
+		return make_response("Layer geometry is not available for files on SD card", 400)
+
+	if not _verifyFileExists(target, filename):
+		return make_response("File not found on '%s': %s" % (target, filename), 404)
+
+	start = None
+	end = None
+	try:
+		if "from" in request.values:
+			start = int(request.values["from"])
+		if "to" in request.values:
+			end = int(request.values["to"])
+	except ValueError:
+		return make_response("from and to must be integer layer numbers", 400)
+	if (start is not None and start < 0) or (end is not None and end < 0):
+		return make_response("from and to must not be negative", 400)
+
+	metadata = fileManager.get_metadata(target, filename)
+	if not metadata or not "hash" in metadata or fileManager.get_layer_index(target, filename) is None:
+		return make_response("No layer index available for %s yet" % filename, 404)
+
+	etag = "{hash}-{version}-{start}-{end}".format(hash=metadata["hash"],
+	                                               version=octoprint.filemanager.geometry.VERSION,
+	                                               start=start if start is not None else "",
+	                                               end=end if end is not None else "")
+	if request.if_none_match.contains(etag):
+		response = make_response("", 304)
+		response.set_etag(etag)
+		return response
+
+	result = fileManager.get_layer_geometry(target, filename, start=start, end=end)
+	if result is None:
+		# geometry is being generated, tell the client to come back later
+		response = make_response("Layer geometry for %s is being generated" % filename, 202)
+		response.headers["Retry-After"] = "2"
+		return response
+
+	count, data = result
+	response = make_response(data)
+	response.headers["Content-Type"] = "application/octet-stream"
+	response.headers["X-Layer-Count"] = str(count)
+	response.set_etag(etag)
+	return response
+
+
+@api.route("/files/<string:target>/<path:filename>/thumbnail", methods=["GET"])
+def readGcodeFileThumbnail(target, filename):
+	if not target in [FileDestinations.LOCAL, FileDestinations.SDCARD]:
+		return make_response("Unknown target: %s" % target, 404)
+
+	if target == FileDestinations.SDCARD:
+		return make_response("Thumbnails are not available for files on SD card", 400)
+
+	if not _verifyFileExists(target, filename):
+		return make_response("File not found on '%s': %s" % (target, filename), 404)
+
+	thumbnail_path = fileManager.get_thumbnail(target, filename)
+	if thumbnail_path is None:
+		return make_response("No thumbnail available for %s" % filename, 404)
+
+	# thumbnails are stored by file hash, so that's a perfect etag
+	etag = fileManager.get_metadata(target, filename)["hash"]
+	if request.if_none_match.contains(etag):
+		response = make_response("", 304)
+		response.set_etag(etag)
+		return response
+
+	with open(thumbnail_path, "rb") as f:
+		response = make_response(f.read())
+	response.headers["Content-Type"] = "image/png"
+	response.set_etag(etag)
+	return response
+
+
 @api.route("/files/<string:target>/<path:filename>", methods=["POST"])
 @restricted_access
 def gcodeFileCommand(filename, target):
@@ -448,6 +950,15 @@ def deleteGcodeFile(filename, target):
 
 	return NO_CONTENT
 
+
+#~~ analysis queue
+
+
+@api.route("/analysis", methods=["GET"])
+def readAnalysisQueue():
+	return jsonify(analysisQueue.status)
+
+
 def _getCurrentFile():
 	currentJob = printer.get_current_job()
 	if currentJob is not None and "file" in currentJob.keys() and "name" in currentJob["file"] and "origin" in currentJob["file"]:
@@ -5,6 +5,7 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import json
 import logging
 import threading
 import sockjs.tornado
@@ -40,6 +41,12 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection, octoprint.printer.
 
 		self._remoteAddress = None
 
+		# clients may opt into receiving only the changes of the current state, see on_message
+		self._delta = False
+		self._sequence = None
+		self._lastSnapshot = None
+		self._currentMutex = threading.Lock()
+
 	def _getRemoteAddress(self, info):
 		forwardedFor = info.headers.get("X-Forwarded-For")
 		if forwardedFor is not None:
@@ -93,9 +100,30 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection, octoprint.printer.
 			self._eventManager.unsubscribe(event, self._onEvent)
 
 	def on_message(self, message):
-		pass
-
-	def on_printer_send_current_data(self, data):
+		try:
+			data = json.loads(message)
+		except ValueError:
+			self._logger.debug("Ignoring invalid message from client %s" % self._remoteAddress)
+			return
+
+		if not isinstance(data, dict) or not "delta" in data:
+			return
+
+		# enabling delta updates (again) always starts over with the full current state
+		with self._currentMutex:
+			self._delta = data["delta"] is True
+			self._sequence = None
+			if self._delta and self._lastSnapshot is not None:
+				self._sendCurrent(self._lastSnapshot)
+
+	def on_printer_send_current_snapshot(self, snapshot):
+		# pushes from the printer and requests for the full state from the client must not overtake each other, or the
+		# client would lose track of the sequence
+		with self._currentMutex:
+			self._lastSnapshot = snapshot
+			self._sendCurrent(snapshot)
+
+	def _sendCurrent(self, snapshot):
 		# add current temperature, log and message backlogs to sent data
 		with self._temperatureBacklogMutex:
 			temperatures = self._temperatureBacklog
@@ -109,6 +137,7 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection, octoprint.printer.
 			messages = self._messageBacklog
 			self._messageBacklog = []
 
+		data = snapshot.data
 		busy_files = [dict(origin=v[0], name=v[1]) for v in self._fileManager.get_busy_files()]
 		if "job" in data and data["job"] is not None \
 				and "file" in data["job"] and "name" in data["job"]["file"] and "origin" in data["job"]["file"] \
@@ -116,14 +145,24 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection, octoprint.printer.
 				and (self._printer.is_printing() or self._printer.is_paused()):
 			busy_files.append(dict(origin=data["job"]["file"]["origin"], name=data["job"]["file"]["name"]))
 
-		data.update({
+		extra = {
 			"serverTime": time.time(),
 			"temps": temperatures,
 			"logs": logs,
 			"messages": messages,
 			"busyFiles": busy_files,
-		})
-		self._emit("current", data)
+		}
+
+		# the snapshot is shared by all connections and already JSON encoded, only our additions still need encoding
+		if not self._delta:
+			self._emit_jsonified("current", snapshot.as_json(extra=extra))
+		elif self._sequence is not None and snapshot.sequence == self._sequence + 1 and snapshot.changes is not None:
+			self._emit_jsonified("delta", snapshot.as_delta_json(extra=extra))
+			self._sequence = snapshot.sequence
+		else:
+			extra["seq"] = snapshot.sequence
+			self._emit_jsonified("current", snapshot.as_json(extra=extra))
+			self._sequence = snapshot.sequence
 
 	def on_printer_send_initial_data(self, data):
 		data_to_send = dict(data)
@@ -164,3 +203,17 @@ class PrinterStateConnection(sockjs.tornado.SockJSConnection, octoprint.printer.
 			self.send({type: payload})
 		except Exception as e:
 			self._logger.warn("Could not send message to client %s: %s" % (self._remoteAddress, str(e)))
+
+	def _emit_jsonified(self, type, payload):
+		# same as _emit, but for a payload that is already JSON encoded, see sockjs.tornado's SockJSRouter.broadcast
+		if self.is_closed:
+			return
+
+		message = "{%s:%s}" % (json.dumps(type), payload)
+		try:
+			if self.session.send_expects_json:
+				self.session.send_jsonified(message)
+			else:
+				self.session.send_message(message)
+		except Exception as e:
+			self._logger.warn("Could not send message to client %s: %s" % (self._remoteAddress, str(e)))
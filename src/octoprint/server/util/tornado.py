@@ -5,6 +5,7 @@ __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
+import io
 import logging
 import os
 import datetime
@@ -67,7 +68,8 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 	"""
 	A ``RequestHandler`` similar to ``tornado.web.FallbackHandler`` which fetches any files contained in the request bodies
 	of content type ``multipart``, stores them in temporary files and supplies the ``fallback`` with the file's ``name``,
-	``content_type``, ``path`` and ``size`` instead via a rewritten body.
+	``content_type``, ``path``, ``size`` and ``hash`` (the SHA1 hex digest of the file's contents, computed while the data
+	was streamed in) instead via a rewritten body.
 
 	Basically similar to what the nginx upload module does.
 
@@ -118,8 +120,15 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 	    Content-Disposition: form-data; name="file.size"
 
 	    349182
+	    ------WebKitFormBoundarypYiSUx63abAmhT5C
+	    Content-Disposition: form-data; name="file.hash"
+
+	    9f2b4c2c7d3b0e0b4b4a8fd5d0dbd0f8a9d7c0a1
 	    ------WebKitFormBoundarypYiSUx63abAmhT5C--
 
+	Any parts sent by the client under the name of one of these generated fields (e.g. ``file.hash`` in the above
+	example) are dropped.
+
 	The underlying application can then access the contained files via their respective paths and just move them
 	where necessary.
 	"""
@@ -136,7 +145,7 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		self._file_suffix = file_suffix
 		self._path = path
 
-		self._suffixes = dict((key, key) for key in ("name", "path", "content_type", "size"))
+		self._suffixes = dict((key, key) for key in ("name", "path", "content_type", "size", "hash"))
 		for suffix_type, suffix in suffixes.iteritems():
 			if suffix_type in self._suffixes and suffix is not None:
 				self._suffixes[suffix_type] = suffix
@@ -299,6 +308,7 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		* ``content_type``: content type of the part
 		* ``file``: file handle for the temporary file (mode "wb", not deleted on close, will be deleted however after
 		  handling of the request has finished in :func:`_handle_method`)
+		* ``hash``: ``hashlib.sha1`` instance incrementally hashing the part's data while it is received
 
 		Structure of ``data`` parts:
 
@@ -314,12 +324,14 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		if filename is not None:
 			# this is a file
 			import tempfile
+			import hashlib
 			handle = tempfile.NamedTemporaryFile(mode="wb", prefix=self._file_prefix, suffix=self._file_suffix, dir=self._path, delete=False)
 			return dict(name=tornado.escape.utf8(name),
 						filename=tornado.escape.utf8(filename),
 						path=tornado.escape.utf8(handle.name),
 						content_type=tornado.escape.utf8(content_type),
-						file=handle)
+						file=handle,
+						hash=hashlib.sha1())
 
 		else:
 			return dict(name=tornado.escape.utf8(name), content_type=content_type, data=b"")
@@ -333,6 +345,7 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		"""
 		if "file" in part:
 			part["file"].write(data)
+			part["hash"].update(data)
 		else:
 			part["data"] += data
 
@@ -356,8 +369,18 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 		logged parts, turning ``file`` parts into new ``data`` parts.
 		"""
 
+		# fields we generate for the contained files, parts sent by the client under any of these names are dropped so
+		# they can't override (or be mistaken for) ours
+		generated = set(name + "." + suffix
+		                for name, part in self._parts.iteritems() if "filename" in part
+		                for suffix in self._suffixes.values())
+
 		self._new_body = b""
 		for name, part in self._parts.iteritems():
+			if name in generated:
+				self._logger.warn("Dropping part {} which clashes with a field generated for an uploaded file".format(name))
+				continue
+
 			if "filename" in part:
 				# add form fields for filename, path, size and content_type for all files contained in the request
 				if not "path" in part:
@@ -368,6 +391,8 @@ class UploadStorageFallbackHandler(tornado.web.RequestHandler):
 					path=part["path"],
 					size=str(os.stat(part["path"]).st_size)
 				)
+				if "hash" in part:
+					parameters["hash"] = part["hash"].hexdigest()
 				if "content_type" in part:
 					parameters["content_type"] = part["content_type"]
 
@@ -776,25 +801,91 @@ class LargeResponseHandler(tornado.web.StaticFileHandler):
 	       with the requested path as parameter. Should raise a ``tornado.web.HTTPError`` (e.g. an 404) if the requested
 	       path does not pass validation in which case the request will not be further processed.
 	       Defaults to ``None`` and hence no path validation being performed.
+	   compressed_files (bool): Whether served files might be stored gzip compressed (see
+	       :mod:`octoprint.util.compression`). Compressed files are sent as they are with ``Content-Encoding: gzip`` to
+	       clients accepting that and decompressed on the fly for all others. Either way ETag, Last-Modified and Range
+	       requests are supported, with ranges referring to the bytes actually sent (so the compressed data in the
+	       first case). Defaults to ``False``.
 	"""
 
-	def initialize(self, path, default_filename=None, as_attachment=False, access_validation=None, path_validation=None):
+	def initialize(self, path, default_filename=None, as_attachment=False, access_validation=None, path_validation=None, compressed_files=False):
 		tornado.web.StaticFileHandler.initialize(self, os.path.abspath(path), default_filename)
 		self._as_attachment = as_attachment
 		self._access_validation = access_validation
 		self._path_validation = path_validation
+		self._compressed_files = compressed_files
 
 	def get(self, path, include_body=True):
 		if self._access_validation is not None:
 			self._access_validation(self.request)
 		if self._path_validation is not None:
 			self._path_validation(path)
+
+		self._compression = None
+		if self._compressed_files:
+			from octoprint.util.compression import is_compressed
+
+			absolute_path = self.get_absolute_path(self.root, self.parse_url_path(path))
+			absolute_path = self.validate_absolute_path(self.root, absolute_path)
+			if absolute_path is None:
+				# the request has already been answered, e.g. with a redirect
+				return
+			if is_compressed(absolute_path):
+				if accepts_encoding(self.request.headers.get("Accept-Encoding"), "gzip"):
+					# the client can decompress the file itself, so there's no need for us to do it
+					self._compression = "gzip"
+				else:
+					self._compression = "decompress"
+
+					# tornado only knows get_content as a class method working on the path alone, so we shadow it
+					# on this instance to read the decompressed contents instead
+					self.get_content = self._get_decompressed_content
+
 		result = tornado.web.StaticFileHandler.get(self, path, include_body=include_body)
 		return result
 
+	def compute_etag(self):
+		etag = tornado.web.StaticFileHandler.compute_etag(self)
+		if etag is not None and self._compression == "gzip":
+			# the encoded representation needs an ETag of its own
+			etag = etag[:-1] + "-gzip\""
+		return etag
+
+	def get_content_size(self):
+		if self._compression == "decompress":
+			from octoprint.util.compression import uncompressed_size
+			return uncompressed_size(self.absolute_path)
+		return tornado.web.StaticFileHandler.get_content_size(self)
+
+	def _get_decompressed_content(self, abspath, start=None, end=None):
+		from octoprint.util.compression import open_file, BLOCKSIZE
+
+		with open_file(abspath) as f:
+			if start is not None:
+				f.seek(start)
+			if end is not None:
+				remaining = end - (start or 0)
+			else:
+				remaining = None
+			while True:
+				chunk_size = BLOCKSIZE
+				if remaining is not None and remaining < chunk_size:
+					chunk_size = remaining
+				chunk = f.read(chunk_size)
+				if chunk:
+					if remaining is not None:
+						remaining -= len(chunk)
+					yield chunk
+				else:
+					return
+
 	def set_extra_headers(self, path):
 		if self._as_attachment:
 			self.set_header("Content-Disposition", "attachment")
+		if self._compression is not None:
+			self.set_header("Vary", "Accept-Encoding")
+		if self._compression == "gzip":
+			self.set_header("Content-Encoding", "gzip")
 
 	@classmethod
 	def get_content_version(cls, abspath):
@@ -802,6 +893,107 @@ class LargeResponseHandler(tornado.web.StaticFileHandler):
 		import stat
 		return os.stat(abspath)[stat.ST_MTIME]
 
+##~~ ZIP archive handler for downloading several files at once
+
+
+class ZipArchiveHandler(tornado.web.RequestHandler):
+	"""
+	`tornado.web.RequestHandler <http://tornado.readthedocs.org/en/branch4.0/web.html#request-handlers>`_ that streams
+	a ZIP archive of files and folders below a configured path, generated on the fly while it is being sent (see
+	:mod:`octoprint.util.zipstream`), so no temporary archive is ever created.
+
+	The files and folders to include are selected through (repeatable) ``path`` query parameters, relative to the
+	configured path. Folders are included with all their contents. Without any ``path`` parameter, all contents of the
+	configured path are included. Hidden files and folders are never included. Names within the archive are relative to
+	the closest folder containing all selected files and folders, so a single selected folder appears as the top level
+	folder of the archive.
+
+	Arguments:
+	   path (str): The system path from which to serve files.
+	   basename (str): Base name of the archive if it contains more than a single selected folder, otherwise it is
+	       named after that folder. Defaults to ``files``.
+	   access_validation (function): Callback to call in the ``get`` method to validate access to the resource. Will
+	       be called with ``self.request`` as parameter which contains the full tornado request object. Should raise
+	       a ``tornado.web.HTTPError`` if access is not allowed in which case the request will not be further processed.
+	       Defaults to ``None`` and hence no access validation being performed.
+	   path_validation (function): Callback to call in the ``get`` method to validate each requested path. Will be
+	       called with the requested path as parameter. Should raise a ``tornado.web.HTTPError`` (e.g. an 404) if the
+	       requested path does not pass validation in which case the request will not be further processed.
+	       Defaults to ``None`` and hence no path validation being performed.
+	   compressed_files (bool): Whether served files might be stored gzip compressed (see
+	       :mod:`octoprint.util.compression`), in which case their compressed data is passed into the archive as is.
+	       Defaults to ``False``.
+	"""
+
+	def initialize(self, path, basename="files", access_validation=None, path_validation=None, compressed_files=False):
+		tornado.web.RequestHandler.initialize(self)
+		self._root = os.path.realpath(os.path.abspath(path))
+		self._basename = basename
+		self._access_validation = access_validation
+		self._path_validation = path_validation
+		self._compressed_files = compressed_files
+
+	@tornado.gen.coroutine
+	def get(self):
+		from octoprint.util.zipstream import zip_stream
+
+		if self._access_validation is not None:
+			self._access_validation(self.request)
+
+		paths = self.get_arguments("path") or [""]
+		if self._path_validation is not None:
+			for path in paths:
+				self._path_validation(path)
+
+		selected = []
+		for path in paths:
+			absolute_path = os.path.realpath(os.path.join(self._root, path.lstrip("/")))
+			if absolute_path != self._root and not absolute_path.startswith(self._root + os.sep):
+				raise tornado.web.HTTPError(403)
+			if not os.path.exists(absolute_path):
+				raise tornado.web.HTTPError(404)
+			if not absolute_path in selected:
+				selected.append(absolute_path)
+
+		entries = self._entries(selected)
+
+		if len(selected) == 1 and selected[0] != self._root and os.path.isdir(selected[0]):
+			filename = os.path.basename(selected[0])
+		else:
+			filename = self._basename
+		self.set_header("Content-Type", "application/zip")
+		self.set_header("Content-Disposition", "attachment; filename=\"{}.zip\"".format(filename))
+
+		for chunk in zip_stream(entries, passthrough_compressed=self._compressed_files):
+			self.write(chunk)
+			yield self.flush()
+
+	def _entries(self, selected):
+		# names are relative to the closest folder containing everything selected
+		parents = [path if path == self._root else os.path.dirname(path) for path in selected]
+		base = os.sep.join(os.path.commonprefix([parent.split(os.sep) for parent in parents]))
+
+		def name(path):
+			return os.path.relpath(path, base).replace(os.sep, "/")
+
+		entries = []
+		seen = set()
+		for path in selected:
+			if os.path.isfile(path):
+				files = [path]
+			else:
+				files = []
+				for folder, dirs, names in os.walk(path):
+					dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+					files += [os.path.join(folder, n) for n in sorted(names) if not n.startswith(".")]
+
+			for f in files:
+				if f in seen:
+					continue
+				seen.add(f)
+				entries.append((f, name(f)))
+		return entries
+
 ##~~ URL Forward Handler for forwarding requests to a preconfigured static URL
 
 
@@ -936,3 +1128,44 @@ def path_validation_factory(path_filter, status_code=404):
 		if not path_filter(path):
 			raise tornado.web.HTTPError(status_code)
 	return f
+
+#~~ Content negotiation
+
+
+def accepts_encoding(accept_encoding, encoding):
+	"""
+	Checks whether the supplied ``Accept-Encoding`` header value allows the given content coding, taking quality
+	values and the ``*`` wildcard into account as described in RFC 7231 section 5.3.4.
+
+	:param accept_encoding: the value of the ``Accept-Encoding`` header, may be ``None``
+	:param encoding: the content coding to check for, e.g. ``gzip``
+	:return: ``True`` if the client accepts the content coding, ``False`` otherwise
+	"""
+	if not accept_encoding:
+		return False
+
+	aliases = dict(gzip="x-gzip", compress="x-compress")
+	names = (encoding.lower(), aliases.get(encoding.lower()))
+
+	wildcard = None
+	for part in accept_encoding.split(","):
+		params = part.split(";")
+		name = params[0].strip().lower()
+		if not name:
+			continue
+
+		quality = 1.0
+		for param in params[1:]:
+			key, _, value = param.partition("=")
+			if key.strip().lower() == "q":
+				try:
+					quality = float(value.strip())
+				except ValueError:
+					quality = 0.0
+
+		if name in names:
+			return quality > 0
+		elif name == "*":
+			wildcard = quality
+
+	return wildcard is not None and wildcard > 0
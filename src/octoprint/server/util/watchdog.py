@@ -6,6 +6,11 @@ __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agp
 __copyright__ = "Copyright (C) 2014 The OctoPrint Project - Released under terms of the AGPLv3 License"
 
 import logging
+import os
+import Queue
+import threading
+import time
+
 import watchdog.events
 
 import octoprint.filemanager
@@ -16,9 +21,16 @@ import octoprint.util
 class GcodeWatchdogHandler(watchdog.events.PatternMatchingEventHandler):
 	"""
 	Takes care of automatically "uploading" files that get added to the watched folder.
+
+	A file is only picked up once its size and modification time haven't changed for ``settle_time`` seconds, so
+	that files still being written (e.g. copied over a network share) don't get uploaded half-finished. All files that
+	have settled at the same time are then uploaded as one batch: they are hashed in parallel by up to ``workers``
+	threads and then moved (renamed, if on the same file system) into the storage one after the other, with the
+	metadata of the whole batch persisted together and only one ``UpdatedFiles`` event being fired. Batches are
+	uploaded one after the other, the next check only takes place once the current batch has been uploaded.
 	"""
 
-	def __init__(self, file_manager, printer):
+	def __init__(self, file_manager, printer, settle_time=2.0, workers=4):
 		watchdog.events.PatternMatchingEventHandler.__init__(self, patterns=map(lambda x: "*.%s" % x, octoprint.filemanager.get_all_extensions()))
 
 		self._logger = logging.getLogger(__name__)
@@ -26,9 +38,110 @@ class GcodeWatchdogHandler(watchdog.events.PatternMatchingEventHandler):
 		self._file_manager = file_manager
 		self._printer = printer
 
-	def _upload(self, path):
-		import os
-		file_wrapper = octoprint.filemanager.util.DiskFileWrapper(os.path.basename(path), path)
+		self._settle_time = settle_time
+		self._workers = max(1, workers)
+
+		self._lock = threading.Lock()
+		self._pending = dict()
+		self._timer = None
+
+	def _watch(self, path):
+		with self._lock:
+			# (size, mtime) of None never matches, so the file gets its first look at the next check
+			self._pending[path] = (None, None, time.time())
+			if self._timer is None:
+				self._start_timer()
+
+	def _start_timer(self):
+		self._timer = threading.Timer(self._settle_time / 2.0, self._check)
+		self._timer.daemon = True
+		self._timer.start()
+
+	def _check(self):
+		now = time.time()
+		settled = []
+
+		with self._lock:
+			for path, (size, mtime, since) in self._pending.items():
+				try:
+					stat = os.stat(path)
+				except OSError:
+					# gone already
+					del self._pending[path]
+					continue
+
+				if (stat.st_size, stat.st_mtime) != (size, mtime):
+					self._pending[path] = (stat.st_size, stat.st_mtime, now)
+				elif now - since >= self._settle_time:
+					settled.append(path)
+					del self._pending[path]
+
+			if not settled:
+				self._reschedule()
+
+		if not settled:
+			return
+
+		# the timer stays set while uploading, so no other check and hence no other batch can run concurrently
+		try:
+			self._upload_batch(sorted(settled))
+		except:
+			self._logger.exception("Error while uploading files from the watched folder")
+		finally:
+			with self._lock:
+				self._reschedule()
+
+	def _reschedule(self):
+		if self._pending:
+			self._start_timer()
+		else:
+			self._timer = None
+
+	def _upload_batch(self, paths):
+		self._logger.info("Uploading {} file(s) from the watched folder".format(len(paths)))
+
+		hashes = self._hash_all(paths)
+		with self._file_manager.batch(octoprint.filemanager.FileDestinations.LOCAL):
+			for path in paths:
+				try:
+					self._upload(path, hash=hashes.get(path))
+				except:
+					self._logger.exception("Error while uploading {} from the watched folder".format(path))
+
+	def _hash_all(self, paths):
+		from octoprint.filemanager.hashing import create_hash
+
+		queue = Queue.Queue()
+		for path in paths:
+			queue.put(path)
+
+		hashes = dict()
+		def work():
+			while True:
+				try:
+					path = queue.get_nowait()
+				except Queue.Empty:
+					return
+
+				try:
+					hashes[path] = create_hash(path)
+				except (IOError, OSError):
+					# will be hashed by the storage then
+					pass
+
+		threads = [threading.Thread(target=work) for _ in range(min(self._workers, len(paths)))]
+		for thread in threads:
+			thread.daemon = True
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return hashes
+
+	def _upload(self, path, hash=None):
+		if not os.path.isfile(path):
+			return
+
+		file_wrapper = octoprint.filemanager.util.DiskFileWrapper(os.path.basename(path), path, hash=hash)
 
 		# determine current job
 		currentFilename = None
@@ -63,4 +176,13 @@ class GcodeWatchdogHandler(watchdog.events.PatternMatchingEventHandler):
 				self._logger.exception("Error while trying to clear a file from the watched folder")
 
 	def on_created(self, event):
-		self._upload(event.src_path)
+		self._watch(event.src_path)
+
+	def on_modified(self, event):
+		if not event.is_directory:
+			self._watch(event.src_path)
+
+	def on_moved(self, event):
+		# e.g. a temporary file renamed to its final name once it has been written
+		if not event.is_directory and octoprint.filemanager.valid_file_type(event.dest_path):
+			self._watch(event.dest_path)
@@ -135,9 +135,50 @@ default_settings = {
 		"enabled": True,
 		"mobileSizeThreshold": 2 * 1024 * 1024, # 2MB
 		"sizeThreshold": 20 * 1024 * 1024, # 20MB
+		"geometry": {
+			"cacheSize": 20
+		}
 	},
 	"gcodeAnalysis": {
-		"maxExtruders": 10
+		"maxExtruders": 10,
+		"ingest": {
+			"enabled": True,
+			"maxSize": 1 * 1024 * 1024 # 1MB
+		},
+		"thumbnail": {
+			"enabled": True,
+			"size": 128
+		},
+		"fastPath": {
+			"enabled": True,
+			"readSize": 64 * 1024 # 64KB from start and end of file each
+		}
+	},
+	"fileStorage": {
+		"metadata": {
+			"backend": "yaml",
+			"flushDelay": 2.0
+		},
+		"hashing": {
+			"workers": 1,
+			"cacheSize": 1000
+		},
+		"index": {
+			"enabled": True,
+			"maxEntries": 100000,
+			"polling": False
+		},
+		"compression": {
+			"enabled": False,
+			"level": 6
+		},
+		"deduplication": {
+			"enabled": False
+		},
+		"watched": {
+			"settleTime": 2.0,
+			"workers": 4
+		}
 	},
 	"feature": {
 		"temperatureGraph": True,
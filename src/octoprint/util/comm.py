@@ -25,6 +25,7 @@ from octoprint.events import eventManager, Events
 from octoprint.filemanager import valid_file_type
 from octoprint.filemanager.destinations import FileDestinations
 from octoprint.util import get_exception_string, sanitize_ascii, filter_non_ascii, CountedEvent, RepeatedTimer
+from octoprint.util.compression import open_file, uncompressed_size
 
 try:
 	import _winreg
@@ -274,6 +275,12 @@ class MachineCom(object):
 		self._sdAvailable = False
 		self._sdFileList = False
 		self._sdFiles = []
+		self._sdFilesReceiving = []
+
+		# the SD file list is cached, these count refresh requests to tell whether the cached list is outdated
+		self._sdFilesRequested = 1
+		self._sdFilesRequestSent = 0
+		self._sdFilesListed = 0
 		self._sdFileToSelect = None
 		self._ignore_select = False
 
@@ -312,8 +319,7 @@ class MachineCom(object):
 		if newState == self.STATE_CLOSED or newState == self.STATE_CLOSED_WITH_ERROR:
 			if settings().getBoolean(["feature", "sdSupport"]):
 				self._sdFileList = False
-				self._sdFiles = []
-				self._callback.on_comm_sd_files([])
+				self._setSdFiles([])
 
 			if self._currentFile is not None:
 				self._currentFile.close()
@@ -323,6 +329,10 @@ class MachineCom(object):
 		self._log('Changing monitoring state from \'%s\' to \'%s\'' % (oldState, self.getStateString()))
 		self._callback.on_comm_state_change(newState)
 
+		if newState == self.STATE_OPERATIONAL and self._sdAvailable and self.isSdFileListOutdated():
+			# catch up on refreshes of the SD file list we couldn't do while busy
+			self.refreshSdFiles()
+
 	def _log(self, message):
 		self._callback.on_comm_log(message)
 		self._serialLogger.debug(message)
@@ -523,7 +533,7 @@ class MachineCom(object):
 		self._serial = None
 
 		if settings().getBoolean(["feature", "sdSupport"]):
-			self._sdFileList = []
+			self._sdFileList = False
 
 		if printing:
 			payload = None
@@ -769,6 +779,13 @@ class MachineCom(object):
 	def getSdFiles(self):
 		return self._sdFiles
 
+	def isSdFileListOutdated(self):
+		"""
+		Whether the SD file list returned by :func:`getSdFiles` might not reflect all modifications of the SD card yet,
+		since a refresh has been requested since the last list was requested from the printer.
+		"""
+		return self._sdFilesListed < self._sdFilesRequested
+
 	def startSdFileTransfer(self, filename):
 		if not self.isOperational() or self.isBusy():
 			return
@@ -795,9 +812,13 @@ class MachineCom(object):
 		self.refreshSdFiles()
 
 	def refreshSdFiles(self):
+		# remember the request even if we can't send it right now, the list is refreshed once we are done printing
+		self._sdFilesRequested += 1
 		if not self.isOperational() or self.isBusy():
 			return
-		self.sendCommand("M20")
+
+		# requests still waiting in the send queue are merged, a single refreshed list will satisfy all of them
+		self.sendCommand("M20", cmd_type="sd_file_list")
 
 	def initSdCard(self):
 		if not self.isOperational():
@@ -815,10 +836,14 @@ class MachineCom(object):
 
 		self.sendCommand("M22")
 		self._sdAvailable = False
-		self._sdFiles = []
 
 		self._callback.on_comm_sd_state_change(self._sdAvailable)
-		self._callback.on_comm_sd_files(self._sdFiles)
+		self._setSdFiles([])
+
+	def _setSdFiles(self, files):
+		# the cached list is only ever replaced as a whole, so readers never see a partially received one
+		self._sdFiles = files
+		self._callback.on_comm_sd_files(files)
 
 	def sayHello(self):
 		self.sendCommand(self._hello_command, force=True)
@@ -962,7 +987,7 @@ class MachineCom(object):
 							if not filename.startswith("/"):
 								# file from the root of the sd -- we'll prepend a /
 								filename = "/" + filename
-							self._sdFiles.append((filename, size))
+							self._sdFilesReceiving.append((filename, size))
 						continue
 
 				##~~ process oks
@@ -1016,8 +1041,8 @@ class MachineCom(object):
 				##~~ SD Card handling
 				elif 'SD init fail' in line or 'volume.init failed' in line or 'openRoot failed' in line:
 					self._sdAvailable = False
-					self._sdFiles = []
 					self._callback.on_comm_sd_state_change(self._sdAvailable)
+					self._setSdFiles([])
 				elif 'Not SD printing' in line:
 					if self.isSdFileSelected() and self.isPrinting():
 						# something went wrong, printer is reporting that we actually are not printing right now...
@@ -1028,11 +1053,13 @@ class MachineCom(object):
 					self.refreshSdFiles()
 					self._callback.on_comm_sd_state_change(self._sdAvailable)
 				elif 'Begin file list' in line:
-					self._sdFiles = []
+					self._sdFilesReceiving = []
 					self._sdFileList = True
 				elif 'End file list' in line:
 					self._sdFileList = False
-					self._callback.on_comm_sd_files(self._sdFiles)
+					self._sdFilesListed = self._sdFilesRequestSent
+					self._setSdFiles(self._sdFilesReceiving)
+					self._sdFilesReceiving = []
 				elif 'SD printing byte' in line and self.isSdPrinting():
 					# answer to M27, at least on Marlin, Repetier and Sprinter: "SD printing byte %d/%d"
 					match = regex_sdPrintingByte.search(line)
@@ -1802,6 +1829,10 @@ class MachineCom(object):
 		self._heating = True
 		self._gcode_M140_sent(cmd, cmd_type)
 
+	def _gcode_M20_sent(self, cmd, cmd_type=None):
+		# the list we'll receive for this reflects all modifications requested so far
+		self._sdFilesRequestSent = self._sdFilesRequested
+
 	def _gcode_M110_sending(self, cmd, cmd_type=None):
 		newLineNumber = None
 		match = regexes_parameters["intN"].search(cmd)
@@ -1978,7 +2009,8 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 
 		if not os.path.exists(self._filename) or not os.path.isfile(self._filename):
 			raise IOError("File %s does not exist" % self._filename)
-		self._size = os.stat(self._filename).st_size
+		# files may be stored compressed, progress is tracked through their uncompressed contents
+		self._size = uncompressed_size(self._filename)
 		self._pos = 0
 
 	def start(self):
@@ -1986,7 +2018,7 @@ class PrintingGcodeFileInformation(PrintingFileInformation):
 		Opens the file for reading and determines the file size.
 		"""
 		PrintingFileInformation.start(self)
-		self._handle = open(self._filename, "r")
+		self._handle = open_file(self._filename)
 
 	def close(self):
 		"""
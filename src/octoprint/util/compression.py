@@ -0,0 +1,148 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import gzip
+import io
+import os
+import shutil
+import struct
+
+# Helpers for files stored gzip compressed on disk, which are read transparently as if they were stored uncompressed.
+# Compressed files keep their original name, they are recognized by the gzip magic number at their start. All offsets
+# and sizes reported for them refer to their uncompressed contents.
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+COMPRESSED_EXTENSION = ".gz"
+
+BLOCKSIZE = 64 * 1024
+
+
+class _ClosingGzipFile(gzip.GzipFile):
+	"""
+	:class:`gzip.GzipFile` which also closes the file object it reads from when it gets closed.
+	"""
+
+	def close(self):
+		fileobj = self.fileobj
+		try:
+			gzip.GzipFile.close(self)
+		finally:
+			if fileobj is not None:
+				fileobj.close()
+
+
+def is_compressed(path):
+	"""
+	Returns whether the file at ``path`` is gzip compressed.
+	"""
+	try:
+		with io.open(path, "rb") as f:
+			return f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+	except (IOError, OSError):
+		return False
+
+
+def open_file(path):
+	"""
+	Opens the file at ``path`` for reading in binary mode, decompressing it on the fly if it is gzip compressed.
+	``tell`` and ``seek`` of the returned file object work on the uncompressed contents.
+	"""
+	if is_compressed(path):
+		return _ClosingGzipFile(fileobj=io.open(path, "rb"), mode="rb")
+	return io.open(path, "rb")
+
+
+def decompressing_stream(stream):
+	"""
+	Wraps the gzip compressed ``stream`` into a stream of its uncompressed contents, closing ``stream`` along with it.
+	"""
+	return _ClosingGzipFile(fileobj=stream, mode="rb")
+
+
+def uncompressed_size(path):
+	"""
+	Returns the size of the contents of the file at ``path`` in bytes, which for a gzip compressed file is the size
+	recorded in its trailer (modulo 4GB).
+	"""
+	size = os.stat(path).st_size
+	if size < 18 or not is_compressed(path):
+		return size
+
+	with io.open(path, "rb") as f:
+		f.seek(-4, os.SEEK_END)
+		return struct.unpack("<I", f.read(4))[0]
+
+
+def deflate_data(path):
+	"""
+	Locates the raw deflate data within the gzip compressed file at ``path``, so that it can be passed on as it is,
+	e.g. into a ZIP archive. Returns an ``(offset, length, crc, size)`` tuple of the offset and length of the deflate
+	data in the file, the CRC32 of the uncompressed contents and their size (modulo 4GB), or ``None`` if the file is not
+	gzip compressed.
+	"""
+	if not is_compressed(path):
+		return None
+
+	with io.open(path, "rb") as f:
+		header = f.read(10)
+		if len(header) < 10 or ord(header[2]) != 8:
+			# only deflate is used in practice, but better safe than sorry
+			return None
+
+		flags = ord(header[3])
+		if flags & 0x04:
+			# extra field
+			length = struct.unpack("<H", f.read(2))[0]
+			f.read(length)
+		for flag in (0x08, 0x10):
+			# zero terminated file name and comment
+			if flags & flag:
+				while f.read(1) not in (b"\x00", b""):
+					pass
+		if flags & 0x02:
+			# header CRC
+			f.read(2)
+
+		offset = f.tell()
+		f.seek(-8, os.SEEK_END)
+		trailer_offset = f.tell()
+		crc, size = struct.unpack("<II", f.read(8))
+
+	if trailer_offset < offset:
+		return None
+	return offset, trailer_offset - offset, crc, size
+
+
+def compress_file(path, level=6):
+	"""
+	Compresses the file at ``path`` in place, through a temporary file in the same folder that replaces the original
+	file only once it has been completely written. The original modification time is preserved.
+	"""
+	temp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".compressing")
+	stat = os.stat(path)
+	try:
+		with io.open(path, "rb") as source:
+			with io.open(temp_path, "wb") as destination:
+				# no file name and a fixed timestamp in the header, so that identical contents compress identically
+				with gzip.GzipFile(filename="", mode="wb", compresslevel=level, fileobj=destination, mtime=0) as compressed:
+					shutil.copyfileobj(source, compressed, BLOCKSIZE)
+		os.utime(temp_path, (stat.st_atime, stat.st_mtime))
+		shutil.move(temp_path, path)
+	finally:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+
+
+def strip_compressed_extension(filename):
+	"""
+	Returns ``filename`` without its ``.gz`` extension, or ``None`` if it has none.
+	"""
+	if filename is None or not filename.lower().endswith(COMPRESSED_EXTENSION) or len(filename) <= len(COMPRESSED_EXTENSION):
+		return None
+	return filename[:-len(COMPRESSED_EXTENSION)]
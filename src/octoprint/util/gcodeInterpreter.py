@@ -10,8 +10,11 @@ import os
 import base64
 import zlib
 import logging
+import collections
 
 from octoprint.settings import settings
+from octoprint.util.compression import open_file, uncompressed_size
+from octoprint.util.planner import KinematicPlanner
 
 
 class AnalysisAborted(Exception):
@@ -19,6 +22,10 @@ class AnalysisAborted(Exception):
 
 
 class gcode(object):
+
+	timeSampleInterval = 2.0
+	"""Minimum estimated time in seconds between two samples of :attr:`times`."""
+
 	def __init__(self):
 		self._logger = logging.getLogger(__name__)
 
@@ -26,18 +33,29 @@ class gcode(object):
 		self.extrusionAmount = [0]
 		self.extrusionVolume = [0]
 		self.totalMoveTimeMinute = 0
+		self.layers = []
+		self.times = []
 		self.filename = None
+		self._fileSize = None
 		self.progressCallback = None
+		self.segmentCallback = None
 		self._abort = False
 		self._filamentDiameter = 0
 
 	def load(self, filename, printer_profile, throttle=None):
 		if os.path.isfile(filename):
 			self.filename = filename
-			self._fileSize = os.stat(filename).st_size
-			with open(filename, "r") as f:
+			self._fileSize = uncompressed_size(filename)
+			with open_file(filename) as f:
 				self._load(f, printer_profile, throttle=throttle)
 
+	def load_lines(self, lines, printer_profile, throttle=None):
+		"""
+		Analyses the lines provided by the iterable ``lines`` instead of reading them from a file, allowing to analyse
+		a file while it is being written (e.g. during an upload).
+		"""
+		self._load(lines, printer_profile, throttle=throttle)
+
 	def abort(self):
 		self._abort = True
 
@@ -60,16 +78,45 @@ class gcode(object):
 			feedRateXY = 2000
 		offsets = printer_profile["extruder"]["offsets"]
 
+		# layers as (byte offset, line number, z, cumulative time in seconds, cumulative filament in mm), a layer
+		# starts with the z change preceding the first extruding xy move on a new z height
+		layers = []
+		currentLayerZ = None
+		zChange = None
+
+		# (byte offset, cumulative time in seconds) samples mapping file position to estimated print time, at least
+		# timeSampleInterval apart unless forced
+		times = []
+
+		def recordTime(offset, time, force=False):
+			if times and (offset <= times[-1][0] or (not force and time - times[-1][1] < self.timeSampleInterval)):
+				return
+			times.append((offset, time))
+
+		# if the printer profile tells us about the printer's kinematics, moves are timed by simulating the
+		# firmware's planner, otherwise we fall back to distance divided by feedrate
+		pendingLayers = collections.deque()
+
+		def onBlockPlanned(offset, startTime, duration):
+			# the planner only knows when a move starts once it has left its look ahead buffer, so the start times
+			# of layers have to be filled in here
+			while pendingLayers and layers[pendingLayers[0]][0] <= offset:
+				layers[pendingLayers.popleft()][3] = startTime
+			recordTime(offset, startTime)
+
+		planner = KinematicPlanner.from_profile(printer_profile, block_callback=onBlockPlanned)
+
 		for line in gcodeFile:
 			if self._abort:
 				raise AnalysisAborted()
 			filePos += 1
+			lineStart = readBytes
 			readBytes += len(line)
 
-			if isinstance(gcodeFile, (file)):
-				percentage = float(readBytes) / float(self._fileSize)
-			elif isinstance(gcodeFile, (list)):
+			if isinstance(gcodeFile, (list)):
 				percentage = float(filePos) / float(len(gcodeFile))
+			elif self._fileSize:
+				percentage = float(readBytes) / float(self._fileSize)
 			else:
 				percentage = None
 
@@ -115,6 +162,8 @@ class gcode(object):
 					z = getCodeFloat(line, 'Z')
 					e = getCodeFloat(line, 'E')
 					f = getCodeFloat(line, 'F')
+					timeBefore = totalMoveTimeMinute
+					filamentBefore = sum(totalExtrusion)
 					oldPos = pos
 					pos = pos[:]
 					if posAbs:
@@ -149,34 +198,66 @@ class gcode(object):
 					else:
 						e = 0.0
 
-					if x is not None or y is not None or z is not None:
-						diffX = oldPos[0] - pos[0]
-						diffY = oldPos[1] - pos[1]
-						totalMoveTimeMinute += math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
-					elif moveType == "extrude":
-						diffX = oldPos[0] - pos[0]
-						diffY = oldPos[1] - pos[1]
-						time1 = math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
-						time2 = abs(e / feedRateXY)
-						totalMoveTimeMinute += max(time1, time2)
-					elif moveType == "retract":
-						totalMoveTimeMinute += abs(e / feedRateXY)
+					if planner is not None:
+						planner.add_move(pos[0] - oldPos[0], pos[1] - oldPos[1], pos[2] - oldPos[2], e, feedRateXY / 60.0, tag=lineStart)
+					else:
+						recordTime(lineStart, timeBefore * 60.0)
+						if x is not None or y is not None or z is not None:
+							diffX = oldPos[0] - pos[0]
+							diffY = oldPos[1] - pos[1]
+							totalMoveTimeMinute += math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
+						elif moveType == "extrude":
+							diffX = oldPos[0] - pos[0]
+							diffY = oldPos[1] - pos[1]
+							time1 = math.sqrt(diffX * diffX + diffY * diffY) / feedRateXY
+							time2 = abs(e / feedRateXY)
+							totalMoveTimeMinute += max(time1, time2)
+						elif moveType == "retract":
+							totalMoveTimeMinute += abs(e / feedRateXY)
+
+					if self.segmentCallback is not None:
+						self.segmentCallback(lineStart, oldPos, pos, moveType, currentExtruder)
+
+					if oldPos[2] != pos[2] and zChange is None:
+						zChange = (lineStart, filePos, timeBefore * 60.0, filamentBefore)
+
+					if moveType == 'extrude' and (x is not None or y is not None):
+						# extrusions without xy movement (e.g. priming) don't start a layer
+						if pos[2] != currentLayerZ:
+							if zChange is None:
+								zChange = (lineStart, filePos, timeBefore * 60.0, filamentBefore)
+							offset, lineNumber, time, filament = zChange
+							layers.append([offset, lineNumber, pos[2], time, filament])
+							if planner is not None:
+								pendingLayers.append(len(layers) - 1)
+							currentLayerZ = pos[2]
+						zChange = None
 
 					if moveType == 'move' and oldPos[2] != pos[2]:
 						if oldPos[2] > pos[2] and abs(oldPos[2] - pos[2]) > 5.0 and pos[2] < 1.0:
 							oldPos[2] = 0.0
 				elif G == 4:	#Delay
 					S = getCodeFloat(line, 'S')
-					if S is not None:
-						totalMoveTimeMinute += S / 60.0
 					P = getCodeFloat(line, 'P')
-					if P is not None:
-						totalMoveTimeMinute += P / 60.0 / 1000.0
+					seconds = (S if S is not None else 0.0) + (P / 1000.0 if P is not None else 0.0)
+					if seconds > 0:
+						# sample right before and after the dwell, it would be spread over the surrounding moves otherwise
+						if planner is not None:
+							planner.flush()
+							recordTime(lineStart, planner.total_time, force=True)
+							planner.dwell(seconds)
+							recordTime(readBytes, planner.total_time, force=True)
+						else:
+							recordTime(lineStart, totalMoveTimeMinute * 60.0, force=True)
+							totalMoveTimeMinute += seconds / 60.0
+							recordTime(readBytes, totalMoveTimeMinute * 60.0, force=True)
 				elif G == 20:	#Units are inches
 					scale = 25.4
 				elif G == 21:	#Units are mm
 					scale = 1.0
 				elif G == 28:	#Home
+					if planner is not None:
+						planner.flush()
 					x = getCodeFloat(line, 'X')
 					y = getCodeFloat(line, 'Y')
 					z = getCodeFloat(line, 'Z')
@@ -214,6 +295,25 @@ class gcode(object):
 					absoluteE = True
 				elif M == 83:   #Relative E
 					absoluteE = False
+				elif planner is not None:
+					if M in (109, 190, 400):   #Wait for temperature or moves to finish
+						planner.flush()
+					elif M == 201:   #Max acceleration
+						planner.set_max_acceleration(**getCodeAxes(line))
+					elif M == 203:   #Max feedrate
+						planner.set_max_feedrate(**getCodeAxes(line))
+					elif M == 204:   #Acceleration
+						S = getCodeFloat(line, 'S')
+						P = getCodeFloat(line, 'P')
+						travel = getCodeFloat(line, 'T')
+						planner.set_acceleration(print_acceleration=P if P is not None else S,
+						                         travel_acceleration=travel if travel is not None else S,
+						                         retract_acceleration=getCodeFloat(line, 'R'))
+					elif M == 205:   #Jerk and junction deviation
+						planner.set_jerk(**getCodeAxes(line))
+						J = getCodeFloat(line, 'J')
+						if J is not None:
+							planner.junction_deviation = J
 
 			elif T is not None:
 				if T > settings().getInt(["gcodeAnalysis", "maxExtruders"]):
@@ -240,8 +340,14 @@ class gcode(object):
 			if throttle is not None:
 				throttle()
 
+		if planner is not None:
+			planner.flush()
+			totalMoveTimeMinute = planner.total_time / 60.0
+			while pendingLayers:
+				layers[pendingLayers.popleft()][3] = planner.total_time
+
 		if self.progressCallback is not None:
-			self.progressCallback(100.0)
+			self.progressCallback(1.0)
 
 		self.extrusionAmount = maxExtrusion
 		self.extrusionVolume = [0] * len(maxExtrusion)
@@ -249,6 +355,10 @@ class gcode(object):
 			radius = self._filamentDiameter / 2
 			self.extrusionVolume[i] = (self.extrusionAmount[i] * (math.pi * radius * radius)) / 1000
 		self.totalMoveTimeMinute = totalMoveTimeMinute
+		self.layers = [tuple(layer) for layer in layers]
+
+		recordTime(readBytes, totalMoveTimeMinute * 60.0, force=True)
+		self.times = times
 
 	def _parseCuraProfileString(self, comment, prefix):
 		return {key: value for (key, value) in map(lambda x: x.split("=", 1), zlib.decompress(base64.b64decode(comment[len(prefix):])).split("\b"))}
@@ -267,6 +377,19 @@ def getCodeInt(line, code):
 		return None
 
 
+def getCodeAxes(line):
+	"""
+	Returns the values of the ``X``, ``Y``, ``Z`` and ``E`` parameters of ``line`` as keyword arguments for the
+	:class:`~octoprint.util.planner.KinematicPlanner`, leaving out those not present.
+	"""
+	result = dict()
+	for axis in ("X", "Y", "Z", "E"):
+		value = getCodeFloat(line, axis)
+		if value is not None:
+			result[axis.lower()] = value
+	return result
+
+
 def getCodeFloat(line, code):
 	import math
 	n = line.find(code) + 1
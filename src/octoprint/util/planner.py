@@ -0,0 +1,304 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import math
+
+
+AXES = ("x", "y", "z", "e")
+
+_EPSILON = 0.000001
+
+
+class KinematicPlanner(object):
+	"""
+	Simulates the motion planner of a typical RepRap firmware to estimate how long the moves of a machine code file
+	take to execute, taking acceleration, junction speeds and look ahead into account.
+
+	Moves are added one by one through :meth:`add_move`. Like the firmware, the planner keeps the last
+	``buffer_depth`` moves in a look ahead buffer. Each time a move is added, the maximum entry speeds of the buffered
+	moves are recalculated backwards from the new move on, stopping as soon as an entry speed doesn't change anymore,
+	so that each move is touched only a couple of times. Once a move leaves the buffer its entry and exit speed are
+	final, the duration of its trapezoidal velocity profile (accelerate, cruise, decelerate) is calculated and
+	reported to ``block_callback`` together with the time at which the move starts.
+
+	Junction speeds between consecutive moves are limited either through junction deviation (if
+	``junction_deviation`` is set) or through the maximum instantaneous speed change per axis (``jerk``) otherwise.
+
+	All speeds are in mm/s, all accelerations in mm/s², all durations in seconds.
+
+	Arguments:
+	    acceleration (float): Acceleration for printing moves (``M204 P``).
+	    travel_acceleration (float): Acceleration for travel moves without extrusion (``M204 T``).
+	    retract_acceleration (float): Acceleration for extruder only moves (``M204 R``).
+	    max_acceleration (dict): Maximum acceleration per axis ``x``, ``y``, ``z`` and ``e`` (``M201``).
+	    max_feedrate (dict): Maximum feedrate per axis ``x``, ``y``, ``z`` and ``e`` (``M203``).
+	    jerk (dict): Maximum instantaneous speed change per axis ``x``, ``y``, ``z`` and ``e`` (``M205``).
+	    junction_deviation (float): Junction deviation in mm, ``0`` to use ``jerk`` instead.
+	    buffer_depth (int): Number of moves to look ahead.
+	    block_callback (callable): Called with the ``tag`` provided to :meth:`add_move`, the time the move starts and
+	        its duration once a move has been planned.
+	"""
+
+	minimum_speed = 0.05
+	"""Speed at which the planner starts from and comes to a stand still."""
+
+	def __init__(self, acceleration=1000.0, travel_acceleration=1000.0, retract_acceleration=1000.0,
+	             max_acceleration=None, max_feedrate=None, jerk=None, junction_deviation=0.0, buffer_depth=16,
+	             block_callback=None):
+		self.acceleration = float(acceleration)
+		self.travel_acceleration = float(travel_acceleration)
+		self.retract_acceleration = float(retract_acceleration)
+		self.max_acceleration = _axes_values(max_acceleration, dict(x=3000.0, y=3000.0, z=100.0, e=10000.0))
+		self.max_feedrate = _axes_values(max_feedrate, dict(x=300.0, y=300.0, z=5.0, e=25.0))
+		self.jerk = _axes_values(jerk, dict(x=10.0, y=10.0, z=0.4, e=5.0))
+		self.junction_deviation = float(junction_deviation)
+		self.buffer_depth = max(1, int(buffer_depth))
+		self.block_callback = block_callback
+
+		self._buffer = []
+		self._previous = None
+		self._time = 0.0
+
+	@classmethod
+	def from_profile(cls, printer_profile, block_callback=None):
+		"""
+		Creates a planner configured by the ``kinematics`` section of ``printer_profile``.
+
+		Returns:
+		    KinematicPlanner: The planner, or ``None`` if the profile doesn't have a ``kinematics`` section.
+		"""
+		kinematics = printer_profile.get("kinematics") if printer_profile else None
+		if not kinematics:
+			return None
+
+		acceleration = kinematics.get("acceleration", dict())
+		return cls(acceleration=acceleration.get("print", 1000.0),
+		           travel_acceleration=acceleration.get("travel", 1000.0),
+		           retract_acceleration=acceleration.get("retract", 1000.0),
+		           max_acceleration=kinematics.get("maxAcceleration"),
+		           max_feedrate=kinematics.get("maxFeedrate"),
+		           jerk=kinematics.get("jerk"),
+		           junction_deviation=kinematics.get("junctionDeviation", 0.0),
+		           buffer_depth=kinematics.get("bufferDepth", 16),
+		           block_callback=block_callback)
+
+	@property
+	def total_time(self):
+		"""Duration of all moves that have left the look ahead buffer plus all dwells so far, in seconds."""
+		return self._time
+
+	def add_move(self, dx, dy, dz, de, feedrate, tag=None):
+		"""
+		Adds a move by ``dx``, ``dy``, ``dz`` and ``de`` mm at the requested ``feedrate`` in mm/s.
+		"""
+		distance = math.sqrt(dx * dx + dy * dy + dz * dz)
+		if distance < _EPSILON:
+			# extruder only move
+			distance = abs(de)
+			if distance < _EPSILON:
+				return
+			acceleration = self.retract_acceleration
+			unit = None
+		else:
+			acceleration = self.acceleration if de else self.travel_acceleration
+			unit = (dx / distance, dy / distance, dz / distance, de / distance)
+
+		# limit speed and acceleration so that no axis exceeds its maximum, unrolled since this is called for every
+		# single move of a file
+		max_feedrate = self.max_feedrate
+		max_acceleration = self.max_acceleration
+		speed = feedrate if feedrate > 0 else max_feedrate[0]
+		if dx:
+			ratio = distance / abs(dx)
+			if speed > max_feedrate[0] * ratio:
+				speed = max_feedrate[0] * ratio
+			if acceleration > max_acceleration[0] * ratio:
+				acceleration = max_acceleration[0] * ratio
+		if dy:
+			ratio = distance / abs(dy)
+			if speed > max_feedrate[1] * ratio:
+				speed = max_feedrate[1] * ratio
+			if acceleration > max_acceleration[1] * ratio:
+				acceleration = max_acceleration[1] * ratio
+		if dz:
+			ratio = distance / abs(dz)
+			if speed > max_feedrate[2] * ratio:
+				speed = max_feedrate[2] * ratio
+			if acceleration > max_acceleration[2] * ratio:
+				acceleration = max_acceleration[2] * ratio
+		if de:
+			ratio = distance / abs(de)
+			if speed > max_feedrate[3] * ratio:
+				speed = max_feedrate[3] * ratio
+			if acceleration > max_acceleration[3] * ratio:
+				acceleration = max_acceleration[3] * ratio
+
+		max_entry = self._junction_speed(unit, speed, acceleration)
+		if max_entry > speed:
+			max_entry = speed
+		max_entry_squared = max_entry * max_entry
+		delta_squared = 2.0 * acceleration * distance
+
+		# entry speed assuming we have to come to a stand still at the end of this move
+		entry_squared = self.minimum_speed * self.minimum_speed + delta_squared
+		if entry_squared > max_entry_squared:
+			entry_squared = max_entry_squared
+
+		# blocks are lists of distance, nominal speed, acceleration, 2 * acceleration * distance, squared maximum
+		# entry speed, squared entry speed, tag and whether the entry speed is final
+		buffer = self._buffer
+		buffer.append([distance, speed, acceleration, delta_squared, max_entry_squared, entry_squared, tag, False])
+		self._previous = (unit, speed)
+
+		# propagate backwards until we reach a block whose entry speed didn't change or is already final
+		index = len(buffer) - 2
+		while index >= 0:
+			current = buffer[index]
+			if current[7]:
+				break
+			entry_squared += current[3]
+			if entry_squared > current[4]:
+				entry_squared = current[4]
+			if entry_squared == current[5]:
+				break
+			current[5] = entry_squared
+			index -= 1
+
+		if len(buffer) > self.buffer_depth:
+			self._plan_first()
+
+	def dwell(self, seconds):
+		"""
+		Waits for all buffered moves to finish and then pauses for ``seconds`` seconds (``G4``).
+		"""
+		self.flush()
+		self._time += max(0.0, seconds)
+
+	def flush(self):
+		"""
+		Plans all buffered moves, bringing the machine to a stand still (e.g. ``M400`` or homing).
+		"""
+		while self._buffer:
+			self._plan_first()
+		self._previous = None
+
+	def set_acceleration(self, print_acceleration=None, travel_acceleration=None, retract_acceleration=None):
+		"""Sets the accelerations as done by ``M204``."""
+		if print_acceleration is not None:
+			self.acceleration = print_acceleration
+		if travel_acceleration is not None:
+			self.travel_acceleration = travel_acceleration
+		if retract_acceleration is not None:
+			self.retract_acceleration = retract_acceleration
+
+	def set_max_acceleration(self, **values):
+		"""Sets the per axis maximum accelerations as done by ``M201``."""
+		self.max_acceleration = _axes_values(values, self.max_acceleration)
+
+	def set_max_feedrate(self, **values):
+		"""Sets the per axis maximum feedrates as done by ``M203``."""
+		self.max_feedrate = _axes_values(values, self.max_feedrate)
+
+	def set_jerk(self, **values):
+		"""Sets the per axis jerk as done by ``M205``."""
+		self.jerk = _axes_values(values, self.jerk)
+
+	def _junction_speed(self, unit, speed, acceleration):
+		previous = self._previous
+		if previous is None or unit is None or previous[0] is None:
+			# starting from a stand still or extruder only move involved, only the speed change the jerk setting
+			# allows for is possible without stopping
+			return self._safe_speed(unit, speed)
+
+		previous_unit, previous_speed = previous
+		if self.junction_deviation > 0:
+			cos_theta = -(previous_unit[0] * unit[0] + previous_unit[1] * unit[1] + previous_unit[2] * unit[2])
+			if cos_theta > 0.999999:
+				# full reversal
+				return self.minimum_speed
+			elif cos_theta < -0.999999:
+				# straight line
+				junction_speed = previous_speed
+			else:
+				sin_theta_d2 = math.sqrt(0.5 * (1.0 - cos_theta))
+				junction_speed = math.sqrt(acceleration * self.junction_deviation * sin_theta_d2 / (1.0 - sin_theta_d2))
+		else:
+			# limit the speed so that the velocity change of each axis stays within its jerk, unrolled for speed
+			junction_speed = previous_speed if previous_speed < speed else speed
+			jerk = self.jerk
+			change = abs(unit[0] - previous_unit[0])
+			if change * junction_speed > jerk[0]:
+				junction_speed = jerk[0] / change
+			change = abs(unit[1] - previous_unit[1])
+			if change * junction_speed > jerk[1]:
+				junction_speed = jerk[1] / change
+			change = abs(unit[2] - previous_unit[2])
+			if change * junction_speed > jerk[2]:
+				junction_speed = jerk[2] / change
+			change = abs(unit[3] - previous_unit[3])
+			if change * junction_speed > jerk[3]:
+				junction_speed = jerk[3] / change
+
+		if junction_speed > previous_speed:
+			junction_speed = previous_speed
+		if junction_speed < self.minimum_speed:
+			junction_speed = self.minimum_speed
+		return junction_speed
+
+	def _safe_speed(self, unit, speed):
+		if unit is None:
+			return min(speed, self.jerk[3])
+
+		safe_speed = speed
+		for component, jerk in zip(unit, self.jerk):
+			component = abs(component)
+			if component * safe_speed > jerk:
+				safe_speed = jerk / component
+		return max(self.minimum_speed, safe_speed)
+
+	def _plan_first(self):
+		buffer = self._buffer
+		distance, speed, acceleration, delta_squared, _, entry_squared, tag, _ = buffer.pop(0)
+
+		exit_squared = entry_squared + delta_squared
+		if buffer:
+			following = buffer[0]
+			if exit_squared > following[5]:
+				exit_squared = following[5]
+			following[5] = exit_squared
+			following[7] = True
+		else:
+			exit_squared = min(self.minimum_speed * self.minimum_speed, exit_squared)
+
+		duration = _trapezoid_duration(distance, speed, acceleration, math.sqrt(entry_squared), math.sqrt(exit_squared))
+		if self.block_callback is not None:
+			self.block_callback(tag, self._time, duration)
+		self._time += duration
+
+
+def _trapezoid_duration(distance, speed, acceleration, entry, exit):
+	if acceleration <= 0:
+		return distance / speed
+
+	acceleration_distance = (speed * speed - entry * entry) / (2.0 * acceleration)
+	deceleration_distance = (speed * speed - exit * exit) / (2.0 * acceleration)
+	cruise_distance = distance - acceleration_distance - deceleration_distance
+	if cruise_distance >= 0:
+		return (speed - entry) / acceleration + (speed - exit) / acceleration + cruise_distance / speed
+
+	# we never reach the requested speed, triangular profile
+	peak = math.sqrt(max((2.0 * acceleration * distance + entry * entry + exit * exit) / 2.0, entry * entry, exit * exit))
+	return (peak - entry) / acceleration + (peak - exit) / acceleration
+
+
+def _axes_values(values, defaults):
+	if isinstance(defaults, dict):
+		defaults = tuple(float(defaults[axis]) for axis in AXES)
+	if not values:
+		return defaults
+	return tuple(float(values[axis]) if values.get(axis) is not None else default for axis, default in zip(AXES, defaults))
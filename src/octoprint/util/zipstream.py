@@ -0,0 +1,212 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import io
+import logging
+import os
+import struct
+import time
+import zlib
+
+from octoprint.util.compression import deflate_data, BLOCKSIZE
+
+# Generates ZIP archives on the fly, as a sequence of chunks to be sent one after the other, without ever seeking
+# back or needing the whole archive in memory or on disk.
+#
+# Files are stored uncompressed, there's no point in spending the CPU time to compress them while sending them. Files
+# that are stored gzip compressed on disk (see octoprint.util.compression) are put into the archive with their
+# existing deflate data, ZIP and gzip share the same compression method. Their CRC and size are known up front from
+# the gzip trailer, for all other files they follow the file's data in a data descriptor.
+
+ZIP64_LIMIT = 0xFFFFFFFF
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_DATA_DESCRIPTOR64 = struct.Struct("<IIQQ")
+_DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_CENTRAL_HEADER_SIGNATURE = 0x02014b50
+_END_RECORD = struct.Struct("<IHHHHIIH")
+_END_RECORD_SIGNATURE = 0x06054b50
+_END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+_END_RECORD64_SIGNATURE = 0x06064b50
+_END_LOCATOR64 = struct.Struct("<IIQI")
+_END_LOCATOR64_SIGNATURE = 0x07064b50
+
+_ZIP64_EXTRA_ID = 0x0001
+
+_METHOD_STORED = 0
+_METHOD_DEFLATED = 8
+
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+_VERSION = 20
+_VERSION_ZIP64 = 45
+_VERSION_MADE_BY = (3 << 8) | _VERSION_ZIP64  # unix
+
+_EXTERNAL_ATTRIBUTES = 0o100644 << 16
+
+
+class _Entry(object):
+	def __init__(self, name, flags, method, dos_time, dos_date, crc, compressed_size, size, offset):
+		self.name = name
+		self.flags = flags
+		self.method = method
+		self.dos_time = dos_time
+		self.dos_date = dos_date
+		self.crc = crc
+		self.compressed_size = compressed_size
+		self.size = size
+		self.offset = offset
+
+
+def zip_stream(entries, passthrough_compressed=True, blocksize=BLOCKSIZE):
+	"""
+	Generates a ZIP archive of ``entries``, an iterable of ``(path, name)`` tuples of the absolute path of each file to
+	add and its name within the archive. Yields the archive in chunks of at most ``blocksize`` bytes of file data
+	(plus some headers).
+
+	If ``passthrough_compressed`` is set, files stored gzip compressed on disk are added with their compressed data as
+	is, otherwise they are added as they are stored on disk. Files that can't be read are skipped.
+	"""
+	logger = logging.getLogger(__name__)
+
+	offset = 0
+	written = []
+	for path, name in entries:
+		try:
+			stat = os.stat(path)
+			deflate = deflate_data(path) if passthrough_compressed else None
+		except (IOError, OSError):
+			logger.warn("Could not add {} to ZIP archive, skipping it".format(path))
+			continue
+
+		if isinstance(name, unicode):
+			name = name.encode("utf-8")
+		flags = 0
+		try:
+			name.decode("ascii")
+		except UnicodeDecodeError:
+			flags |= _FLAG_UTF8
+
+		dos_time, dos_date = _dos_timestamp(stat.st_mtime)
+
+		if deflate is not None:
+			data_offset, length, crc, size = deflate
+			entry = _Entry(name, flags, _METHOD_DEFLATED, dos_time, dos_date, crc, length, size, offset)
+			zip64 = length >= ZIP64_LIMIT or size >= ZIP64_LIMIT
+			header = _local_header(entry, zip64)
+			yield header
+			offset += len(header)
+
+			for chunk in _read(path, data_offset, length, blocksize):
+				yield chunk
+				offset += len(chunk)
+
+		else:
+			# the CRC is only known once the data has been read, it follows in the data descriptor
+			entry = _Entry(name, flags | _FLAG_DATA_DESCRIPTOR, _METHOD_STORED, dos_time, dos_date, 0, 0, 0, offset)
+			zip64 = stat.st_size >= ZIP64_LIMIT
+			header = _local_header(entry, zip64)
+			yield header
+			offset += len(header)
+
+			crc = 0
+			size = 0
+			for chunk in _read(path, 0, stat.st_size, blocksize):
+				crc = zlib.crc32(chunk, crc)
+				size += len(chunk)
+				yield chunk
+			offset += size
+
+			entry.crc = crc & 0xFFFFFFFF
+			entry.compressed_size = entry.size = size
+			if zip64:
+				descriptor = _DATA_DESCRIPTOR64.pack(_DATA_DESCRIPTOR_SIGNATURE, entry.crc, size, size)
+			else:
+				descriptor = _DATA_DESCRIPTOR.pack(_DATA_DESCRIPTOR_SIGNATURE, entry.crc, size, size)
+			yield descriptor
+			offset += len(descriptor)
+
+		written.append(entry)
+
+	yield _central_directory(written, offset)
+
+
+def _read(path, offset, length, blocksize):
+	with io.open(path, "rb") as f:
+		f.seek(offset)
+		while length > 0:
+			chunk = f.read(min(blocksize, length))
+			if not chunk:
+				break
+			length -= len(chunk)
+			yield chunk
+
+
+def _dos_timestamp(timestamp):
+	t = time.localtime(timestamp)
+	if t.tm_year < 1980:
+		# the earliest date a ZIP archive can represent
+		return 0, (1 << 5) | 1
+	return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _local_header(entry, zip64):
+	extra = b""
+	compressed_size, size = entry.compressed_size, entry.size
+	if zip64:
+		extra = struct.pack("<HHQQ", _ZIP64_EXTRA_ID, 16, size, compressed_size)
+		compressed_size = size = 0xFFFFFFFF
+
+	header = _LOCAL_HEADER.pack(_LOCAL_HEADER_SIGNATURE, _VERSION_ZIP64 if zip64 else _VERSION, entry.flags, entry.method,
+	                            entry.dos_time, entry.dos_date, entry.crc, compressed_size, size, len(entry.name), len(extra))
+	return header + entry.name + extra
+
+
+def _central_directory(entries, offset):
+	result = []
+	for entry in entries:
+		# only the values that don't fit go into the ZIP64 extra field, in this order
+		values = []
+		size, compressed_size, entry_offset = entry.size, entry.compressed_size, entry.offset
+		if size >= ZIP64_LIMIT:
+			values.append(size)
+			size = 0xFFFFFFFF
+		if compressed_size >= ZIP64_LIMIT:
+			values.append(compressed_size)
+			compressed_size = 0xFFFFFFFF
+		if entry_offset >= ZIP64_LIMIT:
+			values.append(entry_offset)
+			entry_offset = 0xFFFFFFFF
+
+		extra = b""
+		if values:
+			extra = struct.pack("<HH" + "Q" * len(values), _ZIP64_EXTRA_ID, 8 * len(values), *values)
+
+		result.append(_CENTRAL_HEADER.pack(_CENTRAL_HEADER_SIGNATURE, _VERSION_MADE_BY, _VERSION_ZIP64 if values else _VERSION,
+		                                   entry.flags, entry.method, entry.dos_time, entry.dos_date, entry.crc,
+		                                   compressed_size, size, len(entry.name), len(extra), 0, 0, 0,
+		                                   _EXTERNAL_ATTRIBUTES, entry_offset))
+		result.append(entry.name)
+		result.append(extra)
+
+	directory_size = sum(len(part) for part in result)
+	count = len(entries)
+
+	if count >= 0xFFFF or directory_size >= ZIP64_LIMIT or offset >= ZIP64_LIMIT:
+		result.append(_END_RECORD64.pack(_END_RECORD64_SIGNATURE, _END_RECORD64.size - 12, _VERSION_MADE_BY, _VERSION_ZIP64,
+		                                 0, 0, count, count, directory_size, offset))
+		result.append(_END_LOCATOR64.pack(_END_LOCATOR64_SIGNATURE, 0, offset + directory_size, 1))
+		result.append(_END_RECORD.pack(_END_RECORD_SIGNATURE, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0))
+	else:
+		result.append(_END_RECORD.pack(_END_RECORD_SIGNATURE, 0, 0, count, count, directory_size, offset, 0))
+
+	return b"".join(result)
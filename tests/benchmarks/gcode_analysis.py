@@ -0,0 +1,96 @@
+# coding=utf-8
+"""
+Benchmarks the GCODE analysis with the kinematic print time estimation of :class:`octoprint.util.planner.KinematicPlanner`
+against the plain distance by feedrate estimation of :class:`octoprint.util.gcodeInterpreter.gcode`.
+
+Usage::
+
+    python tests/benchmarks/gcode_analysis.py [--runs N] [file.gcode ...]
+
+If no files are provided, a synthetic file with short infill like moves is generated and analysed.
+"""
+
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import copy
+import io
+import math
+import os
+import tempfile
+import timeit
+
+import mock
+
+
+def generate_gcode(path, layers=50, moves_per_layer=2000):
+	with io.open(path, "wb") as f:
+		f.write(b"G21\nG90\nM82\nG28\nG92 E0\n")
+		e = 0.0
+		for layer in range(layers):
+			f.write("G1 Z{:.2f} F600\n".format(0.2 * (layer + 1)).encode("ascii"))
+			for move in range(moves_per_layer):
+				angle = move * 0.3
+				radius = 20.0 + 10.0 * math.sin(move * 0.01)
+				x = 100.0 + radius * math.cos(angle)
+				y = 100.0 + radius * math.sin(angle)
+				if move % 50 == 0:
+					f.write("G1 E{:.5f} F2400\nG0 X{:.3f} Y{:.3f} F9000\nG1 E{:.5f} F2400\n".format(e - 1.0, x, y, e).encode("ascii"))
+				else:
+					e += 0.05
+					f.write("G1 X{:.3f} Y{:.3f} E{:.5f} F1800\n".format(x, y, e).encode("ascii"))
+
+
+def analyse(path, profile):
+	import octoprint.util.gcodeInterpreter as gcodeInterpreter
+	gcode = gcodeInterpreter.gcode()
+	gcode.load(path, profile)
+	return gcode
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark the kinematic GCODE print time estimation")
+	parser.add_argument("--runs", type=int, default=3, help="Number of runs per file and estimator")
+	parser.add_argument("files", nargs="*", help="GCODE files to analyse")
+	args = parser.parse_args()
+
+	from octoprint.printer.profile import PrinterProfileManager
+	legacy = copy.deepcopy(PrinterProfileManager.default)
+	kinematic = copy.deepcopy(legacy)
+	kinematic["kinematics"] = copy.deepcopy(PrinterProfileManager.default_kinematics)
+
+	files = args.files
+	generated = None
+	if not files:
+		handle, generated = tempfile.mkstemp(suffix=".gcode")
+		os.close(handle)
+		generate_gcode(generated)
+		files = [generated]
+
+	try:
+		with mock.patch("octoprint.util.gcodeInterpreter.settings") as settings:
+			settings.return_value.getInt.return_value = 10
+
+			for path in files:
+				print("{} ({} bytes)".format(path, os.stat(path).st_size))
+
+				results = dict()
+				for name, profile in (("gcodeInterpreter", legacy), ("kinematic", kinematic)):
+					duration = min(timeit.repeat(lambda: analyse(path, profile), number=1, repeat=args.runs))
+					estimate = analyse(path, profile).totalMoveTimeMinute
+					results[name] = duration
+					print("  {:<18} {:8.3f}s analysis, estimated print time {:8.1f} min".format(name, duration, estimate))
+
+				print("  overhead of kinematic estimation: {:.0%}".format(results["kinematic"] / results["gcodeInterpreter"] - 1.0))
+	finally:
+		if generated is not None:
+			os.remove(generated)
+
+
+if __name__ == "__main__":
+	main()
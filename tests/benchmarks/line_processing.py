@@ -0,0 +1,116 @@
+# coding=utf-8
+"""
+Benchmarks storing a file through a chain of three :class:`octoprint.filemanager.util.LineProcessorStream` based
+preprocessors, as set up by three ``octoprint.filemanager.preprocessor`` hooks, fused into one single pass over the
+file against the same processors reading each other's output one after another.
+
+Usage::
+
+    python tests/benchmarks/line_processing.py [--size MB] [--runs N] [file.gcode]
+
+If no file is provided, a synthetic file of ``--size`` MB (default 200) is generated and processed.
+"""
+
+from __future__ import absolute_import, print_function
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import argparse
+import io
+import os
+import tempfile
+import timeit
+
+from octoprint.filemanager.util import LineProcessorStream, StreamWrapper
+
+
+class CommentStrippingStream(LineProcessorStream):
+	def process_line(self, line):
+		if line.startswith(b";"):
+			return None
+		return line
+
+
+class TemperatureCappingStream(LineProcessorStream):
+	def process_line(self, line):
+		if line.startswith(b"M104 S") or line.startswith(b"M109 S"):
+			return line[:6] + b"%d\n" % min(int(line[6:].split()[0]), 250)
+		return line
+
+
+class LineNumberingStream(LineProcessorStream):
+	def __init__(self, input_stream):
+		LineProcessorStream.__init__(self, input_stream)
+		self.line_number = 0
+
+	def process_line(self, line):
+		self.line_number += 1
+		return b"N%d " % self.line_number + line
+
+
+PREPROCESSORS = (CommentStrippingStream, TemperatureCappingStream, LineNumberingStream)
+
+
+def generate_gcode(path, size):
+	block = []
+	for i in range(1000):
+		if i % 100 == 0:
+			block.append(b"M104 S%d\n" % (200 + i // 10))
+		if i % 10 == 0:
+			block.append(b"; move %d\n" % i)
+		block.append(b"G1 X%.3f Y%.3f E%.5f F1800\n" % (100.0 + i * 0.01, 100.0 - i * 0.01, i * 0.05))
+	block = b"".join(block)
+
+	with io.open(path, "wb") as f:
+		written = 0
+		while written < size:
+			f.write(block)
+			written += len(block)
+
+
+def process(path, destination, fused):
+	stream = io.open(path, "rb")
+	for preprocessor in PREPROCESSORS:
+		if not fused:
+			# a buffered reader in between keeps the processors from being fused
+			stream = io.BufferedReader(stream)
+		stream = preprocessor(stream)
+	StreamWrapper(os.path.basename(path), stream).save(destination)
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmark chained line processing preprocessors")
+	parser.add_argument("--size", type=int, default=200, help="Size of the generated file in MB")
+	parser.add_argument("--runs", type=int, default=3, help="Number of runs per variant")
+	parser.add_argument("file", nargs="?", help="GCODE file to process")
+	args = parser.parse_args()
+
+	folder = tempfile.mkdtemp()
+	path = args.file
+	if path is None:
+		path = os.path.join(folder, "generated.gcode")
+		generate_gcode(path, args.size * 1024 * 1024)
+	destination = os.path.join(folder, "processed.gcode")
+
+	try:
+		size = os.stat(path).st_size
+		print("{} ({} bytes)".format(path, size))
+
+		results = dict()
+		for name, fused in (("chained", False), ("fused", True)):
+			duration = min(timeit.repeat(lambda: process(path, destination, fused), number=1, repeat=args.runs))
+			results[name] = duration
+			print("  {:<8} {:8.3f}s, {:6.1f} MB/s".format(name, duration, size / duration / 1024 / 1024))
+
+		print("  speedup of fused processing: {:.2f}x".format(results["chained"] / results["fused"]))
+	finally:
+		for name in os.listdir(folder):
+			os.remove(os.path.join(folder, name))
+		os.rmdir(folder)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,101 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import unittest
+import mock
+
+from octoprint.filemanager.analysis import AbstractAnalysisQueue, QueueEntry
+
+
+class AnalysisQueueSchedulingTest(unittest.TestCase):
+
+	def setUp(self):
+		# we drive the queue manually instead of through its worker thread
+		self.thread_patcher = mock.patch("octoprint.filemanager.analysis.threading.Thread")
+		self.thread_patcher.start()
+
+		self.time_patcher = mock.patch("octoprint.filemanager.analysis.time.time")
+		self.time = self.time_patcher.start()
+		self.time.return_value = 1000.0
+
+		self.queue = AbstractAnalysisQueue(mock.MagicMock())
+
+	def tearDown(self):
+		self.time_patcher.stop()
+		self.thread_patcher.stop()
+
+	def test_priority(self):
+		self.queue.enqueue(self._entry("low.gcode"))
+		self.queue.enqueue(self._entry("high.gcode"), high_priority=True)
+
+		self.assertEquals("high.gcode", self._next())
+		self.assertEquals("low.gcode", self._next())
+
+	def test_fifo_within_priority(self):
+		for name in ("a.gcode", "b.gcode", "c.gcode"):
+			self.queue.enqueue(self._entry(name))
+
+		self.assertEquals(["a.gcode", "b.gcode", "c.gcode"], [self._next() for _ in range(3)])
+
+	def test_deduplication(self):
+		self.queue.enqueue(self._entry("a.gcode"))
+		self.queue.enqueue(self._entry("b.gcode"))
+		self.queue.enqueue(self._entry("a.gcode"), high_priority=True)
+
+		self.assertEquals(2, len(self.queue.status["queue"]))
+		self.assertEquals("a.gcode", self._next())
+		self.assertEquals("b.gcode", self._next())
+
+	def test_aging(self):
+		self.queue.enqueue(self._entry("old.gcode"))
+
+		self.time.return_value = 1000.0 + 601.0
+		self.queue.enqueue(self._entry("new.gcode"), high_priority=True)
+
+		self.assertEquals("old.gcode", self._next())
+
+	def test_dequeue(self):
+		self.queue.enqueue(self._entry("a.gcode"))
+		self.queue.enqueue(self._entry("folder/b.gcode"))
+		self.queue.enqueue(self._entry("folder/c.gcode"))
+
+		self.assertTrue(self.queue.dequeue("local", "a.gcode"))
+		self.assertTrue(self.queue.dequeue("local", "folder"))
+		self.assertFalse(self.queue.dequeue("local", "a.gcode"))
+		self.assertEquals([], self.queue.status["queue"])
+
+	def test_dequeue_current(self):
+		self.queue.enqueue(self._entry("a.gcode"))
+		job = self.queue._next_job()
+
+		self.assertTrue(self.queue.dequeue("local", "a.gcode"))
+		self.assertTrue(job.cancelled)
+
+	def test_enqueue_current(self):
+		self.queue.enqueue(self._entry("a.gcode"))
+		job = self.queue._next_job()
+
+		self.queue.enqueue(self._entry("a.gcode"))
+		self.assertTrue(job.cancelled)
+		self.assertEquals(["a.gcode"], [entry["path"] for entry in self.queue.status["queue"]])
+
+	def test_status(self):
+		self.queue.enqueue(self._entry("a.gcode"))
+		self.queue.enqueue(self._entry("b.gcode"), high_priority=True)
+
+		status = self.queue.status
+		self.assertIsNone(status["current"])
+		self.assertIsNone(status["estimatedTime"])
+		self.assertEquals(["b.gcode", "a.gcode"], [entry["path"] for entry in status["queue"]])
+		self.assertTrue(status["queue"][0]["highPriority"])
+		self.assertEquals("local", status["queue"][0]["origin"])
+
+	def _entry(self, path):
+		return QueueEntry(path, "gcode", "local", None, None)
+
+	def _next(self):
+		return self.queue._next_job().entry.path
@@ -0,0 +1,117 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from octoprint.filemanager.fileindex import FileTreeIndex
+
+
+class FileTreeIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = os.path.realpath(os.path.abspath(tempfile.mkdtemp()))
+		self._write("a.gcode", "G28\n")
+		os.mkdir(os.path.join(self.basefolder, "sub"))
+		self._write(os.path.join("sub", "b.gcode"), "G1 X10\n")
+		self._write(".metadata.yaml", "{}\n")
+
+	def tearDown(self):
+		shutil.rmtree(self.basefolder)
+
+	def _write(self, path, content):
+		with open(os.path.join(self.basefolder, path), "wb") as f:
+			f.write(content)
+
+	def _path(self, *parts):
+		return os.path.join(self.basefolder, *parts)
+
+	def test_scan(self):
+		index = FileTreeIndex(self.basefolder, watch=False)
+		self.assertTrue(index.valid)
+
+		entries = sorted(index.list_folder(self.basefolder))
+		self.assertEquals(["a.gcode", "sub"], [entry[0] for entry in entries])
+		self.assertEquals((True, 4), entries[0][1:3])
+		self.assertEquals((False, None, None), entries[1][1:])
+
+		self.assertEquals([("b.gcode", True, 7, os.stat(self._path("sub", "b.gcode")).st_mtime)], index.list_folder(self._path("sub")))
+		self.assertIsNone(index.list_folder(self._path("missing")))
+
+	def test_file_exists(self):
+		index = FileTreeIndex(self.basefolder, watch=False)
+		self.assertTrue(index.file_exists(self._path("sub", "b.gcode")))
+		self.assertFalse(index.file_exists(self._path("sub")))
+		self.assertFalse(index.file_exists(self._path("c.gcode")))
+		self.assertFalse(index.file_exists(self._path(".metadata.yaml")))
+
+	def test_refresh(self):
+		index = FileTreeIndex(self.basefolder, watch=False)
+
+		os.makedirs(self._path("new", "deeper"))
+		self._write(os.path.join("new", "deeper", "c.gcode"), "G28\n")
+		index.refresh(self._path("new", "deeper", "c.gcode"))
+		self.assertTrue(index.file_exists(self._path("new", "deeper", "c.gcode")))
+
+		os.remove(self._path("a.gcode"))
+		index.refresh(self._path("a.gcode"))
+		self.assertFalse(index.file_exists(self._path("a.gcode")))
+
+		shutil.rmtree(self._path("new"))
+		index.refresh(self._path("new"))
+		self.assertEquals(["sub"], [entry[0] for entry in index.list_folder(self.basefolder)])
+
+	def test_overflow(self):
+		index = FileTreeIndex(self.basefolder, max_entries=3, watch=False)
+		self.assertTrue(index.valid)
+
+		self._write("c.gcode", "G28\n")
+		index.refresh(self._path("c.gcode"))
+		self.assertFalse(index.valid)
+		self.assertIsNone(index.list_folder(self.basefolder))
+		self.assertIsNone(index.file_exists(self._path("c.gcode")))
+
+		os.remove(self._path("c.gcode"))
+		index.rescan()
+		self.assertTrue(index.valid)
+
+	def test_watch(self):
+		index = FileTreeIndex(self.basefolder, watch=True)
+		try:
+			self._write("c.gcode", "G28\n")
+
+			deadline = time.time() + 5.0
+			while not index.file_exists(self._path("c.gcode")) and time.time() < deadline:
+				time.sleep(0.05)
+			self.assertTrue(index.file_exists(self._path("c.gcode")))
+		finally:
+			index.stop()
+
+	def test_watch_change_callback(self):
+		changes = []
+
+		index = FileTreeIndex(self.basefolder, watch=True)
+		index.register_change_callback(changes.append)
+		try:
+			self._write("c.gcode", "G28\n")
+			self._write(".hidden.yaml", "{}\n")
+
+			deadline = time.time() + 5.0
+			while not self._path("c.gcode") in changes and time.time() < deadline:
+				time.sleep(0.05)
+			self.assertIn(self._path("c.gcode"), changes)
+
+			# the index already knows about the change when the callback is called
+			self.assertTrue(index.file_exists(self._path("c.gcode")))
+
+			# hidden files are of no interest
+			self.assertNotIn(self._path(".hidden.yaml"), changes)
+		finally:
+			index.stop()
@@ -65,12 +65,196 @@ class FileManagerTest(unittest.TestCase):
 		self.local_storage.add_file.assert_called_once_with("test.file", wrapper, printer_profile=test_profile, allow_overwrite=False, links=None)
 		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
 
+	def test_print_history(self):
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", 1000, 100.0, True, "_default")
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", 2000, 50.0, False, "_default")
+
+		statistics = self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", printer_profile="_default")
+		self.assertEquals(2, statistics["count"])
+		self.assertEquals(1, statistics["successes"])
+		self.assertEquals(100.0, statistics["printTime"]["percentiles"]["p50"])
+
+		self.file_manager.remove_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode")
+		self.assertIsNone(self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode"))
+
+	def test_print_history_in_entries(self):
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.get_file.side_effect = lambda path: dict(name="test.gcode", type="machinecode", size=100)
+		self.local_storage.list_files.side_effect = lambda **kwargs: {"test.gcode": dict(name="test.gcode", type="machinecode", size=100)}
+
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", 1000, 100.0, True, "_default")
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", 2000, 50.0, False, "mk2")
+
+		expected = dict(success=1, failure=1, printerProfiles=["_default", "mk2"],
+		                last=dict(success=False, date=2000, printTime=50.0, printerProfile="mk2"))
+		self.assertEquals(expected, self.file_manager.get_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode")["prints"])
+		self.assertEquals(expected, self.file_manager.list_files(octoprint.filemanager.FileDestinations.LOCAL)[octoprint.filemanager.FileDestinations.LOCAL]["test.gcode"]["prints"])
+
+		# nothing gets written to the storage's metadata anymore
+		self.assertEquals([], [call for call in self.local_storage.method_calls if call[0] in ("add_history", "update_history", "remove_history")])
+
+		# the search index is kept up to date
+		self.assertEquals([(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode")], self.file_manager.search_files(values=dict(lastPrintProfile="mk2", lastPrintSuccess=False)))
+
+	def test_print_history_storage(self):
+		self.local_storage.set_print_history.assert_called_once_with(self.file_manager.print_history, octoprint.filemanager.FileDestinations.LOCAL)
+
+	def test_print_history_sdcard(self):
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.SDCARD, "test.gco", 1000, 100.0, True, "_default")
+		self.assertEquals(1, self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.SDCARD, "test.gco")["successes"])
+		self.assertFalse(self.fire_event.called)
+
+	def _persistent_print_history(self):
+		import os
+		import shutil
+		import tempfile
+		from octoprint.filemanager.history import PrintHistory
+
+		folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, folder)
+		self.file_manager._print_history = PrintHistory(os.path.join(folder, "print_history.jsonl"))
+		return folder
+
+	def test_import_legacy_history(self):
+		self._persistent_print_history()
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.list_files.return_value = {
+			"parts": dict(type="folder", children={
+				"bracket.gcode": dict(name="bracket.gcode", type="machinecode", size=100,
+				                      history=[dict(timestamp=2000, success=False, printerProfile="_default"),
+				                               dict(timestamp=1000, success=True, printTime=100.0, printerProfile="_default")],
+				                      statistics=dict(averagePrintTime=dict(_default=100.0), lastPrintTime=dict(_default=100.0)))
+			}),
+			"known.gcode": dict(name="known.gcode", type="machinecode", size=100,
+			                    history=[dict(timestamp=500, success=True, printTime=10.0, printerProfile="_default")])
+		}
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "known.gcode", 1000, 20.0, True, "_default")
+
+		self.file_manager._build_search_index(octoprint.filemanager.FileDestinations.LOCAL, self.local_storage)
+
+		statistics = self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "parts/bracket.gcode")
+		self.assertEquals(2, statistics["count"])
+		self.assertEquals(1, statistics["successes"])
+		self.assertEquals(dict(success=False, timestamp=2000), statistics["lastPrint"])
+
+		# files the print history already knows are not imported again
+		self.assertEquals(1, self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "known.gcode")["count"])
+
+		self.local_storage.remove_additional_metadata.assert_has_calls([mock.call("parts/bracket.gcode", "history"),
+		                                                                mock.call("parts/bracket.gcode", "statistics"),
+		                                                                mock.call("known.gcode", "history"),
+		                                                                mock.call("known.gcode", "statistics")], any_order=True)
+		self.assertEquals([(octoprint.filemanager.FileDestinations.LOCAL, "parts/bracket.gcode")], self.file_manager.search_files(values=dict(lastPrintSuccess=False)))
+
+	def test_import_legacy_history_not_persisted(self):
+		import os
+		folder = self._persistent_print_history()
+		os.mkdir(os.path.join(folder, "print_history.jsonl"))
+
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.list_files.return_value = {
+			"bracket.gcode": dict(name="bracket.gcode", type="machinecode", size=100,
+			                      history=[dict(timestamp=1000, success=True, printTime=100.0, printerProfile="_default")])
+		}
+
+		self.file_manager._build_search_index(octoprint.filemanager.FileDestinations.LOCAL, self.local_storage)
+
+		# the print history can't be written, so the legacy history has to stay where it is
+		self.assertFalse(self.local_storage.remove_additional_metadata.called)
+		self.assertEquals(1, self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "bracket.gcode")["count"])
+
+	def test_move_file(self):
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.move_file.return_value = "sub/moved.gcode"
+		self.local_storage.analysis_backlog_for_path.return_value = iter([("sub/moved.gcode", "prefix/sub/moved.gcode", None)])
+		self.printer_profile_manager.get_default.return_value = dict(id="_default")
+
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", 1000, 100.0, True, "_default")
+		self.fire_event.reset_mock()
+
+		file_path = self.file_manager.move_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", "sub/moved.gcode")
+
+		self.assertEquals("sub/moved.gcode", file_path)
+		self.local_storage.move_file.assert_called_once_with("test.gcode", "sub/moved.gcode")
+
+		# a pending analysis moves along
+		self.analysis_queue.dequeue.assert_called_once_with(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode")
+		self.analysis_queue.enqueue.assert_called_once_with(octoprint.filemanager.QueueEntry("sub/moved.gcode", "gcode", octoprint.filemanager.FileDestinations.LOCAL, "prefix/sub/moved.gcode", dict(id="_default")), high_priority=False)
+
+		# and so does the print history
+		self.assertIsNone(self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode"))
+		self.assertEquals(1, self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "sub/moved.gcode")["count"])
+
+		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
+
+	def test_copy_file(self):
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.copy_file.return_value = "copy.gcode"
+		self.local_storage.analysis_backlog_for_path.return_value = iter([])
+
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", 1000, 100.0, True, "_default")
+		self.fire_event.reset_mock()
+
+		file_path = self.file_manager.copy_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", "copy.gcode")
+
+		self.assertEquals("copy.gcode", file_path)
+		self.local_storage.copy_file.assert_called_once_with("test.gcode", "copy.gcode")
+		self.assertFalse(self.analysis_queue.dequeue.called)
+
+		# the copy has never been printed
+		self.assertEquals(1, self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode")["count"])
+		self.assertIsNone(self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "copy.gcode"))
+
+		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
+
+	def test_move_folder(self):
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.move_folder.return_value = "other/folder"
+		self.local_storage.analysis_backlog_for_path.return_value = iter([])
+		self.local_storage.list_files.return_value = dict()
+
+		self.file_manager.log_print(octoprint.filemanager.FileDestinations.LOCAL, "folder/sub/test.gcode", 1000, 100.0, True, "_default")
+		self.fire_event.reset_mock()
+
+		with self.file_manager.batch(octoprint.filemanager.FileDestinations.LOCAL):
+			folder_path = self.file_manager.move_folder(octoprint.filemanager.FileDestinations.LOCAL, "folder", "other/folder")
+			self.file_manager.remove_file(octoprint.filemanager.FileDestinations.LOCAL, "other.gcode")
+
+		self.assertEquals("other/folder", folder_path)
+		self.local_storage.move_folder.assert_called_once_with("folder", "other/folder")
+		self.local_storage.list_files.assert_called_once_with(path="other/folder", recursive=True)
+		self.assertEquals(1, self.file_manager.get_print_statistics(octoprint.filemanager.FileDestinations.LOCAL, "other/folder/sub/test.gcode")["count"])
+
+		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
+
 	def test_remove_file(self):
 		self.file_manager.remove_file(octoprint.filemanager.FileDestinations.LOCAL, "test.file")
 
 		self.local_storage.remove_file.assert_called_once_with("test.file")
 		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
 
+	def test_batch(self):
+		self.local_storage.add_file.return_value = ("", "test.file")
+		self.local_storage.path_on_disk.return_value = "prefix/test.file"
+
+		with self.file_manager.batch(octoprint.filemanager.FileDestinations.LOCAL):
+			with self.file_manager.batch(octoprint.filemanager.FileDestinations.LOCAL):
+				self.file_manager.add_file(octoprint.filemanager.FileDestinations.LOCAL, "test.file", object())
+			self.file_manager.remove_file(octoprint.filemanager.FileDestinations.LOCAL, "other.file")
+			self.assertFalse(self.fire_event.called)
+
+		self.assertEquals(2, self.local_storage.batch.call_count)
+		self.fire_event.assert_called_once_with(octoprint.filemanager.Events.UPDATED_FILES, dict(type="printables"))
+
 	def test_add_folder(self):
 		self.local_storage.add_folder.return_value = ("", "test_folder")
 
@@ -109,6 +293,162 @@ class FileManagerTest(unittest.TestCase):
 		self.assertEquals(metadata, expected)
 		self.local_storage.get_metadata.assert_called_once_with("test.file")
 
+	def test_add_file_provisional_analysis(self):
+		wrapper = object()
+		provisional = dict(estimatedPrintTime=120.0, provisional=True, slicer=dict(name="cura", estimatedPrintTime=120.0))
+
+		self.local_storage.add_file.return_value = "test.gcode"
+		self.local_storage.path_on_disk.return_value = "prefix/test.gcode"
+		self.local_storage.get_metadata.return_value = dict(hash="somehash")
+		self.analysis_queue.analyze_provisionally.return_value = provisional
+
+		self.file_manager.add_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", wrapper, analysis=None)
+
+		self.analysis_queue.analyze_provisionally.assert_called_once_with("gcode", "prefix/test.gcode")
+		self.local_storage.set_additional_metadata.assert_called_once_with("test.gcode", "analysis", provisional, overwrite=True)
+		self.assertEquals(1, self.analysis_queue.enqueue.call_count)
+
+	def test_add_file_provisional_analysis_keeps_full_analysis(self):
+		wrapper = object()
+
+		self.local_storage.add_file.return_value = "test.gcode"
+		self.local_storage.path_on_disk.return_value = "prefix/test.gcode"
+		self.local_storage.get_metadata.return_value = dict(hash="somehash", analysis=dict(estimatedPrintTime=100.0))
+
+		self.file_manager.add_file(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode", wrapper, analysis=None)
+
+		self.assertFalse(self.analysis_queue.analyze_provisionally.called)
+		self.assertFalse(self.local_storage.set_additional_metadata.called)
+
+	def test_analysis_finished_replaces_provisional(self):
+		slicer = dict(name="cura", estimatedPrintTime=120.0)
+		self.local_storage.get_metadata.return_value = dict(hash="somehash", analysis=dict(estimatedPrintTime=120.0, provisional=True, slicer=slicer))
+
+		entry = octoprint.filemanager.QueueEntry("test.gcode", "gcode", octoprint.filemanager.FileDestinations.LOCAL, "prefix/test.gcode", None)
+		self.file_manager._on_analysis_finished(entry, dict(estimatedPrintTime=140.0, layerCount=10))
+
+		self.local_storage.set_additional_metadata.assert_called_once_with("test.gcode", "analysis", dict(estimatedPrintTime=140.0, layerCount=10, slicer=slicer), overwrite=True, merge=True)
+
+	def test_analysis_finished_merges(self):
+		self.local_storage.get_metadata.return_value = dict(hash="somehash", analysis=dict(estimatedPrintTime=120.0))
+
+		entry = octoprint.filemanager.QueueEntry("test.gcode", "gcode", octoprint.filemanager.FileDestinations.LOCAL, "prefix/test.gcode", None)
+		self.file_manager._on_analysis_finished(entry, dict(estimatedPrintTime=140.0))
+
+		self.local_storage.set_additional_metadata.assert_called_once_with("test.gcode", "analysis", dict(estimatedPrintTime=140.0), overwrite=False, merge=True)
+
+	def test_search_index_maintained(self):
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.list_files.return_value = dict(
+			parts=dict(type="folder", children={"bracket.gcode": dict(name="bracket.gcode", type="machinecode", size=100)}),
+		)
+		self.file_manager._build_search_index(octoprint.filemanager.FileDestinations.LOCAL, self.local_storage)
+		self.assertEquals([(octoprint.filemanager.FileDestinations.LOCAL, "parts/bracket.gcode")], self.file_manager.search_files(text="bracket"))
+
+		# analysis results are picked up
+		self.local_storage.get_metadata.return_value = dict(hash="somehash")
+		self.local_storage.get_file.return_value = dict(name="bracket.gcode", type="machinecode", size=100, analysis=dict(estimatedPrintTime=140.0))
+		entry = octoprint.filemanager.QueueEntry("parts/bracket.gcode", "gcode", octoprint.filemanager.FileDestinations.LOCAL, "prefix/parts/bracket.gcode", None)
+		self.file_manager._on_analysis_finished(entry, dict(estimatedPrintTime=140.0))
+		self.local_storage.get_file.assert_called_with("parts/bracket.gcode")
+		self.assertEquals(1, len(self.file_manager.search_files(ranges=dict(estimatedPrintTime=(None, 200.0)))))
+
+		# removed folders are dropped
+		self.file_manager.remove_folder(octoprint.filemanager.FileDestinations.LOCAL, "parts")
+		self.assertEquals([], self.file_manager.search_files(text="bracket"))
+
+	def test_search_index_external_changes(self):
+		import os
+		import shutil
+		import tempfile
+
+		folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, folder)
+		os.mkdir(os.path.join(folder, "parts"))
+
+		self.local_storage.path_on_disk.side_effect = lambda path: os.path.join(folder, path)
+		self.local_storage.path_in_storage.side_effect = lambda path: os.path.relpath(path, folder)
+		self.local_storage.list_files.return_value = {"old.gcode": dict(name="old.gcode", type="machinecode", size=100)}
+		self.file_manager._build_search_index(octoprint.filemanager.FileDestinations.LOCAL, self.local_storage)
+
+		on_changed = self.local_storage.register_change_callback.call_args[0][0]
+
+		with mock.patch("threading.Timer") as timer:
+			on_changed("old.gcode")
+			on_changed("new.gcode")
+			on_changed("parts")
+
+		# refreshes are batched
+		self.assertEquals(3, timer.call_count)
+		self.assertEquals(2, timer.return_value.cancel.call_count)
+
+		files = {"new.gcode": dict(name="new.gcode", type="machinecode", size=100)}
+		self.local_storage.get_file.side_effect = lambda path: files.get(path)
+		self.local_storage.list_files.return_value = {"bracket.gcode": dict(name="bracket.gcode", type="machinecode", size=100)}
+		self.file_manager._refresh_search_index()
+
+		self.local_storage.list_files.assert_called_with(path="parts", recursive=True)
+		self.assertEquals([(octoprint.filemanager.FileDestinations.LOCAL, "new.gcode"),
+		                   (octoprint.filemanager.FileDestinations.LOCAL, "parts/bracket.gcode")],
+		                  sorted(self.file_manager.search_files()))
+
+	def test_thumbnails_evicted(self):
+		import os
+		import shutil
+		import tempfile
+
+		folder = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, folder)
+		for hash in ("kept", "removed"):
+			with open(os.path.join(folder, hash + ".png"), "wb") as f:
+				f.write(b"png")
+		self.file_manager._thumbnail_folder = folder
+
+		self.local_storage.path_on_disk.side_effect = lambda path: "prefix/" + path
+		self.local_storage.path_in_storage.side_effect = lambda path: path[len("prefix/"):]
+		self.local_storage.list_files.return_value = {
+			"kept.gcode": dict(name="kept.gcode", type="machinecode", size=100, hash="kept"),
+			"removed.gcode": dict(name="removed.gcode", type="machinecode", size=100, hash="removed")
+		}
+		self.file_manager._build_search_index(octoprint.filemanager.FileDestinations.LOCAL, self.local_storage)
+		self.assertEquals(os.path.join(folder, "removed.png"), self.file_manager.get_thumbnail_by_hash("removed"))
+
+		# nothing is evicted until the search index knows all files
+		self.file_manager.remove_file(octoprint.filemanager.FileDestinations.LOCAL, "removed.gcode")
+		self.assertTrue(os.path.exists(os.path.join(folder, "removed.png")))
+
+		self.file_manager._search_index_complete = True
+		self.file_manager._evict_thumbnails()
+		self.assertFalse(os.path.exists(os.path.join(folder, "removed.png")))
+		self.assertIsNone(self.file_manager.get_thumbnail_by_hash("removed"))
+		self.assertEquals(os.path.join(folder, "kept.png"), self.file_manager.get_thumbnail_by_hash("kept"))
+
+	def test_get_layer_geometry_linked_profile(self):
+		linked_profile = dict(id="linked", name="Linked Profile")
+		self.printer_profile_manager.get.side_effect = lambda identifier: linked_profile if identifier == "linked" else None
+		self.printer_profile_manager.get_current_or_default.return_value = dict(id="_default", name="My Default Profile")
+
+		cache = mock.MagicMock()
+		cache.read.return_value = None
+		self.file_manager._geometry_cache = cache
+
+		layer_index = object()
+		self.local_storage.get_metadata.return_value = dict(hash="somehash")
+		self.local_storage.get_layer_index.return_value = layer_index
+		self.local_storage.path_on_disk.return_value = "prefix/test.gcode"
+		self.local_storage.get_link.return_value = [dict(id="linked")]
+
+		self.assertIsNone(self.file_manager.get_layer_geometry(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode"))
+		cache.generate.assert_called_once_with("somehash", "prefix/test.gcode", layer_index, linked_profile)
+		self.local_storage.get_link.assert_called_once_with("test.gcode", "printerprofile")
+
+		# falls back to the current profile if the linked one is gone
+		cache.reset_mock()
+		self.local_storage.get_link.return_value = [dict(id="deleted")]
+		self.file_manager.get_layer_geometry(octoprint.filemanager.FileDestinations.LOCAL, "test.gcode")
+		cache.generate.assert_called_once_with("somehash", "prefix/test.gcode", layer_index, dict(id="_default", name="My Default Profile"))
+
 	@mock.patch("__builtin__.open", new_callable=mock.mock_open)
 	@mock.patch("io.FileIO")
 	@mock.patch("shutil.copyfileobj")
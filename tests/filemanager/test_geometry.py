@@ -0,0 +1,164 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import array
+import copy
+import io
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+
+import mock
+
+from octoprint.filemanager.geometry import LayerGeometryBuilder, LayerGeometryCache, FLAG_EXTRUDE, FLAG_RETRACT, FLAG_UNRETRACT
+from octoprint.filemanager.layers import LayerIndex
+from octoprint.printer.profile import PrinterProfileManager
+
+
+class LayerGeometryTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.cache = LayerGeometryCache(self.folder, max_entries=2)
+
+		index = LayerIndex([
+			(100, 5, 0.3, 0.0, 0.0),
+			(1000, 50, 0.5, 10.0, 5.0)
+		])
+
+		builder = LayerGeometryBuilder(index)
+		builder.add_segment(10, [0.0, 0.0, 0.0], [5.0, 5.0, 0.3], "move", 0)
+		builder.add_segment(120, [5.0, 5.0, 0.3], [10.0, 5.0, 0.3], "extrude", 0)
+		builder.add_segment(150, [10.0, 5.0, 0.3], [10.0, 5.0, 0.3], "retract", 0)
+		builder.add_segment(1000, [10.0, 5.0, 0.3], [10.0, 5.0, 0.5], "move", 0)
+		builder.add_segment(1010, [10.0, 5.0, 0.5], [10.0, 5.0, 0.5], "extrude", 0)
+		builder.add_segment(1020, [10.0, 5.0, 0.5], [0.0, 0.0, 0.5], "extrude", 1)
+
+		with io.open(os.path.join(self.folder, "somehash.geometry"), "wb") as f:
+			builder.dump(f)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_read_all(self):
+		count, data = self.cache.read("somehash")
+		self.assertEquals(2, count)
+
+		layers = self._parse(data, 0, 2)
+		self.assertEquals(2, len(layers))
+
+		z, coords, offsets, flags, tools = layers[0]
+		self.assertAlmostEqual(0.3, z, places=5)
+		self.assertEquals([0.0, 0.0, 5.0, 5.0, 5.0, 5.0, 10.0, 5.0, 10.0, 5.0, 10.0, 5.0], list(coords))
+		self.assertEquals([10, 120, 150], list(offsets))
+		self.assertEquals([0, FLAG_EXTRUDE, FLAG_RETRACT], list(flags))
+		self.assertEquals([0, 0, 0], list(tools))
+
+		z, coords, offsets, flags, tools = layers[1]
+		self.assertAlmostEqual(0.5, z, places=5)
+		self.assertEquals([1010, 1020], list(offsets))
+		self.assertEquals([FLAG_UNRETRACT, FLAG_EXTRUDE], list(flags))
+		self.assertEquals([0, 1], list(tools))
+
+	def test_read_range(self):
+		count, data = self.cache.read("somehash", start=1, end=5)
+		self.assertEquals(2, count)
+
+		layers = self._parse(data, 1, 1)
+		self.assertAlmostEqual(0.5, layers[0][0], places=5)
+
+	def test_read_empty_range(self):
+		count, data = self.cache.read("somehash", start=5)
+		self.assertEquals(2, count)
+		self._parse(data, 2, 0)
+
+	def test_read_unknown(self):
+		self.assertIsNone(self.cache.read("unknown"))
+
+	def test_generate_single_worker(self):
+		with mock.patch("octoprint.filemanager.geometry.threading.Thread") as thread:
+			self.assertTrue(self.cache.generate("hash1", "file1.gcode", LayerIndex([]), dict()))
+			self.assertTrue(self.cache.generate("hash2", "file2.gcode", LayerIndex([]), dict()))
+			self.assertFalse(self.cache.generate("hash1", "file1.gcode", LayerIndex([]), dict()))
+
+		self.assertEquals(1, thread.call_count)
+		self.assertTrue(self.cache.is_generating("hash1"))
+		self.assertTrue(self.cache.is_generating("hash2"))
+
+	def test_generate_paused(self):
+		paused = [True]
+		cache = LayerGeometryCache(self.folder, paused=lambda: paused[0])
+
+		path, layer_index = self._gcode_file()
+		self.assertTrue(cache.generate("gcodehash", path, layer_index, copy.deepcopy(PrinterProfileManager.default)))
+		time.sleep(0.2)
+		self.assertTrue(cache.is_generating("gcodehash"))
+		self.assertFalse(cache.is_available("gcodehash"))
+
+		paused[0] = False
+		self._wait_for(cache, "gcodehash")
+
+		count, data = cache.read("gcodehash")
+		self.assertEquals(2, count)
+
+	def test_generate_paused_while_running(self):
+		# not paused when picked up, paused on the first line, not paused anymore after that
+		states = iter([False, True])
+		paused = mock.MagicMock(side_effect=lambda: next(states, False))
+		cache = LayerGeometryCache(self.folder, paused=paused)
+
+		path, layer_index = self._gcode_file()
+		with mock.patch("octoprint.filemanager.geometry.LayerGeometryBuilder", wraps=LayerGeometryBuilder) as builder:
+			self.assertTrue(cache.generate("gcodehash", path, layer_index, copy.deepcopy(PrinterProfileManager.default)))
+			self._wait_for(cache, "gcodehash")
+
+		# aborted and requeued generation started from scratch
+		self.assertEquals(2, builder.call_count)
+		count, data = cache.read("gcodehash")
+		self.assertEquals(2, count)
+
+	def _gcode_file(self):
+		path = os.path.join(self.folder, "test.gcode")
+		with io.open(path, "wb") as f:
+			f.write(b"G1 Z0.3\nG1 X10 Y10 E1\nG1 Z0.5\nG1 X0 Y0 E2\n")
+		return path, LayerIndex([(8, 1, 0.3, 0.0, 0.0), (31, 3, 0.5, 0.0, 0.0)])
+
+	def _wait_for(self, cache, hash, timeout=5.0):
+		deadline = time.time() + timeout
+		while cache.is_generating(hash) and time.time() < deadline:
+			time.sleep(0.05)
+		self.assertFalse(cache.is_generating(hash))
+		self.assertTrue(cache.is_available(hash))
+
+	def _parse(self, data, expected_start, expected_count):
+		magic, version, start, count = struct.unpack_from("<4sBxxxII", data)
+		self.assertEquals(b"OPLG", magic)
+		self.assertEquals(1, version)
+		self.assertEquals(expected_start, start)
+		self.assertEquals(expected_count, count)
+
+		layers = []
+		position = 16
+		for _ in range(count):
+			z, segments = struct.unpack_from("<fI", data, position)
+			position += 8
+			coords = array.array("f", data[position:position + 16 * segments])
+			position += 16 * segments
+			offsets = array.array("I", data[position:position + 4 * segments])
+			position += 4 * segments
+			flags = array.array("B", data[position:position + segments])
+			position += segments
+			tools = array.array("B", data[position:position + segments])
+			position += segments
+			position += (4 - position % 4) % 4
+			layers.append((z, coords, offsets, flags, tools))
+
+		self.assertEquals(len(data), position)
+		return layers
@@ -0,0 +1,95 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from octoprint.filemanager.hashing import BackgroundHasher, HashCache
+
+
+class HashCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.path = os.path.join(self.folder, "test.gcode")
+		self._write(b"G28\n")
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def _write(self, data, mtime=None):
+		with open(self.path, "wb") as f:
+			f.write(data)
+		if mtime is not None:
+			os.utime(self.path, (mtime, mtime))
+
+	def test_get(self):
+		cache = HashCache()
+
+		with mock.patch("octoprint.filemanager.hashing.create_hash", wraps=lambda path: hashlib.sha1(open(path, "rb").read()).hexdigest()) as create_hash:
+			self.assertIsNone(cache.cached(self.path))
+			self.assertEquals(hashlib.sha1(b"G28\n").hexdigest(), cache.get(self.path))
+			self.assertEquals(hashlib.sha1(b"G28\n").hexdigest(), cache.get(self.path))
+			self.assertEquals(hashlib.sha1(b"G28\n").hexdigest(), cache.cached(self.path))
+			self.assertEquals(1, create_hash.call_count)
+
+	def test_modification_invalidates(self):
+		cache = HashCache()
+		self._write(b"G28\n", mtime=1000)
+		cache.get(self.path)
+
+		self._write(b"G28 X\n", mtime=2000)
+		self.assertIsNone(cache.cached(self.path))
+		self.assertEquals(hashlib.sha1(b"G28 X\n").hexdigest(), cache.get(self.path))
+
+	def test_set(self):
+		cache = HashCache()
+		cache.set(self.path, "known")
+		self.assertEquals("known", cache.get(self.path))
+
+	def test_missing_file(self):
+		cache = HashCache()
+		self.assertIsNone(cache.cached(os.path.join(self.folder, "missing.gcode")))
+		self.assertRaises(OSError, cache.get, os.path.join(self.folder, "missing.gcode"))
+
+
+class BackgroundHasherTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_enqueue(self):
+		paths = []
+		for name in ("a.gcode", "b.gcode"):
+			path = os.path.join(self.folder, name)
+			with open(path, "wb") as f:
+				f.write(name.encode("ascii"))
+			paths.append(path)
+
+		results = dict()
+		done = threading.Event()
+		def callback(path, hash):
+			results[path] = hash
+			if len(results) == len(paths):
+				done.set()
+
+		hasher = BackgroundHasher(HashCache(), callback, workers=2)
+		for path in paths + [os.path.join(self.folder, "missing.gcode")]:
+			hasher.enqueue(path)
+
+		self.assertTrue(done.wait(5.0))
+		self.assertEquals(dict((path, hashlib.sha1(os.path.basename(path).encode("ascii")).hexdigest()) for path in paths), results)
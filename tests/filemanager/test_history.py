@@ -0,0 +1,147 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from octoprint.filemanager.history import PrintHistory, PrintStatistics
+
+
+class PrintStatisticsTest(unittest.TestCase):
+
+	def test_empty(self):
+		statistics = PrintStatistics()
+		self.assertIsNone(statistics.success_rate)
+		self.assertIsNone(statistics.mean)
+		self.assertIsNone(statistics.percentile(50))
+		self.assertEquals(dict(count=0), statistics.as_dict()["printTime"])
+
+	def test_incremental(self):
+		statistics = PrintStatistics()
+		for print_time in (500.0, 100.0, 400.0, 200.0, 300.0):
+			statistics.add(True, print_time=print_time)
+		statistics.add(False, print_time=50.0)
+
+		self.assertEquals(6, statistics.count)
+		self.assertEquals(5, statistics.successes)
+		self.assertEquals(1, statistics.failures)
+		self.assertAlmostEqual(5 / 6.0, statistics.success_rate)
+		self.assertAlmostEqual(300.0, statistics.mean)
+		self.assertAlmostEqual(300.0, statistics.percentile(50))
+		self.assertAlmostEqual(140.0, statistics.percentile(10))
+		self.assertAlmostEqual(100.0, statistics.percentile(0))
+		self.assertAlmostEqual(500.0, statistics.percentile(100))
+
+		print_time = statistics.as_dict()["printTime"]
+		self.assertEquals(5, print_time["count"])
+		self.assertEquals(100.0, print_time["min"])
+		self.assertEquals(500.0, print_time["max"])
+		self.assertAlmostEqual(460.0, print_time["percentiles"]["p90"])
+
+	def test_last_print(self):
+		statistics = PrintStatistics()
+		statistics.add(True, print_time=100.0, timestamp=2000)
+		statistics.add(False, timestamp=1000)
+		self.assertEquals(dict(success=True, printTime=100.0, timestamp=2000), statistics.last_print)
+
+
+class PrintHistoryTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.path = os.path.join(self.folder, "print_history.jsonl")
+		self.history = PrintHistory(self.path)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def _log_prints(self):
+		self.history.log("local", "a.gcode", 1000, True, "mk2", print_time=100.0)
+		self.history.log("local", "a.gcode", 2000, True, "mk3", print_time=80.0)
+		self.history.log("local", "folder/b.gcode", 3000, False, "mk2", print_time=10.0)
+		self.history.log("sdcard", "c.gco", 4000, True, "mk2", print_time=300.0)
+
+	def test_statistics(self):
+		self._log_prints()
+
+		self.assertEquals(2, self.history.statistics("local", "a.gcode").count)
+		self.assertEquals(100.0, self.history.statistics("local", "a.gcode", printer_profile="mk2").mean)
+		self.assertIsNone(self.history.statistics("local", "a.gcode", printer_profile="other"))
+		self.assertIsNone(self.history.statistics("local", "unknown.gcode"))
+
+		self.assertEquals(3, self.history.statistics(printer_profile="mk2").count)
+		self.assertEquals(2, self.history.statistics(printer_profile="mk2").successes)
+		self.assertEquals(4, self.history.statistics().count)
+		self.assertEquals(set(["mk2", "mk3"]), set(self.history.printer_profiles().keys()))
+		self.assertEquals(set(["mk2", "mk3"]), set(self.history.printer_profiles("local", "a.gcode").keys()))
+		self.assertEquals(set(["mk2"]), set(self.history.printer_profiles("local", "folder/b.gcode").keys()))
+		self.assertEquals(dict(), self.history.printer_profiles("local", "unknown.gcode"))
+
+		self.assertEquals(set([("local", "a.gcode"), ("local", "folder/b.gcode")]),
+		                  set((origin, path) for origin, path, _ in self.history.files(origin="local", printer_profile="mk2")))
+
+	def test_forget(self):
+		self._log_prints()
+
+		self.history.forget("local", "folder", recursive=True)
+		self.assertIsNone(self.history.statistics("local", "folder/b.gcode"))
+		self.assertIsNotNone(self.history.statistics("local", "a.gcode"))
+
+		self.history.forget("local", "a.gcode")
+		self.assertIsNone(self.history.statistics("local", "a.gcode"))
+
+		# prints of forgotten files still count
+		self.assertEquals(4, self.history.statistics().count)
+
+	def test_forget_unknown_not_logged(self):
+		self.history.forget("local", "unknown.gcode")
+		self.assertFalse(os.path.exists(self.path))
+
+	def test_move(self):
+		self._log_prints()
+
+		self.history.move("local", "a.gcode", "renamed.gcode")
+		self.assertIsNone(self.history.statistics("local", "a.gcode"))
+		self.assertEquals(2, self.history.statistics("local", "renamed.gcode").count)
+
+		self.history.move("local", "folder", "other", recursive=True)
+		self.assertIsNone(self.history.statistics("local", "folder/b.gcode"))
+		self.assertEquals(1, self.history.statistics("local", "other/b.gcode").count)
+
+		# moves are replayed on startup as well
+		history = PrintHistory(self.path)
+		self.assertEquals(2, history.statistics("local", "renamed.gcode").count)
+		self.assertEquals(1, history.statistics("local", "other/b.gcode").count)
+
+	def test_log_written(self):
+		self.assertTrue(self.history.log("local", "a.gcode", 1000, True, "_default"))
+		self.assertTrue(self.history.log_many("local", "b.gcode", [dict(timestamp=1000, success=True, printerProfile="_default"),
+		                                                          dict(timestamp=2000, success=False, printerProfile="_default")]))
+		self.assertEquals(3, PrintHistory(self.path).statistics().count)
+
+		self.assertFalse(PrintHistory().log("local", "a.gcode", 1000, True, "_default"))
+
+		os.remove(self.path)
+		os.mkdir(self.path)
+		self.assertFalse(self.history.log("local", "a.gcode", 3000, True, "_default"))
+		self.assertEquals(2, self.history.statistics("local", "a.gcode").count)
+
+	def test_persistence(self):
+		self._log_prints()
+		self.history.forget("local", "a.gcode")
+
+		# a partially written line must not keep the rest of the history from loading
+		with open(self.path, "ab") as f:
+			f.write(b'{"event": "print", "orig')
+
+		history = PrintHistory(self.path)
+		self.assertIsNone(history.statistics("local", "a.gcode"))
+		self.assertEquals(1, history.statistics("sdcard", "c.gco").count)
+		self.assertEquals(4, history.statistics().count)
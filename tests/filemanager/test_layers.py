@@ -0,0 +1,67 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import io
+import unittest
+
+from ddt import ddt, data, unpack
+
+from octoprint.filemanager.layers import LayerIndex
+
+
+@ddt
+class LayerIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.index = LayerIndex([
+			(100, 5, 0.3, 1.0, 0.5),
+			(2000, 80, 0.5, 30.0, 12.0),
+			(4500, 170, 0.7, 62.5, 25.0)
+		])
+
+	def test_roundtrip(self):
+		stream = io.BytesIO()
+		self.index.dump(stream)
+		stream.seek(0)
+
+		loaded = LayerIndex.load(stream)
+
+		self.assertEquals(len(self.index), len(loaded))
+		for expected, actual in zip(self.index, loaded):
+			self.assertEquals(expected.offset, actual.offset)
+			self.assertEquals(expected.line, actual.line)
+			self.assertAlmostEqual(expected.z, actual.z, places=5)
+			self.assertAlmostEqual(expected.time, actual.time, places=5)
+			self.assertAlmostEqual(expected.filament, actual.filament, places=5)
+
+	@data(
+		(b"",),
+		(b"XXXX\x01\x00\x00\x00\x00",),
+		(b"OPLI\x01\x02\x00\x00\x00",)
+	)
+	@unpack
+	def test_load_invalid(self, content):
+		self.assertRaises(ValueError, LayerIndex.load, io.BytesIO(content))
+
+	@data(
+		(0, None),
+		(99, None),
+		(100, 0),
+		(1999, 0),
+		(2000, 1),
+		(10000, 2)
+	)
+	@unpack
+	def test_layer_for_offset(self, offset, expected):
+		self.assertEquals(expected, self.index.layer_for_offset(offset))
+
+	def test_as_dict_list(self):
+		layers = self.index.as_dict_list(start=1, end=2)
+		self.assertEquals(1, len(layers))
+		self.assertEquals(1, layers[0]["number"])
+		self.assertEquals(2000, layers[0]["offset"])
+		self.assertEquals(80, layers[0]["line"])
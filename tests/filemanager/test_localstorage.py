@@ -9,10 +9,14 @@ import unittest
 import os
 import mock
 import os.path
+import shutil
 
 from ddt import ddt, unpack, data
 
 import octoprint.filemanager.storage
+from octoprint.filemanager.metadata import SqliteMetadataStore
+from octoprint.filemanager.storage import LocalFileStorage
+from octoprint.filemanager.util import DecompressingFileWrapper, DiskFileWrapper, IngestFileWrapper
 
 
 class FileWrapper(object):
@@ -40,10 +44,16 @@ FILE_CRAZYRADIO_STL = FileWrapper("crazyradio.stl")
 @ddt
 class LocalStorageTest(unittest.TestCase):
 
+	metadata_backend = "yaml"
+	hash_workers = 0
+	index = False
+	compress = False
+	deduplicate = False
+
 	def setUp(self):
 		import tempfile
 		self.basefolder = os.path.realpath(os.path.abspath(tempfile.mkdtemp()))
-		self.storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder)
+		self.storage = octoprint.filemanager.storage.LocalFileStorage(self.basefolder, metadata_backend=self.metadata_backend, hash_workers=self.hash_workers, index=self.index, index_watch=False, compress=self.compress, deduplicate=self.deduplicate)
 
 		# mock file manager module
 		self.filemanager_patcher = mock.patch("octoprint.filemanager")
@@ -121,6 +131,22 @@ class LocalStorageTest(unittest.TestCase):
 		self.assertTrue("hash" in link)
 		self.assertEquals(FILE_BP_CASE_GCODE.hash, link["hash"])
 
+	def test_indices(self):
+		from octoprint.filemanager.layers import LayerIndex
+		from octoprint.filemanager.timeindex import TimeIndex
+
+		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.assertIsNone(self.storage.get_layer_index(gcode_name))
+		self.assertIsNone(self.storage.get_time_index(gcode_name))
+
+		self.storage.set_layer_index(gcode_name, LayerIndex([(100, 5, 0.3, 0.0, 0.0)]))
+		self.storage.set_time_index(gcode_name, TimeIndex([(0, 0.0), (1000, 10.0)]))
+		self.assertEquals(1, len(self.storage.get_layer_index(gcode_name)))
+		self.assertEquals(10.0, self.storage.get_time_index(gcode_name).total)
+
+		self.storage.remove_file(gcode_name)
+		self.assertEquals([], [entry for entry in os.listdir(self.basefolder) if entry.startswith(".bp_case")])
+
 	def test_remove_file(self):
 		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
 		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=stl_name))])
@@ -183,6 +209,162 @@ class LocalStorageTest(unittest.TestCase):
 
 		self.storage.remove_folder(content_folder, recursive=False)
 
+	def test_move_file(self):
+		from octoprint.filemanager.layers import LayerIndex
+
+		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=stl_name))])
+		self._add_folder("sub", "sub")
+		self.storage.set_additional_metadata(gcode_name, "analysis", dict(estimatedPrintTime=1234.5))
+		self.storage.set_layer_index(gcode_name, LayerIndex([(100, 5, 0.3, 0.0, 0.0)]))
+
+		moved_name = self.storage.move_file(gcode_name, "sub/moved file.gcode")
+		self.assertEquals("sub/moved_file.gcode", moved_name)
+		self.assertFalse(os.path.exists(os.path.join(self.basefolder, "bp_case.gcode")))
+		self.assertTrue(os.path.isfile(os.path.join(self.basefolder, "sub", "moved_file.gcode")))
+		self.assertFalse(self.storage.file_exists(gcode_name))
+		self.assertTrue(self.storage.file_exists(moved_name))
+
+		# metadata and indices come along, links to files in the old folder don't
+		self.assertIsNone(self.storage.get_metadata(gcode_name))
+		moved_metadata = self.storage.get_metadata(moved_name)
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, moved_metadata["hash"])
+		self.assertEquals(1234.5, moved_metadata["analysis"]["estimatedPrintTime"])
+		self.assertEquals([], moved_metadata["links"])
+		self.assertEquals([], self.storage.get_metadata(stl_name)["links"])
+		self.assertEquals(1, len(self.storage.get_layer_index(moved_name)))
+		self.assertEquals([], [entry for entry in os.listdir(self.basefolder) if entry.startswith(".bp_case")])
+
+	def test_rename_file(self):
+		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=stl_name))])
+
+		renamed_name = self.storage.move_file(gcode_name, "renamed.gcode")
+		self.assertEquals("renamed.gcode", renamed_name)
+
+		# within the folder, links survive in both directions
+		renamed_metadata = self.storage.get_metadata(renamed_name)
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, renamed_metadata["hash"])
+		self.assertEquals([stl_name], [link["name"] for link in renamed_metadata["links"]])
+		self.assertEquals([renamed_name], [link["name"] for link in self.storage.get_metadata(stl_name)["links"]])
+
+		self.assertEquals(["bp_case.stl", "renamed.gcode"], sorted(self.storage.list_files().keys()))
+
+	def test_copy_file(self):
+		from octoprint.filemanager.layers import LayerIndex
+
+		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=stl_name))])
+		self._add_folder("sub", "sub")
+		self.storage.set_additional_metadata(gcode_name, "analysis", dict(estimatedPrintTime=1234.5))
+		self.storage.set_layer_index(gcode_name, LayerIndex([(100, 5, 0.3, 0.0, 0.0)]))
+
+		copy_name = self.storage.copy_file(gcode_name, "sub/copy.gcode")
+		self.assertEquals("sub/copy.gcode", copy_name)
+		self.assertTrue(self.storage.file_exists(gcode_name))
+		self.assertTrue(self.storage.file_exists(copy_name))
+
+		copy_metadata = self.storage.get_metadata(copy_name)
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, copy_metadata["hash"])
+		self.assertEquals(1234.5, copy_metadata["analysis"]["estimatedPrintTime"])
+		self.assertEquals([], copy_metadata["links"])
+		self.assertEquals(1, len(self.storage.get_layer_index(copy_name)))
+
+		# the original is left untouched
+		self.assertEquals(1, len(self.storage.get_metadata(gcode_name)["links"]))
+		self.assertEquals(1, len(self.storage.get_metadata(stl_name)["links"]))
+		self.assertEquals(1, len(self.storage.get_layer_index(gcode_name)))
+
+		# and the copy is a copy
+		self.storage.set_additional_metadata(copy_name, "analysis", dict(estimatedPrintTime=1.0), overwrite=True)
+		self.assertEquals(1234.5, self.storage.get_metadata(gcode_name)["analysis"]["estimatedPrintTime"])
+
+	@data(
+		("missing.gcode", "other.gcode"),
+		("bp_case.gcode", "bp_case.stl"),
+		("bp_case.gcode", "existing.gcode"),
+		("bp_case.gcode", "missing/other.gcode")
+	)
+	@unpack
+	def test_move_file_invalid(self, source, destination):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("existing.gcode", "existing.gcode", FILE_BP_CASE_GCODE)
+
+		self.assertRaises(RuntimeError, self.storage.move_file, source, destination)
+		self.assertRaises(RuntimeError, self.storage.copy_file, source, destination)
+		self.assertTrue(self.storage.file_exists("bp_case.gcode"))
+
+	def test_move_folder(self):
+		stl_name = self._add_file("content/bp_case.stl", "content/bp_case.stl", FILE_BP_CASE_STL)
+		gcode_name = self._add_file("content/sub/bp_case.gcode", "content/sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.set_additional_metadata(gcode_name, "analysis", dict(estimatedPrintTime=1234.5))
+		self._add_folder("other", "other")
+
+		moved_name = self.storage.move_folder("content", "other/moved")
+		self.assertEquals("other/moved", moved_name)
+		self.assertFalse(os.path.exists(os.path.join(self.basefolder, "content")))
+		self.assertIsNone(self.storage.get_metadata(stl_name))
+		self.assertIsNone(self.storage.get_metadata(gcode_name))
+
+		self.assertEquals(FILE_BP_CASE_STL.hash, self.storage.get_metadata("other/moved/bp_case.stl")["hash"])
+		gcode_metadata = self.storage.get_metadata("other/moved/sub/bp_case.gcode")
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, gcode_metadata["hash"])
+		self.assertEquals(1234.5, gcode_metadata["analysis"]["estimatedPrintTime"])
+
+		files = self.storage.list_files()
+		self.assertEquals(["other"], files.keys())
+		self.assertEquals(["bp_case.stl", "sub"], sorted(files["other"]["children"]["moved"]["children"].keys()))
+
+	def test_copy_folder(self):
+		self._add_file("content/bp_case.stl", "content/bp_case.stl", FILE_BP_CASE_STL)
+		gcode_name = self._add_file("content/sub/bp_case.gcode", "content/sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.set_additional_metadata(gcode_name, "analysis", dict(estimatedPrintTime=1234.5))
+
+		copy_name = self.storage.copy_folder("content", "copy")
+		self.assertEquals("copy", copy_name)
+
+		for folder in ("content", "copy"):
+			self.assertEquals(FILE_BP_CASE_STL.hash, self.storage.get_metadata(folder + "/bp_case.stl")["hash"])
+			self.assertEquals(1234.5, self.storage.get_metadata(folder + "/sub/bp_case.gcode")["analysis"]["estimatedPrintTime"])
+
+		self.storage.remove_additional_metadata("copy/sub/bp_case.gcode", "analysis")
+		self.assertTrue("analysis" in self.storage.get_metadata(gcode_name))
+
+	@data(
+		("content", "content/sub/moved"),
+		("content", "existing"),
+		("missing", "moved"),
+		("content", "missing/moved"),
+		("", "moved")
+	)
+	@unpack
+	def test_move_folder_invalid(self, source, destination):
+		self._add_file("content/sub/bp_case.gcode", "content/sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_folder("existing", "existing")
+
+		self.assertRaises(RuntimeError, self.storage.move_folder, source, destination)
+		self.assertRaises(RuntimeError, self.storage.copy_folder, source, destination)
+		self.assertTrue(self.storage.file_exists("content/sub/bp_case.gcode"))
+
+	def test_analysis_backlog_for_path(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("content/bp_case.gcode", "content/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("content/sub/bp_case.stl", "content/sub/bp_case.stl", FILE_BP_CASE_STL)
+		self.storage.set_additional_metadata("content/bp_case.gcode", "analysis", dict(layerCount=10))
+
+		self.assertEquals(["content/sub/bp_case.stl"], [entry[0] for entry in self.storage.analysis_backlog_for_path("content")])
+		self.assertEquals(["bp_case.gcode"], [entry[0] for entry in self.storage.analysis_backlog_for_path("bp_case.gcode")])
+		self.assertEquals([], list(self.storage.analysis_backlog_for_path("content/bp_case.gcode")))
+
+	def test_analysis_backlog_provisional(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("content/bp_case.gcode", "content/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.set_additional_metadata("bp_case.gcode", "analysis", dict(layerCount=10, provisional=True))
+		self.storage.set_additional_metadata("content/bp_case.gcode", "analysis", dict(layerCount=10))
+
+		self.assertEquals(["bp_case.gcode"], [entry[0] for entry in self.storage.analysis_backlog])
+		self.assertEquals(["bp_case.gcode"], [entry[0] for entry in self.storage.analysis_backlog_for_path("bp_case.gcode")])
+
 	def test_list(self):
 		bp_case_stl = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
 		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE, links=[("model", dict(name=bp_case_stl))])
@@ -214,6 +396,25 @@ class LocalStorageTest(unittest.TestCase):
 		self.assertEquals("folder", file_list["empty"]["type"])
 		self.assertEquals(0, len(file_list["empty"]["children"]))
 
+	def test_get_file(self):
+		content_folder = self._add_folder("content", "content")
+		self._add_file((content_folder, "bp_case.gcode"), content_folder + "/bp_case.gcode", FILE_BP_CASE_GCODE)
+		FILE_CRAZYRADIO_STL.save(os.path.join(self.basefolder, "content", "crazyradio.stl"))
+
+		# the same entry as in the listing
+		entry = self.storage.get_file("content/bp_case.gcode")
+		self.assertEquals(self.storage.list_files()["content"]["children"]["bp_case.gcode"], entry)
+		self.assertEquals("bp_case.gcode", entry["name"])
+		self.assertEquals("machinecode", entry["type"])
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, entry["hash"])
+
+		# files added behind our back get basic metadata
+		entry = self.storage.get_file("content/crazyradio.stl")
+		self.assertEquals("model", entry["type"])
+		self.assertIsNotNone(self.storage.get_metadata("content/crazyradio.stl"))
+
+		self.assertIsNone(self.storage.get_file("content/missing.gcode"))
+
 	def test_add_link_model(self):
 		stl_name = self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
 		gcode_name = self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
@@ -379,6 +580,28 @@ class LocalStorageTest(unittest.TestCase):
 		self.assertEquals(expected_path, actual_path)
 		self.assertEquals(expected_name, actual_name)
 
+	def test_add_history_deprecated(self):
+		import warnings
+		from octoprint.filemanager.history import PrintHistory
+
+		self._add_folder("sub", "sub")
+		self._add_file("sub/bp_case.gcode", "sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+
+		history = PrintHistory()
+		self.storage.set_print_history(history, "local")
+
+		with warnings.catch_warnings(record=True) as w:
+			warnings.simplefilter("always")
+			self.storage.add_history("sub/bp_case.gcode", dict(timestamp=1000, success=True, printTime=100.0, printerProfile="_default"))
+			self.storage.remove_history("sub/bp_case.gcode", 0)
+		self.assertEquals([DeprecationWarning, DeprecationWarning], [warning.category for warning in w])
+
+		# the print ends up in the print history, never in the metadata
+		statistics = history.statistics("local", "sub/bp_case.gcode")
+		self.assertEquals(1, statistics.count)
+		self.assertEquals(dict(success=True, timestamp=1000, printTime=100.0), statistics.last_print)
+		self.assertFalse("history" in self.storage.get_metadata("sub/bp_case.gcode"))
+
 	def _add_file(self, path, expected_path, file_object, links=None, overwrite=False):
 		sanitized_path = self.storage.add_file(path, file_object, links=links, allow_overwrite=overwrite)
 		split_path = sanitized_path.split("/")
@@ -391,7 +614,8 @@ class LocalStorageTest(unittest.TestCase):
 
 		self.assertEquals(expected_path, sanitized_path)
 		self.assertTrue(os.path.exists(file_path))
-		self.assertTrue(os.path.exists(os.path.join(folder_path, ".metadata.yaml")))
+		if self.metadata_backend == "yaml":
+			self.assertTrue(os.path.exists(os.path.join(folder_path, ".metadata.yaml")))
 
 		metadata = self.storage.get_metadata(sanitized_path)
 		self.assertIsNotNone(metadata)
@@ -414,3 +638,274 @@ class LocalStorageTest(unittest.TestCase):
 
 		return sanitized_path
 
+
+class BackgroundHashingLocalStorageTest(LocalStorageTest):
+
+	hash_workers = 1
+
+	def test_list_hashes_in_background(self):
+		import threading
+
+		FILE_BP_CASE_GCODE.save(os.path.join(self.basefolder, "bp_case.gcode"))
+
+		updated = threading.Event()
+		self.storage.register_metadata_callback(lambda path, key: updated.set() if (path, key) == ("bp_case.gcode", "hash") else None)
+
+		files = self.storage.list_files()
+		self.assertTrue("bp_case.gcode" in files)
+
+		self.assertTrue(updated.wait(5.0))
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("bp_case.gcode")["hash"])
+
+	def test_list_hashes_unfinished(self):
+		import threading
+
+		# as left behind if we went down before the background hashing of the file finished
+		FILE_BP_CASE_GCODE.save(os.path.join(self.basefolder, "bp_case.gcode"))
+		self.storage._save_metadata(self.basefolder, dict([("bp_case.gcode", dict(links=[], notes=[]))]))
+
+		updated = threading.Event()
+		self.storage.register_metadata_callback(lambda path, key: updated.set() if (path, key) == ("bp_case.gcode", "hash") else None)
+
+		self.storage.list_files()
+		self.assertTrue(updated.wait(5.0))
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("bp_case.gcode")["hash"])
+
+		# known now, the next listing picks it up right away
+		self.storage._save_metadata(self.basefolder, dict([("bp_case.gcode", dict(links=[], notes=[]))]))
+		self.storage.list_files()
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("bp_case.gcode")["hash"])
+
+
+class IndexedLocalStorageTest(LocalStorageTest):
+
+	index = True
+
+	def test_list_from_index(self):
+		self._add_folder("sub", "sub")
+		self._add_file("sub/bp_case.gcode", "sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+
+		# changes made behind the storage's back only show up after a rescan
+		FILE_BP_CASE_GCODE.save(os.path.join(self.basefolder, "sub", "other.gcode"))
+		self.assertEquals(["bp_case.gcode"], self.storage.list_files()["sub"]["children"].keys())
+		self.assertFalse(self.storage.file_exists("sub/other.gcode"))
+
+		self.storage.rescan()
+		self.assertEquals(["bp_case.gcode", "other.gcode"], sorted(self.storage.list_files()["sub"]["children"].keys()))
+		self.assertTrue(self.storage.file_exists("sub/other.gcode"))
+
+	def test_change_callback(self):
+		changes = []
+		self.storage.register_change_callback(changes.append)
+
+		# the index reports changes by absolute path, callbacks get the path in storage
+		self.storage._index._notify_change(os.path.join(self.basefolder, "sub", "other.gcode"))
+		self.assertEquals(["sub/other.gcode"], changes)
+
+		self.storage.unregister_change_callback(changes.append)
+		self.storage._index._notify_change(os.path.join(self.basefolder, "another.gcode"))
+		self.assertEquals(["sub/other.gcode"], changes)
+
+
+class CompressingLocalStorageTest(LocalStorageTest):
+
+	compress = True
+
+	def test_stored_compressed(self):
+		from octoprint.util.compression import is_compressed, open_file
+
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+
+		gcode_path = os.path.join(self.basefolder, "bp_case.gcode")
+		self.assertTrue(is_compressed(gcode_path))
+		self.assertFalse(is_compressed(os.path.join(self.basefolder, "bp_case.stl")))
+
+		with open_file(gcode_path) as f, open(FILE_BP_CASE_GCODE.path, "rb") as original:
+			self.assertEquals(original.read(), f.read())
+
+		# the hash is the one of the uncompressed contents, no matter whether it had to be computed again
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("bp_case.gcode")["hash"])
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage._create_hash(gcode_path))
+
+	def test_compressed_size(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+
+		gcode_path = os.path.join(self.basefolder, "bp_case.gcode")
+		original_size = os.stat(FILE_BP_CASE_GCODE.path).st_size
+		self.assertNotEquals(original_size, os.stat(gcode_path).st_size)
+
+		# listings report the size of the uncompressed contents
+		entry = self.storage.list_files()["bp_case.gcode"]
+		self.assertEquals(original_size, entry["size"])
+		self.assertFalse("compression" in entry)
+		self.assertEquals(original_size, self.storage.get_file("bp_case.gcode")["size"])
+
+		# unless the file was replaced behind our back
+		import shutil
+		shutil.copy(FILE_BP_CASE_GCODE.path, gcode_path)
+		with open(gcode_path, "ab") as f:
+			f.write(b"M84\n")
+		self.assertEquals(original_size + 4, self.storage.get_file("bp_case.gcode")["size"])
+
+
+class DeduplicatingLocalStorageTest(LocalStorageTest):
+
+	deduplicate = True
+
+	def test_identical_contents_stored_once(self):
+		self._add_folder("sub", "sub")
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("sub/copy.gcode", "sub/copy.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("bp_case.stl", "bp_case.stl", FILE_BP_CASE_STL)
+
+		original_path = os.path.join(self.basefolder, "bp_case.gcode")
+		copy_path = os.path.join(self.basefolder, "sub", "copy.gcode")
+		self.assertTrue(os.path.samefile(original_path, copy_path))
+		self.assertFalse(os.path.samefile(original_path, os.path.join(self.basefolder, "bp_case.stl")))
+
+		# metadata stays separate
+		self.storage.set_additional_metadata("sub/copy.gcode", "analysis", dict(estimatedPrintTime=1234.5))
+		self.assertFalse("analysis" in self.storage.get_metadata("bp_case.gcode"))
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("sub/copy.gcode")["hash"])
+
+		# removing one of them leaves the other one intact
+		self.storage.remove_file("bp_case.gcode")
+		self.assertFalse(os.path.exists(original_path))
+		with open(copy_path, "rb") as f, open(FILE_BP_CASE_GCODE.path, "rb") as original:
+			self.assertEquals(original.read(), f.read())
+
+	def test_overwrite_linked_file(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self._add_file("copy.gcode", "copy.gcode", FILE_BP_CASE_GCODE)
+
+		# overwriting one of the files must not change the other one
+		self._add_file("copy.gcode", "copy.gcode", FILE_BP_CASE_STL, overwrite=True)
+
+		original_path = os.path.join(self.basefolder, "bp_case.gcode")
+		self.assertFalse(os.path.samefile(original_path, os.path.join(self.basefolder, "copy.gcode")))
+		with open(original_path, "rb") as f, open(FILE_BP_CASE_GCODE.path, "rb") as original:
+			self.assertEquals(original.read(), f.read())
+
+	def test_copy_file_linked(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.copy_file("bp_case.gcode", "copy.gcode")
+		self.assertTrue(os.path.samefile(os.path.join(self.basefolder, "bp_case.gcode"), os.path.join(self.basefolder, "copy.gcode")))
+
+	def test_hash_unknown_before_saving(self):
+		class HashlessFileWrapper(object):
+			def __init__(self, file_object):
+				self._wrapped = file_object
+
+			def save(self, destination):
+				self._wrapped.save(destination)
+
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.add_file("copy.gcode", HashlessFileWrapper(FILE_BP_CASE_GCODE))
+
+		self.assertTrue(os.path.samefile(os.path.join(self.basefolder, "bp_case.gcode"), os.path.join(self.basefolder, "copy.gcode")))
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("copy.gcode")["hash"])
+
+
+	def test_claimed_hash_verified(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+
+		# a file claiming the hash of another one is stored with its own contents
+		upload = os.path.join(self.basefolder, ".upload")
+		shutil.copy(FILE_BP_CASE_STL.path, upload)
+		self.storage.add_file("copy.gcode", DiskFileWrapper("copy.gcode", upload, hash=FILE_BP_CASE_GCODE.hash))
+
+		copy_path = os.path.join(self.basefolder, "copy.gcode")
+		self.assertFalse(os.path.samefile(os.path.join(self.basefolder, "bp_case.gcode"), copy_path))
+		with open(copy_path, "rb") as f, open(FILE_BP_CASE_STL.path, "rb") as original:
+			self.assertEquals(original.read(), f.read())
+		self.assertEquals(FILE_BP_CASE_STL.hash, self.storage.get_metadata("copy.gcode")["hash"])
+
+	def test_claimed_hash_linked(self):
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+
+		upload = os.path.join(self.basefolder, ".upload")
+		shutil.copy(FILE_BP_CASE_GCODE.path, upload)
+		self.storage.add_file("copy.gcode", IngestFileWrapper(DiskFileWrapper("copy.gcode", upload, hash=FILE_BP_CASE_GCODE.hash)))
+
+		self.assertTrue(os.path.samefile(os.path.join(self.basefolder, "bp_case.gcode"), os.path.join(self.basefolder, "copy.gcode")))
+
+	def test_compressed_upload_linked(self):
+		import gzip
+		self._add_file("bp_case.gcode", "bp_case.gcode", FILE_BP_CASE_GCODE)
+
+		upload = os.path.join(self.basefolder, ".upload.gcode.gz")
+		with open(FILE_BP_CASE_GCODE.path, "rb") as source:
+			compressed = gzip.open(upload, "wb")
+			try:
+				shutil.copyfileobj(source, compressed)
+			finally:
+				compressed.close()
+		wrapper = DiskFileWrapper("copy.gcode.gz", upload)
+		wrapper.hash = self.storage._create_hash(upload)
+		self.storage.add_file("copy.gcode", DecompressingFileWrapper(wrapper))
+
+		self.assertTrue(os.path.samefile(os.path.join(self.basefolder, "bp_case.gcode"), os.path.join(self.basefolder, "copy.gcode")))
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, self.storage.get_metadata("copy.gcode")["hash"])
+
+
+class SqliteDeduplicatingLocalStorageTest(DeduplicatingLocalStorageTest):
+
+	metadata_backend = "sqlite"
+
+
+class SqliteLocalStorageTest(LocalStorageTest):
+
+	metadata_backend = "sqlite"
+
+	def test_database(self):
+		self.assertIsInstance(self.storage._metadata_store, SqliteMetadataStore)
+		self.assertTrue(os.path.exists(os.path.join(self.basefolder, ".metadata.db")))
+		self.assertFalse(os.path.exists(os.path.join(self.basefolder, ".metadata.yaml")))
+
+	def test_persistence(self):
+		self._add_folder("sub", "sub")
+		self._add_file("sub/bp_case.gcode", "sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.set_additional_metadata("sub/bp_case.gcode", "analysis", dict(estimatedPrintTime=1234.5))
+
+		# a new storage instance has to see the same metadata without having it cached
+		storage = LocalFileStorage(self.basefolder, metadata_backend="sqlite")
+		metadata = storage.get_metadata("sub/bp_case.gcode")
+		self.assertEquals(FILE_BP_CASE_GCODE.hash, metadata["hash"])
+		self.assertEquals(dict(estimatedPrintTime=1234.5), metadata["analysis"])
+
+	def test_remove_folder_removes_metadata(self):
+		self._add_folder("sub", "sub")
+		self._add_file("sub/bp_case.gcode", "sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.storage.set_additional_metadata("sub/bp_case.gcode", "analysis", dict(estimatedPrintTime=1234.5))
+
+		self.storage.remove_folder("sub")
+
+		self._add_folder("sub", "sub")
+		self._add_file("sub/bp_case.gcode", "sub/bp_case.gcode", FILE_BP_CASE_GCODE)
+		self.assertFalse("analysis" in self.storage.get_metadata("sub/bp_case.gcode"))
+
+	def test_migration_from_yaml(self):
+		import shutil
+		import tempfile
+		import yaml
+
+		basefolder = os.path.realpath(os.path.abspath(tempfile.mkdtemp()))
+		try:
+			os.mkdir(os.path.join(basefolder, "sub"))
+			for folder in (basefolder, os.path.join(basefolder, "sub")):
+				FILE_BP_CASE_GCODE.save(os.path.join(folder, "bp_case.gcode"))
+				with open(os.path.join(folder, ".metadata.yaml"), "wb") as f:
+					yaml.safe_dump({"bp_case.gcode": dict(hash=FILE_BP_CASE_GCODE.hash, links=[], notes=[], analysis=dict(estimatedPrintTime=42.0))}, f)
+
+			storage = LocalFileStorage(basefolder, metadata_backend="sqlite")
+
+			for path in ("bp_case.gcode", "sub/bp_case.gcode"):
+				metadata = storage.get_metadata(path)
+				self.assertEquals(FILE_BP_CASE_GCODE.hash, metadata["hash"])
+				self.assertEquals(dict(estimatedPrintTime=42.0), metadata["analysis"])
+
+			# the yaml files stay untouched
+			self.assertTrue(os.path.exists(os.path.join(basefolder, "sub", ".metadata.yaml")))
+		finally:
+			shutil.rmtree(basefolder)
@@ -0,0 +1,197 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import mock
+
+from octoprint.filemanager.metadata import SqliteMetadataStore, WriteBehindMetadataStore, YamlMetadataStore
+
+
+class WriteBehindMetadataStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.store = mock.MagicMock()
+		self.store.get.return_value = dict()
+		self.write_behind = WriteBehindMetadataStore(self.store, 60.0)
+
+	def tearDown(self):
+		self.write_behind.flush()
+
+	def test_coalesce(self):
+		metadata = dict(a=dict(hash="a"))
+		self.write_behind.save("/folder", metadata, ["a"])
+
+		metadata["b"] = dict(hash="b")
+		self.write_behind.save("/folder", metadata, ["b"])
+
+		other = dict(c=dict(hash="c"))
+		self.write_behind.save("/other", other, ["c"])
+
+		self.assertFalse(self.store.save.called)
+		self.assertFalse(self.store.save_many.called)
+
+		self.write_behind.flush()
+		self.store.save_many.assert_called_once_with([("/folder", metadata, set(["a", "b"])), ("/other", other, set(["c"]))])
+
+		# nothing left to flush
+		self.write_behind.flush()
+		self.assertEquals(1, self.store.save_many.call_count)
+
+	def test_full_save_wins(self):
+		metadata = dict(a=dict(hash="a"))
+		self.write_behind.save("/folder", metadata, ["a"])
+		self.write_behind.save("/folder", metadata)
+		self.write_behind.save("/folder", metadata, ["a"])
+
+		self.write_behind.flush()
+		self.store.save_many.assert_called_once_with([("/folder", metadata, None)])
+
+	def test_read_pending(self):
+		metadata = dict(a=dict(hash="a"))
+		self.write_behind.save("/folder", metadata, ["a"])
+
+		self.assertIs(metadata, self.write_behind.get("/folder"))
+		self.assertFalse(self.store.get.called)
+
+		self.write_behind.get("/other")
+		self.store.get.assert_called_once_with("/other")
+
+	def test_remove_folder(self):
+		self.write_behind.save("/folder/sub", dict(a=dict(hash="a")), ["a"])
+		self.write_behind.save("/folder2", dict(b=dict(hash="b")), ["b"])
+
+		self.write_behind.remove_folder("/folder")
+		self.store.remove_folder.assert_called_once_with("/folder")
+
+		self.write_behind.flush()
+		self.assertEquals(["/folder2"], [path for path, _, _ in self.store.save_many.call_args[0][0]])
+
+	def test_find_by_hash_flushes(self):
+		self.write_behind.save("/folder", dict(a=dict(hash="a")), ["a"])
+		self.store.find_by_hash.return_value = ["/folder/a"]
+
+		self.assertEquals(["/folder/a"], self.write_behind.find_by_hash("a"))
+		self.assertTrue(self.store.save_many.called)
+		self.store.find_by_hash.assert_called_once_with("a")
+
+	def test_batch(self):
+		write_behind = WriteBehindMetadataStore(self.store, 0.01)
+		with write_behind.batch():
+			write_behind.save("/folder", dict(a=dict(hash="a")), ["a"])
+			with write_behind.batch():
+				write_behind.save("/other", dict(b=dict(hash="b")), ["b"])
+
+			# the timer doesn't flush while the batch is open
+			time.sleep(0.1)
+			self.assertFalse(self.store.save_many.called)
+
+		self.assertEquals(1, self.store.save_many.call_count)
+		self.assertEquals(["/folder", "/other"], [path for path, _, _ in self.store.save_many.call_args[0][0]])
+
+	def test_timer(self):
+		write_behind = WriteBehindMetadataStore(self.store, 0.01)
+		write_behind.save("/folder", dict(), [])
+
+		for _ in range(100):
+			if self.store.save_many.called:
+				break
+			time.sleep(0.01)
+		self.assertTrue(self.store.save_many.called)
+
+
+class YamlWriteBehindTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = tempfile.mkdtemp()
+		self.store = YamlMetadataStore()
+		self.write_behind = WriteBehindMetadataStore(self.store, 60.0)
+
+	def tearDown(self):
+		shutil.rmtree(self.basefolder)
+
+	def test_single_write(self):
+		metadata_path = os.path.join(self.basefolder, ".metadata.yaml")
+
+		with mock.patch.object(self.store, "save", wraps=self.store.save) as save:
+			metadata = self.write_behind.get(self.basefolder)
+			for name in ("a", "b", "c"):
+				metadata[name] = dict(hash=name)
+				self.write_behind.save(self.basefolder, metadata, [name])
+
+			self.assertFalse(os.path.exists(metadata_path))
+			self.write_behind.close()
+
+			self.assertEquals(1, save.call_count)
+		self.assertTrue(os.path.exists(metadata_path))
+		self.assertEquals(set(["a", "b", "c"]), set(YamlMetadataStore().get(self.basefolder).keys()))
+
+
+class YamlMetadataStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = os.path.realpath(tempfile.mkdtemp())
+		self.sub = os.path.join(self.basefolder, "sub")
+		os.mkdir(self.sub)
+
+	def tearDown(self):
+		shutil.rmtree(self.basefolder)
+
+	def test_find_by_hash(self):
+		YamlMetadataStore().save(self.basefolder, dict(a=dict(hash="same"), b=dict(hash="other")))
+		YamlMetadataStore().save(self.sub, dict(c=dict(hash="same")))
+
+		store = YamlMetadataStore(self.basefolder)
+		self.assertEquals(set([os.path.join(self.basefolder, "a"), os.path.join(self.sub, "c")]), set(store.find_by_hash("same")))
+		self.assertEquals([], store.find_by_hash("unknown"))
+
+	def test_find_by_hash_modifications(self):
+		store = YamlMetadataStore(self.basefolder)
+		self.assertEquals([], store.find_by_hash("same"))
+
+		metadata = store.get(self.basefolder)
+		metadata["a"] = dict(hash="same")
+		metadata["b"] = dict(hash="same")
+		store.save(self.basefolder, metadata, ["a", "b"])
+		store.save(self.sub, dict(c=dict(hash="same")))
+		self.assertEquals(3, len(store.find_by_hash("same")))
+
+		metadata["a"]["hash"] = "other"
+		del metadata["b"]
+		store.save(self.basefolder, metadata, ["a", "b"])
+		self.assertEquals([os.path.join(self.basefolder, "a")], store.find_by_hash("other"))
+		self.assertEquals([os.path.join(self.sub, "c")], store.find_by_hash("same"))
+
+		store.remove_folder(self.sub)
+		self.assertEquals([], store.find_by_hash("same"))
+
+	def test_find_by_hash_without_basefolder(self):
+		self.assertIsNone(YamlMetadataStore().find_by_hash("same"))
+
+
+class SqliteMetadataStoreTest(unittest.TestCase):
+
+	def setUp(self):
+		self.basefolder = os.path.realpath(tempfile.mkdtemp())
+		self.store = SqliteMetadataStore(self.basefolder)
+
+	def tearDown(self):
+		self.store.close()
+		shutil.rmtree(self.basefolder)
+
+	def test_find_by_hash(self):
+		sub = os.path.join(self.basefolder, "sub")
+		self.store.save(self.basefolder, dict(a=dict(hash="same"), b=dict(hash="other")))
+		self.store.save(sub, dict(c=dict(hash="same")))
+
+		self.assertEquals(set([os.path.join(self.basefolder, "a"), os.path.join(sub, "c")]), set(self.store.find_by_hash("same")))
+		self.assertEquals([], self.store.find_by_hash("unknown"))
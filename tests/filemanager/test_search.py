@@ -0,0 +1,132 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import unittest
+
+from ddt import ddt, data, unpack
+
+from octoprint.filemanager.search import FileSearchIndex, extract_fields, tokenize
+
+
+def _entry(size=100, date=1000, estimated=None, filament=None, prints=None, profile=None):
+	entry = dict(type="machinecode", size=size, date=date, links=[])
+	if estimated is not None or filament is not None:
+		entry["analysis"] = dict()
+		if estimated is not None:
+			entry["analysis"]["estimatedPrintTime"] = estimated
+		if filament is not None:
+			entry["analysis"]["filament"] = dict(("tool%d" % i, dict(length=length)) for i, length in enumerate(filament))
+	if prints is not None:
+		entry["prints"] = prints
+	if profile is not None:
+		entry["links"].append(dict(rel="printerprofile", id=profile, name=profile))
+	return entry
+
+
+@ddt
+class FileSearchIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.index = FileSearchIndex()
+		self.index.update("local", "whistle_v2.gcode", _entry(estimated=1188, filament=[810.0], profile="_default",
+		                                                      prints=dict(success=1, failure=1, printerProfiles=["_default", "mk2"],
+		                                                                  last=dict(success=True, date=2, printTime=1200, printerProfile="mk2"))))
+		self.index.update("local", "parts/bracket_left.gcode", _entry(estimated=9000, filament=[1500.0, 500.0],
+		                                                              prints=dict(success=1, failure=0, printerProfiles=["mk2"],
+		                                                                          last=dict(success=True, date=3, printTime=8000, printerProfile="mk2"))))
+		self.index.update("local", "parts/bracket_right.gcode", _entry(estimated=3600, filament=[1500.0]))
+		self.index.update("local", "calibration cube.stl", dict(type="model", size=20, date=500, links=[]))
+
+	@data(
+		("whistle", ["whistle_v2.gcode"]),
+		("BRACK", ["parts/bracket_left.gcode", "parts/bracket_right.gcode"]),
+		("parts left", ["parts/bracket_left.gcode"]),
+		("cube", ["calibration cube.stl"]),
+		("bracket cube", []),
+		("", ["calibration cube.stl", "parts/bracket_left.gcode", "parts/bracket_right.gcode", "whistle_v2.gcode"])
+	)
+	@unpack
+	def test_text(self, text, expected):
+		self.assertEquals(expected, self._search(text=text))
+
+	@data(
+		(dict(estimatedPrintTime=(None, 7200)), ["parts/bracket_right.gcode", "whistle_v2.gcode"]),
+		(dict(estimatedPrintTime=(3600, 9000)), ["parts/bracket_left.gcode", "parts/bracket_right.gcode"]),
+		(dict(filamentLength=(1600, None)), ["parts/bracket_left.gcode"]),
+		(dict(**{"filamentLength.tool1": (None, None)}), ["parts/bracket_left.gcode"]),
+		(dict(size=(None, 50)), ["calibration cube.stl"]),
+		(dict(lastPrintDate=(2, 2)), ["whistle_v2.gcode"])
+	)
+	@unpack
+	def test_ranges(self, ranges, expected):
+		self.assertEquals(expected, self._search(ranges=ranges))
+
+	@data(
+		(dict(type="model"), ["calibration cube.stl"]),
+		(dict(folder="parts"), ["parts/bracket_left.gcode", "parts/bracket_right.gcode"]),
+		(dict(printerProfile="_default"), ["whistle_v2.gcode"]),
+		(dict(printerProfile="mk2"), ["parts/bracket_left.gcode", "whistle_v2.gcode"]),
+		(dict(lastPrintSuccess=True, lastPrintProfile="mk2"), ["parts/bracket_left.gcode", "whistle_v2.gcode"]),
+		(dict(lastPrintProfile="_default"), [])
+	)
+	@unpack
+	def test_values(self, values, expected):
+		self.assertEquals(expected, self._search(values=values))
+
+	def test_combined(self):
+		# all files under 2h that last succeeded on profile mk2
+		self.assertEquals(["whistle_v2.gcode"], self._search(ranges=dict(estimatedPrintTime=(None, 7200)),
+		                                                    values=dict(lastPrintSuccess=True, lastPrintProfile="mk2")))
+
+	def test_update(self):
+		self.index.update("local", "parts/bracket_right.gcode", _entry(estimated=7000, prints=dict(success=0, failure=1, printerProfiles=["mk2"], last=dict(success=False, date=4, printerProfile="mk2"))))
+
+		self.assertEquals(["parts/bracket_right.gcode"], self._search(ranges=dict(estimatedPrintTime=(6000, 8000))))
+		self.assertEquals([], self._search(ranges=dict(estimatedPrintTime=(3600, 3600))))
+		self.assertEquals(["parts/bracket_right.gcode"], self._search(values=dict(lastPrintSuccess=False)))
+		self.assertEquals(["parts/bracket_left.gcode"], self._search(ranges=dict(filamentLength=(None, None)), text="bracket"))
+
+	def test_remove(self):
+		self.index.remove("local", "whistle_v2.gcode")
+		self.assertEquals([], self._search(text="whistle"))
+		self.assertEquals(3, len(self.index))
+
+		self.index.remove("local", "parts", recursive=True)
+		self.assertEquals(["calibration cube.stl"], self._search())
+		self.assertEquals([], self._search(ranges=dict(estimatedPrintTime=(None, None))))
+
+	def test_clear_origin(self):
+		self.index.update("sdcard", "whistle.gco", dict(type="machinecode", size=10))
+		self.index.clear("local")
+		self.assertEquals([("sdcard", "whistle.gco")], list(self.index.search(text="whistle")))
+
+	def test_hash(self):
+		self.index.update("local", "copy.gcode", dict(type="machinecode", size=10, hash="aabbcc"))
+		self.index.update("local", "other/copy.gcode", dict(type="machinecode", size=10, hash="aabbcc"))
+		self.assertEquals(["copy.gcode", "other/copy.gcode"], self._search(values=dict(hash="aabbcc")))
+		self.assertEquals(set(["aabbcc"]), self.index.values("hash"))
+
+		self.index.remove("local", "copy.gcode")
+		self.index.remove("local", "other/copy.gcode")
+		self.assertEquals(set(), self.index.values("hash"))
+
+	def test_unknown_field(self):
+		self.assertRaises(ValueError, self.index.search, ranges=dict(type=(None, None)))
+		self.assertRaises(ValueError, self.index.search, values=dict(size=100))
+
+	def test_tokenize(self):
+		self.assertEquals(["whistle", "v2", "gcode"], tokenize("Whistle_v2.gcode"))
+
+	def test_extract_fields(self):
+		fields = extract_fields("local", "parts/bracket_left.gcode", _entry(estimated=9000, filament=[1500.0, 500.0]))
+		self.assertEquals(set(["parts"]), fields["folder"])
+		self.assertEquals(2000.0, fields["filamentLength"])
+		self.assertEquals(500.0, fields["filamentLength.tool1"])
+		self.assertFalse("lastPrintSuccess" in fields)
+
+	def _search(self, **kwargs):
+		return sorted(path for origin, path in self.index.search(**kwargs))
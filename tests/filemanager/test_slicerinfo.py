@@ -0,0 +1,109 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import io
+import os
+import tempfile
+import unittest
+
+import ddt
+
+from octoprint.filemanager.slicerinfo import read_slicer_info
+
+
+CURA = u""";FLAVOR:RepRap
+;TIME:6512
+;Filament used: 4.52m
+;Layer height: 0.2
+;Generated with Cura_SteamEngine 2.3.1
+;LAYER_COUNT:120
+;LAYER:0
+G1 X10 Y10 E1
+"""
+
+CURA_LEGACY = u""";Sliced at: Wed 02-09-2015 10:43:27
+;Layer count: 70
+;Print time: #P_TIME#
+;Filament used: #F_AMNT#m #F_WGHT#g
+G1 X10 Y10 E1
+;CURA_PROFILE_STRING:eNrtWk1z2zYQvfdX4NhDO
+"""
+
+SLIC3R = u"""; generated by PrusaSlicer 2.1.0 on 2019-10-22 at 10:12:13 UTC
+G1 X10 Y10 E1
+; filament used [mm] = 1234.5, 10.0
+; filament used [cm3] = 2.97, 0.02
+; estimated printing time (normal mode) = 1h 2m 3s
+; estimated printing time (silent mode) = 1h 10m 3s
+; filament_diameter = 1.75,1.75
+"""
+
+SIMPLIFY3D = u"""; G-Code generated by Simplify3D(R) Version 4.0.1
+; filamentDiameters,1.75|1.75
+G1 X10 Y10 E1
+; layer 1, Z = 0.2
+G1 X20 Y10 E2
+; layer 2, Z = 0.4
+;   Build time: 1 hour 5 minutes
+;   Filament length: 3000.0 mm (3.00 m)
+;   Plastic volume: 7215.00 mm^3 (7.22 cc)
+"""
+
+UNKNOWN = u"""; some handwritten file
+G28
+G1 X10 Y10 E1
+"""
+
+
+@ddt.ddt
+class SlicerInfoTest(unittest.TestCase):
+
+	def setUp(self):
+		self.paths = []
+
+	def tearDown(self):
+		for path in self.paths:
+			os.remove(path)
+
+	@ddt.data(
+		(CURA, dict(slicer="cura", estimatedPrintTime=6512.0, filament=dict(tool0=dict(length=4520.0)), layerCount=120)),
+		(CURA_LEGACY, dict(slicer="cura", layerCount=70)),
+		(SIMPLIFY3D, dict(slicer="simplify3d", estimatedPrintTime=3900.0, filament=dict(tool0=dict(length=3000.0, volume=7.215)), layerCount=2)),
+		(UNKNOWN, None)
+	)
+	@ddt.unpack
+	def test_read_slicer_info(self, content, expected):
+		self.assertEquals(expected, read_slicer_info(self._write(content)))
+
+	def test_read_slicer_info_slic3r(self):
+		result = read_slicer_info(self._write(SLIC3R))
+
+		self.assertEquals("slic3r", result["slicer"])
+		self.assertEquals(3723.0, result["estimatedPrintTime"])
+		self.assertEquals(1234.5, result["filament"]["tool0"]["length"])
+		self.assertEquals(2.97, result["filament"]["tool0"]["volume"])
+		self.assertEquals(10.0, result["filament"]["tool1"]["length"])
+		self.assertFalse("layerCount" in result)
+
+	def test_read_slicer_info_head_and_tail_only(self):
+		filler = u"G1 X10 Y10 E1\n" * 1000
+		content = u"; generated by Slic3r 1.2.9\n" + filler + u"; estimated printing time = 5m\n" + filler + u"; filament used = 100.0mm (0.2cm3)\n"
+
+		result = read_slicer_info(self._write(content), read_size=1024)
+
+		# the estimate in the middle of the file is not read
+		self.assertEquals(dict(slicer="slic3r", filament=dict(tool0=dict(length=100.0, volume=0.2))), result)
+
+	def test_read_slicer_info_missing_file(self):
+		self.assertIsNone(read_slicer_info("/does/not/exist.gcode"))
+
+	def _write(self, content):
+		handle, path = tempfile.mkstemp(suffix=".gcode")
+		with io.open(handle, "wt", encoding="utf-8") as f:
+			f.write(content)
+		self.paths.append(path)
+		return path
@@ -0,0 +1,69 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import struct
+import unittest
+import zlib
+
+from octoprint.filemanager.thumbnail import ToolpathThumbnail
+
+
+class ToolpathThumbnailTest(unittest.TestCase):
+
+	def test_render_empty(self):
+		thumbnail = ToolpathThumbnail()
+		thumbnail.add_segment(0, [0.0, 0.0, 0.0], [10.0, 10.0, 0.0], "move", 0)
+		thumbnail.add_segment(10, [10.0, 10.0, 0.0], [10.0, 10.0, 0.0], "extrude", 0)
+
+		self.assertTrue(thumbnail.empty)
+		self.assertIsNone(thumbnail.render())
+
+	def test_render(self):
+		thumbnail = ToolpathThumbnail(width=16, height=8)
+		thumbnail.add_segment(0, [0.0, 0.0, 0.2], [10.0, 0.0, 0.2], "extrude", 0)
+
+		data = thumbnail.render()
+		self.assertEquals(b"\x89PNG\r\n\x1a\n", data[:8])
+
+		chunks = dict()
+		position = 8
+		while position < len(data):
+			length, = struct.unpack(">I", data[position:position + 4])
+			chunk_type = data[position + 4:position + 8]
+			chunks[chunk_type] = data[position + 8:position + 8 + length]
+			position += 12 + length
+
+		self.assertEquals((16, 8, 8, 6, 0, 0, 0), struct.unpack(">IIBBBBB", chunks[b"IHDR"]))
+		self.assertTrue(b"IEND" in chunks)
+
+		raw = bytearray(zlib.decompress(chunks[b"IDAT"]))
+		self.assertEquals(8 * (1 + 16 * 4), len(raw))
+
+		# a single horizontal line is centered vertically and drawn between the margins
+		drawn = []
+		for row in range(8):
+			scanline = raw[row * 65 + 1:(row + 1) * 65]
+			drawn.append(sum(1 for x in range(16) if scanline[x * 4 + 3] == 255))
+		self.assertEquals(1, len([count for count in drawn if count]))
+		self.assertEquals(16 - 2 * ToolpathThumbnail.margin, max(drawn))
+
+	def test_decimate(self):
+		thumbnail = ToolpathThumbnail(width=16, height=8, max_segments=10)
+		for i in range(100):
+			thumbnail.add_segment(i, [0.0, float(i), 0.2], [10.0, float(i), 0.2], "extrude", 0)
+
+		self.assertLessEqual(len(thumbnail._segments), 5 * 10)
+		self.assertGreaterEqual(len(thumbnail._segments), 5 * 5)
+
+		# kept segments are spread over the whole file, the bounds still cover all of them
+		ys = thumbnail._segments[1::5]
+		self.assertLess(min(ys), 10.0)
+		self.assertGreater(max(ys), 90.0)
+		self.assertEquals([0.0, 0.0, 0.2], thumbnail._min)
+		self.assertEquals([10.0, 99.0, 0.2], thumbnail._max)
+
+		self.assertEquals(b"\x89PNG\r\n\x1a\n", thumbnail.render()[:8])
@@ -0,0 +1,57 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import io
+import unittest
+
+import ddt
+
+from octoprint.filemanager.timeindex import TimeIndex
+
+
+@ddt.ddt
+class TimeIndexTest(unittest.TestCase):
+
+	def setUp(self):
+		self.index = TimeIndex([(100, 0.0), (1100, 10.0), (1200, 110.0), (2000, 120.0)])
+
+	@ddt.data(
+		(0, 0.0),
+		(100, 0.0),
+		(600, 5.0),
+		(1100, 10.0),
+		(1150, 60.0),
+		(1600, 115.0),
+		(2000, 120.0),
+		(5000, 120.0)
+	)
+	@ddt.unpack
+	def test_time_at(self, offset, expected):
+		self.assertAlmostEqual(expected, self.index.time_at(offset))
+
+	def test_progress_at(self):
+		self.assertEquals(120.0, self.index.total)
+		self.assertAlmostEqual(0.5, self.index.progress_at(1150))
+		self.assertEquals(1.0, self.index.progress_at(5000))
+
+	def test_empty(self):
+		index = TimeIndex()
+		self.assertIsNone(index.total)
+		self.assertIsNone(index.time_at(100))
+		self.assertIsNone(index.progress_at(100))
+
+	def test_dump_load(self):
+		stream = io.BytesIO()
+		self.index.dump(stream)
+
+		stream.seek(0)
+		loaded = TimeIndex.load(stream)
+		self.assertEquals(list(self.index), list(loaded))
+
+	@ddt.data(b"", b"OPTI", b"XXXX\x01\x00\x00\x00\x00", b"OPTI\x01\x02\x00\x00\x00")
+	def test_load_invalid(self, data):
+		self.assertRaises(ValueError, TimeIndex.load, io.BytesIO(data))
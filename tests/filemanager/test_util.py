@@ -0,0 +1,235 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import octoprint.filemanager.util
+
+
+class IngestFileWrapperTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.content = b"".join(b"G1 X%d Y%d E%d\n" % (i, i, i) for i in range(10000))
+		self.expected_hash = hashlib.sha1(self.content).hexdigest()
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def _stream_wrapper(self):
+		return octoprint.filemanager.util.StreamWrapper("test.gcode", io.BytesIO(self.content))
+
+	def test_save_without_analyzer(self):
+		path = os.path.join(self.folder, "test.gcode")
+
+		wrapper = octoprint.filemanager.util.IngestFileWrapper(self._stream_wrapper())
+		wrapper.save(path)
+
+		with open(path, "rb") as f:
+			self.assertEquals(self.content, f.read())
+		self.assertEquals(self.expected_hash, wrapper.hash)
+		self.assertIsNone(wrapper.analysis)
+
+	def test_save_with_analyzer(self):
+		path = os.path.join(self.folder, "test.gcode")
+
+		def analyzer(lines):
+			return len(list(lines))
+
+		wrapper = octoprint.filemanager.util.IngestFileWrapper(self._stream_wrapper(), analyzer=analyzer)
+		wrapper.save(path)
+
+		with open(path, "rb") as f:
+			self.assertEquals(self.content, f.read())
+		self.assertEquals(self.expected_hash, wrapper.hash)
+		self.assertEquals(10000, wrapper.analysis)
+
+	def test_save_with_analyzer_exceeding_limit(self):
+		path = os.path.join(self.folder, "test.gcode")
+
+		def analyzer(lines):
+			return len(list(lines))
+
+		wrapper = octoprint.filemanager.util.IngestFileWrapper(self._stream_wrapper(), analyzer=analyzer, max_size=1024)
+		wrapper.save(path)
+
+		with open(path, "rb") as f:
+			self.assertEquals(self.content, f.read())
+		self.assertEquals(self.expected_hash, wrapper.hash)
+		self.assertIsNone(wrapper.analysis)
+
+	def test_save_disk_file_with_known_hash(self):
+		source = os.path.join(self.folder, "source.gcode")
+		with open(source, "wb") as f:
+			f.write(self.content)
+		path = os.path.join(self.folder, "test.gcode")
+
+		disk_wrapper = octoprint.filemanager.util.DiskFileWrapper("test.gcode", source, hash="known")
+		wrapper = octoprint.filemanager.util.IngestFileWrapper(disk_wrapper)
+		wrapper.save(path)
+
+		self.assertFalse(os.path.exists(source))
+		self.assertTrue(os.path.exists(path))
+		self.assertEquals("known", wrapper.hash)
+
+
+class DecompressingFileWrapperTest(unittest.TestCase):
+
+	def setUp(self):
+		import gzip
+
+		self.folder = tempfile.mkdtemp()
+		self.content = b"".join(b"G1 X%d Y%d E%d\n" % (i, i, i) for i in range(10000))
+		self.expected_hash = hashlib.sha1(self.content).hexdigest()
+
+		compressed = io.BytesIO()
+		with gzip.GzipFile(fileobj=compressed, mode="wb") as f:
+			f.write(self.content)
+		self.compressed = compressed.getvalue()
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def _wrapper(self):
+		return octoprint.filemanager.util.DecompressingFileWrapper(octoprint.filemanager.util.StreamWrapper("test.gcode.gz", io.BytesIO(self.compressed)))
+
+	def test_filename(self):
+		self.assertEquals("test.gcode", self._wrapper().filename)
+
+	def test_save(self):
+		path = os.path.join(self.folder, "test.gcode")
+
+		wrapper = self._wrapper()
+		wrapper.save(path)
+
+		with open(path, "rb") as f:
+			self.assertEquals(self.content, f.read())
+		self.assertEquals(self.expected_hash, wrapper.hash)
+
+	def test_ingest(self):
+		path = os.path.join(self.folder, "test.gcode")
+
+		wrapper = octoprint.filemanager.util.IngestFileWrapper(self._wrapper(), analyzer=lambda lines: len(list(lines)))
+		wrapper.save(path)
+
+		with open(path, "rb") as f:
+			self.assertEquals(self.content, f.read())
+		self.assertEquals(self.expected_hash, wrapper.hash)
+		self.assertEquals(10000, wrapper.analysis)
+
+
+class CommentStrippingStream(octoprint.filemanager.util.LineProcessorStream):
+	def process_line(self, line):
+		if line.startswith(b";"):
+			return None
+		return line
+
+
+class LineNumberingStream(octoprint.filemanager.util.LineProcessorStream):
+	def __init__(self, input_stream):
+		octoprint.filemanager.util.LineProcessorStream.__init__(self, input_stream)
+		self.line_number = 0
+
+	def process_line(self, line):
+		self.line_number += 1
+		return b"N%d " % self.line_number + line
+
+
+class LineDoublingStream(octoprint.filemanager.util.LineProcessorStream):
+	def process_line(self, line):
+		return line + line
+
+
+class LineProcessorStreamTest(unittest.TestCase):
+
+	def setUp(self):
+		lines = []
+		for i in range(20000):
+			lines.append(b"G1 X%d Y%d E%d\n" % (i, i, i))
+			if i % 3 == 0:
+				lines.append(b"; comment %d\n" % i)
+		self.content = b"".join(lines)
+
+	def _expected(self, content):
+		# what the processors of the chain in _chain do, line by line
+		result = []
+		number = 0
+		for line in io.BytesIO(content):
+			if line.startswith(b";"):
+				continue
+			number += 1
+			result.append(b"N%d " % number + line)
+			result.append(b"N%d " % number + line)
+		return b"".join(result)
+
+	def _chain(self, content):
+		return LineDoublingStream(LineNumberingStream(CommentStrippingStream(io.BytesIO(content))))
+
+	def test_read_all(self):
+		self.assertEquals(self._expected(self.content), self._chain(self.content).read())
+
+	def test_read_in_chunks(self):
+		for size in (13, 4096, 100000):
+			stream = self._chain(self.content)
+			result = []
+			while True:
+				chunk = stream.read(size)
+				if not chunk:
+					break
+				self.assertTrue(len(chunk) <= size)
+				result.append(chunk)
+			self.assertEquals(self._expected(self.content), b"".join(result))
+
+	def test_readinto(self):
+		stream = io.BufferedReader(self._chain(self.content), buffer_size=1000)
+		self.assertEquals(self._expected(self.content), stream.read())
+
+	def test_fused(self):
+		stream = self._chain(self.content)
+		self.assertEquals(3, len(stream._processors))
+		self.assertIsInstance(stream.input_stream, io.BytesIO)
+
+	def test_not_fused_once_read(self):
+		inner = CommentStrippingStream(io.BytesIO(b"; comment\nG28\n; comment\nG1 X10\n"))
+		self.assertEquals(b"G28\n", inner.read(4))
+
+		stream = LineNumberingStream(inner)
+		self.assertEquals(1, len(stream._processors))
+		self.assertEquals(b"N1 G1 X10\n", stream.read())
+
+	def test_last_line_without_newline(self):
+		self.assertEquals(b"N1 G28\nN1 G28\nN2 G1 X10N2 G1 X10", self._chain(b"; start\nG28\nG1 X10").read())
+
+	def test_processed_lines_split_and_joined(self):
+		class SplittingStream(octoprint.filemanager.util.LineProcessorStream):
+			def process_line(self, line):
+				# returns two lines for the first line, and the first half of a line without a newline for the second
+				if line.startswith(b"G28"):
+					return b"G28 X\nG28 Y\n"
+				return line.rstrip(b"\n")
+
+		stream = LineNumberingStream(SplittingStream(io.BytesIO(b"G28\nG1 X10\nG1 X20\n")))
+		self.assertEquals(b"N1 G28 X\nN2 G28 Y\nN3 G1 X10G1 X20", stream.read())
+
+	def test_save(self):
+		folder = tempfile.mkdtemp()
+		try:
+			path = os.path.join(folder, "test.gcode")
+			wrapper = octoprint.filemanager.util.StreamWrapper("test.gcode", self._chain(self.content))
+			wrapper.save(path)
+
+			expected = self._expected(self.content)
+			with open(path, "rb") as f:
+				self.assertEquals(expected, f.read())
+			self.assertEquals(hashlib.sha1(expected).hexdigest(), wrapper.hash)
+		finally:
+			shutil.rmtree(folder)
@@ -1,6 +1,6 @@
 # coding=utf-8
 from __future__ import absolute_import
-from octoprint.printer.estimation import TimeEstimationHelper
+from octoprint.printer.estimation import TimeEstimationHelper, PrintTimeEstimator, TimeIndexPrintTimeEstimator
 
 __author__ = "Gina Häußge <osd@foosel.net>"
 __license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
@@ -11,6 +11,7 @@ import unittest
 from ddt import ddt, data, unpack
 
 import octoprint.printer
+from octoprint.filemanager.timeindex import TimeIndex
 
 @ddt
 class EstimationTestCase(unittest.TestCase):
@@ -73,3 +74,177 @@ class EstimationTestCase(unittest.TestCase):
 
 		self.assertEquals(self.estimation_helper.is_stable(), expected)
 
+
+	@data(
+		((1.0, 1.0), None),
+		((1.0, 1.0, 1.0), 0.0),
+		((1.0, 2.0, 3.0), 1.0),
+		((1.0, 2.0, 3.0, 4.0, 5.0), 1.0),
+		((5.0, 1.0, 2.0, 4.0, 3.0), 1.0)
+	)
+	@unpack
+	def test_variance_rolling(self, estimates, expected):
+		for estimate in estimates:
+			self.estimation_helper.update(estimate)
+
+		if expected is None:
+			self.assertIsNone(self.estimation_helper.variance_rolling)
+		else:
+			self.assertAlmostEqual(self.estimation_helper.variance_rolling, expected)
+
+	def test_confidence_interval(self):
+		self.assertIsNone(self.estimation_helper.confidence_interval())
+
+		for estimate in (1.0, 2.0, 3.0, 4.0, 5.0):
+			self.estimation_helper.update(estimate)
+
+		low, high = self.estimation_helper.confidence_interval(z=2.0)
+		self.assertAlmostEqual(2.0, low)
+		self.assertAlmostEqual(6.0, high)
+
+	def test_rolling_matches_recomputation(self):
+		import random
+		rng = random.Random(42)
+
+		helper = TimeEstimationHelper(rolling_window=10)
+		estimates = [rng.uniform(3000.0, 4000.0) for _ in range(1000)]
+		for estimate in estimates:
+			helper.update(estimate)
+
+		window = estimates[-10:]
+		mean = sum(window) / len(window)
+		variance = sum((estimate - mean) ** 2 for estimate in window) / (len(window) - 1)
+
+		self.assertAlmostEqual(mean, helper.average_total_rolling, places=6)
+		self.assertAlmostEqual(variance, helper.variance_rolling, places=3)
+
+
+class PrintTimeEstimatorTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.job = dict(file="test.gcode", origin="local", size=2000, estimatedPrintTime=None, averagePrintTime=None, timeIndex=None)
+
+	def test_no_estimate(self):
+		estimator = PrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.5, 1000, 100.0, 90.0)
+		self.assertEquals(0.5, estimate.progress)
+		self.assertIsNone(estimate.time_left)
+		self.assertIsNone(estimate.interval)
+
+	def test_statistical_estimate(self):
+		self.job["estimatedPrintTime"] = 1000.0
+		estimator = PrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.5, 1000, 100.0, 90.0)
+		self.assertEquals(910.0, estimate.time_left)
+		self.assertFalse(estimate.stable)
+
+	def test_statistical_estimate_with_percentiles(self):
+		self.job["estimatedPrintTime"] = 1000.0
+		self.job["printTimeStatistics"] = dict(printTime=dict(percentiles=dict(p10=900.0, p25=950.0, p50=1000.0, p75=1100.0, p90=1200.0)))
+		estimator = PrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.5, 1000, 100.0, 90.0)
+		self.assertEquals(910.0, estimate.time_left)
+		self.assertEquals((810.0, 1110.0), estimate.interval)
+
+	def test_stable_estimate(self):
+		estimator = PrintTimeEstimator(self.job)
+		estimator._helper = TimeEstimationHelper(rolling_window=3, countdown=1, threshold=0.1)
+
+		for printTime in (50.0, 50.0, 50.0, 50.0, 50.0):
+			estimate = estimator.estimate(0.5, 1000, printTime, printTime)
+
+		self.assertEquals(50.0, estimate.time_left)
+		self.assertEquals((50.0, 50.0), estimate.interval)
+		self.assertTrue(estimate.stable)
+
+
+class TimeIndexPrintTimeEstimatorTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.job = dict(file="test.gcode", origin="local", size=2000, estimatedPrintTime=None, averagePrintTime=None,
+		                timeIndex=TimeIndex([(0, 0.0), (1000, 1000.0), (2000, 2000.0)]))
+
+	def test_progress_from_time_index(self):
+		estimator = TimeIndexPrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.25, 500, None, None)
+		self.assertAlmostEqual(0.25, estimate.progress)
+		self.assertAlmostEqual(1500.0, estimate.time_left)
+
+	def test_drift_correction(self):
+		estimator = TimeIndexPrintTimeEstimator(self.job)
+
+		# early on, drift is barely trusted
+		estimate = estimator.estimate(0.03, 60, 120.0, 120.0)
+		self.assertLess(estimate.time_left, 1.2 * (2000.0 - 60.0))
+		self.assertAlmostEqual(2000.0 - 60.0, estimate.interval[0])
+		self.assertAlmostEqual(2.0 * (2000.0 - 60.0), estimate.interval[1])
+		self.assertFalse(estimate.stable)
+
+		# after the drift window, it fully is
+		estimate = estimator.estimate(0.5, 1000, 1500.0, 1500.0)
+		self.assertAlmostEqual(1500.0, estimate.time_left)
+		self.assertTrue(estimate.stable)
+
+	def test_average_print_time(self):
+		self.job["averagePrintTime"] = 4000.0
+		estimator = TimeIndexPrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.5, 1000, None, None)
+		self.assertAlmostEqual(2000.0, estimate.time_left)
+
+	def test_median_print_time(self):
+		self.job["averagePrintTime"] = 8000.0
+		self.job["printTimeStatistics"] = dict(printTime=dict(percentiles=dict(p10=3000.0, p25=3500.0, p50=4000.0, p75=5000.0, p90=8000.0)))
+		estimator = TimeIndexPrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.5, 1000, None, None)
+		self.assertAlmostEqual(2000.0, estimate.time_left)
+
+	def test_no_time_index(self):
+		self.job["timeIndex"] = None
+		self.job["estimatedPrintTime"] = 1000.0
+		estimator = TimeIndexPrintTimeEstimator(self.job)
+
+		estimate = estimator.estimate(0.5, 1000, 100.0, 90.0)
+		self.assertEquals(0.5, estimate.progress)
+		self.assertEquals(910.0, estimate.time_left)
+
+
+class PrinterProgressTestCase(unittest.TestCase):
+
+	def setUp(self):
+		import mock
+		from octoprint.printer.estimation import PrintTimeEstimate
+
+		self.printer = mock.MagicMock()
+		self.printer._lastProgressReport = None
+		self.estimate = PrintTimeEstimate
+		self.set_progress = self.printer._stateMonitor.set_progress
+
+	def _set_progress_data(self, estimate):
+		from octoprint.printer.standard import Printer
+
+		self.printer._timeEstimator.estimate.return_value = estimate
+		Printer._setProgressData.__func__(self.printer, 0.5, 1000, 100.0, 90.0)
+		return self.set_progress.call_args[0][0]
+
+	def test_interval_and_stable(self):
+		progress = self._set_progress_data(self.estimate(0.5, 912.4, (850.2, 1020.7), True))
+		self.assertEquals(912, progress["printTimeLeft"])
+		self.assertEquals([850, 1020], progress["printTimeLeftInterval"])
+		self.assertTrue(progress["printTimeLeftStable"])
+
+	def test_no_interval(self):
+		progress = self._set_progress_data(self.estimate(0.5, 912.4, None))
+		self.assertIsNone(progress["printTimeLeftInterval"])
+		self.assertFalse(progress["printTimeLeftStable"])
+
+	def test_no_estimate(self):
+		progress = self._set_progress_data(self.estimate(0.5, None, (850.2, 1020.7), True))
+		self.assertIsNone(progress["printTimeLeft"])
+		self.assertIsNone(progress["printTimeLeftInterval"])
+		self.assertFalse(progress["printTimeLeftStable"])
@@ -0,0 +1,65 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+
+import copy
+import unittest
+
+import mock
+
+from octoprint.printer.profile import PrinterProfileManager
+
+
+class PrinterProfileMigrationTest(unittest.TestCase):
+
+	def setUp(self):
+		with mock.patch("octoprint.printer.profile.settings"):
+			self.manager = PrinterProfileManager()
+
+	def test_migrate_kinematics(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		del profile["kinematics"]
+
+		# kinematics stay unconfigured, so the print time estimation doesn't change on its own
+		self.assertTrue(self.manager._migrate_profile(profile))
+		self.assertIsNone(profile["kinematics"])
+		self.assertTrue(self.manager._ensure_valid_profile(profile))
+
+	def test_migrate_partial_kinematics(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["kinematics"] = dict(jerk=dict(x=20.0))
+
+		self.assertTrue(self.manager._migrate_profile(profile))
+		self.assertEquals(20.0, profile["kinematics"]["jerk"]["x"])
+		self.assertEquals(PrinterProfileManager.default_kinematics["jerk"]["y"], profile["kinematics"]["jerk"]["y"])
+		self.assertEquals(PrinterProfileManager.default_kinematics["bufferDepth"], profile["kinematics"]["bufferDepth"])
+
+	def test_migrate_up_to_date(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		self.assertFalse(self.manager._migrate_profile(profile))
+
+		profile["kinematics"] = copy.deepcopy(PrinterProfileManager.default_kinematics)
+		self.assertFalse(self.manager._migrate_profile(profile))
+
+	def test_partial_kinematics_filled_in(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["kinematics"] = dict(bufferDepth="8")
+
+		profile = self.manager._ensure_valid_profile(profile)
+		self.assertEquals(8, profile["kinematics"]["bufferDepth"])
+		self.assertEquals(PrinterProfileManager.default_kinematics["acceleration"], profile["kinematics"]["acceleration"])
+
+	def test_invalid_kinematics(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["kinematics"] = "fast"
+		self.assertFalse(self.manager._ensure_valid_profile(profile))
+
+	def test_invalid_buffer_depth(self):
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		profile["kinematics"] = copy.deepcopy(PrinterProfileManager.default_kinematics)
+		profile["kinematics"]["bufferDepth"] = 0
+		self.assertFalse(self.manager._ensure_valid_profile(profile))
@@ -0,0 +1,165 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import copy
+import json
+import unittest
+
+import mock
+
+from octoprint.printer import PrinterCallback, PrinterStateSnapshot
+
+
+class PrinterStateSnapshotTest(unittest.TestCase):
+
+	def setUp(self):
+		self.data = dict(state=dict(text="Printing", flags=dict(printing=True)),
+		                 job=dict(file=dict(name="test.gcode", origin="local")),
+		                 progress=dict(completion=42.0),
+		                 currentZ=None,
+		                 offsets=dict(tool0=5),
+		                 temps=[dict(time=1, bed=dict(actual=60.0, target=60.0))])
+
+	def test_data(self):
+		snapshot = PrinterStateSnapshot(self.data)
+		self.assertEquals(self.data["state"], snapshot.data["state"])
+		self.assertEquals("test.gcode", snapshot.data["job"]["file"]["name"])
+
+	def test_data_detached(self):
+		snapshot = PrinterStateSnapshot(self.data)
+		self.data["state"]["text"] = "Operational"
+		self.data["temps"].append(dict(time=2))
+		self.assertEquals("Printing", snapshot.data["state"]["text"])
+		self.assertEquals(1, len(snapshot.data["temps"]))
+
+	def test_data_immutable(self):
+		snapshot = PrinterStateSnapshot(self.data)
+		self.assertRaises(TypeError, snapshot.data.__setitem__, "currentZ", 0.2)
+		self.assertRaises(TypeError, snapshot.data["state"].update, dict(text="Operational"))
+		self.assertRaises(TypeError, snapshot.data["offsets"].pop, "tool0")
+		self.assertIsInstance(snapshot.data["temps"], tuple)
+
+	def test_copy(self):
+		snapshot = PrinterStateSnapshot(self.data)
+
+		data = snapshot.copy()
+		self.assertEquals(self.data, data)
+
+		data["state"]["text"] = "Operational"
+		data["temps"].append(dict(time=2))
+		self.assertEquals("Printing", snapshot.data["state"]["text"])
+		self.assertEquals(self.data, snapshot.copy())
+
+		self.assertEquals(snapshot.data, copy.deepcopy(snapshot.data))
+
+	def test_as_json(self):
+		snapshot = PrinterStateSnapshot(self.data)
+		self.assertEquals(self.data, json.loads(snapshot.as_json()))
+
+	def test_as_json_encoded_once(self):
+		snapshot = PrinterStateSnapshot(self.data)
+		with mock.patch("octoprint.printer.json.dumps", wraps=json.dumps) as dumps:
+			first = snapshot.as_json()
+			snapshot.as_json(extra=dict(serverTime=1))
+			third = snapshot.as_json(extra=dict(serverTime=2))
+		self.assertIs(first, snapshot.as_json())
+		self.assertEquals(3, dumps.call_count)
+		self.assertEquals([snapshot.data, dict(serverTime=1), dict(serverTime=2)], [c[0][0] for c in dumps.call_args_list])
+
+		expected = dict(self.data)
+		expected["serverTime"] = 2
+		self.assertEquals(expected, json.loads(third))
+
+	def test_as_json_extra(self):
+		snapshot = PrinterStateSnapshot(self.data)
+		result = json.loads(snapshot.as_json(extra=dict(serverTime=1, logs=["Send: M105"], currentZ=0.2)))
+
+		expected = dict(self.data)
+		expected.update(serverTime=1, logs=["Send: M105"], currentZ=0.2)
+		self.assertEquals(expected, result)
+
+	def test_as_json_extra_empty(self):
+		self.assertEquals(dict(serverTime=1), json.loads(PrinterStateSnapshot(dict()).as_json(extra=dict(serverTime=1))))
+		self.assertEquals(self.data, json.loads(PrinterStateSnapshot(self.data).as_json(extra=dict())))
+
+	def test_sequence(self):
+		first = PrinterStateSnapshot(self.data)
+		second = PrinterStateSnapshot(self.data, previous=first)
+		third = PrinterStateSnapshot(self.data, previous=second)
+
+		self.assertEquals([1, 2, 3], [first.sequence, second.sequence, third.sequence])
+		self.assertIsNone(first.changes)
+		self.assertEquals((), second.changes)
+
+	def test_changes(self):
+		previous = PrinterStateSnapshot(self.data)
+
+		data = previous.copy()
+		data["progress"]["completion"] = 43.0
+		data["state"]["flags"]["paused"] = False
+		del data["offsets"]["tool0"]
+		data["currentZ"] = 0.2
+		data["temps"][0]["bed"]["actual"] = 59.5
+		snapshot = PrinterStateSnapshot(data, previous=previous)
+
+		self.assertEquals(sorted([(("progress", "completion"), 43.0),
+		                          (("state", "flags", "paused"), False),
+		                          (("offsets", "tool0"),),
+		                          (("currentZ",), 0.2),
+		                          (("temps",), ({"time": 1, "bed": {"actual": 59.5, "target": 60.0}},))]),
+		                  sorted(snapshot.changes))
+
+	def test_changes_types(self):
+		previous = PrinterStateSnapshot(dict(a=1, b=1, c=None, d=dict(e=1)))
+		snapshot = PrinterStateSnapshot(dict(a=1.0, b=True, c=None, d=None), previous=previous)
+		self.assertEquals(sorted([(("a",), 1.0), (("b",), True), (("d",), None)]), sorted(snapshot.changes))
+
+	def test_as_delta_json(self):
+		previous = PrinterStateSnapshot(self.data)
+		self.assertIsNone(previous.as_delta_json())
+
+		data = previous.copy()
+		data["progress"]["completion"] = 43.0
+		del data["offsets"]["tool0"]
+		snapshot = PrinterStateSnapshot(data, previous=previous)
+
+		result = json.loads(snapshot.as_delta_json(extra=dict(serverTime=1)))
+		self.assertEquals(2, result["seq"])
+		self.assertEquals(1, result["serverTime"])
+		self.assertEquals(sorted([[["progress", "completion"], 43.0], [["offsets", "tool0"]]]), sorted(result["changes"]))
+
+		# applying the changes to the previous data gets us the current data
+		current = previous.copy()
+		for change in result["changes"]:
+			path = change[0]
+			container = current
+			for key in path[:-1]:
+				container = container[key]
+			if len(change) > 1:
+				container[path[-1]] = change[1]
+			else:
+				del container[path[-1]]
+		self.assertEquals(data, current)
+
+
+class PrinterCallbackTest(unittest.TestCase):
+
+	def test_send_current_snapshot(self):
+		data = dict(state=dict(text="Printing"), temps=[1, 2])
+		callback = PrinterCallback()
+		callback.on_printer_send_current_data = mock.MagicMock()
+
+		snapshot = PrinterStateSnapshot(data)
+		callback.on_printer_send_current_snapshot(snapshot)
+
+		callback.on_printer_send_current_data.assert_called_once_with(data)
+
+		# the callback gets its own copy to do with as it pleases
+		received = callback.on_printer_send_current_data.call_args[0][0]
+		received["state"]["text"] = "Operational"
+		received["temps"].append(3)
+		self.assertEquals(data, snapshot.copy())
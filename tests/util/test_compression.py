@@ -0,0 +1,82 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ddt import ddt, data, unpack
+
+from octoprint.util.compression import compress_file, is_compressed, open_file, uncompressed_size, strip_compressed_extension
+
+
+@ddt
+class CompressionTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.content = b"".join(b"G1 X%d Y%d E%d\n" % (i, i, i) for i in range(10000))
+		self.path = os.path.join(self.folder, "test.gcode")
+		with open(self.path, "wb") as f:
+			f.write(self.content)
+		os.utime(self.path, (1000, 1000))
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_uncompressed(self):
+		self.assertFalse(is_compressed(self.path))
+		self.assertEquals(len(self.content), uncompressed_size(self.path))
+		with open_file(self.path) as f:
+			self.assertEquals(self.content, f.read())
+
+	def test_compress(self):
+		compress_file(self.path)
+
+		self.assertTrue(is_compressed(self.path))
+		self.assertLess(os.stat(self.path).st_size, len(self.content) / 2)
+		self.assertEquals(1000, os.stat(self.path).st_mtime)
+		self.assertEquals(["test.gcode"], os.listdir(self.folder))
+
+		self.assertEquals(len(self.content), uncompressed_size(self.path))
+		with open_file(self.path) as f:
+			self.assertEquals(self.content, f.read())
+
+	def test_compress_deterministic(self):
+		other = os.path.join(self.folder, "other.gcode")
+		shutil.copy(self.path, other)
+
+		compress_file(self.path)
+		compress_file(other)
+
+		with open(self.path, "rb") as a, open(other, "rb") as b:
+			self.assertEquals(a.read(), b.read())
+
+	def test_positions(self):
+		compress_file(self.path)
+
+		with open_file(self.path) as f:
+			first = f.readline()
+			self.assertEquals(len(first), f.tell())
+
+			f.seek(len(self.content) - 10)
+			self.assertEquals(self.content[-10:], f.read())
+
+	def test_missing(self):
+		self.assertFalse(is_compressed(os.path.join(self.folder, "missing.gcode")))
+
+	@data(
+		("test.gcode.gz", "test.gcode"),
+		("TEST.GCODE.GZ", "TEST.GCODE"),
+		("test.gcode", None),
+		(".gz", None),
+		(None, None)
+	)
+	@unpack
+	def test_strip_compressed_extension(self, filename, expected):
+		self.assertEquals(expected, strip_compressed_extension(filename))
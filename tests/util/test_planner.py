@@ -0,0 +1,191 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import copy
+import unittest
+
+import ddt
+import mock
+
+from octoprint.util.planner import KinematicPlanner
+
+
+NO_JERK = dict(x=0.0, y=0.0, z=0.0, e=0.0)
+
+
+@ddt.ddt
+class KinematicPlannerTest(unittest.TestCase):
+
+	def test_trapezoid(self):
+		planner = KinematicPlanner(acceleration=1000.0, jerk=NO_JERK)
+		planner.add_move(100.0, 0.0, 0.0, 1.0, 50.0)
+		planner.flush()
+
+		# from a stand still, accelerate to 50mm/s within 0.05s and 1.25mm, cruise for 97.5mm, decelerate within 0.05s
+		self.assertAlmostEqual(2.05, planner.total_time, places=2)
+
+	def test_triangle(self):
+		planner = KinematicPlanner(travel_acceleration=1000.0, jerk=NO_JERK)
+		planner.add_move(1.0, 0.0, 0.0, 0.0, 100.0)
+		planner.flush()
+
+		# the requested speed is never reached, peak speed is sqrt(1000mm/s² * 1mm)
+		self.assertAlmostEqual(2 * 31.623 / 1000.0, planner.total_time, places=3)
+
+	@ddt.data(0.0, 0.05)
+	def test_collinear_moves(self, junction_deviation):
+		single = KinematicPlanner(junction_deviation=junction_deviation)
+		single.add_move(100.0, 0.0, 0.0, 1.0, 50.0)
+		single.flush()
+
+		split = KinematicPlanner(junction_deviation=junction_deviation)
+		split.add_move(50.0, 0.0, 0.0, 0.5, 50.0)
+		split.add_move(50.0, 0.0, 0.0, 0.5, 50.0)
+		split.flush()
+
+		self.assertAlmostEqual(single.total_time, split.total_time, places=5)
+
+	@ddt.data(0.0, 0.05)
+	def test_corner_slows_down(self, junction_deviation):
+		straight = KinematicPlanner(junction_deviation=junction_deviation)
+		straight.add_move(50.0, 0.0, 0.0, 0.0, 100.0)
+		straight.add_move(50.0, 0.0, 0.0, 0.0, 100.0)
+		straight.flush()
+
+		corner = KinematicPlanner(junction_deviation=junction_deviation)
+		corner.add_move(50.0, 0.0, 0.0, 0.0, 100.0)
+		corner.add_move(0.0, 50.0, 0.0, 0.0, 100.0)
+		corner.flush()
+
+		self.assertGreater(corner.total_time, straight.total_time)
+
+	def test_start_at_jerk_speed(self):
+		planner = KinematicPlanner(travel_acceleration=1000.0, jerk=dict(x=10.0))
+		planner.add_move(100.0, 0.0, 0.0, 0.0, 50.0)
+		planner.flush()
+
+		# starting at 10mm/s, it takes only 0.04s and 1.2mm to reach 50mm/s, but still 0.05s and 1.25mm to stop
+		self.assertAlmostEqual(0.04 + 0.05 + (100.0 - 1.2 - 1.25) / 50.0, planner.total_time, places=2)
+
+	def test_axis_limits(self):
+		planner = KinematicPlanner(max_feedrate=dict(z=5.0), max_acceleration=dict(z=100.0), jerk=NO_JERK)
+		planner.add_move(0.0, 0.0, 10.0, 0.0, 50.0)
+		planner.flush()
+
+		# limited to 5mm/s and 100mm/s²
+		self.assertAlmostEqual(2.05, planner.total_time, places=2)
+
+	def test_buffer_depth(self):
+		def total_time(depth):
+			planner = KinematicPlanner(buffer_depth=depth)
+			for _ in range(100):
+				planner.add_move(0.5, 0.0, 0.0, 0.01, 100.0)
+			planner.flush()
+			return planner.total_time
+
+		# with a deeper buffer the planner can keep up speed across more short moves
+		self.assertGreater(total_time(1), total_time(4))
+		self.assertGreater(total_time(4), total_time(32))
+
+	def test_block_callback(self):
+		blocks = []
+		planner = KinematicPlanner(buffer_depth=2, block_callback=lambda tag, start, duration: blocks.append((tag, start, duration)))
+
+		planner.add_move(10.0, 0.0, 0.0, 0.0, 50.0, tag=0)
+		planner.add_move(10.0, 0.0, 0.0, 0.0, 50.0, tag=10)
+		self.assertEquals([], blocks)
+
+		planner.add_move(10.0, 0.0, 0.0, 0.0, 50.0, tag=20)
+		self.assertEquals([0], [block[0] for block in blocks])
+
+		planner.dwell(2.0)
+		self.assertEquals([0, 10, 20], [block[0] for block in blocks])
+
+		for (_, start, duration), (_, next_start, _) in zip(blocks, blocks[1:]):
+			self.assertAlmostEqual(start + duration, next_start)
+		self.assertAlmostEqual(sum(block[2] for block in blocks) + 2.0, planner.total_time)
+
+	def test_from_profile(self):
+		from octoprint.printer.profile import PrinterProfileManager
+		profile = copy.deepcopy(PrinterProfileManager.default)
+		self.assertIsNone(KinematicPlanner.from_profile(profile))
+
+		profile["kinematics"] = copy.deepcopy(PrinterProfileManager.default_kinematics)
+		profile["kinematics"]["acceleration"]["travel"] = 2000.0
+		profile["kinematics"]["jerk"]["x"] = 20.0
+		profile["kinematics"]["bufferDepth"] = 8
+
+		planner = KinematicPlanner.from_profile(profile)
+		self.assertEquals(2000.0, planner.travel_acceleration)
+		self.assertEquals((20.0, 10.0, 0.4, 5.0), planner.jerk)
+		self.assertEquals(8, planner.buffer_depth)
+
+		del profile["kinematics"]
+		self.assertIsNone(KinematicPlanner.from_profile(profile))
+
+
+class GcodeKinematicsTest(unittest.TestCase):
+
+	def setUp(self):
+		from octoprint.printer.profile import PrinterProfileManager
+		self.profile = copy.deepcopy(PrinterProfileManager.default)
+		self.profile["kinematics"] = copy.deepcopy(PrinterProfileManager.default_kinematics)
+
+	def _analyse(self, lines, profile):
+		import octoprint.util.gcodeInterpreter as gcodeInterpreter
+		with mock.patch("octoprint.util.gcodeInterpreter.settings"):
+			gcode = gcodeInterpreter.gcode()
+			gcode.load_lines(lines, profile)
+		return gcode
+
+	def test_acceleration_commands(self):
+		lines = ["G1 X100 F3000\n", "G1 X0\n"]
+
+		slow = self._analyse(["M204 S100\n"] + lines, self.profile)
+		fast = self._analyse(["M204 S5000\n"] + lines, self.profile)
+		self.assertGreater(slow.totalMoveTimeMinute, fast.totalMoveTimeMinute)
+
+	def test_dwell(self):
+		gcode = self._analyse(["G1 X10 F3000\n", "G4 S10\n", "G4 P500\n"], self.profile)
+		self.assertGreater(gcode.totalMoveTimeMinute * 60.0, 10.5)
+
+	def test_layer_times(self):
+		lines = []
+		for layer in range(5):
+			lines += ["G1 Z%.1f F600\n" % (0.2 * (layer + 1)), "G1 X50 E1 F1800\n", "G1 X0 E2\n", "G92 E0\n"]
+
+		gcode = self._analyse(lines, self.profile)
+		self.assertEquals(5, len(gcode.layers))
+		self.assertEquals(0.0, gcode.layers[0][3])
+
+		times = [layer[3] for layer in gcode.layers]
+		self.assertEquals(sorted(times), times)
+		self.assertLess(times[-1], gcode.totalMoveTimeMinute * 60.0)
+
+	def test_time_samples(self):
+		lines = ["G1 X100 F600\n"] * 10 + ["G4 S30\n"] + ["G1 X0 F600\n", "G1 X100\n"]
+
+		gcode = self._analyse(lines, self.profile)
+		offsets = [offset for offset, _ in gcode.times]
+		times = [time for _, time in gcode.times]
+
+		self.assertEquals(sorted(set(offsets)), offsets)
+		self.assertEquals(sorted(times), times)
+		self.assertEquals(sum(len(line) for line in lines), offsets[-1])
+		self.assertAlmostEqual(gcode.totalMoveTimeMinute * 60.0, times[-1])
+
+		# the dwell is sampled right before and after its line
+		dwell_start = sum(len(line) for line in lines[:10])
+		dwell_end = dwell_start + len(lines[10])
+		self.assertTrue(dwell_start in offsets)
+		self.assertAlmostEqual(30.0, times[offsets.index(dwell_end)] - times[offsets.index(dwell_start)])
+
+	def test_legacy_without_kinematics(self):
+		self.profile["kinematics"] = None
+
+		gcode = self._analyse(["G1 X100 F3000\n"], self.profile)
+		self.assertAlmostEqual(100.0 / 3000.0, gcode.totalMoveTimeMinute)
@@ -0,0 +1,84 @@
+# coding=utf-8
+from __future__ import absolute_import
+
+__author__ = "Gina Häußge <osd@foosel.net>"
+__license__ = 'GNU Affero General Public License http://www.gnu.org/licenses/agpl.html'
+__copyright__ = "Copyright (C) 2015 The OctoPrint Project - Released under terms of the AGPLv3 License"
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import mock
+
+from octoprint.util.compression import compress_file, deflate_data
+from octoprint.util.zipstream import zip_stream
+
+
+class ZipStreamTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.content = b"".join(b"G1 X%d Y%d E%d\n" % (i, i, i) for i in range(10000))
+
+		self.plain_path = os.path.join(self.folder, "plain.gcode")
+		self.compressed_path = os.path.join(self.folder, "compressed.gcode")
+		for path in (self.plain_path, self.compressed_path):
+			with open(path, "wb") as f:
+				f.write(self.content)
+		compress_file(self.compressed_path)
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_deflate_data(self):
+		self.assertIsNone(deflate_data(self.plain_path))
+
+		offset, length, crc, size = deflate_data(self.compressed_path)
+		self.assertEquals(len(self.content), size)
+		self.assertEquals(os.stat(self.compressed_path).st_size - 8, offset + length)
+
+	def test_archive(self):
+		archive = self._archive([(self.plain_path, "plain.gcode"), (self.compressed_path, "sub/compressed.gcode")])
+
+		self.assertIsNone(archive.testzip())
+		self.assertEquals(["plain.gcode", "sub/compressed.gcode"], archive.namelist())
+		self.assertEquals(zipfile.ZIP_STORED, archive.getinfo("plain.gcode").compress_type)
+		self.assertEquals(zipfile.ZIP_DEFLATED, archive.getinfo("sub/compressed.gcode").compress_type)
+		for name in archive.namelist():
+			self.assertEquals(self.content, archive.read(name))
+
+	def test_archive_without_passthrough(self):
+		archive = self._archive([(self.compressed_path, "compressed.gcode.gz")], passthrough_compressed=False)
+
+		self.assertEquals(zipfile.ZIP_STORED, archive.getinfo("compressed.gcode.gz").compress_type)
+		with open(self.compressed_path, "rb") as f:
+			self.assertEquals(f.read(), archive.read("compressed.gcode.gz"))
+
+	def test_archive_skips_missing(self):
+		archive = self._archive([(os.path.join(self.folder, "missing.gcode"), "missing.gcode"), (self.plain_path, "plain.gcode")])
+		self.assertEquals(["plain.gcode"], archive.namelist())
+
+	def test_archive_empty(self):
+		archive = self._archive([])
+		self.assertEquals([], archive.namelist())
+
+	def test_archive_zip64(self):
+		# pretend everything is huge to get all the ZIP64 structures
+		with mock.patch("octoprint.util.zipstream.ZIP64_LIMIT", 1):
+			archive = self._archive([(self.plain_path, "plain.gcode"), (self.compressed_path, "compressed.gcode")])
+
+		self.assertIsNone(archive.testzip())
+		for name in ("plain.gcode", "compressed.gcode"):
+			self.assertEquals(self.content, archive.read(name))
+
+	def test_chunked(self):
+		chunks = list(zip_stream([(self.plain_path, "plain.gcode")], blocksize=1000))
+		self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks[1:-1]))
+		self.assertEquals(self.content, zipfile.ZipFile(io.BytesIO(b"".join(chunks))).read("plain.gcode"))
+
+	def _archive(self, entries, **kwargs):
+		return zipfile.ZipFile(io.BytesIO(b"".join(zip_stream(entries, **kwargs))))